@@ -43,13 +43,60 @@ class CulturalItemsService {
       }),
     );
 
-    if (res.statusCode != 200) {
+    // 202: el recàlcul s'ha encuat i el fa el worker en segon pla
+    if (res.statusCode != 200 && res.statusCode != 202) {
       final decoded = _safeJsonDecode(res.body);
       final msg = (decoded is Map && decoded['error'] != null)
           ? decoded['error'].toString()
           : 'Error recalculant punts culturals';
       throw Exception(msg);
     }
+
+    final decoded = _safeJsonDecode(res.body);
+    if (res.statusCode == 202 && decoded is Map && decoded['job_id'] != null) {
+      await _waitForJob(decoded['job_id'] as int, token);
+    }
+  }
+
+  /// Espera que el worker acabi el treball (done o failed) abans de tornar,
+  /// així el getByRoute següent ja llegeix els punts recalculats.
+  Future<void> _waitForJob(
+    int jobId,
+    String? token, {
+    Duration interval = const Duration(seconds: 1),
+    Duration timeout = const Duration(seconds: 90),
+  }) async {
+    final deadline = DateTime.now().add(timeout);
+
+    while (DateTime.now().isBefore(deadline)) {
+      final res = await http.get(
+        Uri.parse('${ApiConfig.baseUrl}/jobs/$jobId'),
+        headers: {
+          'Authorization': 'Bearer $token',
+        },
+      );
+
+      if (res.statusCode == 200) {
+        final job = _safeJsonDecode(res.body);
+        final status = job is Map ? job['status'] : null;
+        if (status == 'done') {
+          final result = job['result'];
+          if (result is Map && result['error'] != null) {
+            throw Exception('No s\'han pogut recalcular els punts culturals');
+          }
+          return;
+        }
+        if (status == 'failed') {
+          throw Exception('Error recalculant punts culturals');
+        }
+      } else if (res.statusCode != 404) {
+        throw Exception('Error consultant l\'estat del recàlcul');
+      }
+
+      await Future.delayed(interval);
+    }
+
+    throw Exception('El recàlcul dels punts culturals està trigant massa');
   }
 
   dynamic _safeJsonDecode(String body) {
@@ -2,7 +2,11 @@ import os
 from dotenv import load_dotenv
 from flask import Flask
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from flask_jwt_extended import JWTManager, get_jwt_identity, jwt_required
+
+from db import pool_stats, release_thread_connections
+from services.admin import is_admin
+from services.http_cache import http_cache
 
 from routes.auth_routes import auth_bp
 
@@ -15,6 +19,8 @@ from routes.routing_routes import routing_bp
 from routes.route_cultural_routes import route_cultural_bp
 from routes.user_preferences_routes import user_preferences_bp
 from routes.social_routes import social_bp
+from routes.jobs_routes import jobs_bp
+from routes.recommendation_routes import recommendation_bp
 
 
 load_dotenv()
@@ -59,6 +65,7 @@ CORS(
     app,
     resources={r"/*": {"origins": _allowed_origins(IS_PRODUCTION)}},
     supports_credentials=False,
+    expose_headers=["X-Next-Cursor", "X-Still-Computing", "X-Job-Id", "X-Bundle-Format", "ETag", "Last-Modified"],
 )
 
 app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
@@ -108,6 +115,12 @@ def add_security_headers(response):
     return response
 
 
+@app.teardown_request
+def release_leaked_connections(_exc):
+    # Retorna al pool les connexions que algun handler no ha tancat
+    release_thread_connections()
+
+
 @app.errorhandler(Exception)
 def handle_unexpected_error(_error):
     if IS_PRODUCTION:
@@ -118,6 +131,23 @@ def handle_unexpected_error(_error):
 def home():
     return {"message": "Backend funcionando!"}
 
+
+# Estat intern del pool i de la cache: només per als usuaris d'ADMIN_USER_IDS
+@app.route("/health/db")
+@jwt_required()
+def db_health():
+    if not is_admin(get_jwt_identity()):
+        return {"error": "No tens permís per veure aquest informe"}, 403
+    return pool_stats()
+
+
+@app.route("/health/http-cache")
+@jwt_required()
+def http_cache_health():
+    if not is_admin(get_jwt_identity()):
+        return {"error": "No tens permís per veure aquest informe"}, 403
+    return http_cache.stats()
+
 app.register_blueprint(auth_bp)
 app.register_blueprint(routes_bp)
 app.register_blueprint(cultural_bp)
@@ -125,6 +155,8 @@ app.register_blueprint(routing_bp)
 app.register_blueprint(route_cultural_bp)
 app.register_blueprint(user_preferences_bp)
 app.register_blueprint(social_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(recommendation_bp)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Omple route_tracks per a les rutes amb GPX pujat abans del track store.
+Cada GPX es descarrega i es parseja una sola vegada.
+"""
+
+import sys
+
+from db import get_connection
+from routes.route_cultural_routes import TrackUnavailable, _load_route_track
+
+
+def backfill_tracks():
+    conn = get_connection()
+    try:
+        print("=" * 70)
+        print("BACKFILL DE TRACKS COMPACTES")
+        print("=" * 70)
+        print()
+
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT rf.route_id
+                FROM route_files rf
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM route_tracks rt WHERE rt.route_id = rf.route_id
+                )
+                ORDER BY rf.route_id
+            """)
+            route_ids = [int(r[0]) for r in cur.fetchall()]
+
+        if not route_ids:
+            print("✓ Totes les rutes ja tenen el track guardat.")
+            return
+
+        print(f"{len(route_ids)} ruta(es) sense track guardat.")
+        print()
+
+        saved = 0
+        for route_id in route_ids:
+            try:
+                track = _load_route_track(conn, route_id)
+                conn.commit()
+                saved += 1
+                print(f"[{route_id}] ✓ {len(track)} punts, {track.length_m / 1000.0:.2f} km")
+            except TrackUnavailable as e:
+                conn.rollback()
+                print(f"[{route_id}] ✗ {e.reason}")
+            except Exception as e:
+                conn.rollback()
+                print(f"[{route_id}] ✗ Error: {e}")
+
+        print()
+        print("=" * 70)
+        print(f"✓ {saved} track(s) guardat(s)")
+        print("=" * 70)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    try:
+        backfill_tracks()
+    except Exception as e:
+        print(f"✗ Error durant el backfill: {e}")
+        sys.exit(1)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parser GPX en streaming (services.gpx_parser.parse_gpx) contra
+el parser anterior basado en ET.fromstring.
+
+Cada parser s'executa en un subprocés separat per poder mesurar el pic de
+memòria (ru_maxrss) de manera independent.
+
+Ús (des de backend/):
+    python benchmarks/bench_gpx_parser.py
+    python benchmarks/bench_gpx_parser.py --sizes 1000 100000
+"""
+
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def legacy_parse_gpx_points(gpx_text: str):
+    """Parser anterior: arbre complet en memòria i llista de tuples."""
+    root = ET.fromstring(gpx_text)
+
+    ns = ""
+    if root.tag.startswith("{") and "}" in root.tag:
+        ns = root.tag.split("}")[0] + "}"
+
+    pts = []
+    for trkpt in root.findall(f".//{ns}trkpt"):
+        lat = trkpt.attrib.get("lat")
+        lon = trkpt.attrib.get("lon")
+        if lat is None or lon is None:
+            continue
+        try:
+            pts.append((float(lat), float(lon)))
+        except ValueError:
+            continue
+
+    return pts
+
+
+def write_gpx(path: str, n_points: int, seed: int = 1):
+    rng = random.Random(seed)
+    lat, lon, ele = 41.4, 2.1, 300.0
+    t0 = 1_700_000_000
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<gpx version="1.1" creator="bench" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        f.write("<trk><name>bench</name><trkseg>\n")
+        for i in range(n_points):
+            lat += rng.uniform(-0.0001, 0.0001)
+            lon += rng.uniform(-0.0001, 0.0001)
+            ele += rng.uniform(-1.0, 1.0)
+            ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t0 + i))
+            f.write(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.1f}</ele><time>{ts}</time></trkpt>\n')
+        f.write("</trkseg></trk>\n</gpx>\n")
+
+
+def _run_one(parser: str, path: str):
+    # Imports fora del temps mesurat (el parser nou carrega NumPy)
+    from services.gpx_parser import parse_gpx
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if parser == "legacy":
+        with open(path, "r", encoding="utf-8") as f:
+            n = len(legacy_parse_gpx_points(f.read()))
+    else:
+        # A més de lat/lon llegeix <ele> i <time> i calcula els totals
+        with open(path, "rb") as f:
+            n = len(parse_gpx(f))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: ru_maxrss en KiB
+    print(f"{n} {elapsed:.6f} {rss_after} {rss_after - rss_before}")
+
+
+def _measure(parser: str, path: str):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", parser, path],
+        check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+    ).stdout.split()
+    return int(out[0]), float(out[1]), int(out[2]), int(out[3])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    ap.add_argument("--run", nargs=2, metavar=("PARSER", "FILE"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run:
+        _run_one(*args.run)
+        return
+
+    print(f"{'Punts':>10} {'Mida':>9} {'Parser':<10} {'Temps (s)':>10} {'Pics RSS':>10} {'Δ RSS':>10}")
+    print("-" * 66)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = os.path.join(tmp, f"bench_{n}.gpx")
+            write_gpx(path, n)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            for parser in ("legacy", "streaming"):
+                points, elapsed, peak_kb, delta_kb = _measure(parser, path)
+                assert points == n, (parser, points, n)
+                print(
+                    f"{n:>10} {size_mb:>7.1f}MB {parser:<10} {elapsed:>10.3f}"
+                    f" {peak_kb / 1024:>8.1f}MB {delta_kb / 1024:>8.1f}MB"
+                )
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
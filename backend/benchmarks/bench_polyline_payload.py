@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: mida i temps de serialització de la polilínia de /routing/walking
+en el format actual (llista JSON de [lat, lon]) contra els formats opcionals
+(polyline de Google, varint delta en base64) i amb simplificació.
+
+Ús (des de backend/):
+    python benchmarks/bench_polyline_payload.py
+    python benchmarks/bench_polyline_payload.py --points 1000 20000 --tolerance 5
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from services.polyline_codec import polyline_fields  # noqa: E402
+
+
+def synthetic_route(n: int, seed: int = 7):
+    """Recorregut a peu: passos de ~2-5 m amb girs suaus, com un overview=full."""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.15, n))
+    step = rng.uniform(2.0, 5.0, n)
+    lat = 41.4 + np.cumsum(step * np.cos(heading)) / 111320.0
+    lon = 2.1 + np.cumsum(step * np.sin(heading)) / (111320.0 * np.cos(np.radians(41.4)))
+    return [[float(a), float(b)] for a, b in zip(lat, lon)]
+
+
+def _measure(points, fmt, simplify, tolerance, repeat):
+    base = {"distance_km": 12.3, "duration_min": 150, "steps": ["Camí", "Carrer"]}
+    best = float("inf")
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = dict(base)
+        payload.update(polyline_fields(points, fmt, simplify, tolerance))
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        best = min(best, time.perf_counter() - start)
+    return len(body), len(gzip.compress(body, 6)), best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--points", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--tolerance", type=float, default=5.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    cases = [
+        ("json (actual)", "json", None),
+        ("polyline", "polyline", None),
+        ("varint", "varint", None),
+        (f"json + dp {args.tolerance:g} m", "json", "dp"),
+        (f"polyline + dp {args.tolerance:g} m", "polyline", "dp"),
+        (f"polyline + vw {args.tolerance:g} m", "polyline", "vw"),
+    ]
+
+    print(f"{'Punts':>8}  {'Format':<24} {'Bytes':>11} {'Gzip':>10} {'Temps (ms)':>11}")
+    print("-" * 70)
+    for n in args.points:
+        points = synthetic_route(n)
+        for label, fmt, simplify in cases:
+            size, gz, elapsed = _measure(points, fmt, simplify, args.tolerance, args.repeat)
+            print(f"{n:>8}  {label:<24} {size:>11,} {gz:>10,} {elapsed * 1000:>11.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: join espacial de tot el catàleg (services/spatial_join.py) sobre
+tracks i ítems sintètics, amb 1 procés i amb un pool de processos.
+Mostra rutes/s i parells ruta-ítem/s.
+
+Ús (des de backend/):
+    python benchmarks/bench_spatial_join.py
+    python benchmarks/bench_spatial_join.py --routes 2000 --items 50000 --processes 1 4 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from services.spatial_join import join_tracks  # noqa: E402
+from services.track_store import encode_track  # noqa: E402
+
+
+def synthetic_catalog(n_routes: int, n_items: int, points: int, seed: int = 7):
+    """Rutes a peu de ~points punts i ítems repartits per Catalunya."""
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for route_id in range(1, n_routes + 1):
+        heading = np.cumsum(rng.normal(0, 0.15, points))
+        step = rng.uniform(5.0, 15.0, points)
+        lat0, lon0 = rng.uniform(40.6, 42.8), rng.uniform(0.2, 3.2)
+        lat = lat0 + np.cumsum(step * np.cos(heading)) / 111320.0
+        lon = lon0 + np.cumsum(step * np.sin(heading)) / (111320.0 * np.cos(np.radians(lat0)))
+        enc = encode_track(lat, lon)
+        tracks.append((route_id, enc["lat_e7"], enc["lon_e7"]))
+    items = (
+        np.arange(1, n_items + 1),
+        rng.uniform(40.6, 42.8, n_items),
+        rng.uniform(0.2, 3.2, n_items),
+    )
+    return tracks, items
+
+
+def _chunks(tracks, size):
+    for start in range(0, len(tracks), size):
+        yield tracks[start:start + size]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--routes", type=int, default=500)
+    ap.add_argument("--items", type=int, default=20_000)
+    ap.add_argument("--points", type=int, default=2_000, help="punts per track")
+    ap.add_argument("--radius", type=float, default=150.0)
+    ap.add_argument("--chunk-size", type=int, default=50)
+    ap.add_argument("--processes", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = ap.parse_args()
+
+    tracks, items = synthetic_catalog(args.routes, args.items, args.points)
+
+    print(f"{args.routes} rutes x {args.points} punts, {args.items} ítems, radi {args.radius:g} m")
+    print(f"{'Processos':>10} {'Temps (s)':>10} {'Rutes/s':>10} {'Parells/s':>14} {'Enllaços':>10}")
+    print("-" * 70)
+    for processes in args.processes:
+        start = time.perf_counter()
+        links = 0
+        for _, rows in join_tracks(items, _chunks(tracks, args.chunk_size), args.radius, processes):
+            links += len(rows)
+        elapsed = time.perf_counter() - start
+        print(f"{processes:>10} {elapsed:>10.2f} {args.routes / elapsed:>10.1f} "
+              f"{args.routes * args.items / elapsed:>14,.0f} {links:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Genera el graf de rutes a peu local a partir d'un extracte d'OpenStreetMap.
+
+Accepta .osm (XML) i, si hi ha pyosmium instal·lat, .osm.pbf. El resultat
+és un directori d'arrays .npy que el backend "local" de /routing/walking
+obre amb mmap (ROUTING_GRAPH_DIR).
+
+Ús:
+    python build_walk_graph.py catalunya-latest.osm.pbf
+    python build_walk_graph.py zona.osm --out data/walk_graph
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from services.walk_graph import import_osm, save_graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el graf de rutes a peu local")
+    parser.add_argument("source", help="extracte OSM (.osm o .osm.pbf)")
+    parser.add_argument("--out", default=os.getenv("ROUTING_GRAPH_DIR", "data/walk_graph"))
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("GRAF DE RUTES A PEU")
+    print("=" * 70)
+    print()
+
+    started = time.monotonic()
+    arrays = import_osm(args.source)
+    meta = save_graph(arrays, args.out, source=os.path.basename(args.source))
+
+    print(f"✓ {meta['nodes']} nodes, {meta['edges']} arestes ({time.monotonic() - started:.1f}s)")
+    print(f"✓ Guardat a {args.out}")
+    print()
+    print("Per fer-lo servir: ROUTING_BACKEND=local,osrm i ROUTING_GRAPH_DIR=" + args.out)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"✗ Error generant el graf: {e}")
+        sys.exit(1)
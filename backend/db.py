@@ -1,10 +1,33 @@
+import logging
 import os
+import threading
+import time
+import traceback
+
 import psycopg2
+from psycopg2 import extensions as pg_ext
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_connection():
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _connect():
     db_url = os.getenv("DATABASE_URL")
     if db_url:
         # Para proveedores cloud suele hacer falta SSL
@@ -22,3 +45,375 @@ def get_connection():
         port=os.getenv("DB_PORT", "5432"),
         connect_timeout=10,
     )
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Slot:
+    """Connexió física del pool amb el seu estat intern."""
+
+    __slots__ = (
+        "raw", "created_at", "last_used_at", "checked_out_at",
+        "thread_id", "stack", "leak_reported", "generation",
+    )
+
+    def __init__(self, raw):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used_at = now
+        self.checked_out_at = None
+        self.thread_id = None
+        self.stack = None
+        self.leak_reported = False
+        self.generation = 0
+
+
+class PooledConnection:
+    """
+    Proxy sobre una connexió psycopg2. Es comporta igual que la connexió
+    original, però close() la retorna al pool en lloc de tancar-la.
+    """
+
+    def __init__(self, pool, slot):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_slot", slot)
+        object.__setattr__(self, "_generation", slot.generation)
+
+    def close(self):
+        slot = self._slot
+        if slot is None:
+            return
+        object.__setattr__(self, "_slot", None)
+        self._pool._release(slot, self._generation)
+
+    @property
+    def closed(self):
+        slot = self._slot
+        if slot is None:
+            return 1
+        return slot.raw.closed
+
+    def __getattr__(self, name):
+        slot = object.__getattribute__(self, "_slot")
+        if slot is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        return getattr(slot.raw, name)
+
+    def __setattr__(self, name, value):
+        slot = self._slot
+        if slot is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        setattr(slot.raw, name, value)
+
+    def __enter__(self):
+        if self._slot is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        self._slot.raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._slot is None:
+            return False
+        return self._slot.raw.__exit__(exc_type, exc, tb)
+
+    def __del__(self):
+        slot = getattr(self, "_slot", None)
+        if slot is not None:
+            logger.warning("Connexió de BD no tancada (recollida pel GC); es retorna al pool")
+            try:
+                self._pool._release(slot, self._generation, leaked=True)
+            except Exception:
+                pass
+
+
+class ConnectionPool:
+    """
+    Pool de connexions per procés (cada worker de gunicorn té el seu).
+
+    - minconn/maxconn: connexions calentes i límit dur.
+    - timeout: segons d'espera màxima quan el pool és ple.
+    - health_check_interval: si una connexió ha estat inactiva més d'aquests
+      segons, es comprova amb SELECT 1 abans de lliurar-la.
+    - max_lifetime: les connexions més antigues es reciclen.
+    - leak_timeout: connexions en ús més d'aquests segons es reporten com a fuites.
+    """
+
+    def __init__(
+        self,
+        connect=_connect,
+        minconn: int = 1,
+        maxconn: int = 10,
+        timeout: float = 10.0,
+        health_check_interval: float = 30.0,
+        max_lifetime: float = 1800.0,
+        leak_timeout: float = 60.0,
+        track_stacks: bool = False,
+    ):
+        if maxconn < 1:
+            raise ValueError("maxconn ha de ser >= 1")
+        self._connect = connect
+        self.minconn = max(0, min(minconn, maxconn))
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+        self.leak_timeout = leak_timeout
+        self.track_stacks = track_stacks
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = {}
+        self._size = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._total_wait_s = 0.0
+        self._max_wait_s = 0.0
+        self._timeouts = 0
+        self._health_check_failures = 0
+        self._leaks_detected = 0
+        self._connections_created = 0
+        self._connections_discarded = 0
+
+        for _ in range(self.minconn):
+            try:
+                self._idle.append(self._new_slot())
+                self._size += 1
+            except Exception:
+                logger.exception("No s'ha pogut obrir la connexió inicial del pool")
+                break
+
+    def _new_slot(self):
+        slot = _Slot(self._connect())
+        with self._cond:
+            self._connections_created += 1
+        return slot
+
+    def _discard(self, slot):
+        with self._cond:
+            self._connections_discarded += 1
+        try:
+            if not slot.raw.closed:
+                slot.raw.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, slot, now: float) -> bool:
+        if slot.raw.closed:
+            return False
+        if self.max_lifetime and now - slot.created_at > self.max_lifetime:
+            return False
+        if now - slot.last_used_at < self.health_check_interval:
+            return True
+        try:
+            with slot.raw.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            slot.raw.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._health_check_failures += 1
+            return False
+
+    def getconn(self) -> PooledConnection:
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        while True:
+            slot = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.InterfaceError("connection pool is closed")
+                self._report_leaks_locked(time.monotonic())
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No hi ha connexions lliures al pool (max={self.maxconn}, en ús={len(self._in_use)})"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    slot = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    slot = self._new_slot()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(slot, time.monotonic()):
+                self._discard(slot)
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                continue
+
+            now = time.monotonic()
+            waited = now - start
+            with self._cond:
+                slot.checked_out_at = now
+                slot.thread_id = threading.get_ident()
+                slot.stack = "".join(traceback.format_stack(limit=12)) if self.track_stacks else None
+                slot.leak_reported = False
+                slot.generation += 1
+                self._in_use[id(slot)] = slot
+                self._checkouts += 1
+                self._total_wait_s += waited
+                self._max_wait_s = max(self._max_wait_s, waited)
+            return PooledConnection(self, slot)
+
+    def _reset(self, slot) -> bool:
+        raw = slot.raw
+        if raw.closed:
+            return False
+        try:
+            status = raw.get_transaction_status()
+            if status == pg_ext.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != pg_ext.TRANSACTION_STATUS_IDLE:
+                raw.rollback()
+            if raw.autocommit:
+                raw.autocommit = False
+            return True
+        except Exception:
+            return False
+
+    def _release(self, slot, generation: int, leaked: bool = False):
+        with self._cond:
+            # Una connexió ja retornada (o reutilitzada per un altre) no es toca
+            if self._in_use.get(id(slot)) is not slot or slot.generation != generation:
+                return
+            del self._in_use[id(slot)]
+            if leaked:
+                self._leaks_detected += 1
+            slot.checked_out_at = None
+            slot.thread_id = None
+            slot.stack = None
+
+        reusable = self._reset(slot)
+        with self._cond:
+            if reusable and not self._closed:
+                slot.last_used_at = time.monotonic()
+                self._idle.append(slot)
+            else:
+                self._size -= 1
+                self._discard(slot)
+            self._cond.notify()
+
+    def _report_leaks_locked(self, now: float):
+        if not self.leak_timeout:
+            return
+        for slot in self._in_use.values():
+            if slot.leak_reported or slot.checked_out_at is None:
+                continue
+            held = now - slot.checked_out_at
+            if held > self.leak_timeout:
+                slot.leak_reported = True
+                self._leaks_detected += 1
+                logger.warning(
+                    "Possible fuita de connexió: en ús des de fa %.1fs (thread %s)%s",
+                    held,
+                    slot.thread_id,
+                    "\n" + slot.stack if slot.stack else "",
+                )
+
+    def release_thread_connections(self) -> int:
+        """Retorna al pool les connexions que el thread actual no ha tancat."""
+        tid = threading.get_ident()
+        with self._cond:
+            leaked = [(s, s.generation, s.stack) for s in self._in_use.values() if s.thread_id == tid]
+        for slot, generation, stack in leaked:
+            logger.warning(
+                "Handler sense conn.close(): es retorna la connexió al pool%s",
+                "\n" + stack if stack else "",
+            )
+            self._release(slot, generation, leaked=True)
+        return len(leaked)
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._report_leaks_locked(time.monotonic())
+            checkouts = self._checkouts
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "checkouts": checkouts,
+                "avg_wait_ms": round((self._total_wait_s / checkouts) * 1000.0, 3) if checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait_s * 1000.0, 3),
+                "timeouts": self._timeouts,
+                "health_check_failures": self._health_check_failures,
+                "leaks_detected": self._leaks_detected,
+                "connections_created": self._connections_created,
+                "connections_discarded": self._connections_discarded,
+            }
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for slot in idle:
+            self._discard(slot)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _pool_enabled() -> bool:
+    return (os.getenv("DB_POOL_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"})
+
+
+def get_pool() -> ConnectionPool:
+    """Pool del procés actual (es recrea després d'un fork de gunicorn)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                minconn=_env_int("DB_POOL_MIN", 1),
+                maxconn=_env_int("DB_POOL_MAX", 10),
+                timeout=_env_float("DB_POOL_TIMEOUT", 10.0),
+                health_check_interval=_env_float("DB_POOL_HEALTH_CHECK_INTERVAL", 30.0),
+                max_lifetime=_env_float("DB_POOL_MAX_LIFETIME", 1800.0),
+                leak_timeout=_env_float("DB_POOL_LEAK_TIMEOUT", 60.0),
+                track_stacks=os.getenv("DB_POOL_TRACK_STACKS", "0").strip().lower() in {"1", "true", "yes", "on"},
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def get_connection():
+    if not _pool_enabled():
+        return _connect()
+    return get_pool().getconn()
+
+
+def release_thread_connections() -> int:
+    if _pool is None or _pool_pid != os.getpid():
+        return 0
+    return _pool.release_thread_connections()
+
+
+def pool_stats() -> dict:
+    if not _pool_enabled():
+        return {"enabled": False}
+    return {"enabled": True, **get_pool().stats()}
@@ -0,0 +1,110 @@
+"""
+In-memory stand-in for a psycopg2 connection, shared by the test scripts.
+
+Every statement goes to the connection's handler(sql, params) (sql with
+whitespace collapsed), which returns the rows of the statement; without a
+handler the scripted results passed to FakeConnection are returned one
+per statement ([] once they run out). A handler can also return
+Result(rows, rowcount) for DML that reports affected rows.
+
+Tests that check what a service does keep a small model of the tables
+they touch in the handler and assert on that state, not on the SQL text.
+"""
+
+from psycopg2 import extensions as pg_ext
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+class Result:
+    """Rows of a statement plus its rowcount (defaults to len(rows))."""
+
+    def __init__(self, rows=(), rowcount: int = None):
+        self.rows = list(rows)
+        self.rowcount = len(self.rows) if rowcount is None else int(rowcount)
+
+
+class FakeCursor:
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = 0
+        self.rows = []
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise Exception("server closed the connection unexpectedly")
+        sql = normalize_sql(sql)
+        self.conn.executed.append((sql, params))
+        self.conn.status = pg_ext.TRANSACTION_STATUS_INTRANS
+
+        if self.conn.handler is not None:
+            result = self.conn.handler(sql, params)
+        else:
+            result = self.conn.results.pop(0) if self.conn.results else []
+        if not isinstance(result, Result):
+            result = Result(result or ())
+        self.rows = result.rows
+        self.rowcount = result.rowcount
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size=None):
+        size = size or self.itersize or 1
+        out, self.rows = self.rows[:size], self.rows[size:]
+        return out
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def copy_expert(self, sql, buf):
+        table = normalize_sql(sql).split()[1]
+        self.conn.copied.setdefault(table, []).extend(buf.getvalue().splitlines())
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, *results, handler=None):
+        self.results = list(results)
+        self.handler = handler
+        self.executed = []
+        self.copied = {}
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = 0
+        self.broken = False
+        self.autocommit = False
+        self.status = pg_ext.TRANSACTION_STATUS_IDLE
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def commit(self):
+        self.commits += 1
+        self.status = pg_ext.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = pg_ext.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
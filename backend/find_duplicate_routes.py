@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Detecció de rutes duplicades per empremta de track (route_fingerprints,
+migració 0015). Les rutes pujades ja es comproven en pujar-les; aquest
+script calcula l'empremta de les que encara no en tenen (tracks anteriors
+a la migració o desats amb backfill_tracks.py) i en mostra l'informe.
+
+Ús:
+    python find_duplicate_routes.py                 # empremtes pendents + informe
+    python find_duplicate_routes.py --all           # torna a comprovar tot el catàleg
+    python find_duplicate_routes.py --report-only --kind duplicate --limit 50
+"""
+
+import argparse
+import sys
+
+from db import get_connection
+from services.track_fingerprint import duplicate_report, fingerprint_routes, routes_missing_fingerprint
+
+
+def _print_progress(phase, done, total):
+    label = "empremtes" if phase == "fingerprint" else "comprovades"
+    print(f"  {label}: {done}/{total}", flush=True)
+
+
+def _print_report(report):
+    print(f"Rutes amb track: {report['routes_with_track']} · amb empremta: {report['routes_fingerprinted']}")
+    for kind, label in (("duplicate", "Duplicades"), ("near_duplicate", "Gairebé duplicades")):
+        t = report["totals"].get(kind, {"pairs": 0, "routes": 0})
+        print(f"{label}: {t['pairs']} parella(es), {t['routes']} ruta(es)")
+    if report["pairs"]:
+        print()
+    for p in report["pairs"]:
+        direction = " (sentit contrari)" if p["reversed"] else ""
+        print(f"  {p['route_id']} {p['name']!r} -> {p['duplicate_of']} {p['duplicate_of_name']!r} · "
+              f"{p['kind']} · similitud {p['similarity']:.2f} · Fréchet {p['frechet_m']:.0f} m · "
+              f"Hausdorff {p['hausdorff_m']:.0f} m{direction}")
+
+
+def run(check_all: bool, report_only: bool, kind: str, limit: int, batch_size: int):
+    conn = get_connection()
+    try:
+        print("=" * 70)
+        print("DETECCIÓ DE RUTES DUPLICADES")
+        print("=" * 70)
+        print()
+
+        if not report_only:
+            missing = routes_missing_fingerprint(conn)
+            detect = None
+            if check_all:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT DISTINCT route_id FROM route_tracks ORDER BY route_id")
+                    detect = [int(r[0]) for r in cur.fetchall()]
+            print(f"Rutes sense empremta: {len(missing)}")
+            totals = fingerprint_routes(conn, missing, detect, batch_size=batch_size, progress=_print_progress)
+            print(f"✓ {totals['fingerprinted']} empremta(es) · {totals['checked']} ruta(es) comprovada(es)")
+            print()
+
+        _print_report(duplicate_report(conn, kind=kind, limit=limit))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print()
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Empremtes de track i informe de rutes duplicades")
+    parser.add_argument("--all", action="store_true", help="comprova totes les rutes, no només les noves")
+    parser.add_argument("--report-only", action="store_true", help="només mostra l'informe")
+    parser.add_argument("--kind", choices=["duplicate", "near_duplicate"])
+    parser.add_argument("--limit", type=int, default=100, help="parelles a mostrar")
+    parser.add_argument("--batch-size", type=int, default=100, help="rutes per transacció")
+    args = parser.parse_args()
+
+    try:
+        run(args.all, args.report_only, args.kind, max(1, args.limit), max(1, args.batch_size))
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Carrega un inventari de patrimoni (CSV o GeoJSON) a cultural_items.
+
+Les files es validen, es normalitza item_type, es descarten els duplicats
+(mateix lloc, a menys de --dedupe-radius metres, i títol semblant) i es
+fusionen amb els ítems existents via COPY a una taula temporal. Només els
+ítems nous o moguts queden a la cua de l'associació incremental amb les
+rutes (treball cultural_items_associate del worker).
+
+Ús:
+    python import_cultural_items.py inventari.csv
+    python import_cultural_items.py inventari.geojson --strict-types
+    python import_cultural_items.py inventari.geojsonl --dry-run
+    python import_cultural_items.py inventari.csv --associate-now   # associa sense esperar el worker
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from db import get_connection
+from routes.route_cultural_routes import _sync_route_cultural_booleans
+from services.cultural_ingest import ingest, iter_csv, iter_geojson
+from services.item_association import drain_queue
+
+
+def _records(path: str, fmt: str, delimiter: str, f):
+    if fmt == "auto":
+        ext = os.path.splitext(path)[1].lower()
+        fmt = {".geojson": "geojson", ".json": "geojson", ".geojsonl": "geojsonl", ".ndjson": "geojsonl", ".jsonl": "geojsonl"}.get(ext, "csv")
+    if fmt == "csv":
+        return iter_csv(f, delimiter)
+    return iter_geojson(f, lines=(fmt == "geojsonl"))
+
+
+def _print_progress(phase, count):
+    if phase == "staged":
+        print(f"  {count} files carregades a staging", flush=True)
+    elif phase == "deduped":
+        print(f"  {count} duplicat(s) dins del fitxer", flush=True)
+    elif phase == "matched":
+        print(f"  {count} fila(es) coincideixen amb ítems existents", flush=True)
+
+
+def run(args) -> bool:
+    started = time.perf_counter()
+    conn = get_connection()
+    try:
+        print("=" * 70)
+        print("IMPORTACIÓ D'ÍTEMS CULTURALS")
+        print("=" * 70)
+        print()
+        print(f"Fitxer: {args.path}")
+        print()
+
+        with open(args.path, "r", encoding=args.encoding, newline="") as f:
+            stats = ingest(
+                conn,
+                _records(args.path, args.format, args.delimiter, f),
+                dedupe_radius_m=args.dedupe_radius,
+                similarity=args.similarity,
+                strict_types=args.strict_types,
+                batch_size=args.batch_size,
+                progress=_print_progress,
+            )
+
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM cultural_item_assoc_queue")
+                stats["queued"] = int(cur.fetchone()[0])
+            if args.associate_now and stats["queued"]:
+                stats["association"] = drain_queue(conn, _sync_route_cultural_booleans)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print()
+    print(f"Llegides: {stats['read']} ({stats['read'] / max(elapsed, 1e-9):,.0f} files/s)")
+    for reason, n in sorted(stats["invalid"].items()):
+        print(f"  ✗ {n} descartada(es) per {reason}")
+    if stats["unknown_types"]:
+        print(f"  ! Tipus no reconeguts (es desen tal qual): "
+              + ", ".join(f"{t} ({n})" for t, n in sorted(stats["unknown_types"].items(), key=lambda kv: -kv[1])[:10]))
+    print(f"Duplicats dins del fitxer: {stats['duplicates_in_input']}")
+    print(f"Coincidències amb ítems existents: {stats['matched_existing']} ({stats['updated']} actualitzat(s))")
+    print(f"Ítems nous: {stats['inserted']}")
+    if "queued" in stats:
+        print(f"Pendents d'associar amb rutes: {stats['queued']}")
+    if "association" in stats:
+        a = stats["association"]
+        print(f"Associats ara: {a['items']} ítem(s), {a['links']} enllaç(os), {a['routes']} ruta(es)")
+    print(f"Temps: {elapsed:.1f} s")
+    print()
+    print("=" * 70)
+    print("✓ Simulació acabada (sense canvis)" if args.dry_run else "✓ Importació completada")
+    print("=" * 70)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa un inventari de patrimoni a cultural_items")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["auto", "csv", "geojson", "geojsonl"], default="auto")
+    parser.add_argument("--delimiter", default=None, help="separador CSV (per defecte es detecta)")
+    parser.add_argument("--encoding", default="utf-8-sig")
+    parser.add_argument("--dedupe-radius", type=float, default=50.0, help="metres (per defecte 50)")
+    parser.add_argument("--similarity", type=float, default=0.85, help="similitud mínima de títols (0-1)")
+    parser.add_argument("--strict-types", action="store_true", help="descarta els item_type no reconeguts")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--dry-run", action="store_true", help="no escriu res")
+    parser.add_argument("--associate-now", action="store_true", help="associa els ítems nous amb les rutes sense esperar el worker")
+    args = parser.parse_args()
+
+    try:
+        run(args)
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Importa un arxiu de tracks GPX: una ruta nova per cada fitxer.
+
+Accepta fitxers .gpx, carpetes (es recorren recursivament) i fitxers .zip.
+Els GPX es parsegen en paral·lel, la dificultat es calcula amb la fórmula
+unificada, els fitxers es pugen a l'storage concurrentment i les rutes es
+creen per lots. La connexió amb els punts culturals s'encua per al worker.
+
+Ús:
+    python import_gpx.py --user 7 arxiu_club.zip
+    python import_gpx.py --user 7 tracks/ --location "Montseny" --processes 4
+    python import_gpx.py --user 7 tracks/ --dry-run     # només parseja, no puja ni escriu
+"""
+
+import argparse
+import os
+import sys
+
+from db import get_connection
+from routes.route_files_routes import _delete_from_supabase_storage, _upload_to_supabase_storage
+from services.difficulty_calculator import calculate_difficulty
+from services.gpx_import import (
+    MAX_FILE_BYTES,
+    GpxParsePool,
+    import_gpx_files,
+    iter_zip,
+)
+
+
+def _sources(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    if name.lower().endswith((".gpx", ".gpx.xml", ".zip")):
+                        yield from _sources([os.path.join(root, name)])
+        elif path.lower().endswith(".zip"):
+            with open(path, "rb") as f:
+                yield from iter_zip(f)
+        elif os.path.getsize(path) > MAX_FILE_BYTES:
+            yield os.path.basename(path), None
+        else:
+            with open(path, "rb") as f:
+                yield os.path.basename(path), f.read()
+
+
+def _print_status(status):
+    if status["status"] == "created":
+        print(f"  ✓ {status['file']} -> ruta {status['route_id']} · {status['distance_km']} km · "
+              f"{status['elevation_gain']} m · {status['difficulty']}", flush=True)
+        for dup in status.get("duplicates", []):
+            label = "duplicada" if dup["kind"] == "duplicate" else "gairebé duplicada"
+            print(f"      ! {label} de la ruta {dup['route_id']} ({dup['name']}) · Fréchet {dup['frechet_m']} m", flush=True)
+    else:
+        print(f"  ✗ {status['file']}: {status['error']}", flush=True)
+        if status.get("orphaned_path"):
+            print(f"      ! fitxer pujat sense esborrar: {status['orphaned_path']}", flush=True)
+
+
+def run(args) -> int:
+    print("=" * 70)
+    print("IMPORTACIÓ MASSIVA DE GPX")
+    print("=" * 70)
+    print()
+
+    pool = GpxParsePool(args.processes)
+    if args.dry_run:
+        # Només parseja: mostra el que es crearia
+        ok = 0
+        for _, res in pool.parse(_sources(args.paths)):
+            if res["ok"]:
+                ok += 1
+                difficulty = calculate_difficulty(res["distance_km"], res["elevation_gain"], res["estimated_time"], lang="ca")
+                print(f"  ✓ {res['file']} · {res['distance_km']} km · {res['elevation_gain']} m · {difficulty}")
+            else:
+                print(f"  ✗ {res['file']}: {res['error']}")
+        print()
+        print("=" * 70)
+        print(f"✓ Simulació: {ok} ruta(es) es crearien")
+        print("=" * 70)
+        return 0
+
+    conn = get_connection()
+    try:
+        statuses = import_gpx_files(
+            conn,
+            args.user,
+            _sources(args.paths),
+            upload=_upload_to_supabase_storage,
+            delete=_delete_from_supabase_storage,
+            location=args.location,
+            batch_size=args.batch_size,
+            upload_workers=args.upload_workers,
+            parse_pool=pool,
+            progress=_print_status,
+        )
+    finally:
+        conn.close()
+
+    created = sum(1 for s in statuses if s["status"] == "created")
+    print()
+    print("=" * 70)
+    print(f"✓ {created} ruta(es) creada(es), {len(statuses) - created} fitxer(s) amb error")
+    print("=" * 70)
+    return 0 if created or not statuses else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa fitxers GPX (o ZIP) com a rutes noves")
+    parser.add_argument("paths", nargs="+", help="fitxers .gpx, .zip o carpetes")
+    parser.add_argument("--user", type=int, required=True, help="user_id del creador de les rutes")
+    parser.add_argument("--location", default="")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--upload-workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--dry-run", action="store_true", help="només parseja")
+    args = parser.parse_args()
+
+    try:
+        sys.exit(run(args))
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Aplica les migracions d'esquema pendents (backend/migrations/*.sql).
+S'ha d'executar en cada desplegament, abans d'arrencar el servidor.
+
+Ús:
+    python migrate.py            # aplica totes les pendents
+    python migrate.py --status   # mostra l'estat de cada migració
+    python migrate.py --dry-run  # llista les pendents sense aplicar-les
+    python migrate.py --target 3 # aplica fins a la versió 3
+"""
+
+import argparse
+import sys
+
+from db import get_connection
+from services.migrations import migration_status, run_migrations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migracions d'esquema de la BD")
+    parser.add_argument("--status", action="store_true", help="mostra l'estat de les migracions")
+    parser.add_argument("--dry-run", action="store_true", help="no aplica res, només llista les pendents")
+    parser.add_argument("--target", type=int, default=None, help="versió màxima a aplicar")
+    args = parser.parse_args(argv)
+
+    conn = get_connection()
+    try:
+        if args.status:
+            for m in migration_status(conn):
+                when = f"  ({m['applied_at']})" if m["applied_at"] else ""
+                print(f"{m['version']:04d}_{m['name']:<40} {m['state']}{when}")
+            return 0
+
+        print("=" * 70)
+        print("MIGRACIONS D'ESQUEMA")
+        print("=" * 70)
+        applied = run_migrations(conn, target=args.target, dry_run=args.dry_run)
+        print()
+        if args.dry_run:
+            print("✓ Dry run: no s'ha aplicat cap canvi")
+        elif applied:
+            print(f"✓ {len(applied)} migració(ns) aplicada(es)")
+        else:
+            print("✓ L'esquema ja està al dia")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except Exception as e:
+        print(f"✗ Error aplicant migracions: {e}")
+        sys.exit(1)
@@ -0,0 +1,16 @@
+-- Taula de rutes completades per usuari (abans es creava a cada petició)
+CREATE TABLE IF NOT EXISTS user_route_completions (
+    completion_id SERIAL PRIMARY KEY,
+    user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+    completion_count INT NOT NULL DEFAULT 1,
+    first_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (user_id, route_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_urc_user_last_completed
+    ON user_route_completions (user_id, last_completed_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_urc_route
+    ON user_route_completions (route_id);
@@ -0,0 +1,10 @@
+-- Marca de temps de l'última associació ítem cultural -> rutes
+CREATE TABLE IF NOT EXISTS cultural_item_routes_cache (
+    item_id INT NOT NULL,
+    radius_m INT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (item_id, radius_m)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cultural_item_routes_cache_updated_at
+    ON cultural_item_routes_cache (updated_at);
@@ -0,0 +1,36 @@
+-- Índexs per a les consultes més freqüents dels endpoints
+CREATE INDEX IF NOT EXISTS idx_routes_created_at
+    ON routes (created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_routes_creator
+    ON routes (creator_id);
+
+CREATE INDEX IF NOT EXISTS idx_route_files_route
+    ON route_files (route_id, file_id);
+
+CREATE INDEX IF NOT EXISTS idx_route_cultural_items_route_distance
+    ON route_cultural_items (route_id, distance_m);
+
+CREATE INDEX IF NOT EXISTS idx_route_cultural_items_item_distance
+    ON route_cultural_items (item_id, distance_m);
+
+CREATE INDEX IF NOT EXISTS idx_cultural_items_lat_lon
+    ON cultural_items (latitude, longitude);
+
+CREATE INDEX IF NOT EXISTS idx_likes_user_route
+    ON likes (user_id, route_id);
+
+CREATE INDEX IF NOT EXISTS idx_likes_route
+    ON likes (route_id);
+
+CREATE INDEX IF NOT EXISTS idx_likes_user_created
+    ON likes (user_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_ratings_route_created
+    ON ratings (route_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_ratings_user_route
+    ON ratings (user_id, route_id);
+
+CREATE INDEX IF NOT EXISTS idx_user_preferences_user
+    ON user_preferences (user_id);
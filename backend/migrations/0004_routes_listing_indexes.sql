@@ -0,0 +1,42 @@
+-- Paginació per cursor (created_at, route_id) i filtres de GET /routes
+CREATE INDEX IF NOT EXISTS idx_routes_created_route
+    ON routes (created_at DESC, route_id DESC);
+
+-- Substituït per l'índex compost anterior
+DROP INDEX IF EXISTS idx_routes_created_at;
+
+CREATE INDEX IF NOT EXISTS idx_routes_difficulty_created_route
+    ON routes (difficulty, created_at DESC, route_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_routes_distance
+    ON routes (distance_km);
+
+CREATE INDEX IF NOT EXISTS idx_routes_elevation
+    ON routes (elevation_gain);
+
+-- Índexs parcials: els filtres culturals són molt selectius
+CREATE INDEX IF NOT EXISTS idx_routes_historical_created
+    ON routes (created_at DESC, route_id DESC) WHERE has_historical_value;
+
+CREATE INDEX IF NOT EXISTS idx_routes_archaeology_created
+    ON routes (created_at DESC, route_id DESC) WHERE has_archaeology;
+
+CREATE INDEX IF NOT EXISTS idx_routes_architecture_created
+    ON routes (created_at DESC, route_id DESC) WHERE has_architecture;
+
+CREATE INDEX IF NOT EXISTS idx_routes_natural_created
+    ON routes (created_at DESC, route_id DESC) WHERE has_natural_interest;
+
+-- El cursor de la paginació keyset necessita la columna sempre informada
+UPDATE routes SET created_at = NOW() WHERE created_at IS NULL;
+
+-- Filtre per location (ILIKE '%...%') amb trigrames si l'extensió és disponible
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_routes_location_trgm
+        ON routes USING gin (location gin_trgm_ops);
+EXCEPTION WHEN insufficient_privilege OR undefined_file THEN
+    RAISE NOTICE 'pg_trgm no disponible: el filtre per location no tindrà índex';
+END
+$$;
@@ -0,0 +1,8 @@
+-- La dificultat és una dada derivada: es guarda la versió de la fórmula
+-- amb què s'ha calculat (services/difficulty_calculator.DIFFICULTY_FORMULA_VERSION).
+-- Les files existents queden amb versió 0 i update_difficulties.py les recalcula.
+ALTER TABLE routes
+    ADD COLUMN IF NOT EXISTS difficulty_version INT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_routes_difficulty_version
+    ON routes (difficulty_version);
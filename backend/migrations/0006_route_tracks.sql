@@ -0,0 +1,19 @@
+-- Track parsejat i compactat de cada fitxer GPX (s'omple en pujar el fitxer).
+-- lat/lon: int32 little-endian en graus * 1e7; ele: float32 little-endian (NaN si no n'hi ha)
+CREATE TABLE IF NOT EXISTS route_tracks (
+    file_id INT PRIMARY KEY REFERENCES route_files(file_id) ON DELETE CASCADE,
+    route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+    point_count INT NOT NULL,
+    lat_e7 BYTEA NOT NULL,
+    lon_e7 BYTEA NOT NULL,
+    ele BYTEA,
+    min_lat DOUBLE PRECISION NOT NULL,
+    max_lat DOUBLE PRECISION NOT NULL,
+    min_lon DOUBLE PRECISION NOT NULL,
+    max_lon DOUBLE PRECISION NOT NULL,
+    length_m DOUBLE PRECISION NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_route_tracks_route
+    ON route_tracks (route_id, file_id);
@@ -0,0 +1,39 @@
+-- Cua de treballs en segon pla (recàlculs pesats fora de les peticions HTTP).
+-- Els workers agafen feina amb SELECT ... FOR UPDATE SKIP LOCKED.
+-- priority: com més baix, abans s'executa.
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    dedupe_key TEXT,
+    priority INT NOT NULL DEFAULT 100,
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_by TEXT,
+    locked_at TIMESTAMPTZ,
+    last_error TEXT,
+    result JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+-- Un sol treball pendent per (kind, dedupe_key): els duplicats s'hi fusionen
+CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_queued_dedupe
+    ON jobs (kind, dedupe_key)
+    WHERE status = 'queued' AND dedupe_key IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_jobs_ready
+    ON jobs (priority, run_after, job_id)
+    WHERE status = 'queued';
+
+CREATE INDEX IF NOT EXISTS idx_jobs_running
+    ON jobs (locked_at)
+    WHERE status = 'running';
+
+CREATE INDEX IF NOT EXISTS idx_jobs_finished
+    ON jobs (finished_at)
+    WHERE status IN ('done', 'failed');
@@ -0,0 +1,11 @@
+-- Tier compartit de la cache de /routing/walking (ROUTING_CACHE_SHARED=1).
+-- cache_key: backend + coordenades d'inici i final arrodonides a la graella.
+CREATE TABLE IF NOT EXISTS routing_cache (
+    cache_key TEXT PRIMARY KEY,
+    value JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_routing_cache_expires
+    ON routing_cache (expires_at);
@@ -0,0 +1,34 @@
+-- Agregats d'aprenentatge per usuari (sumes acumulades de les rutes completades).
+-- S'actualitzen a la mateixa transacció que user_route_completions, de manera que
+-- les preferències efectives es llegeixen en O(1) en lloc de reagregar l'historial.
+-- El rang de dificultat és el de social_routes: 0 fàcil, 1 mitjana, 2 difícil, 3 molt difícil.
+CREATE TABLE IF NOT EXISTS user_learning_stats (
+    user_id INT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    total_completions INT NOT NULL DEFAULT 0,
+    sum_distance_km DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_elevation_gain DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sum_difficulty_rank DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO user_learning_stats (
+    user_id, total_completions, sum_distance_km, sum_elevation_gain, sum_difficulty_rank
+)
+SELECT
+    urc.user_id,
+    SUM(urc.completion_count),
+    SUM(urc.completion_count * COALESCE(r.distance_km, 0)),
+    SUM(urc.completion_count * COALESCE(r.elevation_gain, 0)),
+    SUM(
+        urc.completion_count *
+        CASE
+            WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%molt%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%muy%' THEN 3
+            WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%dif%' THEN 2
+            WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%mitj%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%moder%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%media%' THEN 1
+            ELSE 0
+        END
+    )
+FROM user_route_completions urc
+JOIN routes r ON r.route_id = urc.route_id
+GROUP BY urc.user_id
+ON CONFLICT (user_id) DO NOTHING;
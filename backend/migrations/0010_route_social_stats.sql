@@ -0,0 +1,30 @@
+-- Comptadors de likes i valoracions per ruta, mantinguts a la mateixa transacció
+-- que likes/ratings (like, unlike, rate) en lloc de COUNT(*) a cada consulta.
+-- Taula a part de routes perquè un like no reescrigui la fila de la ruta.
+CREATE TABLE IF NOT EXISTS route_social_stats (
+    route_id INT PRIMARY KEY REFERENCES routes(route_id) ON DELETE CASCADE,
+    like_count INT NOT NULL DEFAULT 0,
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_sum BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO route_social_stats (route_id, like_count, rating_count, rating_sum)
+SELECT
+    r.route_id,
+    COALESCE(l.like_count, 0),
+    COALESCE(rt.rating_count, 0),
+    COALESCE(rt.rating_sum, 0)
+FROM routes r
+LEFT JOIN (
+    SELECT route_id, COUNT(*) AS like_count
+    FROM likes
+    GROUP BY route_id
+) l ON l.route_id = r.route_id
+LEFT JOIN (
+    SELECT route_id, COUNT(*) AS rating_count, SUM(score) AS rating_sum
+    FROM ratings
+    GROUP BY route_id
+) rt ON rt.route_id = r.route_id
+WHERE l.route_id IS NOT NULL OR rt.route_id IS NOT NULL
+ON CONFLICT (route_id) DO NOTHING;
@@ -0,0 +1,39 @@
+-- user_learning_stats passa a ser el resum complet de /routes/stats/me:
+-- rutes úniques, completions per franja de dificultat i primera/última completion.
+-- Les franges són les de personal_stats (fàcil, mitjana, difícil, molt difícil).
+ALTER TABLE user_learning_stats
+    ADD COLUMN IF NOT EXISTS completed_routes_unique INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS easy_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS medium_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS hard_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS very_hard_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS first_completed_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS last_completed_at TIMESTAMPTZ;
+
+UPDATE user_learning_stats s
+SET completed_routes_unique = a.completed_routes_unique,
+    easy_count = a.easy_count,
+    medium_count = a.medium_count,
+    hard_count = a.hard_count,
+    very_hard_count = a.very_hard_count,
+    first_completed_at = a.first_completed_at,
+    last_completed_at = a.last_completed_at
+FROM (
+    SELECT
+        urc.user_id,
+        COUNT(*) AS completed_routes_unique,
+        SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%fàcil%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%facil%' THEN urc.completion_count ELSE 0 END) AS easy_count,
+        SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%mitj%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%moder%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%media%' THEN urc.completion_count ELSE 0 END) AS medium_count,
+        SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%dif%' AND LOWER(COALESCE(r.difficulty, '')) NOT LIKE '%molt%' AND LOWER(COALESCE(r.difficulty, '')) NOT LIKE '%muy%' THEN urc.completion_count ELSE 0 END) AS hard_count,
+        SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%molt%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%muy%' THEN urc.completion_count ELSE 0 END) AS very_hard_count,
+        MIN(urc.first_completed_at) AS first_completed_at,
+        MAX(urc.last_completed_at) AS last_completed_at
+    FROM user_route_completions urc
+    JOIN routes r ON r.route_id = urc.route_id
+    GROUP BY urc.user_id
+) a
+WHERE s.user_id = a.user_id;
+
+-- Top 5 de rutes més completades per usuari sense ordenar tot l'historial
+CREATE INDEX IF NOT EXISTS idx_urc_user_count_last
+    ON user_route_completions (user_id, completion_count DESC, last_completed_at DESC);
@@ -0,0 +1,178 @@
+-- Versions per recurs per a ETag / 304 (services/http_cache.py).
+-- Els triggers incrementen la versió un cop per sentència INSERT/UPDATE/DELETE
+-- (no per fila: una càrrega massiva només toca cada clau una vegada), de manera que
+-- qualsevol procés que escrigui (API, worker, scripts) invalida les respostes.
+-- Recursos: "<taula>" (tota la taula) i "<taula>:<id>" (per ruta o per usuari).
+CREATE TABLE IF NOT EXISTS resource_versions (
+    resource TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Arguments: nom del recurs, columna d'àmbit (opcional), 'global' per
+-- incrementar també el recurs de tota la taula quan hi ha àmbit.
+-- Triggers per sentència amb taules de transició (new_rows / old_rows): les
+-- claus per àmbit s'escriuen amb un sol INSERT ... SELECT DISTINCT.
+CREATE OR REPLACE FUNCTION bump_resource_version() RETURNS trigger AS $$
+DECLARE
+    res TEXT := TG_ARGV[0];
+    col TEXT := CASE WHEN TG_NARGS > 1 THEN TG_ARGV[1] END;
+    with_global BOOLEAN := TG_NARGS = 1 OR (TG_NARGS > 2 AND TG_ARGV[2] = 'global');
+    sources TEXT[] := ARRAY[]::TEXT[];
+    src TEXT;
+    touched BOOLEAN;
+    keys_sql TEXT[] := ARRAY[]::TEXT[];
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        sources := sources || 'new_rows'::TEXT;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        sources := sources || 'old_rows'::TEXT;
+    END IF;
+
+    -- Una sentència que no toca cap fila no canvia cap versió
+    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I)', sources[1]) INTO touched;
+    IF NOT touched THEN
+        RETURN NULL;
+    END IF;
+
+    IF col IS NOT NULL THEN
+        FOREACH src IN ARRAY sources LOOP
+            keys_sql := keys_sql || format('SELECT %L || '':'' || %I FROM %I', res, col, src);
+        END LOOP;
+    END IF;
+    IF with_global THEN
+        keys_sql := keys_sql || format('SELECT %L', res);
+    END IF;
+
+    -- Claus ordenades: dues sentències concurrents les bloquegen en el mateix ordre
+    EXECUTE format(
+        'INSERT INTO resource_versions (resource, version, updated_at)
+         SELECT k, 1, NOW() FROM (%s) AS s(k) WHERE k IS NOT NULL GROUP BY k ORDER BY k
+         ON CONFLICT (resource) DO UPDATE
+             SET version = resource_versions.version + 1,
+                 updated_at = NOW()',
+        array_to_string(keys_sql, ' UNION ')
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_routes_version ON routes;
+DROP TRIGGER IF EXISTS trg_routes_version_ins ON routes;
+DROP TRIGGER IF EXISTS trg_routes_version_upd ON routes;
+DROP TRIGGER IF EXISTS trg_routes_version_del ON routes;
+CREATE TRIGGER trg_routes_version_ins
+    AFTER INSERT ON routes
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('routes', 'route_id', 'global');
+CREATE TRIGGER trg_routes_version_upd
+    AFTER UPDATE ON routes
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('routes', 'route_id', 'global');
+CREATE TRIGGER trg_routes_version_del
+    AFTER DELETE ON routes
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('routes', 'route_id', 'global');
+
+DROP TRIGGER IF EXISTS trg_cultural_items_version ON cultural_items;
+DROP TRIGGER IF EXISTS trg_cultural_items_version_ins ON cultural_items;
+DROP TRIGGER IF EXISTS trg_cultural_items_version_upd ON cultural_items;
+DROP TRIGGER IF EXISTS trg_cultural_items_version_del ON cultural_items;
+CREATE TRIGGER trg_cultural_items_version_ins
+    AFTER INSERT ON cultural_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('cultural_items');
+CREATE TRIGGER trg_cultural_items_version_upd
+    AFTER UPDATE ON cultural_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('cultural_items');
+CREATE TRIGGER trg_cultural_items_version_del
+    AFTER DELETE ON cultural_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('cultural_items');
+
+DROP TRIGGER IF EXISTS trg_route_cultural_items_version ON route_cultural_items;
+DROP TRIGGER IF EXISTS trg_route_cultural_items_version_ins ON route_cultural_items;
+DROP TRIGGER IF EXISTS trg_route_cultural_items_version_upd ON route_cultural_items;
+DROP TRIGGER IF EXISTS trg_route_cultural_items_version_del ON route_cultural_items;
+CREATE TRIGGER trg_route_cultural_items_version_ins
+    AFTER INSERT ON route_cultural_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_cultural_items', 'route_id');
+CREATE TRIGGER trg_route_cultural_items_version_upd
+    AFTER UPDATE ON route_cultural_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_cultural_items', 'route_id');
+CREATE TRIGGER trg_route_cultural_items_version_del
+    AFTER DELETE ON route_cultural_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_cultural_items', 'route_id');
+
+DROP TRIGGER IF EXISTS trg_route_files_version ON route_files;
+DROP TRIGGER IF EXISTS trg_route_files_version_ins ON route_files;
+DROP TRIGGER IF EXISTS trg_route_files_version_upd ON route_files;
+DROP TRIGGER IF EXISTS trg_route_files_version_del ON route_files;
+CREATE TRIGGER trg_route_files_version_ins
+    AFTER INSERT ON route_files
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_files', 'route_id');
+CREATE TRIGGER trg_route_files_version_upd
+    AFTER UPDATE ON route_files
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_files', 'route_id');
+CREATE TRIGGER trg_route_files_version_del
+    AFTER DELETE ON route_files
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_files', 'route_id');
+
+DROP TRIGGER IF EXISTS trg_ratings_version ON ratings;
+DROP TRIGGER IF EXISTS trg_ratings_version_ins ON ratings;
+DROP TRIGGER IF EXISTS trg_ratings_version_upd ON ratings;
+DROP TRIGGER IF EXISTS trg_ratings_version_del ON ratings;
+CREATE TRIGGER trg_ratings_version_ins
+    AFTER INSERT ON ratings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('ratings', 'route_id');
+CREATE TRIGGER trg_ratings_version_upd
+    AFTER UPDATE ON ratings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('ratings', 'route_id');
+CREATE TRIGGER trg_ratings_version_del
+    AFTER DELETE ON ratings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('ratings', 'route_id');
+
+DROP TRIGGER IF EXISTS trg_user_route_completions_version ON user_route_completions;
+DROP TRIGGER IF EXISTS trg_user_route_completions_version_ins ON user_route_completions;
+DROP TRIGGER IF EXISTS trg_user_route_completions_version_upd ON user_route_completions;
+DROP TRIGGER IF EXISTS trg_user_route_completions_version_del ON user_route_completions;
+CREATE TRIGGER trg_user_route_completions_version_ins
+    AFTER INSERT ON user_route_completions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('completions', 'user_id');
+CREATE TRIGGER trg_user_route_completions_version_upd
+    AFTER UPDATE ON user_route_completions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('completions', 'user_id');
+CREATE TRIGGER trg_user_route_completions_version_del
+    AFTER DELETE ON user_route_completions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('completions', 'user_id');
+
+DROP TRIGGER IF EXISTS trg_route_social_stats_version ON route_social_stats;
+DROP TRIGGER IF EXISTS trg_route_social_stats_version_ins ON route_social_stats;
+DROP TRIGGER IF EXISTS trg_route_social_stats_version_upd ON route_social_stats;
+DROP TRIGGER IF EXISTS trg_route_social_stats_version_del ON route_social_stats;
+CREATE TRIGGER trg_route_social_stats_version_ins
+    AFTER INSERT ON route_social_stats
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_social');
+CREATE TRIGGER trg_route_social_stats_version_upd
+    AFTER UPDATE ON route_social_stats
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_social');
+CREATE TRIGGER trg_route_social_stats_version_del
+    AFTER DELETE ON route_social_stats
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_resource_version('route_social');
@@ -0,0 +1,69 @@
+-- Feed de canvis del catàleg de rutes (GET /routes/changes).
+-- updated_at: moment de l'últim canvi de la fila (informatiu per al client).
+-- change_txid: transacció que l'ha canviat; el cursor del feed avança per txid i
+-- només fins al xmin de la instantània, així una transacció llarga que faci
+-- commit més tard no pot quedar per darrere d'un cursor ja lliurat.
+ALTER TABLE routes
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS change_txid BIGINT;
+
+UPDATE routes
+SET updated_at = COALESCE(updated_at, created_at, NOW()),
+    change_txid = COALESCE(change_txid, 0)
+WHERE updated_at IS NULL OR change_txid IS NULL;
+
+ALTER TABLE routes
+    ALTER COLUMN updated_at SET DEFAULT NOW(),
+    ALTER COLUMN updated_at SET NOT NULL,
+    ALTER COLUMN change_txid SET DEFAULT txid_current(),
+    ALTER COLUMN change_txid SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_routes_change_txid
+    ON routes (change_txid, route_id);
+
+CREATE TABLE IF NOT EXISTS route_tombstones (
+    route_id INT PRIMARY KEY,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    change_txid BIGINT NOT NULL DEFAULT txid_current()
+);
+
+CREATE INDEX IF NOT EXISTS idx_route_tombstones_change_txid
+    ON route_tombstones (change_txid, route_id);
+
+CREATE OR REPLACE FUNCTION routes_track_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        -- Actualitzacions sense cap canvi (p. ex. resincronitzar booleans iguals) no compten
+        IF ROW(NEW.*) IS NOT DISTINCT FROM ROW(OLD.*) THEN
+            RETURN NEW;
+        END IF;
+    END IF;
+    NEW.updated_at := clock_timestamp();
+    NEW.change_txid := txid_current();
+    IF TG_OP = 'INSERT' THEN
+        DELETE FROM route_tombstones WHERE route_id = NEW.route_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION routes_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO route_tombstones (route_id, deleted_at, change_txid)
+    VALUES (OLD.route_id, clock_timestamp(), txid_current())
+    ON CONFLICT (route_id) DO UPDATE
+        SET deleted_at = EXCLUDED.deleted_at,
+            change_txid = EXCLUDED.change_txid;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_routes_track_change ON routes;
+CREATE TRIGGER trg_routes_track_change
+    BEFORE INSERT OR UPDATE ON routes
+    FOR EACH ROW EXECUTE FUNCTION routes_track_change();
+
+DROP TRIGGER IF EXISTS trg_routes_tombstone ON routes;
+CREATE TRIGGER trg_routes_tombstone
+    AFTER DELETE ON routes
+    FOR EACH ROW EXECUTE FUNCTION routes_tombstone();
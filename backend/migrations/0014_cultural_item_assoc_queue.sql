@@ -0,0 +1,53 @@
+-- Associació incremental ítem cultural -> rutes (services/item_association.py).
+-- Els ítems inserits o moguts queden a la cua i s'encua (un sol cop) el treball
+-- cultural_items_associate, que els mesura només contra les rutes la caixa de
+-- les quals, ampliada pel radi, els conté.
+CREATE TABLE IF NOT EXISTS cultural_item_assoc_queue (
+    item_id INT PRIMARY KEY,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_cultural_item_assoc_queue_queued_at
+    ON cultural_item_assoc_queue (queued_at);
+
+-- Triggers per sentència: una càrrega massiva encua tots els ítems amb un sol INSERT
+CREATE OR REPLACE FUNCTION queue_cultural_item_assoc() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO cultural_item_assoc_queue (item_id)
+        SELECT n.item_id
+        FROM new_rows n
+        WHERE n.latitude IS NOT NULL AND n.longitude IS NOT NULL
+        ON CONFLICT (item_id) DO UPDATE SET queued_at = NOW();
+    ELSE
+        INSERT INTO cultural_item_assoc_queue (item_id)
+        SELECT n.item_id
+        FROM new_rows n
+        JOIN old_rows o ON o.item_id = n.item_id
+        WHERE n.latitude IS NOT NULL AND n.longitude IS NOT NULL
+          AND (n.latitude, n.longitude) IS DISTINCT FROM (o.latitude, o.longitude)
+        ON CONFLICT (item_id) DO UPDATE SET queued_at = NOW();
+    END IF;
+
+    IF FOUND THEN
+        INSERT INTO jobs (kind, dedupe_key)
+        VALUES ('cultural_items_associate', 'queue')
+        ON CONFLICT (kind, dedupe_key) WHERE status = 'queued' AND dedupe_key IS NOT NULL
+        DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Les taules de transició no admeten més d'un esdeveniment per trigger
+DROP TRIGGER IF EXISTS trg_cultural_items_assoc_insert ON cultural_items;
+CREATE TRIGGER trg_cultural_items_assoc_insert
+    AFTER INSERT ON cultural_items
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION queue_cultural_item_assoc();
+
+DROP TRIGGER IF EXISTS trg_cultural_items_assoc_update ON cultural_items;
+CREATE TRIGGER trg_cultural_items_assoc_update
+    AFTER UPDATE ON cultural_items
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION queue_cultural_item_assoc();
@@ -0,0 +1,43 @@
+-- Empremtes de track per detectar rutes duplicades (services/track_fingerprint.py).
+-- signature: MinHash (uint32 little-endian) del conjunt de cel·les geohash del track;
+-- route_fingerprint_bands: una fila per banda LSH, així els candidats d'una ruta
+-- surten d'una consulta per índex en lloc de comparar-la amb tot el catàleg.
+CREATE TABLE IF NOT EXISTS route_fingerprints (
+    route_id INT PRIMARY KEY REFERENCES routes(route_id) ON DELETE CASCADE,
+    file_id INT NOT NULL,
+    version SMALLINT NOT NULL,
+    cell_count INT NOT NULL,
+    signature BYTEA NOT NULL,
+    length_m DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS route_fingerprint_bands (
+    band SMALLINT NOT NULL,
+    bucket BIGINT NOT NULL,
+    route_id INT NOT NULL REFERENCES route_fingerprints(route_id) ON DELETE CASCADE,
+    PRIMARY KEY (band, bucket, route_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_route_fingerprint_bands_route
+    ON route_fingerprint_bands (route_id);
+
+-- Parelles confirmades (route_id és la ruta més nova, duplicate_of la més antiga).
+-- kind: duplicate (Fréchet discreta dins el llindar) o near_duplicate (Hausdorff).
+CREATE TABLE IF NOT EXISTS route_duplicates (
+    route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+    duplicate_of INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    frechet_m REAL NOT NULL,
+    hausdorff_m REAL NOT NULL,
+    reversed BOOLEAN NOT NULL DEFAULT FALSE,
+    detected_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (route_id, duplicate_of)
+);
+
+CREATE INDEX IF NOT EXISTS idx_route_duplicates_duplicate_of
+    ON route_duplicates (duplicate_of);
+
+CREATE INDEX IF NOT EXISTS idx_route_duplicates_detected_at
+    ON route_duplicates (detected_at DESC);
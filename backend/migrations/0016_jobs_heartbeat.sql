@@ -0,0 +1,10 @@
+-- Batec dels treballs en execució: el worker l'actualitza periòdicament des d'una
+-- connexió pròpia, i requeue_stale només torna a la cua els treballs sense batec
+-- recent (worker mort), no els que simplement triguen més que JOBS_STALE_AFTER_S.
+ALTER TABLE jobs
+    ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ;
+
+DROP INDEX IF EXISTS idx_jobs_running;
+CREATE INDEX IF NOT EXISTS idx_jobs_running_heartbeat
+    ON jobs ((COALESCE(heartbeat_at, locked_at)))
+    WHERE status = 'running';
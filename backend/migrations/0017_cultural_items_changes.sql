@@ -0,0 +1,65 @@
+-- Canvis de cultural_items per al refresc incremental de l'índex espacial en
+-- memòria (services/spatial_index.py). Com a 0013: change_txid és la transacció
+-- que ha inserit o canviat la fila i els esborrats deixen una làpida, així cada
+-- procés aplica els ítems nous, moguts i esborrats sense recarregar tota la taula.
+ALTER TABLE cultural_items
+    ADD COLUMN IF NOT EXISTS change_txid BIGINT;
+
+UPDATE cultural_items
+SET change_txid = 0
+WHERE change_txid IS NULL;
+
+ALTER TABLE cultural_items
+    ALTER COLUMN change_txid SET DEFAULT txid_current(),
+    ALTER COLUMN change_txid SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_cultural_items_change_txid
+    ON cultural_items (change_txid);
+
+CREATE TABLE IF NOT EXISTS cultural_item_tombstones (
+    item_id INT PRIMARY KEY,
+    change_txid BIGINT NOT NULL DEFAULT txid_current()
+);
+
+CREATE INDEX IF NOT EXISTS idx_cultural_item_tombstones_change_txid
+    ON cultural_item_tombstones (change_txid);
+
+CREATE OR REPLACE FUNCTION cultural_items_track_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        -- L'índex només guarda posició i tipus: la resta de canvis no compten
+        IF (NEW.latitude, NEW.longitude, NEW.item_type)
+           IS NOT DISTINCT FROM (OLD.latitude, OLD.longitude, OLD.item_type) THEN
+            RETURN NEW;
+        END IF;
+    END IF;
+    NEW.change_txid := txid_current();
+    IF TG_OP = 'INSERT' THEN
+        DELETE FROM cultural_item_tombstones WHERE item_id = NEW.item_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Per sentència: una neteja massiva escriu totes les làpides amb un sol INSERT
+CREATE OR REPLACE FUNCTION cultural_items_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO cultural_item_tombstones (item_id, change_txid)
+    SELECT o.item_id, txid_current()
+    FROM old_rows o
+    ON CONFLICT (item_id) DO UPDATE
+        SET change_txid = EXCLUDED.change_txid;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_cultural_items_track_change ON cultural_items;
+CREATE TRIGGER trg_cultural_items_track_change
+    BEFORE INSERT OR UPDATE ON cultural_items
+    FOR EACH ROW EXECUTE FUNCTION cultural_items_track_change();
+
+DROP TRIGGER IF EXISTS trg_cultural_items_tombstone ON cultural_items;
+CREATE TRIGGER trg_cultural_items_tombstone
+    AFTER DELETE ON cultural_items
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION cultural_items_tombstone();
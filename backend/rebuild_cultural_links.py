@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Reconstrueix route_cultural_items per a tot el catàleg amb un sol join
+espacial de tots els tracks guardats contra tots els ítems culturals
+(en lloc d'un POST /routes/<id>/cultural-items/recompute per ruta).
+
+Ús:
+    python rebuild_cultural_links.py                    # radi 150 m, 1 procés
+    python rebuild_cultural_links.py --processes 4 --radius 200
+    python rebuild_cultural_links.py --dry-run          # calcula i desfà, sense escriure
+"""
+
+import argparse
+import os
+import sys
+
+from db import get_connection
+from routes.route_cultural_routes import _sync_route_cultural_booleans
+from services.spatial_join import run_catalog_join
+
+
+def _print_progress(done, total, links, elapsed_s):
+    rate = done / elapsed_s if elapsed_s > 0 else 0.0
+    pct = 100.0 * done / total if total else 100.0
+    print(f"  {done}/{total} rutes ({pct:5.1f}%) · {links} enllaços · {rate:.1f} rutes/s", flush=True)
+
+
+def rebuild(radius_m: float, processes: int, chunk_size: int, dry_run: bool = False):
+    conn = get_connection()
+    try:
+        print("=" * 70)
+        print("JOIN ESPACIAL DE TOT EL CATÀLEG: RUTES <-> ÍTEMS CULTURALS")
+        print("=" * 70)
+        print()
+        print(f"Radi: {radius_m:g} m · processos: {processes} · rutes per lot: {chunk_size}")
+        print()
+
+        result = run_catalog_join(conn, radius_m, processes, chunk_size, progress=_print_progress)
+        changed = result["changed_route_ids"]
+        for route_id in changed:
+            _sync_route_cultural_booleans(conn, route_id)
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    join_s = max(result["join_s"], 1e-9)
+    print()
+    print(f"Rutes: {result['routes']} ({result['routes'] / join_s:.1f} rutes/s)")
+    print(f"Ítems: {result['items']} ({result['items'] * result['routes'] / join_s:,.0f} parells ruta-ítem/s)")
+    print(f"Enllaços: {result['links']} · rutes amb canvis: {len(changed)}")
+    print(f"Temps: join {result['join_s']:.1f} s · total {result['total_s']:.1f} s")
+    print()
+    print("=" * 70)
+    print("✓ Simulació acabada (sense canvis)" if dry_run else "✓ route_cultural_items reconstruïda")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Join espacial de tots els tracks contra tots els ítems culturals")
+    parser.add_argument("--radius", type=float, default=150.0, help="radi en metres (per defecte 150)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=50, help="tracks per tasca del pool")
+    parser.add_argument("--dry-run", action="store_true", help="no escriu res")
+    args = parser.parse_args()
+
+    try:
+        rebuild(args.radius, max(1, args.processes), max(1, args.chunk_size), args.dry_run)
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Reconstrueix o comprova el resum per usuari de rutes completades
+(user_learning_stats), que es manté incrementalment a cada completion.
+
+Ús:
+    python rebuild_user_stats.py               # recalcula tots els usuaris
+    python rebuild_user_stats.py --user 42     # només un usuari
+    python rebuild_user_stats.py --check       # compara amb un recàlcul complet, sense escriure
+"""
+
+import argparse
+import sys
+
+from db import get_connection
+from services.learning_stats import check_learning_stats, rebuild_learning_stats
+
+
+def rebuild(user_id: int = None):
+    conn = get_connection()
+    try:
+        print("=" * 70)
+        print("RECONSTRUCCIÓ DEL RESUM D'ESTADÍSTIQUES PER USUARI")
+        print("=" * 70)
+        print()
+        users = rebuild_learning_stats(conn, user_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"✓ Resum recalculat per a {users} usuari(s)")
+    print("=" * 70)
+    print()
+
+
+def check(user_id: int = None, limit: int = 100) -> bool:
+    conn = get_connection()
+    try:
+        print("=" * 70)
+        print("COMPROVACIÓ DEL RESUM D'ESTADÍSTIQUES PER USUARI")
+        print("=" * 70)
+        print()
+        result = check_learning_stats(conn, user_id, limit=limit)
+    finally:
+        conn.close()
+
+    mismatches = result["mismatches"]
+    for m in mismatches:
+        print(f"  ✗ usuari {m['user_id']}: {m['column']} = {m['rollup']} (esperat {m['expected']})")
+    if mismatches:
+        print()
+        print(f"✗ {len(mismatches)} diferència(es) en {result['checked']} usuari(s). "
+              "Executa python rebuild_user_stats.py per corregir-les.")
+    else:
+        print(f"✓ {result['checked']} usuari(s) consistents")
+    print("=" * 70)
+    print()
+    return not mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstrueix o comprova user_learning_stats")
+    parser.add_argument("--user", type=int, default=None, help="només aquest user_id")
+    parser.add_argument("--check", action="store_true", help="només compara, no escriu")
+    parser.add_argument("--limit", type=int, default=100, help="màxim de diferències a mostrar")
+    args = parser.parse_args()
+
+    try:
+        if args.check:
+            sys.exit(0 if check(args.user, args.limit) else 1)
+        rebuild(args.user)
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,74 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+
+from db import get_connection
+from services import jobs
+from services.admin import is_admin
+
+jobs_bp = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+_JOB_STATUSES = {"queued", "running", "done", "failed"}
+
+# El payload i l'últim error (traça completa) només es veuen des del worker
+_PRIVATE_FIELDS = ("payload", "last_error", "locked_by")
+
+
+def _public(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k not in _PRIVATE_FIELDS}
+
+
+@jobs_bp.get("/<int:job_id>")
+@jwt_required()
+def get_job(job_id: int):
+    """Estat d'un treball en segon pla (queued, running, done, failed)."""
+    conn = get_connection()
+    try:
+        job = jobs.get_job(conn, job_id)
+    finally:
+        conn.close()
+
+    if job is None:
+        return jsonify({"error": "Treball no trobat"}), 404
+    return jsonify(_public(job)), 200
+
+
+@jobs_bp.get("")
+@jwt_required()
+def list_jobs():
+    """
+    GET /jobs?status=failed&kind=cultural_item_routes&limit=50
+    Treballs més recents primer. Només per als usuaris d'ADMIN_USER_IDS.
+    """
+    if not is_admin(get_jwt_identity()):
+        return jsonify({"error": "No tens permís per veure aquest informe"}), 403
+
+    status = (request.args.get("status") or "").strip().lower() or None
+    kind = (request.args.get("kind") or "").strip() or None
+    limit = request.args.get("limit", default=50, type=int)
+    limit = max(1, min(limit, 200))
+
+    if status is not None and status not in _JOB_STATUSES:
+        return jsonify({"error": f"Estat invàlid: {status}"}), 400
+
+    conn = get_connection()
+    try:
+        return jsonify([_public(j) for j in jobs.list_jobs(conn, status=status, kind=kind, limit=limit)]), 200
+    finally:
+        conn.close()
+
+
+@jobs_bp.get("/stats")
+@jwt_required()
+def job_stats():
+    """
+    Nombre de treballs per tipus i estat, i antiguitat del més antic pendent.
+    Només per als usuaris d'ADMIN_USER_IDS.
+    """
+    if not is_admin(get_jwt_identity()):
+        return jsonify({"error": "No tens permís per veure aquest informe"}), 403
+
+    conn = get_connection()
+    try:
+        return jsonify(jobs.queue_stats(conn)), 200
+    finally:
+        conn.close()
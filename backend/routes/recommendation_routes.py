@@ -0,0 +1,156 @@
+import numpy as np
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from db import get_connection
+from routes.routes_routes import _parse_bool_arg
+from routes.social_routes import _load_adaptive_snapshot
+from services.recommendation import CULTURAL_BOOST_WEIGHT, difficulty_rank, route_features
+
+recommendation_bp = Blueprint("recommendations", __name__, url_prefix="/routes")
+
+_MAX_K = 100
+
+
+def _load_cultural_interest(conn, user_id: int):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT cultural_interest FROM user_preferences WHERE user_id = %s",
+            (user_id,),
+        )
+        row = cur.fetchone()
+    return (row[0] if row else None) or "mitja"
+
+
+def _load_route_rows(conn, user_id: int, route_ids):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT
+                r.route_id, r.name, r.description, r.distance_km, r.difficulty,
+                r.elevation_gain, r.location, r.estimated_time, r.creator_id,
+                r.cultural_summary, r.has_historical_value, r.has_archaeology,
+                r.has_architecture, r.has_natural_interest, r.created_at,
+                u.name AS creator_name,
+                (urc.route_id IS NOT NULL) AS completed_by_user
+            FROM routes r
+            LEFT JOIN users u ON u.user_id = r.creator_id
+            LEFT JOIN user_route_completions urc
+              ON urc.route_id = r.route_id AND urc.user_id = %s
+            WHERE r.route_id = ANY(%s)
+            """,
+            (user_id, list(route_ids)),
+        )
+        return {int(r[0]): r for r in cur.fetchall()}
+
+
+def _completed_route_ids(conn, user_id: int):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT route_id FROM user_route_completions WHERE user_id = %s",
+            (user_id,),
+        )
+        return [int(r[0]) for r in cur.fetchall()]
+
+
+@recommendation_bp.get("/recommendations")
+@jwt_required()
+def recommended_routes():
+    """
+    GET /routes/recommendations?k=10
+    Les k rutes amb més puntuació per a les preferències efectives de l'usuari.
+    Opcional: distance (km) i max_difficulty per sobreescriure-les,
+    boost_culture=true, strict=true (descarta les que superen la dificultat)
+    i exclude_completed=true.
+    """
+    user_id = int(get_jwt_identity())
+
+    try:
+        k = int(request.args.get("k", 10))
+    except ValueError:
+        return jsonify({"error": "k ha de ser un número"}), 400
+    k = max(1, min(k, _MAX_K))
+
+    try:
+        distance = request.args.get("distance")
+        distance = float(distance) if distance not in (None, "") else None
+    except ValueError:
+        return jsonify({"error": "distance ha de ser un número"}), 400
+
+    try:
+        boost_culture = bool(_parse_bool_arg(request.args.get("boost_culture")))
+        strict = bool(_parse_bool_arg(request.args.get("strict")))
+        exclude_completed = bool(_parse_bool_arg(request.args.get("exclude_completed")))
+    except ValueError:
+        return jsonify({"error": "boost_culture, strict i exclude_completed han de ser true o false"}), 400
+
+    conn = get_connection()
+    try:
+        adaptive = _load_adaptive_snapshot(conn, user_id)
+        cultural_interest = _load_cultural_interest(conn, user_id)
+
+        preferred_distance = distance if distance is not None else float(adaptive["effective_preferred_distance"])
+        max_difficulty = (request.args.get("max_difficulty") or "").strip() or adaptive["effective_max_difficulty"]
+        max_rank = difficulty_rank(max_difficulty)
+
+        # Una sola passada vectoritzada sobre tot el catàleg
+        matrix = route_features.get(conn)
+        scores = matrix.score(
+            preferred_distance,
+            max_difficulty_rank=max_rank,
+            cultural_interest=cultural_interest,
+            cultural_boost=CULTURAL_BOOST_WEIGHT if boost_culture else 1.0,
+        )
+
+        mask = None
+        if strict:
+            mask = matrix.difficulty_rank <= max_rank
+        if exclude_completed:
+            completed = _completed_route_ids(conn, user_id)
+            if completed:
+                not_done = ~np.isin(matrix.route_ids, completed)
+                mask = not_done if mask is None else (mask & not_done)
+
+        top = matrix.top_k(scores, k, mask=mask)
+        top_ids = matrix.route_ids[top].tolist()
+        top_scores = scores[top].tolist()
+        rows = _load_route_rows(conn, user_id, top_ids) if top_ids else {}
+    finally:
+        conn.close()
+
+    out = []
+    for route_id, score in zip(top_ids, top_scores):
+        r = rows.get(route_id)
+        if r is None:
+            # Esborrada després de l'última actualització de la matriu
+            continue
+        out.append({
+            "route_id": r[0],
+            "name": r[1],
+            "description": r[2] or "",
+            "distance_km": float(r[3] or 0),
+            "difficulty": r[4] or "",
+            "elevation_gain": int(r[5] or 0),
+            "location": r[6] or "",
+            "estimated_time": r[7] or "",
+            "creator_id": int(r[8]),
+            "cultural_summary": r[9] or "",
+            "has_historical_value": bool(r[10]),
+            "has_archaeology": bool(r[11]),
+            "has_architecture": bool(r[12]),
+            "has_natural_interest": bool(r[13]),
+            "created_at": r[14].isoformat() if r[14] else None,
+            "creator_name": r[15],
+            "completed_by_user": bool(r[16]),
+            "score": round(score, 3),
+        })
+
+    return jsonify({
+        "preferences": {
+            "preferred_distance": preferred_distance,
+            "max_difficulty": max_difficulty,
+            "cultural_interest": cultural_interest,
+            "boost_culture": boost_culture,
+        },
+        "routes": out,
+    }), 200
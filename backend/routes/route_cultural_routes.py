@@ -1,9 +1,14 @@
 import requests
 from flask import Blueprint, jsonify, request
+from psycopg2.extras import execute_values
 
 from db import get_connection
-from services.gpx_parser import parse_gpx_points
-from services.geo_utils import haversine_m, bbox_for_radius
+from services import jobs
+from services.gpx_parser import parse_gpx_track
+from services.http_cache import conditional_get, http_cache
+from services.recommendation import route_features
+from services.spatial_index import cultural_index
+from services.track_store import TrackUnavailable, load_track, save_track
 
 route_cultural_bp = Blueprint("route_cultural", __name__, url_prefix="/routes")
 
@@ -93,122 +98,157 @@ def sync_route_cultural_booleans(route_id: int):
     try:
         _sync_route_cultural_booleans(conn, route_id)
         conn.commit()
+        route_features.mark_dirty([route_id])
+        http_cache.invalidate(["routes", f"routes:{route_id}"])
         return jsonify({"route_id": route_id, "status": "ok"}), 200
     finally:
         conn.close()
 
-def _get_gpx_url_for_route(conn, route_id: int):
+def _get_gpx_files_for_routes(conn, route_ids):
+    """route_id -> (file_id, url) del GPX de cada ruta, en una sola consulta."""
+    route_ids = [int(r) for r in route_ids]
+    if not route_ids:
+        return {}
+
     with conn.cursor() as cur:
         # Probamos primero file_path (tu esquema original)
         try:
             cur.execute("""
-                select file_path, file_type
+                select route_id, file_id, file_path, file_type
                 from route_files
-                where route_id = %s
-                order by file_id asc
-            """, (route_id,))
+                where route_id = any(%s)
+                order by route_id asc, file_id asc
+            """, (route_ids,))
             files = cur.fetchall()
-            col_is_path = True
         except Exception:
             # fallback si en tu proyecto se llama file_url
             conn.rollback()
             cur.execute("""
-                select file_url, file_type
+                select route_id, file_id, file_url, file_type
                 from route_files
-                where route_id = %s
-                order by file_id asc
-            """, (route_id,))
+                where route_id = any(%s)
+                order by route_id asc, file_id asc
+            """, (route_ids,))
             files = cur.fetchall()
-            col_is_path = False
 
-    if not files:
-        return None
+    # El primer GPX de cada ruta; si no en té cap, el primer fitxer
+    out = {}
+    for route_id, file_id, file_val, file_type in files:
+        route_id = int(route_id)
+        is_gpx = str(file_type).upper() == "GPX"
+        if route_id not in out or (is_gpx and not out[route_id][2]):
+            out[route_id] = (file_id, file_val, is_gpx)
+
+    return {rid: (file_id, url) for rid, (file_id, url, _) in out.items()}
+
+
+def _get_gpx_file_for_route(conn, route_id: int):
+    """(file_id, url) del GPX de la ruta, o None."""
+    return _get_gpx_files_for_routes(conn, [route_id]).get(int(route_id))
+
+
+def _load_route_track(conn, route_id: int, timeout: float = 15):
+    """
+    Track compacte de la ruta. Si encara no està guardat (rutes anteriors al
+    track store), es descarrega i es parseja el GPX una sola vegada i es
+    desa a route_tracks (el commit el fa qui crida).
+    """
+    track = load_track(conn, route_id)
+    if track is not None:
+        return track
 
-    for file_val, file_type in files:
-        if str(file_type).upper() == "GPX":
-            return file_val
+    gpx = _get_gpx_file_for_route(conn, route_id)
+    if not gpx:
+        raise TrackUnavailable("no_gpx")
+    file_id, gpx_url = gpx
 
-    return files[0][0]
+    r = requests.get(gpx_url, timeout=timeout)
+    if r.status_code != 200:
+        raise TrackUnavailable("download")
+
+    lats, lons, eles = parse_gpx_track(r.content)
+    if len(lats) < 2:
+        raise TrackUnavailable("points")
+
+    return save_track(conn, file_id, route_id, lats, lons, eles)
+
+
+def _recompute_route_cultural_items(conn, route_id: int, radius_m: int) -> int:
+    """
+    Calcula items culturales cercanos al track GPX y los guarda en route_cultural_items.
+    La distancia se mide exacta contra los segmentos del track completo.
+    Devuelve el número de items asociados (lanza TrackUnavailable).
+    """
+    track = _load_route_track(conn, route_id)
+
+    # limpiar asociaciones previas (recompute real)
+    with conn.cursor() as cur:
+        cur.execute("delete from route_cultural_items where route_id = %s", (route_id,))
+
+    # item_id -> min_distance_m, en una sola consulta sobre l'índex en memòria
+    index = cultural_index.get(conn)
+    found = index.query_polyline(track.lats, track.lons, radius_m)
+
+    # insertar
+    if found:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                insert into route_cultural_items(route_id, item_id, distance_m)
+                values %s
+                on conflict (route_id, item_id) do nothing
+            """, [(route_id, item_id, int(round(dist))) for item_id, dist in found.items()])
+
+    # Els booleans només canvien quan canvien les associacions
+    _sync_route_cultural_booleans(conn, route_id)
+    return len(found)
 
 
 @route_cultural_bp.post("/<int:route_id>/cultural-items/recompute")
 def recompute_route_cultural_items(route_id: int):
     """
-    Calcula items culturales cercanos al track GPX y los guarda en route_cultural_items.
+    Encola el recàlcul dels items culturals de la ruta i respon 202.
     Body opcional:
       { "radius_m": 150, "step": 20 }
+    "step" s'accepta i es retorna per compatibilitat, però no té cap efecte:
+    la distància es mesura contra tots els segments del track.
+    L'estat es consulta a GET /jobs/<job_id>.
     """
     body = request.get_json(silent=True) or {}
     radius_m = int(body.get("radius_m", 150))
-    step = int(body.get("step", 20))  # 1 de cada 20 puntos
+    step = int(body.get("step", 20))
 
     conn = get_connection()
     try:
-        gpx_url = _get_gpx_url_for_route(conn, route_id)
-        if not gpx_url:
+        if _get_gpx_file_for_route(conn, route_id) is None:
             return jsonify({"error": "Aquesta ruta no té cap GPX associat"}), 400
 
-        # descargar gpx
-        r = requests.get(gpx_url, timeout=15)
-        if r.status_code != 200:
-            return jsonify({"error": "No s'ha pogut descarregar el GPX"}), 502
-
-        points = parse_gpx_points(r.text)
-        if len(points) < 2:
-            return jsonify({"error": "GPX sense punts suficients"}), 400
-
-        sampled = points[::max(step, 1)]
-
-        # limpiar asociaciones previas (recompute real)
-        with conn.cursor() as cur:
-            cur.execute("delete from route_cultural_items where route_id = %s", (route_id,))
-
-        found = {}  # item_id -> min_distance_m
-
-        with conn.cursor() as cur:
-            for (lat, lon) in sampled:
-                lat_min, lat_max, lon_min, lon_max = bbox_for_radius(lat, lon, radius_m)
-                cur.execute("""
-                    select item_id, latitude, longitude
-                    from cultural_items
-                    where latitude between %s and %s
-                      and longitude between %s and %s
-                """, (lat_min, lat_max, lon_min, lon_max))
-
-                for item_id, ilat, ilon in cur.fetchall():
-                    d = haversine_m(lat, lon, float(ilat), float(ilon))
-                    if d <= radius_m:
-                        prev = found.get(item_id)
-                        if prev is None or d < prev:
-                            found[item_id] = d
-
-        # insertar
-        with conn.cursor() as cur:
-            for item_id, dist in found.items():
-                cur.execute("""
-                    insert into route_cultural_items(route_id, item_id, distance_m)
-                    values (%s, %s, %s)
-                    on conflict (route_id, item_id) do nothing
-                """, (route_id, item_id, int(round(dist))))
-
+        job_id = jobs.enqueue(
+            conn,
+            jobs.ROUTE_CULTURAL_RECOMPUTE,
+            {"route_id": route_id, "radius_m": radius_m},
+            priority=jobs.PRIORITY_HIGH,
+            dedupe_key=f"{route_id}:{radius_m}",
+        )
         conn.commit()
 
         return jsonify({
             "route_id": route_id,
             "radius_m": radius_m,
             "step": step,
-            "items_found": len(found),
-        }), 200
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+        }), 202
 
     finally:
         conn.close()
 
+
 @route_cultural_bp.get("/<int:route_id>/cultural-items")
+@conditional_get(lambda route_id: [f"route_cultural_items:{route_id}", "cultural_items"])
 def list_route_cultural_items(route_id: int):
     conn = get_connection()
     try:
-        _sync_route_cultural_booleans(conn, route_id)
-        conn.commit()
         with conn.cursor() as cur:
             cur.execute("""
                 select
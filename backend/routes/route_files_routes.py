@@ -1,9 +1,18 @@
 import os
 import uuid
+import zipfile
 import requests
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from db import get_connection
+from services.admin import is_admin
+from services.gpx_import import MAX_FILE_BYTES, MAX_FILES, import_gpx_files, iter_zip
+from services.gpx_parser import parse_gpx_track
+from services.http_cache import _etag_matches, conditional_get, http_cache
+from services.recommendation import route_features
+from services.route_bundle import COMPRESSED_MIME_TYPES, MIME_TYPES, available_compressions, available_formats, bundle_store
+from services.track_fingerprint import duplicate_report, fingerprint_route
+from services.track_store import save_track
 
 route_files_bp = Blueprint("route_files", __name__, url_prefix="/routes")
 
@@ -35,6 +44,27 @@ def _upload_to_supabase_storage(file_bytes: bytes, object_path: str, content_typ
     return _public_url(object_path)
 
 
+def _delete_from_supabase_storage(object_paths) -> None:
+    supabase_url = os.getenv("SUPABASE_URL")
+    service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+    if not supabase_url or not service_key:
+        raise Exception("Falten variables SUPABASE_URL o SUPABASE_SERVICE_ROLE_KEY")
+
+    headers = {
+        "Authorization": f"Bearer {service_key}",
+        "apikey": service_key,
+    }
+
+    res = requests.delete(
+        f"{supabase_url}/storage/v1/object/{BUCKET}",
+        headers=headers,
+        json={"prefixes": list(object_paths)},
+    )
+    if res.status_code not in (200, 204):
+        raise Exception(f"Error esborrant de Supabase Storage: {res.status_code} - {res.text}")
+
+
 @route_files_bp.route("/<int:route_id>/files", methods=["POST"])
 @jwt_required()
 def upload_route_file(route_id: int):
@@ -77,6 +107,14 @@ def upload_route_file(route_id: int):
         conn.close()
         return jsonify({"error": "El fitxer no sembla un GPX vàlid"}), 400
 
+    # Parsejar un sol cop: el track compacte es desa amb el fitxer
+    try:
+        lats, lons, eles = parse_gpx_track(file_bytes)
+    except Exception:
+        cur.close()
+        conn.close()
+        return jsonify({"error": "El fitxer no sembla un GPX vàlid"}), 400
+
     # 3) Subir a Storage
     object_path = f"{route_id}/{uuid.uuid4().hex}.gpx"
     try:
@@ -98,19 +136,121 @@ def upload_route_file(route_id: int):
     """, (route_id, file_url, "GPX"))
 
     file_id = cur.fetchone()[0]
+    duplicates = []
+    if len(lats) >= 2:
+        track = save_track(conn, file_id, route_id, lats, lons, eles)
+        # Rutes amb el mateix recorregut ja publicades (None: no és el track principal)
+        duplicates = fingerprint_route(conn, route_id, track) or []
     conn.commit()
     cur.close()
     conn.close()
+    http_cache.invalidate([f"route_files:{route_id}"])
 
     return jsonify({
         "file_id": file_id,
         "route_id": route_id,
         "file_type": "GPX",
-        "file_url": file_url
+        "file_url": file_url,
+        "duplicates": duplicates,
     }), 201
 
 
+def _import_sources(uploads):
+    """(filename, bytes) de cada GPX pujat; els ZIP es desempaqueten."""
+    for f in uploads:
+        filename = os.path.basename(f.filename or "")
+        if filename.lower().endswith(".zip"):
+            yield from iter_zip(f.stream)
+            continue
+        data = f.stream.read(MAX_FILE_BYTES + 1)
+        yield filename, (data if len(data) <= MAX_FILE_BYTES else None)
+
+
+@route_files_bp.route("/import", methods=["POST"])
+@jwt_required()
+def import_routes():
+    """
+    POST /routes/import (multipart)
+    Crea una ruta per cada GPX: camp "files" (un o més .gpx o .zip).
+    Opcional: location. Respon l'estat de cada fitxer:
+      {"created": n, "failed": m, "truncated": bool, "files": [{"file", "status", "route_id", ...}]}
+    truncated indica que s'han ignorat els fitxers a partir de GPX_IMPORT_MAX_FILES.
+    """
+    user_id = int(get_jwt_identity())
+    uploads = request.files.getlist("files") or request.files.getlist("file")
+    if not uploads:
+        return jsonify({"error": "Falten els fitxers (field 'files')"}), 400
+
+    location = (request.form.get("location") or "").strip()
+
+    # Límit de fitxers per petició (els ZIP es compten per entrada)
+    truncated = {"value": False}
+
+    def limited(sources):
+        for n, item in enumerate(sources):
+            if n >= MAX_FILES:
+                truncated["value"] = True
+                return
+            yield item
+
+    conn = get_connection()
+    try:
+        statuses = import_gpx_files(
+            conn,
+            user_id,
+            limited(_import_sources(uploads)),
+            upload=_upload_to_supabase_storage,
+            delete=_delete_from_supabase_storage,
+            location=location,
+        )
+    except zipfile.BadZipFile:
+        conn.rollback()
+        return jsonify({"error": "El fitxer ZIP no és vàlid"}), 400
+    finally:
+        conn.close()
+
+    created = [s["route_id"] for s in statuses if s["status"] == "created"]
+    if created:
+        route_features.mark_dirty(created)
+        http_cache.invalidate(["routes"] + [f"routes:{rid}" for rid in created] + [f"route_files:{rid}" for rid in created])
+
+    return jsonify({
+        "created": len(created),
+        "failed": len(statuses) - len(created),
+        "truncated": truncated["value"],
+        "files": statuses,
+    }), 201 if created else 200
+
+
+@route_files_bp.route("/duplicates", methods=["GET"])
+@jwt_required()
+def route_duplicates():
+    """
+    GET /routes/duplicates?kind=duplicate|near_duplicate&route_id=12&limit=100
+    Informe de rutes duplicades detectades per empremta de track: parelles
+    (route_id és la més nova, duplicate_of la més antiga), totals per tipus i
+    quantes rutes amb track tenen empremta (la resta: python find_duplicate_routes.py).
+    Només per als usuaris d'ADMIN_USER_IDS.
+    """
+    if not is_admin(get_jwt_identity()):
+        return jsonify({"error": "No tens permís per veure aquest informe"}), 403
+
+    kind = (request.args.get("kind") or "").strip().lower() or None
+    if kind is not None and kind not in ("duplicate", "near_duplicate"):
+        return jsonify({"error": f"Tipus invàlid: {kind}"}), 400
+    route_id = request.args.get("route_id", type=int)
+    limit = request.args.get("limit", default=100, type=int)
+    limit = max(1, min(limit, 500))
+
+    conn = get_connection()
+    try:
+        return jsonify(duplicate_report(conn, kind=kind, route_id=route_id, limit=limit)), 200
+    finally:
+        conn.close()
+
+
 @route_files_bp.route("/<int:route_id>/files", methods=["GET"])
+@conditional_get(lambda route_id: [f"route_files:{route_id}"])
 def list_route_files(route_id: int):
     conn = get_connection()
     cur = conn.cursor()
@@ -133,3 +273,52 @@ def list_route_files(route_id: int):
         })
 
     return jsonify(files), 200
+
+
+@route_files_bp.route("/<int:route_id>/bundle", methods=["GET"])
+def route_bundle(route_id: int):
+    """
+    GET /routes/<id>/bundle?format=json|msgpack&compression=gzip|zstd&tolerance=5
+    Paquet per a ús offline: ruta, track simplificat i codificat, perfil
+    d'elevació i ítems culturals en una sola descàrrega comprimida.
+    El paquet es desa a disc i només es regenera si canvia alguna dada.
+    Es lliura com a fitxer application/gzip o application/zstd (.gz/.zst),
+    sense Content-Encoding; X-Bundle-Format indica el format de dins.
+    """
+    fmt = (request.args.get("format") or "json").strip().lower()
+    if fmt not in available_formats():
+        return jsonify({"error": f"format ha de ser un de: {', '.join(available_formats())}"}), 400
+
+    compression = (request.args.get("compression") or "gzip").strip().lower()
+    if compression not in available_compressions():
+        return jsonify({"error": f"compression ha de ser una de: {', '.join(available_compressions())}"}), 400
+
+    try:
+        tolerance_m = float(request.args.get("tolerance", 5))
+    except ValueError:
+        return jsonify({"error": "tolerance ha de ser un número"}), 400
+    tolerance_m = max(0.0, min(tolerance_m, 100.0))
+
+    conn = get_connection()
+    try:
+        result = bundle_store.get_or_build(conn, route_id, fmt, compression, tolerance_m)
+    finally:
+        conn.close()
+
+    if result is None:
+        return jsonify({"error": "Ruta no trobada"}), 404
+    data, key, source = result
+
+    etag = f'"{key[:32]}"'
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        resp = make_response("", 304)
+    else:
+        # Fitxer comprimit tal qual: amb Content-Encoding el client el descomprimiria
+        resp = make_response(data, 200)
+        resp.mimetype = COMPRESSED_MIME_TYPES[compression]
+        resp.headers["X-Bundle-Format"] = MIME_TYPES[fmt]
+        resp.headers["Content-Disposition"] = f'attachment; filename="route_{route_id}.{fmt}.{"gz" if compression == "gzip" else "zst"}"'
+        resp.headers["X-Cache"] = "HIT" if source == "hit" else "MISS"
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
@@ -1,35 +1,29 @@
+import base64
+import json
+from concurrent.futures import as_completed
+from datetime import datetime
+
 from flask import Blueprint, request, jsonify
-import requests
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from psycopg2.extras import execute_values
 from db import get_connection
-import math
-from utils.geo import haversine_m
-from services.difficulty_calculator import calculate_difficulty
-from services.gpx_parser import parse_gpx_points
-from routes.route_cultural_routes import _sync_route_cultural_booleans, _get_gpx_url_for_route
+from services import jobs
+from services.geometry import point_to_polyline_m
+from services.difficulty_calculator import calculate_difficulty, DIFFICULTY_FORMULA_VERSION
+from services.spatial_index import cultural_index
+from services.recommendation import route_features
+from services.social_stats import rating_average
+from services.http_cache import conditional_get, http_cache
+from services.track_store import load_tracks
+from services.track_fetch import track_fetcher
+from services.geo_utils import bbox_for_radius
+from routes.route_cultural_routes import _sync_route_cultural_booleans, _get_gpx_files_for_routes
 
 routes_bp = Blueprint("routes", __name__, url_prefix="/routes")
 
 cultural_bp = Blueprint("cultural", __name__)
 
 
-def _ensure_user_route_completions_table(conn):
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS user_route_completions (
-                completion_id SERIAL PRIMARY KEY,
-                user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-                route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
-                completion_count INT NOT NULL DEFAULT 1,
-                first_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                last_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                UNIQUE (user_id, route_id)
-            )
-            """
-        )
-
-
 def _get_optional_user_id():
     try:
         verify_jwt_in_request(optional=True)
@@ -38,80 +32,224 @@ def _get_optional_user_id():
     except Exception:
         return None
 
-def normalize_difficulty(difficulty: str) -> str:
+_ROUTES_MAX_PAGE_SIZE = 100
+
+# Nivell demanat al filtre -> etiquetes amb què es pot haver guardat la ruta
+# (calculate_difficulty escriu en castellà per defecte i l'app en català)
+_DIFFICULTY_LABELS = {
+    "facil": ("Fàcil", "Fácil"),
+    "mitjana": ("Mitjana", "Moderada"),
+    "dificil": ("Difícil",),
+    "molt_dificil": ("Molt Difícil", "Muy Difícil"),
+}
+
+_DIFFICULTY_ALIASES = {
+    "fàcil": "facil", "fácil": "facil", "facil": "facil", "easy": "facil",
+    "mitjana": "mitjana", "mitja": "mitjana", "moderada": "mitjana", "media": "mitjana",
+    "moderate": "mitjana",
+    "difícil": "dificil", "dificil": "dificil", "difficult": "dificil",
+    "molt difícil": "molt_dificil", "molt dificil": "molt_dificil",
+    "muy difícil": "molt_dificil", "muy dificil": "molt_dificil",
+    "very difficult": "molt_dificil",
+}
+
+_CULTURAL_FLAGS = (
+    "has_historical_value",
+    "has_archaeology",
+    "has_architecture",
+    "has_natural_interest",
+)
+
+
+def _parse_bool_arg(value):
+    if value is None:
+        return None
+    norm = value.strip().lower()
+    if norm in {"1", "true", "yes", "si", "sí"}:
+        return True
+    if norm in {"0", "false", "no"}:
+        return False
+    raise ValueError(value)
+
+
+def _encode_cursor(created_at, route_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), int(route_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at_iso, route_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    return datetime.fromisoformat(created_at_iso), int(route_id)
+
+
+def _route_list_filters(args):
     """
-    Normalize difficulty to standard format.
-    Handles both Spanish and Catalan names.
-    Returns: "Fácil", "Moderada", "Difícil", "Muy Difícil" (Spanish)
-             or "Fàcil", "Mitjana", "Difícil", "Molt Difícil" (Catalan)
+    Tradueix els filtres de la query string a condicions SQL.
+    Retorna (clauses, params) o llança ValueError amb el missatge per al client.
     """
-    if not difficulty:
-        return ""
-    
-    norm = difficulty.lower().strip()
-    
-    # Catalan spellings with proper capitalization
-    if 'fàcil' in norm or 'facil' in norm or norm == 'easy':
-        return 'Fàcil'
-    elif 'mitt' in norm or 'media' in norm or 'moderate' in norm:
-        return 'Mitjana'
-    elif 'difícil' in norm or 'dificil' in norm or norm == 'difficult':
-        # Check if it's "very difficult"
-        if 'molt' in norm or 'muy' in norm or 'very' in norm:
-            return 'Molt Difícil'
-        return 'Difícil'
-    elif 'molt' in norm or 'muy' in norm:
-        return 'Molt Difícil'
-    
-    # Return original if can't determine
-    return difficulty if difficulty else ""
+    clauses = []
+    params = []
+
+    difficulty = (args.get("difficulty") or "").strip()
+    if difficulty:
+        values = set()
+        for raw in difficulty.split(","):
+            raw = " ".join(raw.split()).lower()
+            if not raw:
+                continue
+            level = _DIFFICULTY_ALIASES.get(raw)
+            if level is None:
+                raise ValueError("difficulty ha de ser fàcil, mitjana, difícil o molt difícil")
+            values.update(_DIFFICULTY_LABELS[level])
+        if values:
+            clauses.append("r.difficulty = ANY(%s)")
+            params.append(sorted(values))
+
+    for arg, column, op in (
+        ("min_distance", "r.distance_km", ">="),
+        ("max_distance", "r.distance_km", "<="),
+        ("min_elevation", "r.elevation_gain", ">="),
+        ("max_elevation", "r.elevation_gain", "<="),
+    ):
+        raw = args.get(arg)
+        if raw is None or raw == "":
+            continue
+        try:
+            value = float(raw)
+        except ValueError:
+            raise ValueError(f"{arg} ha de ser un número")
+        clauses.append(f"{column} {op} %s")
+        params.append(value)
+
+    for flag in _CULTURAL_FLAGS:
+        try:
+            value = _parse_bool_arg(args.get(flag))
+        except ValueError:
+            raise ValueError(f"{flag} ha de ser true o false")
+        if value is not None:
+            clauses.append(f"r.{flag} = %s")
+            params.append(value)
+
+    location = (args.get("location") or "").strip()
+    if location:
+        clauses.append("r.location ILIKE %s")
+        params.append("%" + location.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+
+    return clauses, params
+
+
+def _routes_list_resources():
+    resources = ["routes"]
+    user_id = _get_optional_user_id()
+    if user_id is not None:
+        resources.append(f"completions:{user_id}")
+    if request.args.get("include_social"):
+        resources.append("route_social")
+    return resources
+
 
 @routes_bp.route("", methods=["GET"])
+@conditional_get(_routes_list_resources)
 def get_routes():
+    """
+    GET /routes
+    Filtres opcionals: difficulty (llista separada per comes), min_distance,
+    max_distance, min_elevation, max_elevation, has_historical_value,
+    has_archaeology, has_architecture, has_natural_interest, location.
+
+    Paginació per cursor (keyset sobre created_at, route_id): si s'indica
+    limit, es retorna com a molt aquest nombre de rutes i, si n'hi ha més,
+    la capçalera X-Next-Cursor amb el valor a passar com a cursor.
+    Sense limit es retorna la llista completa (clients antics).
+
+    Amb include_social=true cada ruta porta likes, liked_by_user,
+    rating_count i rating_avg (comptadors de route_social_stats).
+    """
     user_id = _get_optional_user_id()
-    conn = get_connection()
-    cur = conn.cursor()
 
-    _ensure_user_route_completions_table(conn)
+    try:
+        include_social = bool(_parse_bool_arg(request.args.get("include_social")))
+    except ValueError:
+        return jsonify({"error": "include_social ha de ser true o false"}), 400
 
-    cur.execute("""
+    try:
+        clauses, params = _route_list_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    limit = request.args.get("limit", type=int)
+    if limit is not None:
+        limit = max(1, min(limit, _ROUTES_MAX_PAGE_SIZE))
+
+    cursor = (request.args.get("cursor") or "").strip()
+    if cursor:
+        try:
+            cursor_created_at, cursor_route_id = _decode_cursor(cursor)
+        except Exception:
+            return jsonify({"error": "cursor no vàlid"}), 400
+        clauses.append("(r.created_at, r.route_id) < (%s, %s)")
+        params.extend([cursor_created_at, cursor_route_id])
+
+    where_sql = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    limit_sql = "LIMIT %s" if limit is not None else ""
+
+    social_sql = ""
+    social_join_sql = ""
+    social_params = []
+    if include_social:
+        social_sql = """,
+          COALESCE(rs.like_count, 0), COALESCE(rs.rating_count, 0), COALESCE(rs.rating_sum, 0),
+          EXISTS (SELECT 1 FROM likes l WHERE l.route_id = r.route_id AND l.user_id = %s) as liked_by_user"""
+        social_join_sql = "LEFT JOIN route_social_stats rs ON rs.route_id = r.route_id"
+        social_params = [user_id]
+
+    # user_route_completions té UNIQUE (user_id, route_id): el LEFT JOIN no duplica files
+    query = f"""
         SELECT
           r.route_id, r.name, r.description, r.distance_km, r.difficulty,
           r.elevation_gain, r.location, r.estimated_time, r.creator_id,
           r.cultural_summary, r.has_historical_value, r.has_archaeology,
-                    r.has_architecture, r.has_natural_interest, r.created_at,
-                    u.name as creator_name,
-                    CASE
-                        WHEN %s IS NULL THEN FALSE
-                        ELSE EXISTS (
-                            SELECT 1
-                            FROM user_route_completions urc
-                            WHERE urc.user_id = %s AND urc.route_id = r.route_id
-                        )
-                    END as completed_by_user
+          r.has_architecture, r.has_natural_interest, r.created_at,
+          u.name as creator_name,
+          (urc.route_id IS NOT NULL) as completed_by_user
+          {social_sql}
         FROM routes r
         LEFT JOIN users u ON u.user_id = r.creator_id
-        ORDER BY r.created_at DESC
-        """, (user_id, user_id))
+        LEFT JOIN user_route_completions urc
+          ON urc.route_id = r.route_id AND urc.user_id = %s
+        {social_join_sql}
+        {where_sql}
+        ORDER BY r.created_at DESC, r.route_id DESC
+        {limit_sql}
+    """
+    query_params = social_params + [user_id] + params
+    if limit is not None:
+        # Una fila de més per saber si hi ha pàgina següent
+        query_params.append(limit + 1)
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(query, query_params)
     rows = cur.fetchall()
 
     cur.close()
     conn.close()
 
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(last[14], last[0])
+
     routes = []
     for r in rows:
         distance_km = float(r[3] or 0)
         elevation_gain = int(r[5] or 0)
         estimated_time = r[7] or ""
-        difficulty_stored = r[4] or ""
-        
-        # Always calculate difficulty with the latest formula to avoid stale DB values
-        computed_difficulty = calculate_difficulty(distance_km, elevation_gain, estimated_time, lang='ca')
-        stored_normalized = normalize_difficulty(difficulty_stored)
-
-        # Prefer computed difficulty to reclassify legacy "fàcil" entries
-        difficulty = computed_difficulty or stored_normalized
-        
+        # La dificultat guardada es manté al dia amb update_difficulties.py
+        difficulty = r[4] or ""
+
         routes.append({
             "route_id": r[0],
             "name": r[1],
@@ -131,8 +269,151 @@ def get_routes():
             "creator_name": r[15],
             "completed_by_user": bool(r[16]),
         })
+        if include_social:
+            routes[-1].update({
+                "likes": int(r[17]),
+                "liked_by_user": bool(r[20]),
+                "rating_count": int(r[18]),
+                "rating_avg": rating_average(r[18], r[19]),
+            })
+
+    response = jsonify(routes)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
+
+def _encode_change_token(txid: int, route_id: int) -> str:
+    raw = json.dumps([int(txid), int(route_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_change_token(token: str):
+    padded = token + "=" * (-len(token) % 4)
+    txid, route_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    return int(txid), int(route_id)
 
-    return jsonify(routes), 200
+
+_CHANGES_MAX_PAGE_SIZE = 500
+# route_id sentinella: "tots els canvis d'aquesta transacció ja lliurats"
+_CHANGES_ALL_ROUTES = 2147483647
+
+
+@routes_bp.route("/changes", methods=["GET"])
+def route_changes():
+    """
+    GET /routes/changes?since=<token>&limit=200
+    Rutes creades o modificades (upserted) i esborrades (deleted) des del
+    token. Sense since es retorna tot el catàleg (càrrega inicial).
+    La resposta inclou next_since per a la crida següent i has_more si cal
+    tornar a demanar de seguida.
+    """
+    user_id = _get_optional_user_id()
+
+    limit = request.args.get("limit", default=200, type=int)
+    limit = max(1, min(limit, _CHANGES_MAX_PAGE_SIZE))
+
+    since = (request.args.get("since") or "").strip()
+    since_txid, since_route_id = 0, 0
+    if since:
+        try:
+            since_txid, since_route_id = _decode_change_token(since)
+        except Exception:
+            return jsonify({"error": "since no vàlid"}), 400
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            # Només canvis de transaccions ja acabades per a tothom (per sota del xmin)
+            cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+            xmin = int(cur.fetchone()[0])
+
+            cur.execute(
+                """
+                SELECT change_txid, route_id, deleted
+                FROM (
+                    SELECT change_txid, route_id, FALSE AS deleted
+                    FROM routes
+                    WHERE (change_txid, route_id) > (%s, %s) AND change_txid < %s
+                    UNION ALL
+                    SELECT change_txid, route_id, TRUE AS deleted
+                    FROM route_tombstones
+                    WHERE (change_txid, route_id) > (%s, %s) AND change_txid < %s
+                ) AS changes
+                ORDER BY change_txid, route_id
+                LIMIT %s
+                """,
+                (since_txid, since_route_id, xmin, since_txid, since_route_id, xmin, limit + 1),
+            )
+            changes = cur.fetchall()
+
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            upserted_ids = [int(c[1]) for c in changes if not c[2]]
+            deleted_ids = [int(c[1]) for c in changes if c[2]]
+
+            rows = []
+            if upserted_ids:
+                cur.execute(
+                    """
+                    SELECT
+                      r.route_id, r.name, r.description, r.distance_km, r.difficulty,
+                      r.elevation_gain, r.location, r.estimated_time, r.creator_id,
+                      r.cultural_summary, r.has_historical_value, r.has_archaeology,
+                      r.has_architecture, r.has_natural_interest, r.created_at,
+                      u.name as creator_name,
+                      (urc.route_id IS NOT NULL) as completed_by_user,
+                      r.updated_at
+                    FROM routes r
+                    LEFT JOIN users u ON u.user_id = r.creator_id
+                    LEFT JOIN user_route_completions urc
+                      ON urc.route_id = r.route_id AND urc.user_id = %s
+                    WHERE r.route_id = ANY(%s)
+                    ORDER BY r.change_txid, r.route_id
+                    """,
+                    (user_id, upserted_ids),
+                )
+                rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    if has_more:
+        last = changes[-1]
+        next_token = [int(last[0]), int(last[1])]
+    else:
+        # Al dia: la propera crida comença pel primer txid encara no lliurable
+        next_token = list(max((since_txid, since_route_id), (xmin - 1, _CHANGES_ALL_ROUTES)))
+    next_since = _encode_change_token(*next_token)
+
+    upserted = []
+    for r in rows:
+        upserted.append({
+            "route_id": r[0],
+            "name": r[1],
+            "description": r[2] or "",
+            "distance_km": float(r[3] or 0),
+            "difficulty": r[4] or "",
+            "elevation_gain": int(r[5] or 0),
+            "location": r[6] or "",
+            "estimated_time": r[7] or "",
+            "creator_id": int(r[8]),
+            "cultural_summary": r[9] or "",
+            "has_historical_value": bool(r[10]),
+            "has_archaeology": bool(r[11]),
+            "has_architecture": bool(r[12]),
+            "has_natural_interest": bool(r[13]),
+            "created_at": r[14].isoformat() if r[14] else None,
+            "creator_name": r[15],
+            "completed_by_user": bool(r[16]),
+            "updated_at": r[17].isoformat() if r[17] else None,
+        })
+
+    return jsonify({
+        "upserted": upserted,
+        "deleted": deleted_ids,
+        "next_since": next_since,
+        "has_more": has_more,
+    }), 200
 
 
 @routes_bp.route("", methods=["POST"])
@@ -170,9 +451,9 @@ def create_route():
                     name, description, distance_km, difficulty, elevation_gain,
                     location, estimated_time, creator_id,
                     cultural_summary, has_historical_value, has_archaeology,
-                    has_architecture, has_natural_interest
+                    has_architecture, has_natural_interest, difficulty_version
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 RETURNING
                     route_id, name, description, distance_km, difficulty,
                     elevation_gain, location, estimated_time, creator_id,
@@ -182,22 +463,20 @@ def create_route():
                 name, description, distance_km, difficulty, elevation_gain,
         location, estimated_time, user_id,
         cultural_summary, has_historical_value, has_archaeology,
-        has_architecture, has_natural_interest
+        has_architecture, has_natural_interest, DIFFICULTY_FORMULA_VERSION
     ))
 
     r = cur.fetchone()
     conn.commit()
     cur.close()
     conn.close()
+    route_features.mark_dirty([r[0]])
+    http_cache.invalidate(["routes", f"routes:{r[0]}"])
     
-    # Recalculate difficulty for the response in case database stored empty
     response_distance = float(r[3] or 0)
     response_elevation = int(r[5] or 0)
     response_time = r[7] or ""
-    response_difficulty_stored = r[4] or ""
-    
-    # Always return the fresh computed difficulty to ensure consistency for new routes
-    response_difficulty = calculate_difficulty(response_distance, response_elevation, response_time, lang='ca')
+    response_difficulty = r[4] or difficulty
 
     creator_name = None
     conn = get_connection()
@@ -230,11 +509,10 @@ def create_route():
     }), 201
 
 @routes_bp.route("/<int:route_id>/cultural-items", methods=["GET"])
+@conditional_get(lambda route_id: [f"route_cultural_items:{route_id}", "cultural_items"])
 def get_cultural_items(route_id):
     conn = get_connection()
     try:
-        _sync_route_cultural_booleans(conn, route_id)
-        conn.commit()
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT
@@ -269,6 +547,7 @@ def get_cultural_items(route_id):
 
 
 @cultural_bp.route("/cultural-items/near", methods=["GET"])
+@conditional_get(lambda: ["cultural_items"])
 def cultural_items_near():
     lat = request.args.get("lat", type=float)
     lon = request.args.get("lon", type=float)
@@ -278,121 +557,54 @@ def cultural_items_near():
     if lat is None or lon is None:
         return jsonify({"error": "lat i lon són obligatoris"}), 400
 
-    # Bounding box aproximada
-    # 1 grado lat ~ 111.32km; lon depende de lat
-    lat_deg = radius / 111_320.0
-    lon_deg = radius / (111_320.0 * max(0.2, abs(math.cos(math.radians(lat)))))
-
-    min_lat = lat - lat_deg
-    max_lat = lat + lat_deg
-    min_lon = lon - lon_deg
-    max_lon = lon + lon_deg
-
     conn = get_connection()
-    cur = conn.cursor()
-
-    if item_type:
-        cur.execute("""
-            SELECT item_id, title, description, latitude, longitude, period, item_type, source_url
-            FROM cultural_items
-            WHERE latitude BETWEEN %s AND %s
-              AND longitude BETWEEN %s AND %s
-              AND LOWER(item_type) = LOWER(%s)
-        """, (min_lat, max_lat, min_lon, max_lon, item_type))
-    else:
-        cur.execute("""
-            SELECT item_id, title, description, latitude, longitude, period, item_type, source_url
-            FROM cultural_items
-            WHERE latitude BETWEEN %s AND %s
-              AND longitude BETWEEN %s AND %s
-        """, (min_lat, max_lat, min_lon, max_lon))
+    try:
+        index = cultural_index.get(conn)
+        item_ids, distances = index.query_radius(lat, lon, radius, item_type=item_type)
+        if not len(item_ids):
+            return jsonify([])
 
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT item_id, title, description, latitude, longitude, period, item_type, source_url
+                FROM cultural_items
+                WHERE item_id = ANY(%s)
+            """, (item_ids.tolist(),))
+            rows = {int(r[0]): r for r in cur.fetchall()}
+    finally:
+        conn.close()
 
+    # Ordena por cercanía (el índice ya devuelve los ids ordenados)
     out = []
-    for r in rows:
-        item_id, title, desc, ilat, ilon, period, itype, source_url = r
-        d = haversine_m(lat, lon, float(ilat), float(ilon))
-        if d <= radius:
-            out.append({
-                "item_id": item_id,
-                "title": title,
-                "description": desc,
-                "latitude": float(ilat),
-                "longitude": float(ilon),
-                "period": period,
-                "item_type": itype,
-                "source_url": source_url,
-                "distance_m": round(d, 1),
-            })
+    for item_id, d in zip(item_ids.tolist(), distances.tolist()):
+        r = rows.get(item_id)
+        if r is None:
+            continue
+        _, title, desc, ilat, ilon, period, itype, source_url = r
+        out.append({
+            "item_id": item_id,
+            "title": title,
+            "description": desc,
+            "latitude": float(ilat),
+            "longitude": float(ilon),
+            "period": period,
+            "item_type": itype,
+            "source_url": source_url,
+            "distance_m": round(d, 1),
+        })
 
-    # Ordena por cercanía
-    out.sort(key=lambda x: x["distance_m"])
     return jsonify(out)
 
 
-@cultural_bp.route("/cultural-items/<int:item_id>/routes", methods=["GET"])
-def routes_for_cultural_item(item_id: int):
-    user_id = _get_optional_user_id()
-    limit = request.args.get("limit", default=5, type=int)
-    radius_m = request.args.get("radius_m", default=1000, type=int)
-    step = request.args.get("step", default=30, type=int)
-    max_routes = request.args.get("max_routes", default=60, type=int)
-    max_cache_rows = request.args.get("max_cache_rows", default=2000, type=int)
-
-    limit = max(1, min(limit, 50))
-    radius_m = max(50, min(radius_m, 20000))
-    step = max(1, min(step, 200))
-    max_routes = max(10, min(max_routes, 200))
-    max_cache_rows = max(200, min(max_cache_rows, 10000))
-
-    conn = get_connection()
-    cur = conn.cursor()
-
-    _ensure_user_route_completions_table(conn)
-
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS cultural_item_routes_cache (
-            item_id INT NOT NULL,
-            radius_m INT NOT NULL,
-            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-            PRIMARY KEY (item_id, radius_m)
-        )
-        """
-    )
-
-    cur.execute(
-        """
-        SELECT latitude, longitude
-        FROM cultural_items
-        WHERE item_id = %s
-        """,
-        (item_id,),
-    )
-    row = cur.fetchone()
-    if not row:
-        cur.close()
-        conn.close()
-        return jsonify({"error": "Punt cultural no trobat"}), 404
-
-    item_lat = float(row[0])
-    item_lon = float(row[1])
-
-    cur.execute(
-        """
-        SELECT updated_at
-        FROM cultural_item_routes_cache
-        WHERE item_id = %s AND radius_m = %s
-          AND updated_at > NOW() - INTERVAL '6 hours'
-        """,
-        (item_id, radius_m),
-    )
-    cache_row = cur.fetchone()
-
-    if cache_row is None:
+def _associate_item_routes(conn, item_id, item_lat, item_lon, radius_m, max_routes, fetch_missing=True):
+    """
+    Associa l'ítem amb les max_routes rutes més recents que passen a menys
+    de radius_m (distància exacta al track) i actualitza els seus booleans.
+    Amb fetch_missing=False només es mesuren els tracks ja guardats i es
+    retornen els route_id que encara cal descarregar; si no, es descarreguen
+    en paral·lel i es retorna una llista buida.
+    """
+    with conn.cursor() as cur:
         cur.execute(
             """
             SELECT route_id
@@ -414,44 +626,58 @@ def routes_for_cultural_item(item_id: int):
         )
         route_ids = [int(r[0]) for r in cur.fetchall()]
 
-        for route_id in route_ids:
-            if route_id in existing_route_ids:
-                continue
-
-            gpx_url = _get_gpx_url_for_route(conn, route_id)
-            if not gpx_url:
-                continue
-
+    pending_ids = [rid for rid in route_ids if rid not in existing_route_ids]
+    # Tracks ja guardats en una sola consulta; la resta es descarreguen en paral·lel
+    stored_tracks = load_tracks(conn, pending_ids)
+    gpx_files = _get_gpx_files_for_routes(conn, [rid for rid in pending_ids if rid not in stored_tracks])
+    gpx_files = {rid: f for rid, f in gpx_files.items() if f[1]}
+    item_lat_min, item_lat_max, item_lon_min, item_lon_max = bbox_for_radius(item_lat, item_lon, radius_m)
+
+    def _distance_to(track):
+        # Descarta les rutes la caixa de les quals no toca l'entorn de l'ítem
+        min_lat, max_lat, min_lon, max_lon = track.bbox
+        if (max_lat < item_lat_min or min_lat > item_lat_max
+                or max_lon < item_lon_min or min_lon > item_lon_max):
+            return None
+        min_dist = point_to_polyline_m(item_lat, item_lon, track.lats, track.lons)
+        return min_dist if min_dist <= radius_m else None
+
+    found = []
+    for route_id, track in stored_tracks.items():
+        dist = _distance_to(track)
+        if dist is not None:
+            found.append((route_id, item_id, int(round(dist))))
+
+    if fetch_missing:
+        futures = {track_fetcher.submit(rid, file_id, url): rid for rid, (file_id, url) in gpx_files.items()}
+        for future in as_completed(futures):
             try:
-                r = requests.get(gpx_url, timeout=12)
-                if r.status_code != 200:
-                    continue
-
-                points = parse_gpx_points(r.text)
-                if len(points) < 2:
-                    continue
-
-                sampled = points[::step]
-                min_dist = None
-                for (lat, lon) in sampled:
-                    d = haversine_m(item_lat, item_lon, float(lat), float(lon))
-                    if min_dist is None or d < min_dist:
-                        min_dist = d
-                    if min_dist <= 1:
-                        break
-
-                if min_dist is not None and min_dist <= radius_m:
-                    cur.execute(
-                        """
-                        INSERT INTO route_cultural_items(route_id, item_id, distance_m)
-                        VALUES (%s, %s, %s)
-                        ON CONFLICT (route_id, item_id) DO NOTHING
-                        """,
-                        (route_id, item_id, int(round(min_dist))),
-                    )
+                track = future.result()
             except Exception:
                 continue
+            dist = _distance_to(track)
+            if dist is not None:
+                found.append((futures[future], item_id, int(round(dist))))
 
+    if found:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                """
+                INSERT INTO route_cultural_items(route_id, item_id, distance_m)
+                VALUES %s
+                ON CONFLICT (route_id, item_id) DO NOTHING
+                """,
+                found,
+            )
+        for route_id, _, _ in found:
+            _sync_route_cultural_booleans(conn, route_id)
+
+    return [] if fetch_missing else sorted(gpx_files)
+
+
+def _mark_item_routes_cached(conn, item_id, radius_m, max_cache_rows):
+    with conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO cultural_item_routes_cache(item_id, radius_m, updated_at)
@@ -478,6 +704,66 @@ def routes_for_cultural_item(item_id: int):
                 (total_cache_rows - max_cache_rows,),
             )
 
+
+@cultural_bp.route("/cultural-items/<int:item_id>/routes", methods=["GET"])
+def routes_for_cultural_item(item_id: int):
+    user_id = _get_optional_user_id()
+    limit = request.args.get("limit", default=5, type=int)
+    radius_m = request.args.get("radius_m", default=1000, type=int)
+    # "step" ja no s'utilitza: la distància al track és exacta
+    max_routes = request.args.get("max_routes", default=60, type=int)
+    max_cache_rows = request.args.get("max_cache_rows", default=2000, type=int)
+
+    limit = max(1, min(limit, 50))
+    radius_m = max(50, min(radius_m, 20000))
+    max_routes = max(10, min(max_routes, 200))
+    max_cache_rows = max(200, min(max_cache_rows, 10000))
+    job_id = None
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute(
+        """
+        SELECT latitude, longitude
+        FROM cultural_items
+        WHERE item_id = %s
+        """,
+        (item_id,),
+    )
+    row = cur.fetchone()
+    if not row:
+        cur.close()
+        conn.close()
+        return jsonify({"error": "Punt cultural no trobat"}), 404
+
+    item_lat = float(row[0])
+    item_lon = float(row[1])
+
+    cur.execute(
+        """
+        SELECT updated_at
+        FROM cultural_item_routes_cache
+        WHERE item_id = %s AND radius_m = %s
+          AND updated_at > NOW() - INTERVAL '6 hours'
+        """,
+        (item_id, radius_m),
+    )
+    cache_row = cur.fetchone()
+
+    if cache_row is None:
+        # Només els tracks ja guardats (sense xarxa); les descàrregues les fa el worker
+        pending = _associate_item_routes(conn, item_id, item_lat, item_lon, radius_m, max_routes, fetch_missing=False)
+        if pending:
+            job_id = jobs.enqueue(
+                conn,
+                jobs.CULTURAL_ITEM_ROUTES,
+                {"item_id": item_id, "radius_m": radius_m, "max_routes": max_routes, "max_cache_rows": max_cache_rows},
+                priority=jobs.PRIORITY_HIGH,
+                dedupe_key=f"{item_id}:{radius_m}",
+            )
+        else:
+            _mark_item_routes_cached(conn, item_id, radius_m, max_cache_rows)
         conn.commit()
 
     cur.execute(
@@ -488,22 +774,17 @@ def routes_for_cultural_item(item_id: int):
                     r.cultural_summary, r.has_historical_value, r.has_archaeology,
                                         r.has_architecture, r.has_natural_interest, r.created_at,
                                         rci.distance_m,
-                                        CASE
-                                            WHEN %s IS NULL THEN FALSE
-                                            ELSE EXISTS (
-                                                SELECT 1
-                                                FROM user_route_completions urc
-                                                WHERE urc.user_id = %s AND urc.route_id = r.route_id
-                                            )
-                                        END as completed_by_user
+                                        (urc.route_id IS NOT NULL) as completed_by_user
                 FROM route_cultural_items rci
                 JOIN routes r ON r.route_id = rci.route_id
+                LEFT JOIN user_route_completions urc
+                    ON urc.route_id = r.route_id AND urc.user_id = %s
                 WHERE rci.item_id = %s
                     AND rci.distance_m <= %s
         ORDER BY rci.distance_m ASC NULLS LAST, r.created_at DESC
         LIMIT %s
         """,
-                                (user_id, user_id, item_id, radius_m, limit),
+                                (user_id, item_id, radius_m, limit),
     )
 
     rows = cur.fetchall()
@@ -515,11 +796,7 @@ def routes_for_cultural_item(item_id: int):
         distance_km = float(r[3] or 0)
         elevation_gain = int(r[5] or 0)
         estimated_time = r[7] or ""
-        difficulty_stored = r[4] or ""
-
-        computed_difficulty = calculate_difficulty(distance_km, elevation_gain, estimated_time, lang='ca')
-        stored_normalized = normalize_difficulty(difficulty_stored)
-        difficulty = computed_difficulty or stored_normalized
+        difficulty = r[4] or ""
 
         routes.append({
             "route_id": r[0],
@@ -541,4 +818,9 @@ def routes_for_cultural_item(item_id: int):
             "completed_by_user": bool(r[16]),
         })
 
-    return jsonify(routes), 200
\ No newline at end of file
+    resp = jsonify(routes)
+    if job_id is not None:
+        # Resultat parcial: el worker està descarregant i mesurant la resta de rutes
+        resp.headers["X-Still-Computing"] = "1"
+        resp.headers["X-Job-Id"] = str(job_id)
+    return resp, 200
\ No newline at end of file
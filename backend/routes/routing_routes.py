@@ -1,15 +1,21 @@
-import requests
 from flask import Blueprint, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
 
-routing_bp = Blueprint("routing", __name__, url_prefix="/routing")
+from services.admin import is_admin
+from services.routing_backends import RoutingError, configured_chain, walking_route as compute_walking_route
+from services.polyline_codec import parse_polyline_args, polyline_fields
+from services.routing_cache import route_cache
 
-OSRM_BASE_URL = "https://router.project-osrm.org"  # público, sin API key
+routing_bp = Blueprint("routing", __name__, url_prefix="/routing")
 
 @routing_bp.get("/walking")
 def walking_route():
     """
-    GET /routing/walking?start_lat=..&start_lon=..&end_lat=..&end_lon=..
+    GET /routing/walking?start_lat=..&start_lon=..&end_lat=..&end_lon=..[&backend=local|osrm]
     Devuelve distancia, duración y polyline (lista de [lat, lon]).
+    El backend por defecto se elige con ROUTING_BACKEND (p. ej. "local,osrm").
+    Opcional: format=polyline|varint (polyline_encoded en lugar de polyline),
+    simplify=dp|vw y tolerance_m (simplificación en el servidor).
     """
 
     # 1) Leer params
@@ -17,6 +23,7 @@ def walking_route():
     start_lon = request.args.get("start_lon", type=float)
     end_lat = request.args.get("end_lat", type=float)
     end_lon = request.args.get("end_lon", type=float)
+    backend = (request.args.get("backend") or "").strip().lower() or None
 
     # 2) Validar
     missing = [k for k, v in {
@@ -29,75 +36,46 @@ def walking_route():
     if missing:
         return jsonify({"error": f"Falten paràmetres: {', '.join(missing)}"}), 400
 
-    # 3) OSRM pide coords en orden lon,lat
-    coords = f"{start_lon},{start_lat};{end_lon},{end_lat}"
-
-    # 4) Endpoint OSRM: /route/v1/foot/{coords}
-    # overview=full -> geometría completa
-    # geometries=geojson -> coordenadas como GeoJSON [lon, lat]
-    url_foot = f"{OSRM_BASE_URL}/route/v1/foot/{coords}"
-    url_walk = f"{OSRM_BASE_URL}/route/v1/walking/{coords}"
-
     try:
-        params = {
-            "overview": "full",
-            "geometries": "geojson",
-            "steps": "true",
-            "continue_straight": "true",
-        }
+        fmt, simplify, tolerance_m = parse_polyline_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        r = requests.get(url_foot, params=params, timeout=12)
-        if r.status_code != 200:
-            r = requests.get(url_walk, params=params, timeout=12)
-        r.raise_for_status()
-        data = r.json()
+    if backend is not None and backend not in configured_chain():
+        return jsonify({"error": f"Backend de rutes no disponible: {backend}"}), 400
 
-        if data.get("code") != "Ok" or not data.get("routes"):
-            return jsonify({"error": "No s'ha pogut calcular la ruta"}), 502
+    # 3) Calcular amb el backend configurat (amb fallback entre backends),
+    #    passant per la cache: peticions properes o simultànies comparteixen resultat
+    def _compute():
+        payload, used = compute_walking_route(start_lat, start_lon, end_lat, end_lon, backend=backend)
+        return {"payload": payload, "backend": used}
 
-        route = data["routes"][0]
-        distance_m = float(route.get("distance", 0.0))
-        duration_s = float(route.get("duration", 0.0))
+    key = route_cache.make_key(backend or ",".join(configured_chain()), start_lat, start_lon, end_lat, end_lon)
+    try:
+        cached, source = route_cache.get_or_compute(key, _compute)
+    except RoutingError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception:
+        return jsonify({"error": "Error intern calculant la ruta"}), 500
 
-        # GeoJSON coordinates: [[lon,lat], [lon,lat], ...]
-        coords_geo = route["geometry"]["coordinates"]
-        polyline = [[float(lat), float(lon)] for lon, lat in coords_geo]  # a [lat,lon]
+    payload = dict(cached["payload"])
+    if fmt != "json" or simplify:
+        payload.update(polyline_fields(payload.pop("polyline"), fmt, simplify, tolerance_m))
 
-        # Steps: extract unique road types
-        def classify_road(name):
-            name = name.lower()
-            if any(word in name for word in ['camino', 'sendero', 'camí', 'send', 'track', 'path', 'vereda', 'pista', 'senda', 'trail', 'footpath', 'sender']):
-                return 'Camí'
-            if any(word in name for word in ['carretera', 'autovia', 'autopista', 'highway', 'road', 'vía', 'calzada', 'ruta', 'autovía']):
-                return 'Carretera'
-            if any(word in name for word in ['carrer', 'avinguda', 'plaça', 'street', 'avenue', 'square', 'calle', 'plaza', 'paseo', 'rambla', 'travessera', 'passatge', 'ronda', 'glorieta', 'rotonda', 'passeig', 'plaça']):
-                return 'Carrer'
-            if any(word in name for word in ['pont', 'bridge', 'puente']):
-                return 'Pont'
-            if any(word in name for word in ['parc', 'jardí', 'park', 'garden', 'bosque', 'forest']):
-                return 'Parc'
-            return 'Altres' if name else None
+    resp = jsonify(payload)
+    resp.headers["X-Routing-Backend"] = cached["backend"]
+    resp.headers["X-Cache"] = source.upper()
+    return resp, 200
 
-        steps = []
-        seen = set()
-        if "legs" in route and route["legs"]:
-            for step in route["legs"][0].get("steps", []):
-                name = step.get("name", "").strip()
-                road_type = classify_road(name)
-                if road_type and road_type not in seen:
-                    steps.append(road_type)
-                    seen.add(road_type)
 
-        return jsonify({
-            "distance_km": round(distance_m / 1000.0, 2),
-            "duration_min": int(round(duration_s / 60.0)),
-            "polyline": polyline,
-            "steps": steps,
-        }), 200
+@routing_bp.get("/cache/stats")
+@jwt_required()
+def routing_cache_stats():
+    """
+    Encerts/errades de la cache de rutes a peu d'aquest procés.
+    Només per als usuaris d'ADMIN_USER_IDS.
+    """
+    if not is_admin(get_jwt_identity()):
+        return jsonify({"error": "No tens permís per veure aquest informe"}), 403
 
-    except requests.Timeout:
-        return jsonify({"error": "Temps d'espera esgotat amb el servei de rutes"}), 504
-    except requests.RequestException:
-        return jsonify({"error": "Error comunicant amb el servei de rutes"}), 502
-    except Exception:
-        return jsonify({"error": "Error intern calculant la ruta"}), 500
\ No newline at end of file
+    return jsonify(route_cache.stats()), 200
@@ -2,27 +2,14 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from db import get_connection
+from routes.routes_routes import _get_optional_user_id
+from services.learning_stats import learning_from_stats, load_learning, load_personal_stats, record_completion
+from services.http_cache import conditional_get, http_cache
+from services.social_stats import add_likes, add_rating, load_social_stats
 
 social_bp = Blueprint("social", __name__, url_prefix="/routes")
 
 
-def _ensure_user_route_completions_table(conn):
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS user_route_completions (
-                completion_id SERIAL PRIMARY KEY,
-                user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-                route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
-                completion_count INT NOT NULL DEFAULT 1,
-                first_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                last_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                UNIQUE (user_id, route_id)
-            )
-            """
-        )
-
-
 def _fitness_to_rank(fitness: str) -> int:
     value = (fitness or "").strip().lower()
     if value in {"alta", "alto", "high"}:
@@ -76,7 +63,7 @@ def _compute_adaptive_signals(base_fitness: str, base_distance: float, learning:
     }
 
 
-def _load_adaptive_snapshot(conn, user_id: int):
+def _load_base_preferences(conn, user_id: int):
     base_fitness = "mitjana"
     base_distance = 10.0
 
@@ -98,52 +85,21 @@ def _load_adaptive_snapshot(conn, user_id: int):
         except Exception:
             pass
 
-        learning_row = (0, 0, 0)
-        try:
-            cur.execute(
-                """
-                SELECT
-                    COALESCE(SUM(urc.completion_count), 0) AS total_completions,
-                    COALESCE(
-                        SUM(urc.completion_count * COALESCE(r.distance_km, 0))
-                        / NULLIF(SUM(urc.completion_count), 0),
-                        0
-                    ) AS avg_distance_km,
-                    COALESCE(
-                        SUM(
-                            urc.completion_count *
-                            CASE
-                                WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%molt%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%muy%%' THEN 3
-                                WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%dif%%' THEN 2
-                                WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%mitj%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%moder%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%media%%' THEN 1
-                                ELSE 0
-                            END
-                        )
-                        / NULLIF(SUM(urc.completion_count), 0),
-                        0
-                    ) AS avg_difficulty_rank
-                FROM user_route_completions urc
-                JOIN routes r ON r.route_id = urc.route_id
-                WHERE urc.user_id = %s
-                """,
-                (user_id,),
-            )
-            row = cur.fetchone()
-            if row is not None:
-                learning_row = row
-        except Exception:
-            pass
+    return base_fitness, base_distance
 
-    learning = {
-        "total_completions": int(learning_row[0] or 0),
-        "avg_distance_km": float(learning_row[1] or 0),
-        "avg_difficulty_rank": float(learning_row[2] or 0),
-    }
+
+def _adaptive_snapshot(base_fitness: str, base_distance: float, learning: dict):
     adaptive = _compute_adaptive_signals(base_fitness, base_distance, learning)
     adaptive["total_completed_routes"] = learning["total_completions"]
     return adaptive
 
 
+def _load_adaptive_snapshot(conn, user_id: int):
+    # Agregats de user_learning_stats: una fila, sense recórrer l'historial
+    base_fitness, base_distance = _load_base_preferences(conn, user_id)
+    return _adaptive_snapshot(base_fitness, base_distance, load_learning(conn, user_id))
+
+
 def _build_preferences_update_payload(before, after):
     if before is None or after is None:
         return {
@@ -214,7 +170,9 @@ def like_route(route_id: int):
             )
             like_id = cur.fetchone()[0]
 
+        add_likes(conn, route_id, 1)
         conn.commit()
+        http_cache.invalidate(["route_social"])
         return jsonify({"liked": True, "like_id": like_id}), 201
     finally:
         conn.close()
@@ -234,8 +192,11 @@ def unlike_route(route_id: int):
                 """,
                 (user_id, route_id),
             )
+            removed = cur.rowcount
 
+        add_likes(conn, route_id, -removed)
         conn.commit()
+        http_cache.invalidate(["route_social"])
         return jsonify({"liked": False}), 200
     finally:
         conn.close()
@@ -248,13 +209,14 @@ def likes_count(route_id: int):
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT COUNT(*)
-                FROM likes
+                SELECT like_count
+                FROM route_social_stats
                 WHERE route_id = %s
                 """,
                 (route_id,),
             )
-            count = int(cur.fetchone()[0])
+            row = cur.fetchone()
+            count = int(row[0]) if row else 0
 
         return jsonify({"route_id": route_id, "likes": count}), 200
     finally:
@@ -283,13 +245,46 @@ def like_status(route_id: int):
         conn.close()
 
 
+_SOCIAL_BATCH_MAX_IDS = 200
+
+
+@social_bp.get("/social")
+def social_batch():
+    """
+    GET /routes/social?ids=1,2,3
+    Likes, estat de like de l'usuari (si hi ha token) i valoració mitjana
+    d'una llista de rutes en una sola consulta.
+    """
+    raw = (request.args.get("ids") or "").strip()
+    try:
+        route_ids = sorted({int(v) for v in raw.split(",") if v.strip()})
+    except ValueError:
+        return jsonify({"error": "ids ha de ser una llista de números separats per comes"}), 400
+    if not route_ids:
+        return jsonify({"error": "ids és obligatori"}), 400
+    if len(route_ids) > _SOCIAL_BATCH_MAX_IDS:
+        return jsonify({"error": f"Com a màxim {_SOCIAL_BATCH_MAX_IDS} rutes per petició"}), 400
+
+    user_id = _get_optional_user_id()
+    conn = get_connection()
+    try:
+        stats = load_social_stats(conn, route_ids, user_id)
+    finally:
+        conn.close()
+
+    return jsonify([
+        {"route_id": route_id, **stats[route_id]}
+        for route_id in route_ids
+        if route_id in stats
+    ]), 200
+
+
 @social_bp.get("/liked")
 @jwt_required()
 def liked_routes():
     user_id = int(get_jwt_identity())
     conn = get_connection()
     try:
-        _ensure_user_route_completions_table(conn)
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -348,25 +343,20 @@ def complete_route(route_id: int):
 
     conn = get_connection()
     try:
-        _ensure_user_route_completions_table(conn)
-        before_snapshot = _load_adaptive_snapshot(conn, user_id)
-        after_snapshot = None
-        update_payload = {
-            "preferences_updated": False,
-            "preference_update_message": "Ruta completada. Preferències iguals de moment.",
-        }
+        base_fitness, base_distance = _load_base_preferences(conn, user_id)
+        before_snapshot = _adaptive_snapshot(base_fitness, base_distance, load_learning(conn, user_id))
 
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT 1
+                SELECT distance_km, elevation_gain, difficulty
                 FROM routes
                 WHERE route_id = %s
                 """,
                 (route_id,),
             )
-            route_exists = cur.fetchone()
-            if not route_exists:
+            route_row = cur.fetchone()
+            if not route_row:
                 return jsonify({"error": "Ruta no trobada"}), 404
 
             cur.execute(
@@ -385,10 +375,16 @@ def complete_route(route_id: int):
             )
             row = cur.fetchone()
 
-        after_snapshot = _load_adaptive_snapshot(conn, user_id)
+        # Mateixa transacció: els agregats no poden divergir de les completions
+        learning = record_completion(
+            conn, user_id, route_row[0], route_row[1], route_row[2],
+            new_route=int(row[0]) == 1,
+        )
+        after_snapshot = _adaptive_snapshot(base_fitness, base_distance, learning)
         update_payload = _build_preferences_update_payload(before_snapshot, after_snapshot)
 
         conn.commit()
+        http_cache.invalidate([f"completions:{user_id}"])
         return jsonify({
             "route_id": route_id,
             "user_id": user_id,
@@ -416,7 +412,6 @@ def completed_route_ids():
 
     conn = get_connection()
     try:
-        _ensure_user_route_completions_table(conn)
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -441,49 +436,10 @@ def personal_stats():
 
     conn = get_connection()
     try:
-        def _at(values, index, default=None):
-            if values is None:
-                return default
-            if index < 0 or index >= len(values):
-                return default
-            value = values[index]
-            return default if value is None else value
-
-        _ensure_user_route_completions_table(conn)
+        # Resum materialitzat (user_learning_stats): una fila per usuari
+        stats = load_personal_stats(conn, user_id)
 
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                    COALESCE(COUNT(*), 0) AS completed_routes_unique,
-                    COALESCE(SUM(urc.completion_count), 0) AS completed_routes_total,
-                    COALESCE(SUM(urc.completion_count * COALESCE(r.distance_km, 0)), 0) AS total_distance_km,
-                    COALESCE(SUM(urc.completion_count * COALESCE(r.elevation_gain, 0)), 0) AS total_elevation_gain_m,
-                    COALESCE(
-                        SUM(urc.completion_count * COALESCE(r.distance_km, 0))
-                        / NULLIF(SUM(urc.completion_count), 0),
-                        0
-                    ) AS avg_distance_km,
-                    COALESCE(
-                        SUM(urc.completion_count * COALESCE(r.elevation_gain, 0))
-                        / NULLIF(SUM(urc.completion_count), 0),
-                        0
-                    ) AS avg_elevation_gain_m,
-                    MIN(urc.first_completed_at) AS first_completed_at,
-                    MAX(urc.last_completed_at) AS last_completed_at,
-                    COALESCE(SUM(CASE WHEN urc.last_completed_at >= NOW() - INTERVAL '30 days' THEN 1 ELSE 0 END), 0) AS active_routes_last_30d,
-                    COALESCE(SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%fàcil%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%facil%%' THEN urc.completion_count ELSE 0 END), 0) AS easy_count,
-                    COALESCE(SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%mitj%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%moder%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%media%%' THEN urc.completion_count ELSE 0 END), 0) AS medium_count,
-                    COALESCE(SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%molt%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%muy%%' THEN urc.completion_count ELSE 0 END), 0) AS very_hard_count,
-                    COALESCE(SUM(CASE WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%dif%%' AND LOWER(COALESCE(r.difficulty, '')) NOT LIKE '%%molt%%' AND LOWER(COALESCE(r.difficulty, '')) NOT LIKE '%%muy%%' THEN urc.completion_count ELSE 0 END), 0) AS hard_count
-                FROM user_route_completions urc
-                JOIN routes r ON r.route_id = urc.route_id
-                WHERE urc.user_id = %s
-                """,
-                (user_id,),
-            )
-            row = cur.fetchone()
-
             cur.execute(
                 """
                 SELECT
@@ -511,14 +467,13 @@ def personal_stats():
             )
             top_rows = cur.fetchall()
 
-        completed_unique = int(_at(row, 0, 0) or 0)
-        completed_total = int(_at(row, 1, 0) or 0)
+        completed_total = stats["total_completions"]
 
         difficulty_counts = {
-            "Fàcil": int(_at(row, 9, 0) or 0),
-            "Mitjana": int(_at(row, 10, 0) or 0),
-            "Difícil": int(_at(row, 12, 0) or 0),
-            "Molt Difícil": int(_at(row, 11, 0) or 0),
+            "Fàcil": stats["easy_count"],
+            "Mitjana": stats["medium_count"],
+            "Difícil": stats["hard_count"],
+            "Molt Difícil": stats["very_hard_count"],
         }
 
         top_difficulty = "-"
@@ -528,27 +483,30 @@ def personal_stats():
                 top_count = count
                 top_difficulty = name
 
-        base_fitness = (_at(pref, 0, None) if pref else None) or "mitjana"
-        base_distance = float(_at(pref, 1, 10.0) or 10.0)
-        adaptive = _load_adaptive_snapshot(conn, user_id)
+        base_fitness = (pref[0] if pref else None) or "mitjana"
+        base_distance = float((pref[1] if pref else None) or 10.0)
+        adaptive = _adaptive_snapshot(base_fitness, base_distance, learning_from_stats(stats))
+
+        first_completed_at = stats["first_completed_at"]
+        last_completed_at = stats["last_completed_at"]
 
         return jsonify({
-            "completed_routes_unique": completed_unique,
+            "completed_routes_unique": stats["completed_routes_unique"],
             "completed_routes_total": completed_total,
-            "total_distance_km": round(float(_at(row, 2, 0) or 0), 2),
-            "total_elevation_gain_m": int(round(float(_at(row, 3, 0) or 0))),
-            "avg_distance_km": round(float(_at(row, 4, 0) or 0), 2),
-            "avg_elevation_gain_m": round(float(_at(row, 5, 0) or 0), 1),
-            "first_completed_at": (_at(row, 6, None).isoformat() if _at(row, 6, None) else None),
-            "last_completed_at": (_at(row, 7, None).isoformat() if _at(row, 7, None) else None),
-            "active_routes_last_30d": int(_at(row, 8, 0) or 0),
+            "total_distance_km": round(stats["sum_distance_km"], 2),
+            "total_elevation_gain_m": int(round(stats["sum_elevation_gain"])),
+            "avg_distance_km": round(stats["sum_distance_km"] / completed_total, 2) if completed_total else 0.0,
+            "avg_elevation_gain_m": round(stats["sum_elevation_gain"] / completed_total, 1) if completed_total else 0.0,
+            "first_completed_at": first_completed_at.isoformat() if first_completed_at else None,
+            "last_completed_at": last_completed_at.isoformat() if last_completed_at else None,
+            "active_routes_last_30d": stats["active_routes_last_30d"],
             "difficulty_counts": difficulty_counts,
             "top_difficulty": top_difficulty,
             "initial_preferences": {
                 "fitness_level": base_fitness,
                 "preferred_distance": base_distance,
-                "environment_type": (_at(pref, 2, None) if pref else None),
-                "cultural_interest": (_at(pref, 3, None) if pref else None),
+                "environment_type": (pref[2] if pref else None),
+                "cultural_interest": (pref[3] if pref else None),
             },
             "effective_preferences": {
                 "fitness_level": adaptive.get("effective_fitness_level"),
@@ -576,6 +534,7 @@ def personal_stats():
 
 
 @social_bp.get("/<int:route_id>/ratings")
+@conditional_get(lambda route_id: [f"ratings:{route_id}"])
 def list_ratings(route_id: int):
     conn = get_connection()
     try:
@@ -635,9 +594,10 @@ def rate_route(route_id: int):
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT rating_id
+                SELECT rating_id, score
                 FROM ratings
                 WHERE user_id = %s AND route_id = %s
+                FOR UPDATE
                 """,
                 (user_id, route_id),
             )
@@ -656,7 +616,9 @@ def rate_route(route_id: int):
                     (score_int, comment, row[0]),
                 )
                 rating_id = cur.fetchone()[0]
+                add_rating(conn, route_id, 0, score_int - int(row[1] or 0))
                 conn.commit()
+                http_cache.invalidate([f"ratings:{route_id}", "route_social"])
                 return jsonify({
                     "rating_id": rating_id,
                     "route_id": route_id,
@@ -675,7 +637,9 @@ def rate_route(route_id: int):
             )
             rating_id = cur.fetchone()[0]
 
+        add_rating(conn, route_id, 1, score_int)
         conn.commit()
+        http_cache.invalidate([f"ratings:{route_id}", "route_social"])
         return jsonify({
             "rating_id": rating_id,
             "route_id": route_id,
@@ -2,27 +2,11 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from db import get_connection
+from services.learning_stats import load_learning
 
 user_preferences_bp = Blueprint("user_preferences", __name__, url_prefix="/user-preferences")
 
 
-def _ensure_user_route_completions_table(conn):
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS user_route_completions (
-                completion_id SERIAL PRIMARY KEY,
-                user_id INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-                route_id INT NOT NULL REFERENCES routes(route_id) ON DELETE CASCADE,
-                completion_count INT NOT NULL DEFAULT 1,
-                first_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                last_completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                UNIQUE (user_id, route_id)
-            )
-            """
-        )
-
-
 def _fitness_to_rank(fitness: str) -> int:
     value = (fitness or "").strip().lower()
     if value in {"alta", "alto", "high"}:
@@ -101,7 +85,6 @@ def get_preferences():
 
     conn = get_connection()
     try:
-        _ensure_user_route_completions_table(conn)
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -114,52 +97,14 @@ def get_preferences():
             )
             row = cur.fetchone()
 
-            cur.execute(
-                """
-                SELECT
-                    COALESCE(SUM(urc.completion_count), 0) AS total_completions,
-                    COALESCE(
-                        SUM(urc.completion_count * COALESCE(r.distance_km, 0))
-                        / NULLIF(SUM(urc.completion_count), 0),
-                        0
-                    ) AS avg_distance_km,
-                    COALESCE(
-                        SUM(urc.completion_count * COALESCE(r.elevation_gain, 0))
-                        / NULLIF(SUM(urc.completion_count), 0),
-                        0
-                    ) AS avg_elevation_gain,
-                    COALESCE(
-                        SUM(
-                            urc.completion_count *
-                            CASE
-                                WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%molt%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%muy%%' THEN 3
-                                WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%dif%%' THEN 2
-                                WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%mitj%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%moder%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%media%%' THEN 1
-                                ELSE 0
-                            END
-                        )
-                        / NULLIF(SUM(urc.completion_count), 0),
-                        0
-                    ) AS avg_difficulty_rank
-                FROM user_route_completions urc
-                JOIN routes r ON r.route_id = urc.route_id
-                WHERE urc.user_id = %s
-                """,
-                (user_id,),
-            )
-            learning_row = cur.fetchone()
-
         if row is None:
             return jsonify({}), 200
 
+        # Agregats incrementals (user_learning_stats): lectura O(1)
+        learning = load_learning(conn, user_id)
+
         base_fitness = row[2] or "baixa"
         base_distance = float(row[3]) if row[3] is not None else 10.0
-        learning = {
-            "total_completions": int(learning_row[0] or 0),
-            "avg_distance_km": float(learning_row[1] or 0),
-            "avg_elevation_gain": float(learning_row[2] or 0),
-            "avg_difficulty_rank": float(learning_row[3] or 0),
-        }
         adaptive = _compute_adaptive_signals(base_fitness, base_distance, learning)
 
         return jsonify({
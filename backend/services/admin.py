@@ -0,0 +1,26 @@
+"""
+Operator access for reports and diagnostics.
+
+The app has no roles: the operators are the user_ids listed in
+ADMIN_USER_IDS (comma separated). With the variable unset nobody is an
+operator, so the restricted endpoints answer 403.
+"""
+
+import os
+
+
+def admin_user_ids() -> set:
+    raw = os.getenv("ADMIN_USER_IDS") or ""
+    out = set()
+    for part in raw.split(","):
+        part = part.strip()
+        if part.isdigit():
+            out.add(int(part))
+    return out
+
+
+def is_admin(user_id) -> bool:
+    try:
+        return int(user_id) in admin_user_ids()
+    except (TypeError, ValueError):
+        return False
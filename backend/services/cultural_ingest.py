@@ -0,0 +1,440 @@
+"""
+Bulk loader for cultural_items (heritage inventory dumps).
+
+Rows are streamed from CSV or GeoJSON, validated and normalized (title,
+coordinates, item_type), and COPYed in batches into a temporary staging
+table, so memory stays constant whatever the size of the dump.
+
+Duplicates are resolved against the staging table and cultural_items:
+two records are the same item when they are within dedupe_radius_m of
+each other (candidates are found by a spatial hash, the latitude band of
+the point, plus a longitude range) and their normalized titles are
+similar enough (difflib ratio >= similarity). The candidate pairs are
+streamed from Postgres and only the decisions are written back.
+
+The merge updates matched items (only when something changed) and
+inserts the new ones in the caller's transaction. The triggers of
+migration 0014 then queue exactly the inserted and moved items for the
+incremental route association job.
+"""
+
+import csv
+import io
+import json
+import math
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+from services.geo_utils import haversine_m
+
+try:
+    import ijson
+except ImportError:  # ijson és opcional: sense ell una FeatureCollection es llegeix sencera
+    ijson = None
+
+# Tipus de l'inventari del patrimoni (els mateixos que classifiquen els booleans de les rutes)
+ITEM_TYPES = (
+    "conjunt arquitectònic",
+    "edifici",
+    "element arquitectònic",
+    "element urbà",
+    "obra civil",
+    "jaciment arqueològic",
+    "jaciment paleontològic",
+    "espècimen botànic",
+    "zona d'interès",
+    "costumari",
+    "manifestació festiva",
+    "música i dansa",
+    "tradició oral",
+    "tècnica artesanal",
+    "fons bibliogràfic",
+    "fons d'imatges",
+    "fons documental",
+    "col·lecció",
+    "objecte",
+)
+
+# Noms de columna/propietat acceptats per a cada camp
+_FIELD_ALIASES = {
+    "title": ("title", "titol", "títol", "nom", "name", "denominacio", "denominació"),
+    "description": ("description", "descripcio", "descripció", "desc"),
+    "latitude": ("latitude", "latitud", "lat", "y"),
+    "longitude": ("longitude", "longitud", "lon", "lng", "x"),
+    "period": ("period", "periode", "període", "epoca", "època", "estil"),
+    "item_type": ("item_type", "tipus", "tipologia", "type", "ambit", "àmbit"),
+    "source_url": ("source_url", "url", "link", "enllac", "enllaç"),
+}
+
+STAGING_COLUMNS = (
+    "row_id", "title", "description", "latitude", "longitude",
+    "period", "item_type", "source_url", "title_key", "cell_y", "dlon",
+)
+
+_M_PER_DEG_LAT = 111320.0
+
+
+def _fold(text: str) -> str:
+    """Lowercase, no accents, typographic apostrophes and middle dots unified."""
+    text = (text or "").strip().lower().replace("’", "'").replace("`", "'").replace("l.l", "l·l")
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+_TYPE_BY_FOLDED = {re.sub(r"\s+", " ", _fold(t)): t for t in ITEM_TYPES}
+
+
+def normalize_item_type(value):
+    """(item_type, known): canonical inventory type, or the cleaned value and False."""
+    cleaned = re.sub(r"\s+", " ", (value or "").strip().lower())
+    if not cleaned:
+        return None, True
+    canonical = _TYPE_BY_FOLDED.get(re.sub(r"\s+", " ", _fold(cleaned)))
+    if canonical is not None:
+        return canonical, True
+    return cleaned, False
+
+
+def title_key(title: str) -> str:
+    """Title reduced to lowercase ASCII words, for similarity comparisons."""
+    return " ".join(re.findall(r"[a-z0-9]+", _fold(title)))
+
+
+def titles_similar(a_key: str, b_key: str, similarity: float) -> float:
+    """Similarity ratio of two title keys if it reaches the threshold, else 0."""
+    if not a_key or not b_key:
+        return 0.0
+    if a_key == b_key:
+        return 1.0
+    ratio = SequenceMatcher(None, a_key, b_key).ratio()
+    return ratio if ratio >= similarity else 0.0
+
+
+def _pick(record: dict, field: str):
+    for name in _FIELD_ALIASES[field]:
+        value = record.get(name)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _clean_text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def normalize_record(record: dict, strict_types: bool = False) -> dict:
+    """
+    Validated cultural_items row from a raw record (keys are matched
+    case-insensitively through the aliases). Raises ValueError with a
+    short reason: "title", "coordinates", "item_type".
+    """
+    record = {str(k).strip().lower(): v for k, v in record.items()}
+
+    title = _clean_text(_pick(record, "title"))
+    if not title:
+        raise ValueError("title")
+
+    try:
+        lat = float(str(_pick(record, "latitude")).replace(",", "."))
+        lon = float(str(_pick(record, "longitude")).replace(",", "."))
+    except (TypeError, ValueError):
+        raise ValueError("coordinates")
+    if not (math.isfinite(lat) and math.isfinite(lon)) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("coordinates")
+    if lat == 0 and lon == 0:
+        raise ValueError("coordinates")
+
+    item_type, known = normalize_item_type(_clean_text(_pick(record, "item_type")))
+    if not known and strict_types:
+        raise ValueError("item_type")
+
+    return {
+        "title": title,
+        "description": _clean_text(_pick(record, "description")),
+        "latitude": lat,
+        "longitude": lon,
+        "period": _clean_text(_pick(record, "period")),
+        "item_type": item_type,
+        "source_url": _clean_text(_pick(record, "source_url")),
+        "known_type": known,
+    }
+
+
+def iter_csv(f, delimiter: str = None):
+    """Dicts from a CSV stream; the delimiter is sniffed when not given."""
+    if delimiter is None:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+        except csv.Error:
+            delimiter = ","
+    yield from csv.DictReader(f, delimiter=delimiter)
+
+
+def _feature_record(feature: dict) -> dict:
+    record = dict(feature.get("properties") or {})
+    geometry = feature.get("geometry") or {}
+    # Sense geometria Point només valen les coordenades de les propietats
+    if geometry.get("type") == "Point" and len(geometry.get("coordinates") or []) >= 2:
+        record["longitude"], record["latitude"] = geometry["coordinates"][:2]
+    return record
+
+
+def iter_geojson(f, lines: bool = False):
+    """
+    Dicts from a GeoJSON FeatureCollection, or from GeoJSON Lines (one
+    Feature per line) with lines=True. A FeatureCollection is streamed
+    with ijson when installed; otherwise it is parsed in one go.
+    """
+    if lines:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield _feature_record(json.loads(line))
+        return
+    if ijson is not None:
+        for feature in ijson.items(f, "features.item", use_float=True):
+            yield _feature_record(feature)
+        return
+    for feature in json.load(f).get("features") or []:
+        yield _feature_record(feature)
+
+
+def _lat_cell_deg(dedupe_radius_m: float) -> float:
+    return dedupe_radius_m / _M_PER_DEG_LAT
+
+
+def _dlon(lat: float, dedupe_radius_m: float) -> float:
+    return dedupe_radius_m / (_M_PER_DEG_LAT * max(math.cos(math.radians(min(abs(lat), 89.9))), 1e-6))
+
+
+def _copy(cur, table: str, columns, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def create_staging(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TEMP TABLE ingest_staging (
+                row_id BIGINT PRIMARY KEY,
+                title TEXT NOT NULL,
+                description TEXT,
+                latitude DOUBLE PRECISION NOT NULL,
+                longitude DOUBLE PRECISION NOT NULL,
+                period TEXT,
+                item_type TEXT,
+                source_url TEXT,
+                title_key TEXT NOT NULL,
+                cell_y INT NOT NULL,
+                dlon DOUBLE PRECISION NOT NULL
+            ) ON COMMIT DROP
+            """
+        )
+        cur.execute("CREATE TEMP TABLE ingest_dupes (row_id BIGINT PRIMARY KEY) ON COMMIT DROP")
+        cur.execute("CREATE TEMP TABLE ingest_matches (row_id BIGINT PRIMARY KEY, item_id INT NOT NULL) ON COMMIT DROP")
+
+
+def stage_records(conn, records, dedupe_radius_m: float = 50.0, strict_types: bool = False, batch_size: int = 5000, progress=None) -> dict:
+    """
+    Normalize the raw records and COPY them into ingest_staging in
+    batches. Returns {"read", "staged", "invalid": {reason: n},
+    "unknown_types": {type: n}} (at most 50 distinct unknown types).
+    """
+    cell = _lat_cell_deg(dedupe_radius_m)
+    stats = {"read": 0, "staged": 0, "invalid": {}, "unknown_types": {}}
+    batch = []
+
+    def flush(cur):
+        if batch:
+            _copy(cur, "ingest_staging", STAGING_COLUMNS, batch)
+            stats["staged"] += len(batch)
+            batch.clear()
+            if progress is not None:
+                progress("staged", stats["staged"])
+
+    with conn.cursor() as cur:
+        for record in records:
+            stats["read"] += 1
+            try:
+                row = normalize_record(record, strict_types=strict_types)
+            except ValueError as e:
+                stats["invalid"][str(e)] = stats["invalid"].get(str(e), 0) + 1
+                continue
+            if not row["known_type"] and row["item_type"]:
+                unknown = stats["unknown_types"]
+                if row["item_type"] in unknown or len(unknown) < 50:
+                    unknown[row["item_type"]] = unknown.get(row["item_type"], 0) + 1
+            batch.append((
+                stats["read"], row["title"], row["description"], row["latitude"], row["longitude"],
+                row["period"], row["item_type"], row["source_url"], title_key(row["title"]),
+                int(math.floor(row["latitude"] / cell)), _dlon(row["latitude"], dedupe_radius_m),
+            ))
+            if len(batch) >= batch_size:
+                flush(cur)
+        flush(cur)
+        cur.execute("CREATE INDEX ON ingest_staging (cell_y, longitude)")
+        cur.execute("ANALYZE ingest_staging")
+    return stats
+
+
+def _stream(conn, name: str, sql: str, params, itersize: int):
+    with conn.cursor(name=name) as cur:
+        cur.itersize = itersize
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+
+
+def _find_duplicates(conn, dedupe_radius_m: float, similarity: float, batch_size: int) -> int:
+    """Mark staging rows that repeat an earlier staging row; returns how many."""
+    dupes = 0
+    batch = []
+    last = None
+    with conn.cursor() as cur:
+        pairs = _stream(
+            conn,
+            "ingest_dupe_pairs",
+            """
+            SELECT b.row_id, b.title_key, b.latitude, b.longitude, a.title_key, a.latitude, a.longitude
+            FROM ingest_staging b
+            JOIN ingest_staging a
+              ON a.cell_y BETWEEN b.cell_y - 1 AND b.cell_y + 1
+             AND a.longitude BETWEEN b.longitude - b.dlon AND b.longitude + b.dlon
+             AND a.row_id < b.row_id
+            ORDER BY b.row_id
+            """,
+            None,
+            batch_size,
+        )
+        for row_id, b_key, b_lat, b_lon, a_key, a_lat, a_lon in pairs:
+            if row_id == last:
+                continue
+            if haversine_m(b_lat, b_lon, a_lat, a_lon) <= dedupe_radius_m and titles_similar(b_key, a_key, similarity):
+                batch.append((row_id,))
+                last = row_id
+                if len(batch) >= batch_size:
+                    _copy(cur, "ingest_dupes", ("row_id",), batch)
+                    dupes += len(batch)
+                    batch.clear()
+        if batch:
+            _copy(cur, "ingest_dupes", ("row_id",), batch)
+            dupes += len(batch)
+    return dupes
+
+
+def _match_existing(conn, dedupe_radius_m: float, similarity: float, batch_size: int) -> int:
+    """Map staging rows (not duplicates) to the existing item they repeat; returns how many."""
+    matched = 0
+    batch = []
+    current = None
+    best = None
+
+    def close_current():
+        if current is not None and best is not None:
+            batch.append((current, best[2]))
+
+    with conn.cursor() as cur:
+        pairs = _stream(
+            conn,
+            "ingest_existing_pairs",
+            """
+            SELECT s.row_id, s.title_key, s.latitude, s.longitude, ci.item_id, ci.title, ci.latitude, ci.longitude
+            FROM ingest_staging s
+            JOIN cultural_items ci
+              ON ci.latitude BETWEEN s.latitude - %s AND s.latitude + %s
+             AND ci.longitude BETWEEN s.longitude - s.dlon AND s.longitude + s.dlon
+            WHERE NOT EXISTS (SELECT 1 FROM ingest_dupes d WHERE d.row_id = s.row_id)
+            ORDER BY s.row_id, ci.item_id
+            """,
+            (_lat_cell_deg(dedupe_radius_m), _lat_cell_deg(dedupe_radius_m)),
+            batch_size,
+        )
+        for row_id, s_key, s_lat, s_lon, item_id, ci_title, ci_lat, ci_lon in pairs:
+            if row_id != current:
+                close_current()
+                current, best = row_id, None
+                if len(batch) >= batch_size:
+                    _copy(cur, "ingest_matches", ("row_id", "item_id"), batch)
+                    matched += len(batch)
+                    batch.clear()
+            dist = haversine_m(s_lat, s_lon, float(ci_lat), float(ci_lon))
+            if dist > dedupe_radius_m:
+                continue
+            score = titles_similar(s_key, title_key(ci_title), similarity)
+            # El més semblant i, a igualtat, el més proper
+            if score and (best is None or (score, -dist) > (best[0], best[1])):
+                best = (score, -dist, int(item_id))
+        close_current()
+        if batch:
+            _copy(cur, "ingest_matches", ("row_id", "item_id"), batch)
+            matched += len(batch)
+    return matched
+
+
+def _merge(conn) -> dict:
+    with conn.cursor() as cur:
+        # Un ítem existent repetit a l'entrada s'actualitza amb la primera fila
+        cur.execute(
+            """
+            UPDATE cultural_items ci
+            SET description = COALESCE(s.description, ci.description),
+                latitude = s.latitude,
+                longitude = s.longitude,
+                period = COALESCE(s.period, ci.period),
+                item_type = COALESCE(s.item_type, ci.item_type),
+                source_url = COALESCE(s.source_url, ci.source_url)
+            FROM (
+                SELECT DISTINCT ON (m.item_id) m.item_id, st.*
+                FROM ingest_matches m
+                JOIN ingest_staging st ON st.row_id = m.row_id
+                ORDER BY m.item_id, m.row_id
+            ) s
+            WHERE ci.item_id = s.item_id
+              AND (ci.description, ci.latitude, ci.longitude, ci.period, ci.item_type, ci.source_url)
+                  IS DISTINCT FROM
+                  (COALESCE(s.description, ci.description), s.latitude, s.longitude,
+                   COALESCE(s.period, ci.period), COALESCE(s.item_type, ci.item_type),
+                   COALESCE(s.source_url, ci.source_url))
+            """
+        )
+        updated = cur.rowcount
+        cur.execute(
+            """
+            INSERT INTO cultural_items (title, description, latitude, longitude, period, item_type, source_url)
+            SELECT s.title, s.description, s.latitude, s.longitude, s.period, s.item_type, s.source_url
+            FROM ingest_staging s
+            WHERE NOT EXISTS (SELECT 1 FROM ingest_dupes d WHERE d.row_id = s.row_id)
+              AND NOT EXISTS (SELECT 1 FROM ingest_matches m WHERE m.row_id = s.row_id)
+            ORDER BY s.row_id
+            """
+        )
+        inserted = cur.rowcount
+    return {"updated": updated, "inserted": inserted}
+
+
+def ingest(conn, records, dedupe_radius_m: float = 50.0, similarity: float = 0.85, strict_types: bool = False, batch_size: int = 5000, progress=None) -> dict:
+    """
+    Stage, dedupe and merge records into cultural_items in the caller's
+    transaction (commit it to apply, roll back for a dry run).
+    progress(phase, count) is called as the load advances.
+    """
+    create_staging(conn)
+    stats = stage_records(conn, records, dedupe_radius_m, strict_types, batch_size, progress)
+    stats["duplicates_in_input"] = _find_duplicates(conn, dedupe_radius_m, similarity, batch_size)
+    if progress is not None:
+        progress("deduped", stats["duplicates_in_input"])
+    stats["matched_existing"] = _match_existing(conn, dedupe_radius_m, similarity, batch_size)
+    if progress is not None:
+        progress("matched", stats["matched_existing"])
+    stats.update(_merge(conn))
+    return stats
@@ -13,8 +13,26 @@ Standard hiking scales:
 - Moderate: some fitness required, moderate elevation
 - Difficult: good fitness required, significant elevation
 - Very Difficult: excellent fitness required, steep climbs
+
+The difficulty is persisted in routes.difficulty together with
+routes.difficulty_version. Bump DIFFICULTY_FORMULA_VERSION whenever the
+formula or thresholds change, then run update_difficulties.py to
+reclassify the stale rows.
 """
 
+import bisect
+
+import numpy as np
+
+DIFFICULTY_FORMULA_VERSION = 1
+
+_SCORE_THRESHOLDS = (7, 17, 27)
+
+_LABELS = {
+    'es': ("Fácil", "Moderada", "Difícil", "Muy Difícil"),
+    'ca': ("Fàcil", "Mitjana", "Difícil", "Molt Difícil"),
+}
+
 def calculate_difficulty(distance_km: float, elevation_gain: int, estimated_time: str = None, lang: str = 'es') -> str:
     """
     Calculate route difficulty based on hiking parameters.
@@ -63,20 +81,8 @@ def calculate_difficulty(distance_km: float, elevation_gain: int, estimated_time
                 difficulty_score *= time_ratio * 0.3  # Apply small adjustment
     
     # Classify with adjusted thresholds to widen distribution
-    if difficulty_score < 7:
-        if lang == 'ca':
-            return "Fàcil"
-        return "Fácil"
-    elif difficulty_score < 17:
-        if lang == 'ca':
-            return "Mitjana"
-        return "Moderada"
-    elif difficulty_score < 27:
-        return "Difícil"
-    else:
-        if lang == 'ca':
-            return "Molt Difícil"
-        return "Muy Difícil"
+    labels = _LABELS['ca'] if lang == 'ca' else _LABELS['es']
+    return labels[bisect.bisect_right(_SCORE_THRESHOLDS, difficulty_score)]
 
 
 def _parse_time_to_minutes(time_str: str) -> int:
@@ -149,3 +155,50 @@ def get_difficulty_score(distance_km: float, elevation_gain: int) -> float:
         elevation_gain = 0
     
     return (distance_km * 1.2) + (elevation_gain / 80)
+
+
+def calculate_difficulty_batch(distances_km, elevation_gains, estimated_times=None, lang: str = 'es') -> list:
+    """
+    Vectorized version of calculate_difficulty for many routes at once.
+    Gives exactly the same result as calling calculate_difficulty per row.
+
+    Args:
+        distances_km: Sequence of distances (None allowed)
+        elevation_gains: Sequence of elevation gains (None allowed)
+        estimated_times: Optional sequence of time strings
+        lang: Language for output ('es' or 'ca')
+
+    Returns:
+        List of difficulty labels, in input order
+    """
+    n = len(distances_km)
+    if n == 0:
+        return []
+
+    distance = np.array([d if d is not None else 0 for d in distances_km], dtype=np.float64)
+    elevation = np.array([e if e is not None else 0 for e in elevation_gains], dtype=np.float64)
+    distance[distance < 0] = 0
+    elevation[elevation < 0] = 0
+
+    # Time strings repeat a lot ("2:30", "3h"...): parse each distinct value once
+    time_minutes = np.zeros(n, dtype=np.float64)
+    if estimated_times is not None:
+        parsed = {}
+        for i, t in enumerate(estimated_times):
+            if not t:
+                continue
+            if t not in parsed:
+                parsed[t] = _parse_time_to_minutes(t) or 0
+            time_minutes[i] = parsed[t]
+
+    score = (distance * 1.2) + (elevation / 80)
+
+    expected_minutes = (distance / 4 + (elevation / 300) * 0.5) * 60
+    has_time = (time_minutes > 0) & (expected_minutes > 0)
+    ratio = np.divide(time_minutes, expected_minutes, out=np.zeros(n), where=has_time)
+    adjust = has_time & (ratio > 1.2)
+    score = np.where(adjust, score * ratio * 0.3, score)
+
+    labels = _LABELS['ca'] if lang == 'ca' else _LABELS['es']
+    buckets = np.searchsorted(np.array(_SCORE_THRESHOLDS, dtype=np.float64), score, side='right')
+    return [labels[b] for b in buckets.tolist()]
@@ -0,0 +1,108 @@
+"""
+Batch recomputation of the persisted route difficulty.
+
+routes.difficulty is derived data: it is stored together with
+routes.difficulty_version, and every row whose version is older than
+DIFFICULTY_FORMULA_VERSION is reclassified in bulk here.
+"""
+
+from psycopg2.extras import execute_values
+
+from services.difficulty_calculator import DIFFICULTY_FORMULA_VERSION, calculate_difficulty_batch
+
+
+def count_stale_routes(conn, version: int = DIFFICULTY_FORMULA_VERSION) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT COUNT(*)
+            FROM routes
+            WHERE difficulty_version < %s OR difficulty IS NULL OR difficulty = ''
+            """,
+            (version,),
+        )
+        return int(cur.fetchone()[0])
+
+
+def recompute_difficulties(
+    conn,
+    batch_size: int = 2000,
+    force: bool = False,
+    dry_run: bool = False,
+    version: int = DIFFICULTY_FORMULA_VERSION,
+    progress=None,
+) -> dict:
+    """
+    Reclassify routes with a stale (or, with force=True, any) difficulty.
+
+    Rows are read in keyset batches by route_id, classified with
+    calculate_difficulty_batch and written back with a single
+    UPDATE ... FROM (VALUES ...) per batch. Each batch is committed on
+    its own so a long backfill does not hold one huge transaction.
+
+    progress, if given, is called as progress(processed, changed).
+    Returns {"processed": int, "changed": int, "version": int}.
+    """
+    stale_sql = "" if force else "AND (difficulty_version < %s OR difficulty IS NULL OR difficulty = '')"
+
+    processed = 0
+    changed = 0
+    last_id = 0
+
+    while True:
+        params = [last_id]
+        if not force:
+            params.append(version)
+        params.append(batch_size)
+
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT route_id, distance_km, elevation_gain, estimated_time, difficulty
+                FROM routes
+                WHERE route_id > %s {stale_sql}
+                ORDER BY route_id ASC
+                LIMIT %s
+                """,
+                params,
+            )
+            rows = cur.fetchall()
+
+        if not rows:
+            break
+
+        last_id = int(rows[-1][0])
+        difficulties = calculate_difficulty_batch(
+            [float(r[1]) if r[1] is not None else 0.0 for r in rows],
+            [int(r[2]) if r[2] is not None else 0 for r in rows],
+            [r[3] or "" for r in rows],
+            lang='ca',
+        )
+
+        values = [(int(r[0]), d) for r, d in zip(rows, difficulties)]
+        changed += sum(1 for r, d in zip(rows, difficulties) if (r[4] or "") != d)
+        processed += len(rows)
+
+        if not dry_run:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    UPDATE routes AS r
+                    SET difficulty = v.difficulty,
+                        difficulty_version = %s
+                    FROM (VALUES %%s) AS v(route_id, difficulty)
+                    WHERE r.route_id = v.route_id
+                    """ % int(version),
+                    values,
+                    page_size=batch_size,
+                )
+            conn.commit()
+
+        if progress is not None:
+            progress(processed, changed)
+
+        if len(rows) < batch_size:
+            break
+
+    return {"processed": processed, "changed": changed, "version": version}
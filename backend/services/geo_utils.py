@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 def haversine_m(lat1, lon1, lat2, lon2):
     R = 6371000.0
     phi1 = math.radians(lat1)
@@ -17,3 +19,15 @@ def bbox_for_radius(lat, lon, radius_m):
     # lon depende de latitud
     dlon = radius_m / (111320.0 * max(math.cos(math.radians(lat)), 1e-6))
     return (lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+
+
+def haversine_m_vec(lat1, lon1, lat2, lon2):
+    """Versió vectoritzada (NumPy) de haversine_m; accepta escalars o arrays amb broadcasting."""
+    R = 6371000.0
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = phi2 - phi1
+    dl = np.radians(np.asarray(lon2) - np.asarray(lon1))
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dl / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,229 @@
+"""
+Vectorized polyline geometry for GPS tracks.
+
+Distances are computed in a local equirectangular projection centred on
+each chunk of segments. For the distances involved here (a few km around
+a hiking track) the error against the great-circle distance is far below
+GPS accuracy, and it makes exact point-to-segment distance a handful of
+NumPy operations.
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+_M_PER_DEG_LAT = math.pi * EARTH_RADIUS_M / 180.0
+
+# Segments per bloc: acota la matriu punts x segments
+SEGMENT_CHUNK = 256
+
+
+def _as_array(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+def polyline_length_m(lats, lons) -> float:
+    """Length of the polyline in metres (haversine per segment)."""
+    lats = _as_array(lats)
+    lons = _as_array(lons)
+    if len(lats) < 2:
+        return 0.0
+    phi = np.radians(lats)
+    dphi = np.diff(phi)
+    dl = np.radians(np.diff(lons))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(dl / 2) ** 2
+    return float(np.sum(2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))))
+
+
+def _segment_distances(px, py, ax, ay, bx, by):
+    """
+    Distance from each point (px, py) to each segment A->B, all already in
+    metres in the same planar frame. Returns a points x segments matrix.
+    """
+    abx = bx - ax
+    aby = by - ay
+    len2 = abx * abx + aby * aby
+
+    apx = px[:, None] - ax[None, :]
+    apy = py[:, None] - ay[None, :]
+
+    # Segments degenerats (dos punts iguals) es tracten com a punts
+    safe_len2 = np.where(len2 > 0, len2, 1.0)
+    t = (apx * abx[None, :] + apy * aby[None, :]) / safe_len2[None, :]
+    t = np.where(len2[None, :] > 0, np.clip(t, 0.0, 1.0), 0.0)
+
+    dx = apx - t * abx[None, :]
+    dy = apy - t * aby[None, :]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def points_to_polyline_m(point_lats, point_lons, line_lats, line_lons, max_distance_m: float = None):
+    """
+    Exact minimum distance (metres) from every point to the polyline,
+    considering the full segments, not only the vertices.
+
+    With max_distance_m, segment chunks whose bounding box (buffered by
+    max_distance_m) does not contain a point are skipped for it; points
+    farther than max_distance_m from every chunk get np.inf.
+    """
+    plat = _as_array(point_lats)
+    plon = _as_array(point_lons)
+    llat = _as_array(line_lats)
+    llon = _as_array(line_lons)
+
+    out = np.full(len(plat), np.inf)
+    if not len(plat) or not len(llat):
+        return out
+
+    if len(llat) == 1:
+        # Polilínia d'un sol punt: distància punt a punt
+        llat = np.concatenate([llat, llat])
+        llon = np.concatenate([llon, llon])
+
+    n_seg = len(llat) - 1
+    for start in range(0, n_seg, SEGMENT_CHUNK):
+        stop = min(start + SEGMENT_CHUNK, n_seg)
+        # Vèrtexs start..stop inclusius -> segments start..stop-1
+        clat = llat[start:stop + 1]
+        clon = llon[start:stop + 1]
+
+        lat0 = float(clat.mean())
+        lon0 = float(clon.mean())
+        kx = _M_PER_DEG_LAT * math.cos(math.radians(lat0))
+        ky = _M_PER_DEG_LAT
+
+        if max_distance_m is not None:
+            dlat = max_distance_m / ky
+            dlon = max_distance_m / max(kx, 1e-6)
+            sel = np.nonzero(
+                (plat >= clat.min() - dlat) & (plat <= clat.max() + dlat)
+                & (plon >= clon.min() - dlon) & (plon <= clon.max() + dlon)
+            )[0]
+            if not len(sel):
+                continue
+        else:
+            sel = np.arange(len(plat))
+
+        vx = (clon - lon0) * kx
+        vy = (clat - lat0) * ky
+        px = (plon[sel] - lon0) * kx
+        py = (plat[sel] - lat0) * ky
+
+        d = _segment_distances(px, py, vx[:-1], vy[:-1], vx[1:], vy[1:]).min(axis=1)
+        out[sel] = np.minimum(out[sel], d)
+
+    if max_distance_m is not None:
+        out[out > max_distance_m] = np.inf
+    return out
+
+
+def point_to_polyline_m(lat: float, lon: float, line_lats, line_lons) -> float:
+    """Exact distance (metres) from one point to the polyline."""
+    return float(points_to_polyline_m([lat], [lon], line_lats, line_lons)[0])
+
+
+def polyline_bbox(lats, lons):
+    """(lat_min, lat_max, lon_min, lon_max) of the polyline."""
+    lats = _as_array(lats)
+    lons = _as_array(lons)
+    return float(lats.min()), float(lats.max()), float(lons.min()), float(lons.max())
+
+
+def _project(lats, lons):
+    """Planar metres around the polyline centre (same frame as above)."""
+    lat0 = float(lats.mean())
+    kx = _M_PER_DEG_LAT * math.cos(math.radians(lat0))
+    return (lons - float(lons.mean())) * kx, (lats - lat0) * _M_PER_DEG_LAT
+
+
+def simplify_douglas_peucker(lats, lons, tolerance_m: float):
+    """
+    Indices of the vertices kept by Douglas-Peucker: no removed vertex is
+    farther than tolerance_m from the simplified polyline. Endpoints are
+    always kept.
+    """
+    lats = _as_array(lats)
+    lons = _as_array(lons)
+    n = len(lats)
+    if n <= 2 or tolerance_m <= 0:
+        return np.arange(n)
+
+    x, y = _project(lats, lons)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        d = _segment_distances(x[a + 1:b], y[a + 1:b], x[a:a + 1], y[a:a + 1], x[b:b + 1], y[b:b + 1])[:, 0]
+        i = int(np.argmax(d))
+        if d[i] > tolerance_m:
+            mid = a + 1 + i
+            keep[mid] = True
+            stack.append((a, mid))
+            stack.append((mid, b))
+
+    return np.nonzero(keep)[0]
+
+
+def simplify_visvalingam(lats, lons, tolerance_m: float):
+    """
+    Indices of the vertices kept by Visvalingam-Whyatt: vertices whose
+    effective triangle area is below tolerance_m ** 2 are removed, smallest
+    first. Endpoints are always kept.
+    """
+    lats = _as_array(lats)
+    lons = _as_array(lons)
+    n = len(lats)
+    if n <= 2 or tolerance_m <= 0:
+        return np.arange(n)
+
+    x, y = _project(lats, lons)
+    x = x.tolist()
+    y = y.tolist()
+    min_area = tolerance_m * tolerance_m
+
+    def area(p, i, q):
+        return abs((x[p] - x[i]) * (y[q] - y[i]) - (x[q] - x[i]) * (y[p] - y[i])) / 2.0
+
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    areas = [math.inf] * n
+    heap = []
+    for i in range(1, n - 1):
+        areas[i] = area(i - 1, i, i + 1)
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+
+    removed = [False] * n
+    last_area = 0.0
+    while heap:
+        a, i = heapq.heappop(heap)
+        if removed[i] or a != areas[i]:
+            continue
+        # L'àrea efectiva no pot ser menor que la del vèrtex eliminat abans
+        a = max(a, last_area)
+        if a >= min_area:
+            break
+        last_area = a
+        removed[i] = True
+        p, q = prev[i], nxt[i]
+        nxt[p] = q
+        prev[q] = p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                areas[j] = area(prev[j], j, nxt[j])
+                heapq.heappush(heap, (areas[j], j))
+
+    return np.nonzero(~np.asarray(removed))[0]
+
+
+def simplify_polyline(lats, lons, tolerance_m: float, method: str = "dp"):
+    """Indices kept by "dp" (Douglas-Peucker) or "vw" (Visvalingam-Whyatt)."""
+    if method == "vw":
+        return simplify_visvalingam(lats, lons, tolerance_m)
+    return simplify_douglas_peucker(lats, lons, tolerance_m)
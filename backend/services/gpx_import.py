@@ -0,0 +1,352 @@
+"""
+Bulk GPX import: one route per GPX file.
+
+Files are parsed in a process pool (streaming parse_gpx, one file per
+task, a bounded number in flight). Distance, elevation gain and, when the
+GPX has timestamps, the duration come from the parsed track; the
+difficulty is computed for a whole batch with calculate_difficulty_batch,
+which gives the same labels as calculate_difficulty row by row.
+
+Each batch then:
+  1. reserves its route_ids from the routes sequence (no transaction is
+     held open while uploading),
+  2. uploads the files to storage concurrently under <route_id>/<uuid>.gpx,
+  3. inserts routes, route_files and route_tracks of the uploaded files in
+     one transaction, fingerprints each track against the catalog (so
+     duplicates of existing routes, or within the same upload, are
+     reported) and enqueues their cultural association.
+
+Every file gets its own status, so one bad file does not fail the batch.
+If the inserts fail after the uploads, the batch is rolled back and its
+uploaded objects are deleted again (delete callback); objects that could
+not be deleted are reported in their status as "orphaned_path".
+Concurrent imports only share the sequence, so they do not block each other.
+"""
+
+import os
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from services import jobs
+from services.difficulty_calculator import DIFFICULTY_FORMULA_VERSION, calculate_difficulty_batch
+from services.gpx_parser import parse_gpx
+from services.track_fingerprint import fingerprint_route
+from services.track_store import save_track
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+MAX_FILE_BYTES = _env_int("GPX_IMPORT_MAX_FILE_BYTES", 20 * 1024 * 1024)
+MAX_FILES = _env_int("GPX_IMPORT_MAX_FILES", 500)
+
+
+def route_name_from_filename(filename: str) -> str:
+    base = os.path.basename(filename or "")
+    for ext in (".gpx.xml", ".gpx"):
+        if base.lower().endswith(ext):
+            base = base[: -len(ext)]
+            break
+    name = " ".join(base.replace("_", " ").replace("-", " ").split())
+    return name[:1].upper() + name[1:] if name else "Ruta importada"
+
+
+def _format_minutes(minutes: float) -> str:
+    minutes = int(round(minutes))
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def parse_gpx_file(filename: str, data: bytes) -> dict:
+    """
+    Parse one GPX (runs in a pool process). Returns {"file", "ok", ...}:
+    the route fields and the track arrays, or "error" with the reason.
+    """
+    out = {"file": filename, "ok": False}
+    if data is None:
+        out["error"] = "fitxer massa gran"
+        return out
+    if not (filename or "").lower().endswith((".gpx", ".gpx.xml")):
+        out["error"] = "no és un fitxer .gpx"
+        return out
+    if "<gpx" not in data[:2000].decode("utf-8", errors="ignore").lower():
+        out["error"] = "no sembla un GPX vàlid"
+        return out
+    try:
+        parsed = parse_gpx(data)
+    except Exception:
+        out["error"] = "no sembla un GPX vàlid"
+        return out
+
+    lat, lon, ele, _ = parsed.as_numpy()
+    idx = parsed.track_indices()
+    if len(idx) < 2:
+        out["error"] = "el GPX no té cap track"
+        return out
+
+    estimated_time = ""
+    if parsed.start_time is not None and parsed.end_time is not None and parsed.end_time > parsed.start_time:
+        estimated_time = _format_minutes((parsed.end_time - parsed.start_time) / 60.0)
+
+    out.update({
+        "ok": True,
+        "name": route_name_from_filename(filename),
+        "distance_km": round(parsed.distance_m / 1000.0, 2),
+        "elevation_gain": int(round(parsed.elevation_gain_m)),
+        "estimated_time": estimated_time,
+        "lats": lat[idx].copy(),
+        "lons": lon[idx].copy(),
+        "eles": ele[idx].copy(),
+    })
+    return out
+
+
+def iter_zip(fileobj, max_file_bytes: int = MAX_FILE_BYTES):
+    """
+    (filename, bytes) of every .gpx in a ZIP, read one at a time. Entries
+    larger than max_file_bytes (uncompressed) give None instead of bytes.
+    """
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            base = os.path.basename(info.filename)
+            if info.is_dir() or not base or base.startswith(".") or "__MACOSX" in info.filename:
+                continue
+            if not base.lower().endswith((".gpx", ".gpx.xml")):
+                continue
+            if info.file_size > max_file_bytes:
+                yield base, None
+                continue
+            yield base, zf.read(info)
+
+
+class GpxParsePool:
+    """Per-process pool of GPX parsing processes, created on first use."""
+
+    def __init__(self, processes: int = None):
+        self.processes = max(1, processes or _env_int("GPX_IMPORT_PROCESSES", os.cpu_count() or 1))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # gunicorn fa fork després d'importar: el pool és per procés
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+                self._pid = os.getpid()
+            return self._executor
+
+    def parse(self, named_files):
+        """
+        Yield (data, parse_gpx_file result) in input order; named_files
+        yields (filename, bytes). At most 2 * processes files are in flight.
+        """
+        executor = self.executor()
+        pending = []
+        for filename, data in named_files:
+            pending.append((data, executor.submit(parse_gpx_file, filename, data)))
+            if len(pending) >= 2 * self.processes:
+                data, future = pending.pop(0)
+                yield data, future.result()
+        for data, future in pending:
+            yield data, future.result()
+
+
+gpx_parse_pool = GpxParsePool()
+
+
+def _reserve_route_ids(conn, n: int):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT nextval(pg_get_serial_sequence('routes', 'route_id')) FROM generate_series(1, %s)",
+            (n,),
+        )
+        ids = [int(r[0]) for r in cur.fetchall()]
+    # nextval no es desfà: no cal mantenir la transacció oberta durant les pujades
+    conn.commit()
+    return ids
+
+
+def _upload_all(items, upload, upload_workers: int):
+    """
+    Upload (route_id, result, data) concurrently under <route_id>/<uuid>.gpx.
+    Returns ({index: url or Exception}, {index: object_path}).
+    """
+    paths = {i: f"{route_id}/{uuid.uuid4().hex}.gpx" for i, (route_id, _, _) in enumerate(items)}
+
+    def one(i):
+        return upload(items[i][2], paths[i], "application/gpx+xml")
+
+    out = {}
+    with ThreadPoolExecutor(max_workers=max(1, upload_workers)) as pool:
+        futures = {pool.submit(one, i): i for i in range(len(items))}
+        for future, i in futures.items():
+            try:
+                out[i] = future.result()
+            except Exception as e:
+                out[i] = e
+    return out, paths
+
+
+def _discard_uploads(delete, paths):
+    """Delete uploaded objects; returns the paths that are still stored."""
+    if not paths:
+        return []
+    if delete is None:
+        return list(paths)
+    try:
+        delete(list(paths))
+    except Exception:
+        return list(paths)
+    return []
+
+
+def _store_batch(conn, creator_id: int, location: str, items, urls, radius_m: int):
+    """Insert routes, files and tracks of the uploaded items in one transaction."""
+    rows = [(i, item) for i, item in enumerate(items) if not isinstance(urls.get(i), Exception)]
+    if not rows:
+        return
+    difficulties = calculate_difficulty_batch(
+        [item[1]["distance_km"] for _, item in rows],
+        [item[1]["elevation_gain"] for _, item in rows],
+        [item[1]["estimated_time"] for _, item in rows],
+        lang="ca",
+    )
+    with conn.cursor() as cur:
+        execute_values(
+            cur,
+            """
+            INSERT INTO routes (
+                route_id, name, description, distance_km, difficulty, elevation_gain,
+                location, estimated_time, creator_id, cultural_summary,
+                has_historical_value, has_archaeology, has_architecture,
+                has_natural_interest, difficulty_version
+            )
+            VALUES %s
+            """,
+            [
+                (route_id, res["name"], "", res["distance_km"], difficulty, res["elevation_gain"],
+                 location, res["estimated_time"], creator_id, "",
+                 False, False, False, False, DIFFICULTY_FORMULA_VERSION)
+                for (_, (route_id, res, _)), difficulty in zip(rows, difficulties)
+            ],
+        )
+        file_ids = execute_values(
+            cur,
+            """
+            INSERT INTO route_files (route_id, file_path, file_type)
+            VALUES %s
+            RETURNING route_id, file_id
+            """,
+            [(item[0], urls[i], "GPX") for i, item in rows],
+            fetch=True,
+        )
+    file_by_route = {int(r[0]): int(r[1]) for r in file_ids}
+
+    for (i, (route_id, res, _)), difficulty in zip(rows, difficulties):
+        track = save_track(conn, file_by_route[route_id], route_id, res["lats"], res["lons"], res["eles"])
+        res["duplicates"] = fingerprint_route(conn, route_id, track) or []
+        jobs.enqueue(
+            conn,
+            jobs.ROUTE_CULTURAL_RECOMPUTE,
+            {"route_id": route_id, "radius_m": radius_m},
+            dedupe_key=f"{route_id}:{radius_m}",
+        )
+        res["difficulty"] = difficulty
+    conn.commit()
+
+
+class _StoreError(Exception):
+    """The batch was uploaded but could not be written to the database."""
+
+
+def _status(res, route_id=None, url=None, orphaned_path=None) -> dict:
+    if not res["ok"]:
+        return {"file": res["file"], "status": "error", "error": res["error"]}
+    if isinstance(url, Exception):
+        stage = "desant" if isinstance(url, _StoreError) else "pujada"
+        status = {"file": res["file"], "status": "error", "error": f"{stage}: {url}"}
+        if orphaned_path:
+            status["orphaned_path"] = orphaned_path
+        return status
+    return {
+        "file": res["file"],
+        "status": "created",
+        "route_id": route_id,
+        "name": res["name"],
+        "distance_km": res["distance_km"],
+        "elevation_gain": res["elevation_gain"],
+        "estimated_time": res["estimated_time"],
+        "difficulty": res.get("difficulty"),
+        "file_url": url,
+        "duplicates": res.get("duplicates", []),
+    }
+
+
+def import_gpx_files(
+    conn,
+    creator_id: int,
+    named_files,
+    upload,
+    delete=None,
+    location: str = "",
+    batch_size: int = 25,
+    upload_workers: int = 8,
+    radius_m: int = 150,
+    parse_pool: GpxParsePool = None,
+    progress=None,
+):
+    """
+    Create one route per GPX in named_files ((filename, bytes) pairs).
+    upload(data, object_path, content_type) stores a file and returns its
+    URL; delete(object_paths) removes uploaded files of a batch that could
+    not be stored. progress(status) is called once per file. Returns the
+    list of per-file statuses, in input order.
+    """
+    parse_pool = parse_pool or gpx_parse_pool
+    statuses = []
+    batch = []  # (result, data)
+
+    def flush():
+        parsed = [(res, data) for res, data in batch if res["ok"]]
+        urls = {}
+        paths = {}
+        items = []
+        if parsed:
+            route_ids = _reserve_route_ids(conn, len(parsed))
+            items = [(route_id, res, data) for route_id, (res, data) in zip(route_ids, parsed)]
+            urls, paths = _upload_all(items, upload, upload_workers)
+            try:
+                _store_batch(conn, creator_id, location, items, urls, radius_m)
+            except Exception as e:
+                conn.rollback()
+                # Cap fila apunta als fitxers pujats: s'esborren de l'emmagatzematge
+                uploaded = [paths[i] for i, url in urls.items() if not isinstance(url, Exception)]
+                orphaned = set(_discard_uploads(delete, uploaded))
+                urls = {i: _StoreError(e) for i in range(len(items))}
+                paths = {i: p for i, p in paths.items() if p in orphaned}
+            else:
+                paths = {}
+
+        by_id = {id(res): (i, route_id) for i, (route_id, res, _) in enumerate(items)}
+        for res, _ in batch:
+            i, route_id = by_id.get(id(res), (None, None))
+            status = _status(res, route_id, urls.get(i), paths.get(i))
+            statuses.append(status)
+            if progress is not None:
+                progress(status)
+        batch.clear()
+
+    for data, res in parse_pool.parse(named_files):
+        batch.append((res, data))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return statuses
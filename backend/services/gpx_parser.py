@@ -1,26 +1,254 @@
+"""
+Parser GPX en streaming.
+
+Usa ElementTree.iterparse y va eliminando cada punto del árbol en cuanto
+se ha leído, así que la memoria depende del número de puntos (columnas
+array.array de 8 bytes por valor) y no del tamaño del XML.
+
+Lee trk/trkseg/trkpt, rte/rtept y wpt, con <ele> y <time>. El XML se
+recorre una sola vez; la distancia, el desnivel positivo/negativo y los
+límites se reducen después con NumPy sobre las columnas ya leídas.
+"""
+
+import io
 import xml.etree.ElementTree as ET
+from array import array
+from datetime import datetime, timezone
+
+import numpy as np
+
+from services.geo_utils import haversine_m_vec
+
+_NAN = float("nan")
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
+
+
+def _parse_time(text: str) -> float:
+    """Segundos epoch (UTC) de un <time> ISO 8601, o NaN."""
+    if not text:
+        return _NAN
+    try:
+        dt = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return _NAN
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class ParsedGPX:
+    """
+    Resultado del parser.
+
+    lat, lon, ele, time: columnas array('d') de los puntos de track y de ruta
+    (ele/time valen NaN si el punto no los tiene; time en segundos epoch).
+    segments: lista de (índice_inicio, tipo) con tipo "trkseg" o "rte".
+    wpt_lat, wpt_lon, wpt_name: waypoints sueltos.
+    """
+
+    def __init__(self):
+        self.lat = array("d")
+        self.lon = array("d")
+        self.ele = array("d")
+        self.time = array("d")
+        self.segments = []
+        self.wpt_lat = array("d")
+        self.wpt_lon = array("d")
+        self.wpt_name = []
+
+        self.distance_m = 0.0
+        self.elevation_gain_m = 0.0
+        self.elevation_loss_m = 0.0
+        self.min_lat = self.max_lat = None
+        self.min_lon = self.max_lon = None
+        self.min_ele = self.max_ele = None
+        self.start_time = self.end_time = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def has_elevation(self) -> bool:
+        return self.min_ele is not None
+
+    @property
+    def bounds(self):
+        """(min_lat, max_lat, min_lon, max_lon) o None si no hay puntos."""
+        if self.min_lat is None:
+            return None
+        return self.min_lat, self.max_lat, self.min_lon, self.max_lon
+
+    def segment_ranges(self, kind: str = None):
+        """Rangos [inicio, fin) de cada segmento (opcionalmente de un tipo)."""
+        out = []
+        for i, (start, seg_kind) in enumerate(self.segments):
+            end = self.segments[i + 1][0] if i + 1 < len(self.segments) else len(self.lat)
+            if end > start and (kind is None or seg_kind == kind):
+                out.append((start, end))
+        return out
+
+    def track_indices(self):
+        """
+        Índices de los puntos del track: los trkpt si hay alguno y, si no,
+        los rtept (archivos con sólo una ruta planificada).
+        """
+        ranges = self.segment_ranges("trkseg") or self.segment_ranges("rte")
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(s, e) for s, e in ranges])
+
+    def as_numpy(self):
+        """(lat, lon, ele, time) como arrays NumPy sin copiar."""
+        return (
+            np.frombuffer(self.lat, dtype=np.float64) if len(self.lat) else np.empty(0),
+            np.frombuffer(self.lon, dtype=np.float64) if len(self.lon) else np.empty(0),
+            np.frombuffer(self.ele, dtype=np.float64) if len(self.ele) else np.empty(0),
+            np.frombuffer(self.time, dtype=np.float64) if len(self.time) else np.empty(0),
+        )
+
+
+def _open_source(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source), True
+    if isinstance(source, str):
+        # Un str sempre és el text XML (mai una ruta); el BOM no és XML vàlid dins el text
+        return io.BytesIO(source.lstrip("\ufeff").encode("utf-8")), True
+    return source, False
+
+
+def _segment_totals(lat, lon, ele):
+    """(distancia, desnivel+, desnivel-) de un segmento."""
+    if len(lat) < 2:
+        return 0.0, 0.0, 0.0
+    distance = float(haversine_m_vec(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+    # Los puntos sin <ele> conservan la última elevación conocida
+    known = np.isfinite(ele)
+    if not known.any():
+        return distance, 0.0, 0.0
+    last = np.maximum.accumulate(np.where(known, np.arange(len(ele)), 0))
+    delta = np.diff(ele[last])
+    delta = delta[np.isfinite(delta)]
+    return distance, float(delta[delta > 0].sum()), float(-delta[delta < 0].sum())
+
+
+def parse_gpx(source) -> ParsedGPX:
+    """
+    Parsea un GPX en streaming.
+    source: bytes, texto XML o un objeto tipo archivo binario (para un
+    archivo en disco, ábrelo en modo "rb").
+    """
+    stream, should_close = _open_source(source)
+    out = ParsedGPX()
+
+    lat_a, lon_a, ele_a, time_a = out.lat, out.lon, out.ele, out.time
+    stack = []
+    names = {}  # tag con namespace -> nombre local
+
+    try:
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            tag = elem.tag
+            name = names.get(tag)
+            if name is None:
+                name = names[tag] = _local(tag)
+
+            if event == "start":
+                stack.append(elem)
+                if name == "trkseg" or name == "rte":
+                    out.segments.append((len(lat_a), name))
+                continue
+
+            stack.pop()
+
+            if name == "trkpt" or name == "rtept" or name == "wpt":
+                try:
+                    lat = float(elem.attrib["lat"])
+                    lon = float(elem.attrib["lon"])
+                except (KeyError, ValueError):
+                    lat = lon = None
+
+                ele = _NAN
+                t = _NAN
+                wpt_name = None
+                for child in elem:
+                    cname = names.get(child.tag) or _local(child.tag)
+                    if cname == "ele" and child.text:
+                        try:
+                            ele = float(child.text)
+                        except ValueError:
+                            pass
+                    elif cname == "time":
+                        t = _parse_time(child.text)
+                    elif cname == "name":
+                        wpt_name = child.text
+
+                if lat is not None:
+                    if name == "wpt":
+                        out.wpt_lat.append(lat)
+                        out.wpt_lon.append(lon)
+                        out.wpt_name.append(wpt_name)
+                    else:
+                        if not out.segments:
+                            out.segments.append((0, "trkseg"))
+                        lat_a.append(lat)
+                        lon_a.append(lon)
+                        ele_a.append(ele)
+                        time_a.append(t)
+
+                # Liberar el punto ya leído: el árbol no crece con el archivo
+                elem.clear()
+                if stack:
+                    stack[-1].remove(elem)
+            elif name == "trkseg" or name == "rte" or name == "trk":
+                elem.clear()
+                if stack:
+                    stack[-1].remove(elem)
+    finally:
+        if should_close:
+            stream.close()
+
+    if not len(lat_a):
+        return out
+
+    lat, lon, ele, t = out.as_numpy()
+    out.min_lat, out.max_lat = float(lat.min()), float(lat.max())
+    out.min_lon, out.max_lon = float(lon.min()), float(lon.max())
+    if np.isfinite(ele).any():
+        out.min_ele, out.max_ele = float(np.nanmin(ele)), float(np.nanmax(ele))
+    if np.isfinite(t).any():
+        out.start_time, out.end_time = float(np.nanmin(t)), float(np.nanmax(t))
+
+    # Totales del track; si el archivo trae también la ruta planificada del
+    # mismo recorrido no se suman las dos. Sin track, los de la ruta.
+    ranges = out.segment_ranges("trkseg") or out.segment_ranges("rte")
+    for s, e in ranges:
+        d, gain, loss = _segment_totals(lat[s:e], lon[s:e], ele[s:e])
+        out.distance_m += d
+        out.elevation_gain_m += gain
+        out.elevation_loss_m += loss
+    return out
+
 
 def parse_gpx_points(gpx_text: str):
     """
-    Devuelve lista de (lat, lon) del track (trkpt).
+    Devuelve lista de (lat, lon) del track (trkpt, o rtept si no hay track).
     Compatible con GPX estándar aunque tenga namespaces.
     """
-    root = ET.fromstring(gpx_text)
-
-    # detectar namespace si existe
-    ns = ""
-    if root.tag.startswith("{") and "}" in root.tag:
-        ns = root.tag.split("}")[0] + "}"
-
-    pts = []
-    for trkpt in root.findall(f".//{ns}trkpt"):
-        lat = trkpt.attrib.get("lat")
-        lon = trkpt.attrib.get("lon")
-        if lat is None or lon is None:
-            continue
-        try:
-            pts.append((float(lat), float(lon)))
-        except ValueError:
-            continue
-
-    return pts
+    parsed = parse_gpx(gpx_text)
+    lat, lon, _, _ = parsed.as_numpy()
+    idx = parsed.track_indices()
+    return list(zip(lat[idx].tolist(), lon[idx].tolist()))
+
+
+def parse_gpx_track(gpx_text):
+    """
+    Devuelve (lats, lons, eles) del track como arrays NumPy.
+    eles contiene NaN en los puntos sin <ele>.
+    """
+    parsed = parse_gpx(gpx_text)
+    lat, lon, ele, _ = parsed.as_numpy()
+    idx = parsed.track_indices()
+    return lat[idx], lon[idx], ele[idx]
@@ -0,0 +1,233 @@
+"""
+Conditional GET and short-lived response caching for read-heavy endpoints.
+
+Every cacheable response depends on a few "resources" (e.g. "routes",
+"ratings:12", "completions:7"). Database triggers (migration 0012) bump
+resource_versions.version for them once per INSERT/UPDATE/DELETE
+statement, so any process or script that writes the tables invalidates
+them.
+
+For a request the ETag is a hash of the path, the query string and the
+versions of its resources, so it is computed without running the
+endpoint's main query:
+  - If-None-Match matches (or If-Modified-Since is not older than the
+    newest resource) -> 304 with no body.
+  - The body for that ETag is in the in-process cache -> served as is.
+  - Otherwise the view runs and its 200 response is cached.
+
+Versions are cached per process for HTTP_CACHE_VERSION_TTL_S seconds
+(short: that is how long a write made by another process can go unseen).
+Writes made by this process call invalidate() so they are seen at once.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import wraps
+
+from flask import make_response, request
+
+from db import get_connection
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class HttpCache:
+    def __init__(self, version_ttl_s: float = None, response_ttl_s: float = None, max_entries: int = None):
+        self.version_ttl_s = version_ttl_s if version_ttl_s is not None else _env_float("HTTP_CACHE_VERSION_TTL_S", 2.0)
+        self.response_ttl_s = response_ttl_s if response_ttl_s is not None else _env_float("HTTP_CACHE_RESPONSE_TTL_S", 30.0)
+        self.max_entries = int(max_entries if max_entries is not None else _env_float("HTTP_CACHE_MAX_ENTRIES", 500))
+        self._lock = threading.Lock()
+        # resource -> (version, updated_at, fetched_at)
+        self._versions = {}
+        # etag -> (body, mimetype, headers, resources, stored_at)
+        self._responses = OrderedDict()
+        self._stats = {"not_modified": 0, "hits": 0, "misses": 0, "version_queries": 0}
+
+    # ---- versions ----
+
+    def versions(self, resources, conn=None) -> dict:
+        """{resource: (version, updated_at)}; unknown resources are (0, None)."""
+        now = time.monotonic()
+        out = {}
+        missing = []
+        with self._lock:
+            for res in resources:
+                cached = self._versions.get(res)
+                if cached is not None and now - cached[2] < self.version_ttl_s:
+                    out[res] = cached[:2]
+                else:
+                    missing.append(res)
+
+        if missing:
+            fetched = self._fetch_versions(missing, conn)
+            with self._lock:
+                self._stats["version_queries"] += 1
+                for res in missing:
+                    version, updated_at = fetched.get(res, (0, None))
+                    self._versions[res] = (version, updated_at, now)
+                    out[res] = (version, updated_at)
+        return out
+
+    def _fetch_versions(self, resources, conn=None) -> dict:
+        own = conn is None
+        if own:
+            conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT resource, version, updated_at FROM resource_versions WHERE resource = ANY(%s)",
+                    (list(resources),),
+                )
+                return {r[0]: (int(r[1]), r[2]) for r in cur.fetchall()}
+        finally:
+            if own:
+                conn.close()
+
+    def invalidate(self, resources):
+        """Forget the cached versions (and responses) of resources written by this process."""
+        resources = set(resources)
+        with self._lock:
+            for res in resources:
+                self._versions.pop(res, None)
+            stale = [etag for etag, entry in self._responses.items() if resources & entry[3]]
+            for etag in stale:
+                del self._responses[etag]
+
+    # ---- responses ----
+
+    def _get_response(self, etag):
+        with self._lock:
+            entry = self._responses.get(etag)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[4] >= self.response_ttl_s:
+                del self._responses[etag]
+                return None
+            self._responses.move_to_end(etag)
+            return entry
+
+    def _put_response(self, etag, body, mimetype, headers, resources):
+        with self._lock:
+            self._responses[etag] = (body, mimetype, headers, frozenset(resources), time.monotonic())
+            self._responses.move_to_end(etag)
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, versions=len(self._versions), responses=len(self._responses))
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._responses.clear()
+
+
+http_cache = HttpCache()
+
+# Capçaleres de la resposta original que es guarden amb el cos
+_KEPT_HEADERS = ("X-Next-Cursor",)
+
+
+def make_etag(path: str, query: str, versions: dict) -> str:
+    parts = [path, query] + [f"{res}={versions[res][0]}" for res in sorted(versions)]
+    return '"' + hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _last_modified(versions: dict):
+    stamps = [v[1] for v in versions.values() if v[1] is not None]
+    return max(stamps) if stamps else None
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [t.strip() for t in header.split(",")]
+
+
+def _not_modified_since(header: str, last_modified) -> bool:
+    if not header or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None or last_modified.tzinfo is None:
+        return False
+    # La capçalera té resolució de segons
+    return last_modified.replace(microsecond=0) <= since
+
+
+def _finish(resp, etag, last_modified):
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = "private, no-cache"
+    if last_modified is not None and last_modified.tzinfo is not None:
+        resp.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return resp
+
+
+def conditional_get(resources, cache: HttpCache = None):
+    """
+    Decorator for GET views. resources(**view_kwargs) returns the list of
+    resource names the response depends on; it runs inside the request,
+    so it can look at the query string or the caller's identity.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            c = cache or http_cache
+            names = list(resources(**kwargs))
+            try:
+                versions = c.versions(names)
+            except Exception:
+                # Sense taula de versions (migració pendent): sense cache
+                return view(*args, **kwargs)
+
+            etag = make_etag(request.path, request.query_string.decode("latin-1"), versions)
+            last_modified = _last_modified(versions)
+
+            if request.headers.get("If-None-Match") is not None:
+                not_modified = _etag_matches(request.headers.get("If-None-Match"), etag)
+            else:
+                not_modified = _not_modified_since(request.headers.get("If-Modified-Since"), last_modified)
+            if not_modified:
+                c._count("not_modified")
+                return _finish(make_response("", 304), etag, last_modified)
+
+            entry = c._get_response(etag)
+            if entry is not None:
+                c._count("hits")
+                body, mimetype, headers, _, _ = entry
+                resp = make_response(body, 200)
+                resp.mimetype = mimetype
+                for name, value in headers:
+                    resp.headers[name] = value
+                resp.headers["X-Cache"] = "HIT"
+                return _finish(resp, etag, last_modified)
+
+            c._count("misses")
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+            headers = [(h, resp.headers[h]) for h in _KEPT_HEADERS if h in resp.headers]
+            c._put_response(etag, resp.get_data(), resp.mimetype, headers, names)
+            resp.headers["X-Cache"] = "MISS"
+            return _finish(resp, etag, last_modified)
+
+        return wrapper
+    return decorator
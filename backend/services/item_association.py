@@ -0,0 +1,270 @@
+"""
+Incremental cultural item -> route association.
+
+route_cultural_items used to be filled only by the per-route recompute or
+lazily by /cultural-items/<id>/routes (newest routes only), so an item
+added to cultural_items stayed invisible on existing routes. Migration
+0014 queues every inserted or moved item and enqueues one
+cultural_items_associate job; the job drains the queue in batches.
+
+For each item only the routes whose stored track bounding box, buffered
+by the radius, contains the item are measured (exact distance to the
+track segments). The boxes are kept in an in-process RouteBBoxIndex with
+the same refresh scheme as the cultural items index. Routes without a
+stored track are not indexed (backfill_tracks.py stores them).
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from services.geometry import points_to_polyline_m
+from services.spatial_index import _deg_margins
+from services.track_store import load_tracks
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+DEFAULT_RADIUS_M = int(_env_float("CULTURAL_ASSOC_RADIUS_M", 150))
+
+# Rutes per consulta de tracks (limita la memòria d'un lot)
+_TRACK_CHUNK = 200
+
+
+class RouteBBoxIndex:
+    """Immutable snapshot of the bounding box of every stored route track."""
+
+    def __init__(self, route_ids, min_lat, max_lat, min_lon, max_lon, max_file_id: int = 0):
+        route_ids = np.asarray(route_ids, dtype=np.int64)
+        min_lat = np.asarray(min_lat, dtype=np.float64)
+        # Ordenades per min_lat: la consulta es limita a un rang amb searchsorted
+        order = np.argsort(min_lat, kind="stable")
+        self.route_ids = route_ids[order]
+        self.min_lat = min_lat[order]
+        self.max_lat = np.asarray(max_lat, dtype=np.float64)[order]
+        self.min_lon = np.asarray(min_lon, dtype=np.float64)[order]
+        self.max_lon = np.asarray(max_lon, dtype=np.float64)[order]
+        self.max_file_id = int(max_file_id)
+        self._max_height = float((self.max_lat - self.min_lat).max()) if len(self.route_ids) else 0.0
+        self._ids = set(self.route_ids.tolist())
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    def contains(self, route_id: int) -> bool:
+        return int(route_id) in self._ids
+
+    def candidates(self, lat: float, lon: float, radius_m: float):
+        """route_ids whose box, buffered by radius_m, contains (lat, lon)."""
+        if not len(self.route_ids):
+            return np.empty(0, dtype=np.int64)
+        dlat, dlon = _deg_margins(abs(lat), radius_m)
+        # min_lat <= lat + dlat i max_lat >= lat - dlat (=> min_lat >= lat - dlat - alçada màxima)
+        lo = np.searchsorted(self.min_lat, lat - dlat - self._max_height, side="left")
+        hi = np.searchsorted(self.min_lat, lat + dlat, side="right")
+        sl = slice(lo, hi)
+        mask = (
+            (self.max_lat[sl] >= lat - dlat)
+            & (self.min_lon[sl] <= lon + dlon)
+            & (self.max_lon[sl] >= lon - dlon)
+        )
+        return self.route_ids[sl][mask]
+
+    def merged(self, route_ids, min_lat, max_lat, min_lon, max_lon, max_file_id: int):
+        """New snapshot with routes not yet indexed added (the first track of a route wins)."""
+        new = np.array([int(rid) not in self._ids for rid in route_ids], dtype=bool)
+        return RouteBBoxIndex(
+            np.concatenate([self.route_ids, np.asarray(route_ids, dtype=np.int64)[new]]),
+            np.concatenate([self.min_lat, np.asarray(min_lat, dtype=np.float64)[new]]),
+            np.concatenate([self.max_lat, np.asarray(max_lat, dtype=np.float64)[new]]),
+            np.concatenate([self.min_lon, np.asarray(min_lon, dtype=np.float64)[new]]),
+            np.concatenate([self.max_lon, np.asarray(max_lon, dtype=np.float64)[new]]),
+            max_file_id=max(self.max_file_id, int(max_file_id)),
+        )
+
+
+def _fetch_boxes(conn, min_file_id: int = 0):
+    with conn.cursor() as cur:
+        # Mateix track que load_track: el primer fitxer de cada ruta
+        cur.execute(
+            """
+            SELECT DISTINCT ON (route_id)
+                route_id, min_lat, max_lat, min_lon, max_lon,
+                MAX(file_id) OVER ()
+            FROM route_tracks
+            WHERE file_id > %s
+            ORDER BY route_id, file_id
+            """,
+            (min_file_id,),
+        )
+        rows = cur.fetchall()
+    return (
+        [int(r[0]) for r in rows],
+        [float(r[1]) for r in rows],
+        [float(r[2]) for r in rows],
+        [float(r[3]) for r in rows],
+        [float(r[4]) for r in rows],
+        int(rows[0][5]) if rows else min_file_id,
+    )
+
+
+class RouteBBoxCache:
+    """
+    Holds the current RouteBBoxIndex of this process.
+    New tracks are added every refresh_s; a full reload every full_reload_s
+    also drops deleted routes and picks up replaced tracks.
+    """
+
+    def __init__(self, refresh_s: float = None, full_reload_s: float = None):
+        self.refresh_s = refresh_s if refresh_s is not None else _env_float("ROUTE_BBOX_REFRESH_S", 60.0)
+        self.full_reload_s = full_reload_s if full_reload_s is not None else _env_float("ROUTE_BBOX_FULL_RELOAD_S", 900.0)
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+
+    def get(self, conn) -> RouteBBoxIndex:
+        now = time.monotonic()
+        index = self._index
+        if index is not None and now - self._refreshed_at < self.refresh_s:
+            return index
+
+        with self._lock:
+            now = time.monotonic()
+            if self._index is None or now - self._loaded_at >= self.full_reload_s:
+                *boxes, max_file_id = _fetch_boxes(conn)
+                self._index = RouteBBoxIndex(*boxes, max_file_id=max_file_id)
+                self._loaded_at = now
+                self._refreshed_at = now
+            elif now - self._refreshed_at >= self.refresh_s:
+                *boxes, max_file_id = _fetch_boxes(conn, self._index.max_file_id)
+                if boxes[0]:
+                    self._index = self._index.merged(*boxes, max_file_id=max_file_id)
+                self._refreshed_at = now
+            return self._index
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+
+route_bboxes = RouteBBoxCache()
+
+
+def associate_items(conn, item_ids, radius_m: float = None, index: RouteBBoxIndex = None):
+    """
+    (Re)build the route links of the given items. Their previous links are
+    replaced (a moved item keeps no stale distance) and their entries in
+    cultural_item_routes_cache are dropped, so /cultural-items/<id>/routes
+    recomputes its wider radius. Returns (links_written, affected_route_ids);
+    the caller syncs the cultural booleans of those routes and commits.
+    """
+    radius_m = float(radius_m if radius_m is not None else DEFAULT_RADIUS_M)
+    item_ids = [int(i) for i in item_ids]
+    if not item_ids:
+        return 0, set()
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT item_id, latitude, longitude
+            FROM cultural_items
+            WHERE item_id = ANY(%s) AND latitude IS NOT NULL AND longitude IS NOT NULL
+            """,
+            (item_ids,),
+        )
+        items = [(int(r[0]), float(r[1]), float(r[2])) for r in cur.fetchall()]
+
+    if index is None:
+        index = route_bboxes.get(conn)
+
+    # route_id -> posicions dels ítems que cauen dins la seva caixa
+    by_route = {}
+    for pos, (_, lat, lon) in enumerate(items):
+        for route_id in index.candidates(lat, lon, radius_m).tolist():
+            by_route.setdefault(route_id, []).append(pos)
+
+    item_lats = np.array([it[1] for it in items], dtype=np.float64)
+    item_lons = np.array([it[2] for it in items], dtype=np.float64)
+
+    links = []
+    route_ids = sorted(by_route)
+    for start in range(0, len(route_ids), _TRACK_CHUNK):
+        tracks = load_tracks(conn, route_ids[start:start + _TRACK_CHUNK])
+        for route_id, track in tracks.items():
+            positions = np.asarray(by_route[route_id], dtype=np.int64)
+            d = points_to_polyline_m(item_lats[positions], item_lons[positions], track.lats, track.lons, max_distance_m=radius_m)
+            for pos, dist in zip(positions.tolist(), d.tolist()):
+                if dist <= radius_m:
+                    links.append((route_id, items[pos][0], int(round(dist))))
+
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM route_cultural_items WHERE item_id = ANY(%s) RETURNING route_id",
+            (item_ids,),
+        )
+        affected = {int(r[0]) for r in cur.fetchall()}
+        cur.execute("DELETE FROM cultural_item_routes_cache WHERE item_id = ANY(%s)", (item_ids,))
+        if links:
+            execute_values(
+                cur,
+                """
+                INSERT INTO route_cultural_items(route_id, item_id, distance_m)
+                VALUES %s
+                ON CONFLICT (route_id, item_id) DO UPDATE SET distance_m = EXCLUDED.distance_m
+                """,
+                links,
+            )
+
+    affected.update(route_id for route_id, _, _ in links)
+    return len(links), affected
+
+
+def claim_queued_items(conn, limit: int = 500):
+    """Take up to limit queued item_ids (removed from the queue in this transaction)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM cultural_item_assoc_queue
+            WHERE item_id IN (
+                SELECT item_id
+                FROM cultural_item_assoc_queue
+                ORDER BY queued_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING item_id
+            """,
+            (int(limit),),
+        )
+        return sorted(int(r[0]) for r in cur.fetchall())
+
+
+def drain_queue(conn, sync_route, radius_m: float = None, batch_size: int = 500, max_batches: int = None) -> dict:
+    """
+    Associate queued items batch by batch, committing after each batch.
+    sync_route(conn, route_id) refreshes the cultural booleans of a route.
+    """
+    totals = {"items": 0, "links": 0, "routes": 0, "batches": 0}
+    index = route_bboxes.get(conn)
+    while max_batches is None or totals["batches"] < max_batches:
+        item_ids = claim_queued_items(conn, batch_size)
+        if not item_ids:
+            break
+        links, affected = associate_items(conn, item_ids, radius_m, index=index)
+        for route_id in sorted(affected):
+            sync_route(conn, route_id)
+        conn.commit()
+        totals["items"] += len(item_ids)
+        totals["links"] += links
+        totals["routes"] += len(affected)
+        totals["batches"] += 1
+    return totals
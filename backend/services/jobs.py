@@ -0,0 +1,453 @@
+"""
+Postgres-backed background job queue.
+
+Jobs live in the jobs table (migration 0007). The API enqueues them and
+answers 202; worker.py processes them outside the request path.
+
+- Workers claim one job at a time with FOR UPDATE SKIP LOCKED, so any
+  number of worker processes can share the table without blocking.
+- Lower priority values run first; ties run in run_after / job_id order.
+- A job enqueued with a dedupe_key is merged into an identical job that is
+  still queued (keeping the most urgent priority) instead of duplicated.
+- A failing job is retried with exponential backoff until max_attempts,
+  then left as 'failed' with its last error.
+- While a job runs, its worker bumps heartbeat_at every HEARTBEAT_INTERVAL_S
+  from a separate connection; requeue_stale only requeues running jobs
+  whose heartbeat has stopped (crashed worker), however long they take.
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+from psycopg2 import errors
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 100
+PRIORITY_LOW = 1000
+
+# Cada quant el worker marca que el treball encara s'executa
+HEARTBEAT_INTERVAL_S = 30.0
+
+# Tipus de treball (els handlers es registren a worker.py)
+ROUTE_CULTURAL_RECOMPUTE = "route_cultural_recompute"
+CULTURAL_ITEM_ROUTES = "cultural_item_routes"
+SYNC_CULTURAL_BOOLEANS = "sync_cultural_booleans"
+DIFFICULTY_BACKFILL = "difficulty_backfill"
+# L'encuen també els triggers de cultural_items (migració 0014)
+CULTURAL_ITEMS_ASSOCIATE = "cultural_items_associate"
+CULTURAL_JOIN_ALL = "cultural_join_all"
+
+_JOB_COLUMNS = """
+    job_id, kind, payload, dedupe_key, priority, status, attempts, max_attempts,
+    run_after, locked_by, locked_at, last_error, result, created_at, updated_at, finished_at,
+    heartbeat_at
+"""
+
+_handlers = {}
+
+
+class Job:
+    """A claimed job, as handed to its handler."""
+
+    __slots__ = ("job_id", "kind", "payload", "attempts", "max_attempts")
+
+    def __init__(self, job_id, kind, payload, attempts, max_attempts):
+        self.job_id = int(job_id)
+        self.kind = kind
+        self.payload = payload or {}
+        self.attempts = int(attempts)
+        self.max_attempts = int(max_attempts)
+
+
+def register(kind: str):
+    """Decorator: register handler(conn, payload) -> dict | None for kind."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def registered_kinds():
+    return sorted(_handlers)
+
+
+def enqueue(
+    conn,
+    kind: str,
+    payload: dict = None,
+    priority: int = PRIORITY_NORMAL,
+    dedupe_key: str = None,
+    max_attempts: int = 5,
+    delay_s: float = 0,
+) -> int:
+    """
+    Add a job and return its job_id (the caller commits).
+    With dedupe_key, an identical queued job is reused instead.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO jobs (kind, payload, dedupe_key, priority, max_attempts, run_after)
+            VALUES (%s, %s::jsonb, %s, %s, %s, NOW() + make_interval(secs => %s))
+            ON CONFLICT (kind, dedupe_key) WHERE status = 'queued' AND dedupe_key IS NOT NULL
+            DO UPDATE SET
+                priority = LEAST(jobs.priority, EXCLUDED.priority),
+                run_after = LEAST(jobs.run_after, EXCLUDED.run_after),
+                updated_at = NOW()
+            RETURNING job_id
+            """,
+            (kind, json.dumps(payload or {}), dedupe_key, int(priority), int(max_attempts), float(delay_s)),
+        )
+        return int(cur.fetchone()[0])
+
+
+def claim(conn, worker_id: str, kinds=None):
+    """Take the next runnable job (committed as 'running'), or None."""
+    kind_sql = "AND kind = ANY(%s)" if kinds else ""
+    params = [worker_id] + ([list(kinds)] if kinds else [])
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            UPDATE jobs
+            SET status = 'running',
+                locked_by = %s,
+                locked_at = NOW(),
+                heartbeat_at = NOW(),
+                attempts = attempts + 1,
+                updated_at = NOW()
+            WHERE job_id = (
+                SELECT job_id
+                FROM jobs
+                WHERE status = 'queued' AND run_after <= NOW() {kind_sql}
+                ORDER BY priority, run_after, job_id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING job_id, kind, payload, attempts, max_attempts
+            """,
+            params,
+        )
+        row = cur.fetchone()
+    conn.commit()
+    return Job(*row) if row else None
+
+
+def complete(conn, job_id: int, result=None):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE jobs
+            SET status = 'done', result = %s::jsonb, last_error = NULL,
+                locked_by = NULL, updated_at = NOW(), finished_at = NOW()
+            WHERE job_id = %s
+            """,
+            (json.dumps(result) if result is not None else None, job_id),
+        )
+    conn.commit()
+
+
+def backoff_s(attempts: int, base_s: float = 5.0, cap_s: float = 900.0) -> float:
+    """Exponential backoff with jitter for the retry after the given attempt."""
+    delay = min(cap_s, base_s * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def fail(conn, job: Job, error: str):
+    """Schedule a retry with backoff, or mark the job failed for good."""
+    error = (error or "")[-4000:]
+    if job.attempts >= job.max_attempts:
+        _finish_failed(conn, job.job_id, error)
+        return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'queued', last_error = %s, locked_by = NULL, locked_at = NULL, heartbeat_at = NULL,
+                    run_after = NOW() + make_interval(secs => %s), updated_at = NOW()
+                WHERE job_id = %s
+                """,
+                (error, backoff_s(job.attempts), job.job_id),
+            )
+        conn.commit()
+    except errors.UniqueViolation:
+        # Mentrestant s'ha encuat un treball idèntic: ja farà ell la feina
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'done', result = '{"superseded": true}'::jsonb, last_error = %s,
+                    locked_by = NULL, updated_at = NOW(), finished_at = NOW()
+                WHERE job_id = %s
+                """,
+                (error, job.job_id),
+            )
+        conn.commit()
+
+
+def _finish_failed(conn, job_id: int, error: str):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE jobs
+            SET status = 'failed', last_error = %s, locked_by = NULL,
+                updated_at = NOW(), finished_at = NOW()
+            WHERE job_id = %s
+            """,
+            (error, job_id),
+        )
+    conn.commit()
+
+
+def requeue_stale(conn, stale_after_s: float = 900) -> int:
+    """Requeue running jobs without a heartbeat for stale_after_s (dead worker)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE jobs
+            SET status = 'queued', locked_by = NULL, locked_at = NULL, heartbeat_at = NULL,
+                last_error = COALESCE(last_error, 'worker lost'), updated_at = NOW()
+            WHERE status = 'running'
+              AND COALESCE(heartbeat_at, locked_at) < NOW() - make_interval(secs => %s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM jobs q
+                  WHERE q.status = 'queued' AND q.kind = jobs.kind AND q.dedupe_key = jobs.dedupe_key
+              )
+            """,
+            (float(stale_after_s),),
+        )
+        n = cur.rowcount
+    conn.commit()
+    return n
+
+
+def purge_finished(conn, older_than_days: int = 7) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM jobs
+            WHERE status IN ('done', 'failed')
+              AND finished_at < NOW() - make_interval(days => %s)
+            """,
+            (int(older_than_days),),
+        )
+        n = cur.rowcount
+    conn.commit()
+    return n
+
+
+def _row_to_dict(row):
+    (job_id, kind, payload, dedupe_key, priority, status, attempts, max_attempts,
+     run_after, locked_by, locked_at, last_error, result, created_at, updated_at, finished_at,
+     heartbeat_at) = row
+    iso = lambda dt: dt.isoformat() if dt else None  # noqa: E731
+    return {
+        "job_id": int(job_id),
+        "kind": kind,
+        "payload": payload,
+        "dedupe_key": dedupe_key,
+        "priority": int(priority),
+        "status": status,
+        "attempts": int(attempts),
+        "max_attempts": int(max_attempts),
+        "run_after": iso(run_after),
+        "locked_by": locked_by,
+        "locked_at": iso(locked_at),
+        "heartbeat_at": iso(heartbeat_at),
+        "last_error": last_error,
+        "result": result,
+        "created_at": iso(created_at),
+        "updated_at": iso(updated_at),
+        "finished_at": iso(finished_at),
+    }
+
+
+def get_job(conn, job_id: int):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE job_id = %s", (job_id,))
+        row = cur.fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def list_jobs(conn, status: str = None, kind: str = None, limit: int = 50):
+    where = []
+    params = []
+    if status:
+        where.append("status = %s")
+        params.append(status)
+    if kind:
+        where.append("kind = %s")
+        params.append(kind)
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    params.append(int(limit))
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {_JOB_COLUMNS} FROM jobs {where_sql} ORDER BY job_id DESC LIMIT %s",
+            params,
+        )
+        return [_row_to_dict(r) for r in cur.fetchall()]
+
+
+def queue_stats(conn) -> dict:
+    """{kind: {status: count}} plus the age of the oldest runnable job."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status")
+        counts = {}
+        for kind, status, n in cur.fetchall():
+            counts.setdefault(kind, {})[status] = int(n)
+        cur.execute(
+            """
+            SELECT EXTRACT(EPOCH FROM NOW() - MIN(run_after))
+            FROM jobs
+            WHERE status = 'queued' AND run_after <= NOW()
+            """
+        )
+        lag = cur.fetchone()[0]
+    return {"counts": counts, "oldest_ready_s": float(lag) if lag is not None else 0.0}
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def heartbeat(conn, job_id: int, worker_id: str) -> bool:
+    """Mark a running job as alive; False if this worker no longer holds it."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE jobs
+            SET heartbeat_at = NOW()
+            WHERE job_id = %s AND status = 'running' AND locked_by = %s
+            """,
+            (job_id, worker_id),
+        )
+        alive = cur.rowcount > 0
+    conn.commit()
+    return alive
+
+
+class Heartbeat:
+    """
+    Background thread that calls heartbeat() every interval_s while a job
+    runs. It uses its own connection: the job's transaction is not
+    committed until the handler returns.
+    """
+
+    def __init__(self, get_connection, job_id: int, worker_id: str, interval_s: float = None, log=print):
+        self.get_connection = get_connection
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval_s = interval_s if interval_s is not None else HEARTBEAT_INTERVAL_S
+        self.log = log
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{job_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                conn = self.get_connection()
+                try:
+                    alive = heartbeat(conn, self.job_id, self.worker_id)
+                finally:
+                    conn.close()
+            except Exception as e:
+                # Un batec perdut no atura el treball; el següent ho tornarà a provar
+                self.log(f"[{self.job_id}] batec fallit: {e}")
+                continue
+            if not alive:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def run_job(conn, job: Job, get_connection=None, worker_id: str = None) -> bool:
+    """
+    Run a claimed job with its handler. Returns True if it succeeded.
+    With get_connection, a Heartbeat keeps the job alive while it runs.
+    """
+    handler = _handlers.get(job.kind)
+    if handler is None:
+        _finish_failed(conn, job.job_id, f"unknown job kind: {job.kind}")
+        return False
+    try:
+        if get_connection is not None:
+            with Heartbeat(get_connection, job.job_id, worker_id or default_worker_id()):
+                result = handler(conn, job.payload)
+        else:
+            result = handler(conn, job.payload)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        fail(conn, job, traceback.format_exc())
+        return False
+    complete(conn, job.job_id, result)
+    return True
+
+
+def run_worker(
+    get_connection,
+    worker_id: str = None,
+    kinds=None,
+    poll_interval_s: float = 1.0,
+    stale_after_s: float = 900,
+    once: bool = False,
+    should_stop=lambda: False,
+    log=print,
+):
+    """
+    Worker loop: claim and run jobs until should_stop() (or, with once=True,
+    until the queue has nothing runnable). Each job gets a fresh pooled
+    connection so a broken job cannot poison the next one.
+    """
+    worker_id = worker_id or default_worker_id()
+    last_reap = 0.0
+    processed = 0
+
+    while not should_stop():
+        if time.monotonic() - last_reap > 60:
+            conn = get_connection()
+            try:
+                n = requeue_stale(conn, stale_after_s)
+            finally:
+                conn.close()
+            if n:
+                log(f"{n} treball(s) encallat(s) tornats a la cua")
+            last_reap = time.monotonic()
+
+        conn = get_connection()
+        try:
+            job = claim(conn, worker_id, kinds)
+            if job is None:
+                if once:
+                    break
+                conn.close()
+                conn = None
+                time.sleep(poll_interval_s)
+                continue
+
+            started = time.monotonic()
+            ok = run_job(conn, job, get_connection, worker_id)
+            processed += 1
+            log(
+                f"[{job.job_id}] {job.kind} {'✓' if ok else '✗'} "
+                f"intent {job.attempts}/{job.max_attempts} ({time.monotonic() - started:.2f}s)"
+            )
+        finally:
+            if conn is not None:
+                conn.close()
+
+    return processed
@@ -0,0 +1,285 @@
+"""
+Per-user completion rollup (user_learning_stats).
+
+One row per user with running sums of the routes they have completed:
+completions, distinct routes, distance, elevation gain, difficulty rank,
+completions per difficulty bucket and first/last completion. The row is
+updated in the same transaction as the user_route_completions upsert, so
+the adaptive preferences and /routes/stats/me read one row instead of
+re-aggregating the whole completion history joined with routes.
+
+The sums use the route values at completion time. rebuild_learning_stats
+recomputes them from the history (e.g. after update_difficulties.py) and
+check_learning_stats compares both without writing.
+"""
+
+# Mateixa classificació que feia la consulta SQL (LIKE sobre el text en minúscules)
+_RANK_SQL = """
+    CASE
+        WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%molt%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%muy%%' THEN 3
+        WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%dif%%' THEN 2
+        WHEN LOWER(COALESCE(r.difficulty, '')) LIKE '%%mitj%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%moder%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%media%%' THEN 1
+        ELSE 0
+    END
+"""
+
+# Franges de /routes/stats/me (una dificultat pot no caure en cap)
+_BUCKET_SQL = {
+    "easy_count": "LOWER(COALESCE(r.difficulty, '')) LIKE '%%fàcil%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%facil%%'",
+    "medium_count": "LOWER(COALESCE(r.difficulty, '')) LIKE '%%mitj%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%moder%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%media%%'",
+    "hard_count": "LOWER(COALESCE(r.difficulty, '')) LIKE '%%dif%%' AND LOWER(COALESCE(r.difficulty, '')) NOT LIKE '%%molt%%' AND LOWER(COALESCE(r.difficulty, '')) NOT LIKE '%%muy%%'",
+    "very_hard_count": "LOWER(COALESCE(r.difficulty, '')) LIKE '%%molt%%' OR LOWER(COALESCE(r.difficulty, '')) LIKE '%%muy%%'",
+}
+
+BUCKETS = tuple(_BUCKET_SQL)
+
+# Columnes del resum, en l'ordre de _full_recompute_sql i de load_personal_stats
+STAT_COLUMNS = (
+    "total_completions",
+    "completed_routes_unique",
+    "sum_distance_km",
+    "sum_elevation_gain",
+    "sum_difficulty_rank",
+) + BUCKETS + (
+    "first_completed_at",
+    "last_completed_at",
+)
+
+
+def learning_difficulty_rank(difficulty: str) -> int:
+    """0 fàcil, 1 mitjana, 2 difícil, 3 molt difícil."""
+    d = (difficulty or "").lower()
+    if "molt" in d or "muy" in d:
+        return 3
+    if "dif" in d:
+        return 2
+    if "mitj" in d or "moder" in d or "media" in d:
+        return 1
+    return 0
+
+
+def difficulty_buckets(difficulty: str) -> dict:
+    """{bucket: 0/1} with the same rules as the SQL buckets."""
+    d = (difficulty or "").lower()
+    very_hard = "molt" in d or "muy" in d
+    return {
+        "easy_count": int("fàcil" in d or "facil" in d),
+        "medium_count": int("mitj" in d or "moder" in d or "media" in d),
+        "hard_count": int("dif" in d and not very_hard),
+        "very_hard_count": int(very_hard),
+    }
+
+
+def _as_learning(row) -> dict:
+    """Learning dict for _compute_adaptive_signals from (total, sum_dist, sum_elev, sum_rank)."""
+    if row is None or not row[0]:
+        return {
+            "total_completions": 0,
+            "avg_distance_km": 0.0,
+            "avg_elevation_gain": 0.0,
+            "avg_difficulty_rank": 0.0,
+        }
+    total = int(row[0])
+    return {
+        "total_completions": total,
+        "avg_distance_km": float(row[1] or 0) / total,
+        "avg_elevation_gain": float(row[2] or 0) / total,
+        "avg_difficulty_rank": float(row[3] or 0) / total,
+    }
+
+
+def load_learning(conn, user_id: int) -> dict:
+    """
+    {"total_completions", "avg_distance_km", "avg_elevation_gain",
+    "avg_difficulty_rank"} of the user (zeros if nothing completed).
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT total_completions, sum_distance_km, sum_elevation_gain, sum_difficulty_rank
+            FROM user_learning_stats
+            WHERE user_id = %s
+            """,
+            (user_id,),
+        )
+        return _as_learning(cur.fetchone())
+
+
+def load_personal_stats(conn, user_id: int, active_days: int = 30) -> dict:
+    """
+    The user's rollup as {column: value} (see STAT_COLUMNS) plus
+    "active_routes_last_30d": distinct routes completed in the last
+    active_days days, counted on idx_urc_user_last_completed.
+    Zeros/None when the user has no row.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT
+                {", ".join("s." + c for c in STAT_COLUMNS)},
+                (
+                    SELECT COUNT(*)
+                    FROM user_route_completions urc
+                    WHERE urc.user_id = %s
+                      AND urc.last_completed_at >= NOW() - make_interval(days => %s)
+                ) AS active_routes
+            FROM (SELECT %s AS user_id) u
+            LEFT JOIN user_learning_stats s ON s.user_id = u.user_id
+            """,
+            (user_id, int(active_days), user_id),
+        )
+        row = cur.fetchone()
+
+    stats = {}
+    for i, column in enumerate(STAT_COLUMNS):
+        value = row[i] if row is not None else None
+        if column.endswith("_at"):
+            stats[column] = value
+        elif column.startswith("sum_"):
+            stats[column] = float(value or 0)
+        else:
+            stats[column] = int(value or 0)
+    stats["active_routes_last_30d"] = int((row[len(STAT_COLUMNS)] if row is not None else 0) or 0)
+    return stats
+
+
+def learning_from_stats(stats: dict) -> dict:
+    return _as_learning((
+        stats["total_completions"],
+        stats["sum_distance_km"],
+        stats["sum_elevation_gain"],
+        stats["sum_difficulty_rank"],
+    ))
+
+
+def record_completion(conn, user_id: int, distance_km, elevation_gain, difficulty: str, new_route: bool = False) -> dict:
+    """
+    Add one completion of a route to the user's rollup. new_route is True
+    when it is the user's first completion of that route. Must run in the
+    same transaction as the user_route_completions upsert; the caller
+    commits. Returns the updated learning dict (same shape as load_learning).
+    """
+    buckets = difficulty_buckets(difficulty)
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO user_learning_stats (
+                user_id, total_completions, completed_routes_unique, sum_distance_km,
+                sum_elevation_gain, sum_difficulty_rank,
+                easy_count, medium_count, hard_count, very_hard_count,
+                first_completed_at, last_completed_at, updated_at
+            )
+            VALUES (%s, 1, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW(), NOW())
+            ON CONFLICT (user_id)
+            DO UPDATE SET
+                total_completions = user_learning_stats.total_completions + 1,
+                completed_routes_unique = user_learning_stats.completed_routes_unique + EXCLUDED.completed_routes_unique,
+                sum_distance_km = user_learning_stats.sum_distance_km + EXCLUDED.sum_distance_km,
+                sum_elevation_gain = user_learning_stats.sum_elevation_gain + EXCLUDED.sum_elevation_gain,
+                sum_difficulty_rank = user_learning_stats.sum_difficulty_rank + EXCLUDED.sum_difficulty_rank,
+                easy_count = user_learning_stats.easy_count + EXCLUDED.easy_count,
+                medium_count = user_learning_stats.medium_count + EXCLUDED.medium_count,
+                hard_count = user_learning_stats.hard_count + EXCLUDED.hard_count,
+                very_hard_count = user_learning_stats.very_hard_count + EXCLUDED.very_hard_count,
+                first_completed_at = COALESCE(user_learning_stats.first_completed_at, EXCLUDED.first_completed_at),
+                last_completed_at = EXCLUDED.last_completed_at,
+                updated_at = NOW()
+            RETURNING total_completions, sum_distance_km, sum_elevation_gain, sum_difficulty_rank
+            """,
+            (
+                user_id,
+                1 if new_route else 0,
+                float(distance_km or 0),
+                float(elevation_gain or 0),
+                learning_difficulty_rank(difficulty),
+                buckets["easy_count"],
+                buckets["medium_count"],
+                buckets["hard_count"],
+                buckets["very_hard_count"],
+            ),
+        )
+        return _as_learning(cur.fetchone())
+
+
+def _full_recompute_sql() -> str:
+    """Aggregate of the whole history, one row per user, columns as STAT_COLUMNS."""
+    buckets = ",\n".join(
+        f"SUM(CASE WHEN {cond} THEN urc.completion_count ELSE 0 END)"
+        for cond in _BUCKET_SQL.values()
+    )
+    return f"""
+        SELECT
+            urc.user_id,
+            SUM(urc.completion_count),
+            COUNT(*),
+            SUM(urc.completion_count * COALESCE(r.distance_km, 0)),
+            SUM(urc.completion_count * COALESCE(r.elevation_gain, 0)),
+            SUM(urc.completion_count * {_RANK_SQL}),
+            {buckets},
+            MIN(urc.first_completed_at),
+            MAX(urc.last_completed_at)
+        FROM user_route_completions urc
+        JOIN routes r ON r.route_id = urc.route_id
+        WHERE %s::int IS NULL OR urc.user_id = %s
+        GROUP BY urc.user_id
+    """
+
+
+def rebuild_learning_stats(conn, user_id: int = None) -> int:
+    """
+    Recompute the rollup from user_route_completions (one user or all).
+    Returns the number of users rewritten; the caller commits.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM user_learning_stats WHERE %s::int IS NULL OR user_id = %s",
+            (user_id, user_id),
+        )
+        cur.execute(
+            f"""
+            INSERT INTO user_learning_stats (user_id, {", ".join(STAT_COLUMNS)}, updated_at)
+            SELECT *, NOW() FROM ({_full_recompute_sql()}) AS full_stats
+            """,
+            (user_id, user_id),
+        )
+        return cur.rowcount
+
+
+def _same(column, a, b) -> bool:
+    if column.endswith("_at"):
+        return a == b
+    return abs(float(a or 0) - float(b or 0)) <= 1e-6 * max(1.0, abs(float(b or 0)))
+
+
+def check_learning_stats(conn, user_id: int = None, limit: int = 100) -> dict:
+    """
+    Compare the rollup with a full recomputation (read only).
+    Returns {"checked": users, "mismatches": [{"user_id", "column",
+    "rollup", "expected"}, ...]} with at most limit mismatches.
+    Users with a rollup row but no completions count as mismatches too.
+    """
+    with conn.cursor() as cur:
+        cur.execute(_full_recompute_sql(), (user_id, user_id))
+        expected = {int(r[0]): r[1:] for r in cur.fetchall()}
+        cur.execute(
+            f"""
+            SELECT user_id, {", ".join(STAT_COLUMNS)}
+            FROM user_learning_stats
+            WHERE %s::int IS NULL OR user_id = %s
+            """,
+            (user_id, user_id),
+        )
+        stored = {int(r[0]): r[1:] for r in cur.fetchall()}
+
+    empty = (0,) * (len(STAT_COLUMNS) - 2) + (None, None)
+    mismatches = []
+    users = sorted(set(expected) | set(stored))
+    for uid in users:
+        want = expected.get(uid, empty)
+        have = stored.get(uid, empty)
+        for column, a, b in zip(STAT_COLUMNS, have, want):
+            if not _same(column, a, b):
+                mismatches.append({"user_id": uid, "column": column, "rollup": a, "expected": b})
+                if len(mismatches) >= limit:
+                    return {"checked": len(users), "mismatches": mismatches}
+    return {"checked": len(users), "mismatches": mismatches}
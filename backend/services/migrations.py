@@ -0,0 +1,143 @@
+"""
+Versioned schema migrations.
+
+Migrations are plain SQL files in backend/migrations named
+NNNN_description.sql. Each file is applied once, inside its own
+transaction, and recorded in the schema_migrations table.
+"""
+
+import hashlib
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+# Clau arbitrària per a pg_advisory_lock: evita dues execucions simultànies
+_LOCK_KEY = 748201
+
+_FILENAME_RE = re.compile(r"^(\d+)_([A-Za-z0-9_\-]+)\.sql$")
+
+
+class Migration:
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    @property
+    def sql(self) -> str:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> list:
+    """Return the migrations found in directory, sorted by version."""
+    found = {}
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in found:
+            raise ValueError(f"Versió de migració duplicada: {version}")
+        found[version] = Migration(version, match.group(2), os.path.join(directory, filename))
+    return [found[v] for v in sorted(found)]
+
+
+def _ensure_migrations_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+def applied_migrations(conn) -> dict:
+    """version -> (name, checksum, applied_at)"""
+    with conn.cursor() as cur:
+        _ensure_migrations_table(cur)
+        cur.execute("SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version")
+        rows = cur.fetchall()
+    conn.commit()
+    return {int(r[0]): (r[1], r[2], r[3]) for r in rows}
+
+
+def migration_status(conn, directory: str = MIGRATIONS_DIR) -> list:
+    """
+    Return one dict per known migration with its state:
+    "applied", "pending" or "modified" (applied, but the file changed since).
+    """
+    applied = applied_migrations(conn)
+    out = []
+    for m in discover_migrations(directory):
+        row = applied.get(m.version)
+        if row is None:
+            state = "pending"
+        elif row[1] != m.checksum:
+            state = "modified"
+        else:
+            state = "applied"
+        out.append({
+            "version": m.version,
+            "name": m.name,
+            "state": state,
+            "applied_at": row[2].isoformat() if row and row[2] else None,
+        })
+    return out
+
+
+def run_migrations(conn, directory: str = MIGRATIONS_DIR, target: int = None, dry_run: bool = False, log=print) -> list:
+    """
+    Apply every pending migration up to target (inclusive).
+    Returns the list of versions applied.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (_LOCK_KEY,))
+    conn.commit()
+
+    applied_now = []
+    try:
+        applied = applied_migrations(conn)
+        for m in discover_migrations(directory):
+            if target is not None and m.version > target:
+                break
+            if m.version in applied:
+                if applied[m.version][1] != m.checksum:
+                    log(f"  ! {m.version:04d}_{m.name}: el fitxer ha canviat des que es va aplicar")
+                continue
+
+            if dry_run:
+                log(f"  · {m.version:04d}_{m.name} (pendent)")
+                continue
+
+            log(f"  → {m.version:04d}_{m.name}")
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(m.sql)
+                    cur.execute(
+                        """
+                        INSERT INTO schema_migrations (version, name, checksum)
+                        VALUES (%s, %s, %s)
+                        """,
+                        (m.version, m.name, m.checksum),
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied_now.append(m.version)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_KEY,))
+        conn.commit()
+
+    return applied_now
@@ -0,0 +1,128 @@
+"""
+Compact polyline encodings for API payloads.
+
+- "polyline": Google encoded polyline algorithm format (precision 5 by
+  default, ~1 m), a plain ASCII string that map SDKs decode natively.
+- "varint": zigzag delta varints of lat/lon scaled by 10 ** precision,
+  interleaved (lat0, lon0, dlat1, dlon1, ...), base64 encoded for JSON.
+
+Both are opt-in: the default JSON list of [lat, lon] stays unchanged.
+"""
+
+import base64
+
+import numpy as np
+
+from services.geometry import simplify_polyline
+
+FORMATS = ("json", "polyline", "varint")
+SIMPLIFY_METHODS = ("dp", "vw")
+
+
+def _deltas(lats, lons, precision: int):
+    scale = 10 ** precision
+    lat_i = np.round(np.asarray(lats, dtype=np.float64) * scale).astype(np.int64)
+    lon_i = np.round(np.asarray(lons, dtype=np.float64) * scale).astype(np.int64)
+    pairs = np.empty(2 * len(lat_i), dtype=np.int64)
+    pairs[0::2] = np.diff(lat_i, prepend=0)
+    pairs[1::2] = np.diff(lon_i, prepend=0)
+    return pairs
+
+
+def encode_polyline(lats, lons, precision: int = 5) -> str:
+    """Google encoded polyline of the points."""
+    out = []
+    for v in _deltas(lats, lons, precision).tolist():
+        v = ~(v << 1) if v < 0 else (v << 1)
+        while v >= 0x20:
+            out.append(chr((0x20 | (v & 0x1F)) + 63))
+            v >>= 5
+        out.append(chr(v + 63))
+    return "".join(out)
+
+
+def decode_polyline(encoded: str, precision: int = 5):
+    """(lats, lons) lists from a Google encoded polyline."""
+    values = []
+    shift = result = 0
+    for ch in encoded:
+        b = ord(ch) - 63
+        result |= (b & 0x1F) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+            shift = result = 0
+    coords = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / float(10 ** precision)
+    return coords[:, 0].tolist(), coords[:, 1].tolist()
+
+
+def encode_varint(lats, lons, precision: int = 6) -> bytes:
+    """Zigzag delta varints, lat/lon interleaved."""
+    out = bytearray()
+    for v in _deltas(lats, lons, precision).tolist():
+        v = (v << 1) ^ (v >> 63)
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def decode_varint(data: bytes, precision: int = 6):
+    values = []
+    shift = result = 0
+    for b in data:
+        result |= (b & 0x7F) << shift
+        shift += 7
+        if not b & 0x80:
+            values.append((result >> 1) ^ -(result & 1))
+            shift = result = 0
+    coords = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / float(10 ** precision)
+    return coords[:, 0].tolist(), coords[:, 1].tolist()
+
+
+def polyline_fields(points, fmt: str = "json", simplify: str = None, tolerance_m: float = 0.0) -> dict:
+    """
+    Response fields for a list of [lat, lon] points in the requested format,
+    optionally simplified first:
+
+      json      {"polyline": [[lat, lon], ...]}
+      polyline  {"polyline_encoded": str, "polyline_format": "polyline", "polyline_precision": 5}
+      varint    {"polyline_encoded": base64, "polyline_format": "varint", "polyline_precision": 6}
+    """
+    if simplify and tolerance_m > 0 and len(points) > 2:
+        arr = np.asarray(points, dtype=np.float64)
+        keep = simplify_polyline(arr[:, 0], arr[:, 1], tolerance_m, simplify)
+        points = arr[keep].tolist()
+
+    if fmt == "polyline":
+        lats = [p[0] for p in points]
+        lons = [p[1] for p in points]
+        return {"polyline_encoded": encode_polyline(lats, lons, 5), "polyline_format": "polyline", "polyline_precision": 5}
+    if fmt == "varint":
+        lats = [p[0] for p in points]
+        lons = [p[1] for p in points]
+        data = base64.b64encode(encode_varint(lats, lons, 6)).decode("ascii")
+        return {"polyline_encoded": data, "polyline_format": "varint", "polyline_precision": 6}
+    return {"polyline": points}
+
+
+def parse_polyline_args(args):
+    """
+    (fmt, simplify, tolerance_m) from ?format=&simplify=&tolerance_m=, or
+    raises ValueError with the message for a 400.
+    """
+    fmt = (args.get("format") or "json").strip().lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"format ha de ser un de: {', '.join(FORMATS)}")
+
+    simplify = (args.get("simplify") or "").strip().lower() or None
+    if simplify is not None and simplify not in SIMPLIFY_METHODS:
+        raise ValueError(f"simplify ha de ser un de: {', '.join(SIMPLIFY_METHODS)}")
+
+    try:
+        tolerance_m = float(args.get("tolerance_m", 5.0 if simplify else 0.0))
+    except (TypeError, ValueError):
+        raise ValueError("tolerance_m ha de ser un número")
+    tolerance_m = max(0.0, min(tolerance_m, 500.0))
+    return fmt, simplify, tolerance_m
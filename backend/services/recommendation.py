@@ -0,0 +1,250 @@
+"""
+Server-side route recommendations.
+
+The scoring is the one the Flutter app applied on the phone
+(RecommendationService.rankRoutes), evaluated over a column-oriented
+snapshot of the catalog kept in NumPy arrays: one vectorized pass scores
+every route and the top-k are picked with argpartition instead of
+sorting the whole catalog.
+
+Like the cultural items index, the snapshot is loaded once per worker,
+refreshed incrementally (new route_ids and routes marked dirty by this
+process) every few seconds and fully reloaded periodically, so changes
+made by other processes (worker, update_difficulties.py) are picked up too.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+# Ordre de les columnes de flags culturals a la matriu
+CULTURAL_FLAGS = (
+    "has_historical_value",
+    "has_archaeology",
+    "has_architecture",
+    "has_natural_interest",
+)
+
+# Pes extra de la part cultural quan l'usuari la vol potenciar (com a l'app)
+CULTURAL_BOOST_WEIGHT = 1.8
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def difficulty_rank(difficulty: str) -> int:
+    """0 Fàcil, 1 Mitjana, 2 Difícil, 3 Molt Difícil (same rules as the app)."""
+    d = (difficulty or "").strip().lower()
+    if "molt" in d or "muy" in d or "very" in d:
+        return 3
+    if "difícil" in d or "dificil" in d or d == "difficult":
+        return 2
+    if "mitjana" in d or "mittana" in d or "moderada" in d or "media" in d or "moderate" in d:
+        return 1
+    return 0
+
+
+def cultural_interest_multiplier(interest: str) -> float:
+    value = (interest or "").strip().lower()
+    if "baix" in value:
+        return 0.7
+    if "alt" in value:
+        return 1.4
+    return 1.0
+
+
+class RouteFeatureMatrix:
+    """Immutable column snapshot of the routes table used for scoring."""
+
+    def __init__(self, route_ids, distance_km, elevation_gain, difficulty_ranks, cultural_flags, created_at):
+        self.route_ids = np.asarray(route_ids, dtype=np.int64)
+        self.distance_km = np.asarray(distance_km, dtype=np.float64)
+        self.elevation_gain = np.asarray(elevation_gain, dtype=np.float64)
+        self.difficulty_rank = np.asarray(difficulty_ranks, dtype=np.int8)
+        self.cultural_flags = np.asarray(cultural_flags, dtype=bool).reshape(-1, len(CULTURAL_FLAGS))
+        # Segons des d'epoch; les rutes sense data queden al final dels empats
+        self.created_at = np.asarray(created_at, dtype=np.float64)
+        self.cultural_count = self.cultural_flags.sum(axis=1).astype(np.float64)
+        self.max_route_id = int(self.route_ids.max()) if len(self.route_ids) else 0
+
+    def __len__(self):
+        return len(self.route_ids)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        rows: (route_id, distance_km, elevation_gain, difficulty,
+        has_historical_value, has_archaeology, has_architecture,
+        has_natural_interest, created_at)
+        """
+        rows = list(rows)
+        return cls(
+            [int(r[0]) for r in rows],
+            [float(r[1] or 0) for r in rows],
+            [float(r[2] or 0) for r in rows],
+            [difficulty_rank(r[3]) for r in rows],
+            [[bool(v) for v in r[4:8]] for r in rows],
+            [r[8].timestamp() if r[8] is not None else -np.inf for r in rows],
+        )
+
+    def merged(self, rows, removed_ids=()):
+        """
+        New snapshot with the given rows upserted and removed_ids dropped.
+        A route_id repeated in rows is added once (its last row wins).
+        """
+        update = RouteFeatureMatrix.from_rows(list({int(r[0]): r for r in rows}.values()))
+        drop = np.concatenate([update.route_ids, np.asarray(list(removed_ids), dtype=np.int64)])
+        keep = ~np.isin(self.route_ids, drop)
+        return RouteFeatureMatrix(
+            np.concatenate([self.route_ids[keep], update.route_ids]),
+            np.concatenate([self.distance_km[keep], update.distance_km]),
+            np.concatenate([self.elevation_gain[keep], update.elevation_gain]),
+            np.concatenate([self.difficulty_rank[keep], update.difficulty_rank]),
+            np.concatenate([self.cultural_flags[keep], update.cultural_flags]),
+            np.concatenate([self.created_at[keep], update.created_at]),
+        )
+
+    def score(self, preferred_distance: float, max_difficulty_rank: int = None,
+              cultural_interest: str = None, cultural_boost: float = 1.0):
+        """
+        Score of every route, in the order of route_ids:
+          distance  0..60  gaussian around preferred_distance, with penalties
+                           for routes much shorter or longer than it
+          difficulty +30 under max_difficulty_rank, -40 above it
+          culture   0..20  share of cultural flags x interest multiplier,
+                           times cultural_boost
+        """
+        d = self.distance_km
+        scores = np.zeros(len(d), dtype=np.float64)
+
+        pd = float(preferred_distance or 0)
+        if pd > 0:
+            sigma = min(max(pd * 0.2, 2.0), 10.0)
+            rel = np.abs(d - pd) / sigma
+            gaussian = 60.0 * np.exp(-0.5 * rel * rel)
+            ratio = d / pd
+            penalty = np.select(
+                [ratio < 0.5, ratio < 0.7, ratio > 2.0, ratio > 1.5],
+                [0.1, 0.5, 0.2, 0.7],
+                default=1.0,
+            )
+            scores += np.clip(gaussian * penalty, 0.0, 60.0)
+
+        if max_difficulty_rank is None:
+            scores += 30.0
+        else:
+            scores += np.where(self.difficulty_rank <= max_difficulty_rank, 30.0, -40.0)
+
+        culture = (self.cultural_count / len(CULTURAL_FLAGS)) * 20.0 * cultural_interest_multiplier(cultural_interest)
+        scores += np.clip(culture, 0.0, 20.0) * float(cultural_boost)
+        return scores
+
+    def top_k(self, scores, k: int, mask=None):
+        """
+        Positions of the k best routes, best first; ties broken by the most
+        recent created_at and then the highest route_id. Routes where mask
+        is False are left out.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        candidates = np.arange(len(scores)) if mask is None else np.nonzero(mask)[0]
+        if k <= 0 or not len(candidates):
+            return np.empty(0, dtype=np.int64)
+
+        if k < len(candidates):
+            # Selecció parcial: O(n) per trobar el llindar del k-è millor
+            cand_scores = scores[candidates]
+            part = np.argpartition(-cand_scores, k - 1)[:k]
+            threshold = cand_scores[part].min()
+            # Tots els empatats amb el llindar entren al desempat per data
+            candidates = candidates[cand_scores >= threshold]
+
+        order = np.lexsort((-self.route_ids[candidates], -self.created_at[candidates], -scores[candidates]))
+        return candidates[order[:k]]
+
+
+_ROW_COLUMNS = """
+    route_id, distance_km, elevation_gain, difficulty,
+    has_historical_value, has_archaeology, has_architecture,
+    has_natural_interest, created_at
+"""
+
+
+def _fetch_rows(conn, min_route_id: int = 0, route_ids=None):
+    with conn.cursor() as cur:
+        if route_ids is not None:
+            cur.execute(
+                f"SELECT {_ROW_COLUMNS} FROM routes WHERE route_id = ANY(%s)",
+                (list(route_ids),),
+            )
+        else:
+            cur.execute(
+                f"SELECT {_ROW_COLUMNS} FROM routes WHERE route_id > %s ORDER BY route_id",
+                (min_route_id,),
+            )
+        return cur.fetchall()
+
+
+class RouteFeatureCache:
+    """
+    Holds the current RouteFeatureMatrix of this process.
+    Readers always get a complete snapshot; refreshes swap it atomically.
+    """
+
+    def __init__(self, refresh_s: float = None, full_reload_s: float = None):
+        self.refresh_s = refresh_s if refresh_s is not None else _env_float("RECOMMENDATION_REFRESH_S", 30.0)
+        self.full_reload_s = full_reload_s if full_reload_s is not None else _env_float("RECOMMENDATION_FULL_RELOAD_S", 600.0)
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._dirty = set()
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+
+    def get(self, conn) -> RouteFeatureMatrix:
+        now = time.monotonic()
+        matrix = self._matrix
+        if matrix is not None and not self._dirty and now - self._refreshed_at < self.refresh_s:
+            return matrix
+
+        with self._lock:
+            now = time.monotonic()
+            if self._matrix is None or now - self._loaded_at >= self.full_reload_s:
+                self._matrix = RouteFeatureMatrix.from_rows(_fetch_rows(conn))
+                self._dirty.clear()
+                self._loaded_at = now
+                self._refreshed_at = now
+            elif self._dirty or now - self._refreshed_at >= self.refresh_s:
+                dirty = set(self._dirty)
+                self._dirty.clear()
+                rows = list(_fetch_rows(conn, self._matrix.max_route_id))
+                # Una ruta nova marcada ja arriba amb les files noves
+                dirty -= {int(r[0]) for r in rows}
+                removed = ()
+                if dirty:
+                    changed = _fetch_rows(conn, route_ids=dirty)
+                    # Les rutes marcades que ja no hi són s'han esborrat
+                    removed = dirty - {int(r[0]) for r in changed}
+                    rows.extend(changed)
+                if rows or removed:
+                    self._matrix = self._matrix.merged(rows, removed)
+                self._refreshed_at = now
+            return self._matrix
+
+    def mark_dirty(self, route_ids):
+        """Routes created/changed/deleted by this process: re-read them on the next get()."""
+        with self._lock:
+            if self._matrix is not None:
+                self._dirty.update(int(i) for i in route_ids)
+
+    def invalidate(self):
+        with self._lock:
+            self._matrix = None
+            self._dirty.clear()
+
+
+route_features = RouteFeatureCache()
@@ -0,0 +1,258 @@
+"""
+Offline route bundles: route metadata, simplified encoded track, elevation
+profile and cultural items in one compressed download.
+
+A bundle is identified by the hash of its inputs: the route row, the
+cultural items rows and the md5 of the stored track columns (computed in
+Postgres, so the track is not transferred to compute the key), plus the
+requested format, compression and tolerance. Built bundles are kept on
+disk under that hash and only rebuilt when some input changes.
+
+Formats: JSON (always) and MessagePack (if msgpack is installed).
+Compression: gzip (always) and zstd (if zstandard is installed).
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from services.geo_utils import haversine_m_vec
+from services.geometry import simplify_polyline
+from services.polyline_codec import encode_polyline
+from services.track_store import load_track
+
+try:
+    import msgpack
+except ImportError:  # msgpack és opcional: sense ell només JSON
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard és opcional: sense ell només gzip
+    zstandard = None
+
+# Canviar-lo invalida tots els bundles guardats (canvi d'estructura)
+BUNDLE_FORMAT_VERSION = 1
+
+PROFILE_POINTS = 256
+MAX_CULTURAL_ITEMS = 500
+
+MIME_TYPES = {"json": "application/json", "msgpack": "application/msgpack"}
+# El paquet es lliura com a fitxer comprimit (no com a Content-Encoding)
+COMPRESSED_MIME_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd"}
+
+
+def available_formats():
+    return ("json", "msgpack") if msgpack is not None else ("json",)
+
+
+def available_compressions():
+    return ("gzip", "zstd") if zstandard is not None else ("gzip",)
+
+
+def _load_inputs(conn, route_id: int):
+    """(route_row, item_rows, track_md5) or None if the route does not exist."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT
+                r.route_id, r.name, r.description, r.distance_km, r.difficulty,
+                r.elevation_gain, r.location, r.estimated_time, r.creator_id,
+                r.cultural_summary, r.has_historical_value, r.has_archaeology,
+                r.has_architecture, r.has_natural_interest, r.created_at,
+                u.name AS creator_name
+            FROM routes r
+            LEFT JOIN users u ON u.user_id = r.creator_id
+            WHERE r.route_id = %s
+            """,
+            (route_id,),
+        )
+        route = cur.fetchone()
+        if route is None:
+            return None
+
+        cur.execute(
+            """
+            SELECT
+                ci.item_id, ci.title, ci.description,
+                ci.latitude, ci.longitude, ci.period, ci.item_type, ci.source_url,
+                rci.distance_m
+            FROM route_cultural_items rci
+            JOIN cultural_items ci ON ci.item_id = rci.item_id
+            WHERE rci.route_id = %s
+            ORDER BY rci.distance_m ASC NULLS LAST, ci.title ASC
+            LIMIT %s
+            """,
+            (route_id, MAX_CULTURAL_ITEMS),
+        )
+        items = cur.fetchall()
+
+        # Mateix track que load_track (el primer fitxer de la ruta)
+        cur.execute(
+            """
+            SELECT md5(lat_e7 || lon_e7 || COALESCE(ele, ''::bytea))
+            FROM route_tracks
+            WHERE route_id = %s
+            ORDER BY file_id ASC
+            LIMIT 1
+            """,
+            (route_id,),
+        )
+        track_row = cur.fetchone()
+
+    return route, items, (track_row[0] if track_row else None)
+
+
+def bundle_key(route, items, track_md5, fmt: str, compression: str, tolerance_m: float) -> str:
+    """Content hash of everything that ends up in the bundle."""
+    h = hashlib.sha256()
+    h.update(json.dumps(
+        [BUNDLE_FORMAT_VERSION, fmt, compression, round(float(tolerance_m), 3), track_md5],
+    ).encode("utf-8"))
+    h.update(json.dumps([list(route)] + [list(r) for r in items], default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def elevation_profile(lats, lons, eles, points: int = PROFILE_POINTS):
+    """
+    Elevation resampled at `points` evenly spaced distances along the track:
+    {"distance_km": [...], "elevation_m": [...], "min_m", "max_m"}, or None
+    without elevation data.
+    """
+    if eles is None or len(lats) < 2:
+        return None
+    eles = np.asarray(eles, dtype=np.float64)
+    finite = np.isfinite(eles)
+    if finite.sum() < 2:
+        return None
+
+    cum = np.concatenate([[0.0], np.cumsum(haversine_m_vec(lats[:-1], lons[:-1], lats[1:], lons[1:]))])
+    samples = np.linspace(0.0, cum[-1], min(points, len(lats)))
+    profile = np.interp(samples, cum[finite], eles[finite])
+    return {
+        "distance_km": np.round(samples / 1000.0, 3).tolist(),
+        "elevation_m": np.round(profile, 1).tolist(),
+        "min_m": round(float(eles[finite].min()), 1),
+        "max_m": round(float(eles[finite].max()), 1),
+    }
+
+
+def build_bundle(route, items, track, tolerance_m: float) -> dict:
+    track_out = None
+    profile = None
+    if track is not None and len(track) >= 2:
+        keep = simplify_polyline(track.lats, track.lons, tolerance_m, "dp")
+        track_out = {
+            "polyline_encoded": encode_polyline(track.lats[keep], track.lons[keep], 5),
+            "polyline_format": "polyline",
+            "polyline_precision": 5,
+            "point_count": len(track),
+            "simplified_point_count": int(len(keep)),
+            "tolerance_m": tolerance_m,
+            "length_m": round(track.length_m, 1),
+            "bbox": list(track.bbox) if track.bbox else None,
+        }
+        profile = elevation_profile(track.lats, track.lons, track.eles)
+
+    return {
+        "bundle_version": BUNDLE_FORMAT_VERSION,
+        "route": {
+            "route_id": route[0],
+            "name": route[1],
+            "description": route[2] or "",
+            "distance_km": float(route[3] or 0),
+            "difficulty": route[4] or "",
+            "elevation_gain": int(route[5] or 0),
+            "location": route[6] or "",
+            "estimated_time": route[7] or "",
+            "creator_id": int(route[8]),
+            "cultural_summary": route[9] or "",
+            "has_historical_value": bool(route[10]),
+            "has_archaeology": bool(route[11]),
+            "has_architecture": bool(route[12]),
+            "has_natural_interest": bool(route[13]),
+            "created_at": route[14].isoformat() if route[14] else None,
+            "creator_name": route[15],
+        },
+        "track": track_out,
+        "elevation_profile": profile,
+        "cultural_items": [
+            {
+                "item_id": r[0],
+                "title": r[1],
+                "description": r[2],
+                "latitude": float(r[3]),
+                "longitude": float(r[4]),
+                "period": r[5],
+                "item_type": r[6],
+                "source_url": r[7],
+                "distance_m": r[8],
+            }
+            for r in items
+        ],
+    }
+
+
+def serialize(bundle: dict, fmt: str, compression: str) -> bytes:
+    if fmt == "msgpack":
+        raw = msgpack.packb(bundle, use_bin_type=True)
+    else:
+        raw = json.dumps(bundle, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    return gzip.compress(raw, compresslevel=6, mtime=0)
+
+
+class BundleStore:
+    """Built bundles on disk, one file per content hash."""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.getenv("BUNDLE_CACHE_DIR", os.path.join("data", "bundles"))
+
+    def _path(self, route_id: int, key: str, fmt: str, compression: str) -> str:
+        return os.path.join(self.directory, f"route_{int(route_id)}_{key}.{fmt}.{compression}")
+
+    def get_or_build(self, conn, route_id: int, fmt: str = "json", compression: str = "gzip", tolerance_m: float = 5.0):
+        """
+        (data, key, source) with source "hit" or "built", or None if the
+        route does not exist. Older bundles of the same route and variant
+        are removed when a new one is written.
+        """
+        inputs = _load_inputs(conn, route_id)
+        if inputs is None:
+            return None
+        route, items, track_md5 = inputs
+
+        key = bundle_key(route, items, track_md5, fmt, compression, tolerance_m)
+        path = self._path(route_id, key, fmt, compression)
+        try:
+            with open(path, "rb") as f:
+                return f.read(), key, "hit"
+        except FileNotFoundError:
+            pass
+
+        track = load_track(conn, route_id) if track_md5 else None
+        data = serialize(build_bundle(route, items, track, tolerance_m), fmt, compression)
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Escriptura atòmica: un lector mai veu un fitxer a mitges
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".bundle-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        for old in glob.glob(self._path(route_id, "*", fmt, compression)):
+            if old != path:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        return data, key, "built"
+
+
+bundle_store = BundleStore()
@@ -0,0 +1,242 @@
+"""
+Pluggable walking route backends for /routing/walking.
+
+Every backend answers route(start_lat, start_lon, end_lat, end_lon) with
+the payload the app already consumes:
+
+    {"distance_km": float, "duration_min": int,
+     "polyline": [[lat, lon], ...], "steps": ["Camí", "Carrer", ...]}
+
+- OSRMBackend: HTTP OSRM server (the public one by default).
+- LocalBackend: offline engine over the CSR graph of services.walk_graph.
+
+ROUTING_BACKEND selects them as a comma-separated fallback chain, e.g.
+"local,osrm" tries the local graph first and falls back to OSRM when the
+points are outside the graph or it is not built.
+"""
+
+import abc
+import math
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.walk_graph import GraphUnavailable, WalkGraph
+
+OSRM_BASE_URL = "https://router.project-osrm.org"  # público, sin API key
+
+
+class RoutingError(Exception):
+    """
+    Route could not be computed. status is the HTTP code to answer with;
+    fallback=True means another backend may still succeed.
+    """
+
+    def __init__(self, message: str, status: int = 502, fallback: bool = False):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.fallback = fallback
+
+
+def classify_road(name):
+    name = name.lower()
+    if any(word in name for word in ['camino', 'sendero', 'camí', 'send', 'track', 'path', 'vereda', 'pista', 'senda', 'trail', 'footpath', 'sender']):
+        return 'Camí'
+    if any(word in name for word in ['carretera', 'autovia', 'autopista', 'highway', 'road', 'vía', 'calzada', 'ruta', 'autovía']):
+        return 'Carretera'
+    if any(word in name for word in ['carrer', 'avinguda', 'plaça', 'street', 'avenue', 'square', 'calle', 'plaza', 'paseo', 'rambla', 'travessera', 'passatge', 'ronda', 'glorieta', 'rotonda', 'passeig', 'plaça']):
+        return 'Carrer'
+    if any(word in name for word in ['pont', 'bridge', 'puente']):
+        return 'Pont'
+    if any(word in name for word in ['parc', 'jardí', 'park', 'garden', 'bosque', 'forest']):
+        return 'Parc'
+    return 'Altres' if name else None
+
+
+# Tipus de via per a trams sense nom (highway=*)
+_HIGHWAY_TYPES = {
+    "footway": "Camí", "path": "Camí", "track": "Camí", "bridleway": "Camí",
+    "steps": "Camí", "cycleway": "Camí",
+    "residential": "Carrer", "living_street": "Carrer", "pedestrian": "Carrer",
+    "service": "Carrer", "corridor": "Carrer",
+    "primary": "Carretera", "primary_link": "Carretera", "secondary": "Carretera",
+    "secondary_link": "Carretera", "tertiary": "Carretera", "tertiary_link": "Carretera",
+    "trunk": "Carretera", "unclassified": "Carretera", "road": "Carretera",
+}
+
+
+def _unique_steps(road_types):
+    steps = []
+    seen = set()
+    for road_type in road_types:
+        if road_type and road_type not in seen:
+            steps.append(road_type)
+            seen.add(road_type)
+    return steps
+
+
+class RoutingBackend(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    def route(self, start_lat, start_lon, end_lat, end_lon) -> dict:
+        """Walking route between two points; raises RoutingError."""
+
+
+class OSRMBackend(RoutingBackend):
+    name = "osrm"
+
+    def __init__(self, base_url: str = None, timeout: float = 12):
+        self.base_url = (base_url or os.getenv("OSRM_BASE_URL") or OSRM_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        # Sessió compartida: manté les connexions keep-alive amb el servidor
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=16))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=16))
+
+    def route(self, start_lat, start_lon, end_lat, end_lon) -> dict:
+        # OSRM pide coords en orden lon,lat
+        coords = f"{start_lon},{start_lat};{end_lon},{end_lat}"
+
+        # Endpoint OSRM: /route/v1/foot/{coords}
+        # overview=full -> geometría completa
+        # geometries=geojson -> coordenadas como GeoJSON [lon, lat]
+        url_foot = f"{self.base_url}/route/v1/foot/{coords}"
+        url_walk = f"{self.base_url}/route/v1/walking/{coords}"
+        params = {
+            "overview": "full",
+            "geometries": "geojson",
+            "steps": "true",
+            "continue_straight": "true",
+        }
+
+        try:
+            r = self.session.get(url_foot, params=params, timeout=self.timeout)
+            if r.status_code != 200:
+                r = self.session.get(url_walk, params=params, timeout=self.timeout)
+            r.raise_for_status()
+            data = r.json()
+        except requests.Timeout:
+            raise RoutingError("Temps d'espera esgotat amb el servei de rutes", 504, fallback=True)
+        except requests.RequestException:
+            raise RoutingError("Error comunicant amb el servei de rutes", 502, fallback=True)
+
+        if data.get("code") != "Ok" or not data.get("routes"):
+            raise RoutingError("No s'ha pogut calcular la ruta", 502)
+
+        route = data["routes"][0]
+        distance_m = float(route.get("distance", 0.0))
+        duration_s = float(route.get("duration", 0.0))
+
+        # GeoJSON coordinates: [[lon,lat], [lon,lat], ...]
+        coords_geo = route["geometry"]["coordinates"]
+        polyline = [[float(lat), float(lon)] for lon, lat in coords_geo]  # a [lat,lon]
+
+        # Steps: extract unique road types
+        names = []
+        if "legs" in route and route["legs"]:
+            names = [step.get("name", "").strip() for step in route["legs"][0].get("steps", [])]
+
+        return {
+            "distance_km": round(distance_m / 1000.0, 2),
+            "duration_min": int(round(duration_s / 60.0)),
+            "polyline": polyline,
+            "steps": _unique_steps(classify_road(n) for n in names),
+        }
+
+
+class LocalBackend(RoutingBackend):
+    """Offline engine over a memory-mapped CSR graph (see build_walk_graph.py)."""
+
+    name = "local"
+
+    def __init__(self, graph_dir: str = None, walk_speed_kmh: float = None, max_snap_m: float = None, graph=None):
+        self.graph_dir = graph_dir or os.getenv("ROUTING_GRAPH_DIR", "data/walk_graph")
+        self.walk_speed_kmh = walk_speed_kmh or float(os.getenv("ROUTING_WALK_SPEED_KMH", "5"))
+        self.max_snap_m = max_snap_m or float(os.getenv("ROUTING_MAX_SNAP_M", "500"))
+        self._graph = graph
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self) -> WalkGraph:
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    try:
+                        self._graph = WalkGraph.load(self.graph_dir)
+                    except (GraphUnavailable, OSError) as e:
+                        raise RoutingError(f"Graf de rutes local no disponible: {e}", 503, fallback=True)
+        return self._graph
+
+    def route(self, start_lat, start_lon, end_lat, end_lon) -> dict:
+        graph = self.graph
+        start = graph.nearest_node(start_lat, start_lon, self.max_snap_m)
+        end = graph.nearest_node(end_lat, end_lon, self.max_snap_m)
+        if start is None or end is None:
+            raise RoutingError("Els punts són fora de la zona del graf de rutes", 404, fallback=True)
+
+        (s_node, s_snap), (e_node, e_snap) = start, end
+        found = graph.shortest_path(s_node, e_node)
+        if found is None:
+            raise RoutingError("No hi ha cap camí entre els dos punts", 404, fallback=True)
+        distance_m, path = found
+
+        # Trams d'accés des dels punts demanats fins als nodes del graf
+        polyline = [[float(start_lat), float(start_lon)]]
+        polyline.extend([float(graph.lat[v]), float(graph.lon[v])] for v in path)
+        polyline.append([float(end_lat), float(end_lon)])
+        distance_m += s_snap + e_snap
+
+        road_types = (classify_road(name) if name else _HIGHWAY_TYPES.get(highway, "Altres")
+                      for name, highway in graph.path_ways(path))
+
+        duration_min = distance_m / (self.walk_speed_kmh * 1000.0 / 60.0)
+        return {
+            "distance_km": round(distance_m / 1000.0, 2),
+            "duration_min": int(round(duration_min)) if math.isfinite(duration_min) else 0,
+            "polyline": polyline,
+            "steps": _unique_steps(road_types),
+        }
+
+
+_BACKEND_TYPES = {
+    OSRMBackend.name: OSRMBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str) -> RoutingBackend:
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            backend = _backends[name] = _BACKEND_TYPES[name]()
+        return backend
+
+
+def configured_chain():
+    raw = os.getenv("ROUTING_BACKEND", "osrm")
+    chain = [n.strip().lower() for n in raw.split(",") if n.strip().lower() in _BACKEND_TYPES]
+    return chain or ["osrm"]
+
+
+def walking_route(start_lat, start_lon, end_lat, end_lon, backend: str = None):
+    """
+    (payload, backend_name) using the requested backend or the configured
+    chain. Raises the last RoutingError when every backend fails.
+    """
+    chain = [backend] if backend else configured_chain()
+    error = None
+    for name in chain:
+        try:
+            return get_backend(name).route(start_lat, start_lon, end_lat, end_lon), name
+        except RoutingError as e:
+            error = e
+            if not e.fallback:
+                break
+    raise error
@@ -0,0 +1,226 @@
+"""
+Cache of /routing/walking results.
+
+Keys are the start/end coordinates snapped to a grid of ROUTING_CACHE_GRID_DEG
+degrees (about 50 m by default) plus the backend chain, so nearby requests
+for the same trip share one result.
+
+- In-process tier: LRU bounded by ROUTING_CACHE_MAX_ENTRIES with a TTL.
+- Optional shared tier (ROUTING_CACHE_SHARED=1): the routing_cache table
+  (migration 0008), so every worker and instance benefits from a result.
+- Single-flight: concurrent misses for the same key wait for one upstream
+  call instead of each calling OSRM.
+
+Errors are never cached, but waiters of a failed flight receive the error.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_connection
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RouteCache:
+    def __init__(
+        self,
+        grid_deg: float = None,
+        ttl_s: float = None,
+        max_entries: int = None,
+        shared: bool = None,
+        connect=get_connection,
+    ):
+        self.grid_deg = grid_deg or _env_float("ROUTING_CACHE_GRID_DEG", 0.0005)
+        self.ttl_s = ttl_s if ttl_s is not None else _env_float("ROUTING_CACHE_TTL_S", 6 * 3600)
+        self.max_entries = int(max_entries or _env_float("ROUTING_CACHE_MAX_ENTRIES", 5000))
+        if shared is None:
+            shared = os.getenv("ROUTING_CACHE_SHARED", "0").strip().lower() in {"1", "true", "yes"}
+        self.shared = shared
+        self._connect = connect
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._flights = {}
+        self._stores = 0
+        self._metrics = {
+            "hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "evictions": 0,
+            "expired": 0,
+            "shared_errors": 0,
+        }
+
+    def make_key(self, backend: str, start_lat, start_lon, end_lat, end_lon) -> str:
+        g = self.grid_deg
+        cells = [int(math.floor(v / g + 0.5)) for v in (start_lat, start_lon, end_lat, end_lon)]
+        return f"{backend}|{g:g}|" + "|".join(str(c) for c in cells)
+
+    # --- tier en memòria ---
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self._metrics["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_local(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._metrics["evictions"] += 1
+
+    # --- tier compartit (Postgres) ---
+
+    def _get_shared(self, key):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT value, EXTRACT(EPOCH FROM expires_at)
+                    FROM routing_cache
+                    WHERE cache_key = %s AND expires_at > NOW()
+                    """,
+                    (key,),
+                )
+                row = cur.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        return (row[0], float(row[1])) if row else None
+
+    def _put_shared(self, key, value, expires_at):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO routing_cache (cache_key, value, expires_at)
+                    VALUES (%s, %s::jsonb, to_timestamp(%s))
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at, created_at = NOW()
+                    """,
+                    (key, json.dumps(value), expires_at),
+                )
+                with self._lock:
+                    self._stores += 1
+                    prune = self._stores % 200 == 0
+                if prune:
+                    cur.execute("DELETE FROM routing_cache WHERE expires_at < NOW()")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # --- API ---
+
+    def get_or_compute(self, key: str, compute):
+        """
+        (value, source) where source is "hit", "shared", "miss" or "coalesced".
+        compute() runs at most once per key at a time in this process.
+        """
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                self._metrics["hits"] += 1
+                return value, "hit"
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._metrics["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, "coalesced"
+
+        source = "miss"
+        try:
+            shared = None
+            if self.shared:
+                try:
+                    shared = self._get_shared(key)
+                except Exception:
+                    with self._lock:
+                        self._metrics["shared_errors"] += 1
+
+            if shared is not None:
+                value, expires_at = shared
+                source = "shared"
+            else:
+                value = compute()
+                expires_at = time.time() + self.ttl_s
+                if self.shared:
+                    try:
+                        self._put_shared(key, value, expires_at)
+                    except Exception:
+                        with self._lock:
+                            self._metrics["shared_errors"] += 1
+
+            with self._lock:
+                self._put_local(key, value, expires_at)
+                self._metrics["shared_hits" if source == "shared" else "misses"] += 1
+            flight.result = value
+            return value, source
+        except Exception as e:
+            with self._lock:
+                self._metrics["errors"] += 1
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["entries"] = len(self._entries)
+            metrics["in_flight"] = len(self._flights)
+        lookups = metrics["hits"] + metrics["shared_hits"] + metrics["misses"] + metrics["coalesced"]
+        metrics["hit_ratio"] = round((lookups - metrics["misses"]) / lookups, 4) if lookups else 0.0
+        metrics.update({
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "grid_deg": self.grid_deg,
+            "shared": self.shared,
+        })
+        return metrics
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+route_cache = RouteCache()
@@ -0,0 +1,89 @@
+"""
+Denormalized like/rating counters per route (route_social_stats).
+
+The counters are changed in the same transaction as the likes/ratings
+rows they summarize, so like_count always equals COUNT(*) over likes and
+rating_sum / rating_count is the average score. Routes without a row
+have no likes and no ratings.
+"""
+
+
+def add_likes(conn, route_id: int, delta: int):
+    """Add delta (may be negative) to the route's like_count; the caller commits."""
+    if not delta:
+        return
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO route_social_stats (route_id, like_count, updated_at)
+            VALUES (%s, GREATEST(%s, 0), NOW())
+            ON CONFLICT (route_id)
+            DO UPDATE SET
+                like_count = GREATEST(route_social_stats.like_count + %s, 0),
+                updated_at = NOW()
+            """,
+            (route_id, delta, delta),
+        )
+
+
+def add_rating(conn, route_id: int, count_delta: int, sum_delta: int):
+    """
+    New rating: count_delta=1, sum_delta=score.
+    Changed rating: count_delta=0, sum_delta=new_score - old_score.
+    The caller commits.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO route_social_stats (route_id, rating_count, rating_sum, updated_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (route_id)
+            DO UPDATE SET
+                rating_count = route_social_stats.rating_count + EXCLUDED.rating_count,
+                rating_sum = route_social_stats.rating_sum + EXCLUDED.rating_sum,
+                updated_at = NOW()
+            """,
+            (route_id, count_delta, sum_delta),
+        )
+
+
+def rating_average(rating_count, rating_sum):
+    count = int(rating_count or 0)
+    return round(float(rating_sum or 0) / count, 2) if count else None
+
+
+def load_social_stats(conn, route_ids, user_id: int = None) -> dict:
+    """
+    {route_id: {"likes", "liked", "rating_count", "rating_avg"}} for the
+    given routes in one query; "liked" is the caller's status (False when
+    anonymous). Unknown route_ids are left out.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT
+                r.route_id,
+                COALESCE(s.like_count, 0),
+                COALESCE(s.rating_count, 0),
+                COALESCE(s.rating_sum, 0),
+                EXISTS (
+                    SELECT 1 FROM likes l
+                    WHERE l.route_id = r.route_id AND l.user_id = %s
+                ) AS liked
+            FROM routes r
+            LEFT JOIN route_social_stats s ON s.route_id = r.route_id
+            WHERE r.route_id = ANY(%s)
+            """,
+            (user_id, list(route_ids)),
+        )
+        rows = cur.fetchall()
+
+    return {
+        int(r[0]): {
+            "likes": int(r[1]),
+            "liked": bool(r[4]),
+            "rating_count": int(r[2]),
+            "rating_avg": rating_average(r[2], r[3]),
+        }
+        for r in rows
+    }
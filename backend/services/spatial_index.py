@@ -0,0 +1,334 @@
+"""
+In-process spatial index over cultural_items.
+
+The whole table (id, lat, lon, item_type) is loaded once per worker into
+NumPy arrays and bucketed in a uniform lat/lon grid. Optionally a
+KD-tree (scipy) over unit-sphere coordinates is used instead of the grid.
+The index is refreshed incrementally every few seconds: the items
+inserted, moved or deleted since the last refresh are found by their
+change_txid and tombstones (migration 0017). A periodic full reload is
+only a safety net.
+
+Queries return item_ids with their distance in metres; the caller fetches
+the full rows it needs with a single "item_id = ANY(%s)" query.
+"""
+
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from services.geo_utils import haversine_m_vec
+from services.geometry import points_to_polyline_m
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy és opcional: sense ell només hi ha la graella
+    cKDTree = None
+
+EARTH_RADIUS_M = 6371000.0
+_M_PER_DEG_LAT = 111320.0
+
+# Segments per bloc en les consultes sobre polilínies (limita la memòria)
+_POLYLINE_CHUNK = 512
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _deg_margins(lat_max_abs: float, radius_m: float):
+    dlat = radius_m / _M_PER_DEG_LAT
+    dlon = radius_m / (_M_PER_DEG_LAT * max(math.cos(math.radians(min(lat_max_abs, 89.9))), 1e-6))
+    return dlat, dlon
+
+
+def _unit_xyz(lat, lon):
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+    cos_phi = np.cos(phi)
+    return np.column_stack((cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)))
+
+
+class CulturalItemIndex:
+    """Immutable snapshot of the cultural_items coordinates."""
+
+    def __init__(self, item_ids, lats, lons, item_types, cell_deg: float = 0.02, backend: str = "grid"):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.item_types = np.asarray([(t or "").strip().lower() for t in item_types], dtype=object)
+        self.cell_deg = float(cell_deg)
+        self.backend = backend if (backend != "kdtree" or cKDTree is not None) else "grid"
+
+        self._pos_by_id = {int(i): p for p, i in enumerate(self.item_ids.tolist())}
+
+        # Graella: posicions ordenades per clau de cel·la + rang de cada cel·la
+        cy = np.floor(self.lats / self.cell_deg).astype(np.int64)
+        cx = np.floor(self.lons / self.cell_deg).astype(np.int64)
+        keys = self._cell_key(cy, cx)
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+
+        self._tree = None
+        if self.backend == "kdtree" and len(self.item_ids):
+            self._tree = cKDTree(_unit_xyz(self.lats, self.lons))
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    @staticmethod
+    def _cell_key(cy, cx):
+        # Desplaçament per treballar amb enters positius (lat/lon acotades)
+        return (np.asarray(cy, dtype=np.int64) + (1 << 20)) * (1 << 21) + (np.asarray(cx, dtype=np.int64) + (1 << 20))
+
+    def contains(self, item_id: int) -> bool:
+        return int(item_id) in self._pos_by_id
+
+    def _grid_candidates(self, lat_min, lat_max, lon_min, lon_max):
+        if not len(self.item_ids):
+            return np.empty(0, dtype=np.int64)
+
+        cy0 = int(math.floor(lat_min / self.cell_deg))
+        cy1 = int(math.floor(lat_max / self.cell_deg))
+        cx0 = int(math.floor(lon_min / self.cell_deg))
+        cx1 = int(math.floor(lon_max / self.cell_deg))
+
+        # Les cel·les d'una mateixa fila són consecutives en l'ordre de claus
+        parts = []
+        for cy in range(cy0, cy1 + 1):
+            lo = np.searchsorted(self._sorted_keys, self._cell_key(cy, cx0), side="left")
+            hi = np.searchsorted(self._sorted_keys, self._cell_key(cy, cx1), side="right")
+            if hi > lo:
+                parts.append(self._order[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        cand = np.concatenate(parts)
+
+        lat = self.lats[cand]
+        lon = self.lons[cand]
+        mask = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+        return cand[mask]
+
+    def _kdtree_candidates(self, lats, lons, radius_m):
+        chord = 2.0 * math.sin(min(radius_m / EARTH_RADIUS_M, math.pi) / 2.0)
+        hits = self._tree.query_ball_point(_unit_xyz(lats, lons), r=chord)
+        if len(hits) == 0:
+            return np.empty(0, dtype=np.int64)
+        merged = set()
+        for h in hits:
+            merged.update(h)
+        return np.fromiter(merged, dtype=np.int64, count=len(merged))
+
+    def _type_mask(self, positions, item_type):
+        if not item_type:
+            return np.ones(len(positions), dtype=bool)
+        return self.item_types[positions] == item_type.strip().lower()
+
+    def query_radius(self, lat: float, lon: float, radius_m: float, item_type: str = None):
+        """
+        Items within radius_m of (lat, lon).
+        Returns (item_ids, distances_m) sorted by distance.
+        """
+        if self._tree is not None:
+            cand = self._kdtree_candidates(np.array([lat]), np.array([lon]), radius_m)
+        else:
+            dlat, dlon = _deg_margins(abs(lat), radius_m)
+            cand = self._grid_candidates(lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+
+        cand = cand[self._type_mask(cand, item_type)]
+        if not len(cand):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        d = haversine_m_vec(lat, lon, self.lats[cand], self.lons[cand])
+        keep = d <= radius_m
+        cand, d = cand[keep], d[keep]
+        order = np.argsort(d, kind="stable")
+        return self.item_ids[cand[order]], d[order]
+
+    def query_polyline(self, lats, lons, radius_m: float, item_type: str = None) -> dict:
+        """
+        Items within radius_m of the polyline, measured exactly against
+        its segments (not only its vertices).
+        Returns {item_id: min_distance_m}.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        found = {}
+        if not len(lats) or not len(self.item_ids):
+            return found
+
+        n_seg = max(len(lats) - 1, 1)
+        for start in range(0, n_seg, _POLYLINE_CHUNK):
+            # Els blocs comparteixen el vèrtex frontera perquè no es perdi cap segment
+            clat = lats[start:start + _POLYLINE_CHUNK + 1]
+            clon = lons[start:start + _POLYLINE_CHUNK + 1]
+
+            if self._tree is not None:
+                # Un punt a distància r d'un segment de llargada L és a r + L/2 d'algun vèrtex
+                half_seg = 0.0
+                if len(clat) > 1:
+                    half_seg = float(haversine_m_vec(clat[:-1], clon[:-1], clat[1:], clon[1:]).max()) / 2.0
+                cand = self._kdtree_candidates(clat, clon, radius_m + half_seg)
+            else:
+                dlat, dlon = _deg_margins(float(np.max(np.abs(clat))), radius_m)
+                cand = self._grid_candidates(
+                    float(clat.min()) - dlat, float(clat.max()) + dlat,
+                    float(clon.min()) - dlon, float(clon.max()) + dlon,
+                )
+            cand = cand[self._type_mask(cand, item_type)]
+            if not len(cand):
+                continue
+
+            d = points_to_polyline_m(self.lats[cand], self.lons[cand], clat, clon, max_distance_m=radius_m)
+
+            keep = np.isfinite(d)
+            for item_id, dist in zip(self.item_ids[cand[keep]].tolist(), d[keep].tolist()):
+                prev = found.get(item_id)
+                if prev is None or dist < prev:
+                    found[item_id] = dist
+
+        return found
+
+    def merged(self, item_ids, lats, lons, item_types, removed_ids=()):
+        """New snapshot with the given rows upserted and removed_ids dropped."""
+        drop = {int(i) for i in item_ids} | {int(i) for i in removed_ids}
+        keep = np.array([int(i) not in drop for i in self.item_ids.tolist()], dtype=bool)
+        return CulturalItemIndex(
+            np.concatenate([self.item_ids[keep], np.asarray(item_ids, dtype=np.int64)]),
+            np.concatenate([self.lats[keep], np.asarray(lats, dtype=np.float64)]),
+            np.concatenate([self.lons[keep], np.asarray(lons, dtype=np.float64)]),
+            list(self.item_types[keep]) + list(item_types),
+            cell_deg=self.cell_deg,
+            backend=self.backend,
+        )
+
+
+def _snapshot_xmin(conn) -> int:
+    # Les transaccions per sota del xmin ja han acabat: els seus canvis són tots visibles
+    with conn.cursor() as cur:
+        cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return int(cur.fetchone()[0])
+
+
+def _columns(rows):
+    return (
+        [int(r[0]) for r in rows],
+        [float(r[1]) for r in rows],
+        [float(r[2]) for r in rows],
+        [r[3] for r in rows],
+    )
+
+
+def _fetch_items(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT item_id, latitude, longitude, item_type
+            FROM cultural_items
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ORDER BY item_id
+            """
+        )
+        return _columns(cur.fetchall())
+
+
+def _fetch_changes(conn, since_txid: int, until_txid: int):
+    """
+    Items changed by transactions in [since_txid, until_txid) as
+    ((ids, lats, lons, types), removed_ids). Items that lost their
+    coordinates count as removed.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT item_id, latitude, longitude, item_type
+            FROM cultural_items
+            WHERE change_txid >= %s AND change_txid < %s
+            ORDER BY item_id
+            """,
+            (since_txid, until_txid),
+        )
+        rows = cur.fetchall()
+        cur.execute(
+            """
+            SELECT item_id
+            FROM cultural_item_tombstones
+            WHERE change_txid >= %s AND change_txid < %s
+            """,
+            (since_txid, until_txid),
+        )
+        removed = [int(r[0]) for r in cur.fetchall()]
+
+    placed = [r for r in rows if r[1] is not None and r[2] is not None]
+    removed.extend(int(r[0]) for r in rows if r[1] is None or r[2] is None)
+    return _columns(placed), removed
+
+
+class CulturalIndexCache:
+    """
+    Holds the current CulturalItemIndex of this process.
+    Readers always get a complete snapshot; refreshes swap it atomically.
+    """
+
+    def __init__(self, backend: str = None, cell_deg: float = None, refresh_s: float = None, full_reload_s: float = None):
+        self.backend = backend or os.getenv("CULTURAL_INDEX_BACKEND", "grid").strip().lower()
+        self.cell_deg = cell_deg or _env_float("CULTURAL_INDEX_CELL_DEG", 0.02)
+        self.refresh_s = refresh_s if refresh_s is not None else _env_float("CULTURAL_INDEX_REFRESH_S", 60.0)
+        self.full_reload_s = full_reload_s if full_reload_s is not None else _env_float("CULTURAL_INDEX_FULL_RELOAD_S", 900.0)
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._since_txid = 0
+
+    def _build(self, ids, lats, lons, types):
+        return CulturalItemIndex(ids, lats, lons, types, cell_deg=self.cell_deg, backend=self.backend)
+
+    def get(self, conn) -> CulturalItemIndex:
+        now = time.monotonic()
+        index = self._index
+        if index is not None and now - self._refreshed_at < self.refresh_s:
+            return index
+
+        with self._lock:
+            now = time.monotonic()
+            if self._index is None or now - self._loaded_at >= self.full_reload_s:
+                xmin = _snapshot_xmin(conn)
+                self._index = self._build(*_fetch_items(conn))
+                self._since_txid = xmin
+                self._loaded_at = now
+                self._refreshed_at = now
+            elif now - self._refreshed_at >= self.refresh_s:
+                # Es torna a llegir des del xmin anterior: una transacció que encara
+                # no havia acabat no es perd, i reaplicar una fila no canvia res
+                xmin = _snapshot_xmin(conn)
+                (ids, lats, lons, types), removed = _fetch_changes(conn, self._since_txid, xmin)
+                if ids or removed:
+                    self._index = self._index.merged(ids, lats, lons, types, removed_ids=removed)
+                self._since_txid = xmin
+                self._refreshed_at = now
+            return self._index
+
+    def upsert(self, item_ids, lats, lons, item_types):
+        """Apply inserted/moved items without waiting for the next refresh."""
+        with self._lock:
+            if self._index is not None:
+                self._index = self._index.merged(item_ids, lats, lons, item_types)
+
+    def remove(self, item_ids):
+        with self._lock:
+            if self._index is not None:
+                self._index = self._index.merged([], [], [], [], removed_ids=item_ids)
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+
+cultural_index = CulturalIndexCache()
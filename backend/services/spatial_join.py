@@ -0,0 +1,183 @@
+"""
+Catalog-wide spatial join: every stored route track against every
+cultural item, in one pass.
+
+The cultural items are loaded once into a grid CulturalItemIndex; each
+track is matched with query_polyline (grid candidates + vectorized exact
+distance to the segments). Tracks are streamed from route_tracks with a
+server-side cursor and matched in a process pool, one chunk of tracks
+per task; every worker builds the index once in its initializer.
+
+Results are COPYed into a temporary staging table and merged into
+route_cultural_items in the caller's transaction (delete missing links,
+update changed distances, insert new ones), so readers see either the
+old links or the new ones. Only routes with a stored track are touched.
+"""
+
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from services.spatial_index import CulturalItemIndex, _fetch_items
+from services.track_store import decode_track
+
+# Índex del procés (el construeix _init_worker a cada procés del pool)
+_worker_index = None
+
+
+def _init_worker(item_ids, lats, lons, cell_deg):
+    global _worker_index
+    _worker_index = CulturalItemIndex(item_ids, lats, lons, [""] * len(item_ids), cell_deg=cell_deg, backend="grid")
+
+
+def _join_chunk(tracks, radius_m):
+    """[(route_id, lat_e7, lon_e7)] -> [(route_id, item_id, distance_m)] with the process index."""
+    rows = []
+    for route_id, lat_e7, lon_e7 in tracks:
+        track = decode_track(lat_e7, lon_e7, length_m=0.0)
+        found = _worker_index.query_polyline(track.lats, track.lons, radius_m)
+        rows.extend((route_id, item_id, int(round(dist))) for item_id, dist in found.items())
+    return rows
+
+
+def join_tracks(items, track_chunks, radius_m: float, processes: int = 1, cell_deg: float = 0.02):
+    """
+    items: (item_ids, lats, lons). track_chunks yields lists of
+    (route_id, lat_e7, lon_e7). Yields (chunk, rows) in input order, with
+    at most 2 * processes chunks in flight.
+    """
+    if processes <= 1:
+        _init_worker(*items, cell_deg)
+        for chunk in track_chunks:
+            yield chunk, _join_chunk(chunk, radius_m)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(*items, cell_deg)) as pool:
+        pending = []
+        for chunk in track_chunks:
+            pending.append((chunk, pool.submit(_join_chunk, chunk, radius_m)))
+            if len(pending) >= 2 * processes:
+                done_chunk, future = pending.pop(0)
+                yield done_chunk, future.result()
+        for done_chunk, future in pending:
+            yield done_chunk, future.result()
+
+
+def _copy_rows(cur, table: str, rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(str(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} FROM STDIN", buf)
+
+
+def _stream_tracks(conn, chunk_size: int):
+    # Cursor de servidor: els tracks no es carreguen tots alhora
+    with conn.cursor(name="catalog_join_tracks") as cur:
+        cur.itersize = chunk_size
+        cur.execute(
+            """
+            SELECT DISTINCT ON (route_id) route_id, lat_e7, lon_e7
+            FROM route_tracks
+            ORDER BY route_id, file_id
+            """
+        )
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [(int(r[0]), bytes(r[1]), bytes(r[2])) for r in rows]
+
+
+def _merge_staging(cur) -> set:
+    """Apply rci_staging to route_cultural_items for the routes in rci_scope; returns changed route_ids."""
+    changed = set()
+    cur.execute(
+        """
+        DELETE FROM route_cultural_items t
+        USING rci_scope sc
+        WHERE t.route_id = sc.route_id
+          AND NOT EXISTS (
+              SELECT 1 FROM rci_staging s
+              WHERE s.route_id = t.route_id AND s.item_id = t.item_id
+          )
+        RETURNING t.route_id
+        """
+    )
+    changed.update(int(r[0]) for r in cur.fetchall())
+    cur.execute(
+        """
+        UPDATE route_cultural_items t
+        SET distance_m = s.distance_m
+        FROM rci_staging s
+        WHERE s.route_id = t.route_id AND s.item_id = t.item_id
+          AND t.distance_m IS DISTINCT FROM s.distance_m
+        RETURNING t.route_id
+        """
+    )
+    changed.update(int(r[0]) for r in cur.fetchall())
+    cur.execute(
+        """
+        INSERT INTO route_cultural_items (route_id, item_id, distance_m)
+        SELECT route_id, item_id, distance_m FROM rci_staging
+        ON CONFLICT (route_id, item_id) DO NOTHING
+        RETURNING route_id
+        """
+    )
+    changed.update(int(r[0]) for r in cur.fetchall())
+    return changed
+
+
+def run_catalog_join(conn, radius_m: float = 150, processes: int = 1, chunk_size: int = 50, cell_deg: float = 0.02, progress=None) -> dict:
+    """
+    Rebuild route_cultural_items for every route with a stored track.
+    progress(done_routes, total_routes, links, elapsed_s) is called after
+    each chunk. Returns the totals and "changed_route_ids"; the caller
+    syncs the cultural booleans of those routes and commits (or rolls
+    back for a dry run).
+    """
+    started = time.perf_counter()
+    item_ids, lats, lons, _ = _fetch_items(conn)
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(DISTINCT route_id) FROM route_tracks")
+        total_routes = int(cur.fetchone()[0])
+        cur.execute(
+            """
+            CREATE TEMP TABLE rci_staging (
+                route_id INT NOT NULL,
+                item_id INT NOT NULL,
+                distance_m INT NOT NULL
+            ) ON COMMIT DROP
+            """
+        )
+        cur.execute("CREATE TEMP TABLE rci_scope (route_id INT PRIMARY KEY) ON COMMIT DROP")
+
+    done = 0
+    links = 0
+    with conn.cursor() as cur:
+        for chunk, rows in join_tracks((item_ids, lats, lons), _stream_tracks(conn, chunk_size), radius_m, processes, cell_deg):
+            _copy_rows(cur, "rci_scope", [(route_id,) for route_id, _, _ in chunk])
+            if rows:
+                _copy_rows(cur, "rci_staging", rows)
+            done += len(chunk)
+            links += len(rows)
+            if progress is not None:
+                progress(done, total_routes, links, time.perf_counter() - started)
+        join_s = time.perf_counter() - started
+
+        cur.execute("CREATE INDEX ON rci_staging (route_id, item_id)")
+        cur.execute("ANALYZE rci_staging")
+        changed = _merge_staging(cur)
+        # Les associacions ítem -> rutes amb radi més gran es tornen a calcular a demanda
+        cur.execute("DELETE FROM cultural_item_routes_cache")
+
+    return {
+        "routes": done,
+        "items": len(item_ids),
+        "links": links,
+        "changed_route_ids": sorted(changed),
+        "join_s": join_s,
+        "total_s": time.perf_counter() - started,
+    }
@@ -0,0 +1,106 @@
+"""
+Concurrent GPX download into the track store.
+
+Routes whose track is not stored yet are downloaded by a bounded thread
+pool sharing one keep-alive requests.Session. Each worker parses the GPX
+and saves it to route_tracks with its own pooled connection. Concurrent
+callers asking for the same file share the same in-flight future.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from db import get_connection
+from services.gpx_parser import parse_gpx_track
+from services.track_store import TrackUnavailable, save_track
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class TrackFetcher:
+    """Per-process pool of GPX download workers."""
+
+    def __init__(self, max_workers: int = None, timeout: float = None):
+        self.max_workers = max(1, max_workers or _env_int("GPX_FETCH_WORKERS", 8))
+        self.timeout = timeout or _env_float("GPX_FETCH_TIMEOUT_S", 12.0)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._session = None
+        self._inflight = {}
+
+    def _ensure_started(self):
+        # gunicorn fa fork després d'importar: fils i sockets són per procés
+        pid = os.getpid()
+        if self._executor is not None and self._pid == pid:
+            return
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self._session = session
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gpx-fetch")
+        self._inflight = {}
+        self._pid = pid
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            self._ensure_started()
+            return self._session
+
+    def submit(self, route_id: int, file_id: int, url: str):
+        """
+        Future with the stored Track of the file. Raises TrackUnavailable
+        (download, points) or the underlying network/DB error.
+        """
+        with self._lock:
+            self._ensure_started()
+            future = self._inflight.get(file_id)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._fetch, route_id, file_id, url)
+            self._inflight[file_id] = future
+        future.add_done_callback(lambda f, key=file_id: self._forget(key, f))
+        return future
+
+    def _forget(self, file_id, future):
+        with self._lock:
+            if self._inflight.get(file_id) is future:
+                del self._inflight[file_id]
+
+    def _fetch(self, route_id: int, file_id: int, url: str):
+        r = self._session.get(url, timeout=self.timeout)
+        if r.status_code != 200:
+            raise TrackUnavailable("download")
+
+        lats, lons, eles = parse_gpx_track(r.content)
+        if len(lats) < 2:
+            raise TrackUnavailable("points")
+
+        conn = get_connection()
+        try:
+            track = save_track(conn, file_id, route_id, lats, lons, eles)
+            conn.commit()
+        finally:
+            conn.close()
+        return track
+
+
+track_fetcher = TrackFetcher()
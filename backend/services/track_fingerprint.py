@@ -0,0 +1,465 @@
+"""
+Track fingerprints for duplicate route detection.
+
+A track is resampled every CELL_STEP_M metres and reduced to the set of
+geohash cells (precision 7, ~150 m) it passes through. The set is
+summarised by a MinHash signature of NUM_PERM values; two signatures agree
+on a position with probability equal to the Jaccard similarity of the
+cell sets. The signature is split into BANDS bands of ROWS values and each
+band is hashed into a bucket (LSH): routes sharing a bucket with the new
+track are its candidates, found through the route_fingerprint_bands index
+instead of a scan of the catalog.
+
+Candidates whose estimated similarity reaches MIN_SIMILARITY are
+confirmed on the tracks themselves, both resampled to CONFIRM_POINTS
+points: a discrete Fréchet distance within DUPLICATE_FRECHET_M marks a
+duplicate (same course, in either direction), a Hausdorff distance
+within NEAR_DUPLICATE_HAUSDORFF_M a near duplicate (same course with
+local variations). Confirmed pairs are kept in route_duplicates.
+"""
+
+import hashlib
+import math
+import os
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from services.geometry import _M_PER_DEG_LAT, polyline_length_m
+from services.track_store import load_tracks
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Canviar qualsevol paràmetre de l'empremta obliga a pujar la versió
+FINGERPRINT_VERSION = 1
+GEOHASH_PRECISION = 7
+CELL_STEP_M = 25.0
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+CONFIRM_POINTS = 200
+MAX_CANDIDATES = 50
+MIN_SIMILARITY = _env_float("ROUTE_DUP_MIN_SIMILARITY", 0.5)
+DUPLICATE_FRECHET_M = _env_float("ROUTE_DUP_FRECHET_M", 60.0)
+NEAR_DUPLICATE_HAUSDORFF_M = _env_float("ROUTE_DUP_HAUSDORFF_M", 200.0)
+
+# Límit de mostres per track (una ruta de 100 km a 25 m)
+_MAX_SAMPLES = 4000
+
+_U64 = np.uint64
+
+
+def _constants(label: str):
+    # Derivades d'un hash fix: les signatures desades no depenen de la versió de NumPy
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(f"{label}:{i}".encode(), digest_size=8).digest(), "little") for i in range(NUM_PERM)],
+        dtype=np.uint64,
+    )
+
+
+# Família multiplicativa: h_i(x) = (a_i * x + b_i) mod 2^64, bits alts (a_i senar)
+_PERM_A = _constants("a") | _U64(1)
+_PERM_B = _constants("b")
+
+
+class Fingerprint:
+    """MinHash signature (uint32[NUM_PERM]) and LSH buckets (int64[BANDS]) of a track."""
+
+    __slots__ = ("cell_count", "signature", "buckets", "length_m")
+
+    def __init__(self, cell_count: int, signature, length_m: float):
+        self.cell_count = int(cell_count)
+        self.signature = np.asarray(signature, dtype=np.uint32)
+        self.buckets = band_buckets(self.signature)
+        self.length_m = float(length_m)
+
+    def similarity(self, other_signature) -> float:
+        """Estimated Jaccard similarity of the cell sets."""
+        return float(np.mean(self.signature == np.asarray(other_signature, dtype=np.uint32)))
+
+
+def _projected(lats, lons, lat0: float):
+    kx = _M_PER_DEG_LAT * math.cos(math.radians(lat0))
+    return np.asarray(lons, dtype=np.float64) * kx, np.asarray(lats, dtype=np.float64) * _M_PER_DEG_LAT
+
+
+def resample(lats, lons, n_points: int):
+    """n_points evenly spaced along the track (by planar arc length)."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    x, y = _projected(lats, lons, float(lats.mean()))
+    dist = np.concatenate([[0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))])
+    if dist[-1] <= 0.0:
+        return np.full(n_points, lats[0]), np.full(n_points, lons[0])
+    at = np.linspace(0.0, dist[-1], n_points)
+    return np.interp(at, dist, lats), np.interp(at, dist, lons)
+
+
+def geohash_cells(lats, lons, precision: int = GEOHASH_PRECISION):
+    """Integer geohash (5 * precision bits) of every point."""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    qlat = np.clip(((np.asarray(lats, dtype=np.float64) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    qlon = np.clip(((np.asarray(lons, dtype=np.float64) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+
+    # Entrellaçat del geohash: comença per longitud, de bit alt a baix
+    cells = np.zeros(len(qlat), dtype=np.int64)
+    for k in range(bits):
+        if k % 2 == 0:
+            bit = (qlon >> (lon_bits - 1 - k // 2)) & 1
+        else:
+            bit = (qlat >> (lat_bits - 1 - k // 2)) & 1
+        cells = (cells << 1) | bit
+    return cells
+
+
+def track_cells(lats, lons, length_m: float = None):
+    """Distinct geohash cells visited by the track, sampled every CELL_STEP_M."""
+    if length_m is None:
+        length_m = polyline_length_m(lats, lons)
+    n = int(min(_MAX_SAMPLES, max(2, math.ceil(length_m / CELL_STEP_M) + 1)))
+    rlat, rlon = resample(lats, lons, n)
+    return np.unique(geohash_cells(rlat, rlon))
+
+
+def _mix64(x):
+    # splitmix64: escampa els bits de cel·les veïnes abans del hash lineal
+    with np.errstate(over="ignore"):
+        z = x + _U64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> _U64(30))) * _U64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> _U64(27))) * _U64(0x94D049BB133111EB)
+    return z ^ (z >> _U64(31))
+
+
+def minhash(cells):
+    """NUM_PERM minimum hashes (uint32) of a set of integer cells."""
+    x = _mix64(np.asarray(cells, dtype=np.int64).astype(np.uint64))
+    with np.errstate(over="ignore"):
+        h = (_PERM_A[:, None] * x[None, :] + _PERM_B[:, None]) >> _U64(32)
+    return h.min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket per LSH band."""
+    sig = np.asarray(signature, dtype="<u4")
+    return np.array(
+        [
+            int.from_bytes(hashlib.blake2b(sig[b * ROWS:(b + 1) * ROWS].tobytes(), digest_size=8).digest(), "little", signed=True)
+            for b in range(BANDS)
+        ],
+        dtype=np.int64,
+    )
+
+
+def fingerprint_track(lats, lons, length_m: float = None) -> Fingerprint:
+    if length_m is None:
+        length_m = polyline_length_m(lats, lons)
+    cells = track_cells(lats, lons, length_m)
+    return Fingerprint(len(cells), minhash(cells), length_m)
+
+
+def discrete_frechet(d) -> float:
+    """Discrete Fréchet distance from the pairwise distance matrix d (n x m)."""
+    n, m = d.shape
+    # c[i+1, j+1]: Fréchet dels prefixos; c[0, 0] = 0 i la resta de la vora infinita
+    c = np.full((n + 1, m + 1), np.inf)
+    c[0, 0] = 0.0
+    # Cada antidiagonal només depèn de les dues anteriors: es calcula sencera
+    for k in range(n + m - 1):
+        i = np.arange(max(0, k - m + 1), min(n - 1, k) + 1)
+        j = k - i
+        c[i + 1, j + 1] = np.maximum(d[i, j], np.minimum(np.minimum(c[i, j + 1], c[i, j]), c[i + 1, j]))
+    return float(c[n, m])
+
+
+def compare_tracks(a_lats, a_lons, b_lats, b_lons, points: int = CONFIRM_POINTS) -> dict:
+    """
+    Discrete Fréchet (best of both directions of b) and Hausdorff distance
+    in metres between two tracks, each resampled to `points` points.
+    """
+    a_lat, a_lon = resample(a_lats, a_lons, points)
+    b_lat, b_lon = resample(b_lats, b_lons, points)
+    lat0 = float((a_lat.mean() + b_lat.mean()) / 2.0)
+    ax, ay = _projected(a_lat, a_lon, lat0)
+    bx, by = _projected(b_lat, b_lon, lat0)
+    d = np.hypot(ax[:, None] - bx[None, :], ay[:, None] - by[None, :])
+
+    forward = discrete_frechet(d)
+    backward = discrete_frechet(d[:, ::-1])
+    hausdorff = max(float(d.min(axis=1).max()), float(d.min(axis=0).max()))
+    return {
+        "frechet_m": min(forward, backward),
+        "hausdorff_m": hausdorff,
+        "reversed": backward < forward,
+    }
+
+
+def classify(frechet_m: float, hausdorff_m: float):
+    """'duplicate', 'near_duplicate' or None."""
+    if frechet_m <= DUPLICATE_FRECHET_M:
+        return "duplicate"
+    if hausdorff_m <= NEAR_DUPLICATE_HAUSDORFF_M:
+        return "near_duplicate"
+    return None
+
+
+def save_fingerprint(conn, route_id: int, file_id: int, fp: Fingerprint):
+    """Store the fingerprint and its LSH bands (the caller commits)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO route_fingerprints (route_id, file_id, version, cell_count, signature, length_m)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (route_id) DO UPDATE SET
+                file_id = EXCLUDED.file_id,
+                version = EXCLUDED.version,
+                cell_count = EXCLUDED.cell_count,
+                signature = EXCLUDED.signature,
+                length_m = EXCLUDED.length_m,
+                updated_at = NOW()
+            """,
+            (route_id, file_id, FINGERPRINT_VERSION, fp.cell_count, fp.signature.astype("<u4").tobytes(), fp.length_m),
+        )
+        cur.execute("DELETE FROM route_fingerprint_bands WHERE route_id = %s", (route_id,))
+        execute_values(
+            cur,
+            "INSERT INTO route_fingerprint_bands (band, bucket, route_id) VALUES %s",
+            [(band, int(bucket), route_id) for band, bucket in enumerate(fp.buckets.tolist())],
+        )
+
+
+def find_candidates(conn, route_id: int, fp: Fingerprint, limit: int = MAX_CANDIDATES):
+    """[(route_id, estimated_similarity)] of the routes sharing an LSH bucket, most similar first."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT f.route_id, f.signature
+            FROM (
+                SELECT b.route_id, COUNT(*) AS shared
+                FROM route_fingerprint_bands b
+                JOIN unnest(%s::smallint[], %s::bigint[]) AS q(band, bucket)
+                  ON q.band = b.band AND q.bucket = b.bucket
+                WHERE b.route_id <> %s
+                GROUP BY b.route_id
+                ORDER BY shared DESC, b.route_id
+                LIMIT %s
+            ) c
+            JOIN route_fingerprints f ON f.route_id = c.route_id
+            WHERE f.version = %s
+            """,
+            (list(range(BANDS)), fp.buckets.tolist(), route_id, int(limit), FINGERPRINT_VERSION),
+        )
+        rows = cur.fetchall()
+
+    out = [
+        (int(rid), fp.similarity(np.frombuffer(bytes(sig), dtype="<u4")))
+        for rid, sig in rows
+    ]
+    out.sort(key=lambda c: (-c[1], c[0]))
+    return out
+
+
+def detect_duplicates(conn, route_id: int, track, fp: Fingerprint = None):
+    """
+    Confirm the LSH candidates of a route against its track and replace its
+    rows in route_duplicates (both directions). Returns the confirmed
+    matches, closest first. The caller commits.
+    """
+    fp = fp or fingerprint_track(track.lats, track.lons, track.length_m)
+
+    similar = {rid: sim for rid, sim in find_candidates(conn, route_id, fp) if sim >= MIN_SIMILARITY}
+    matches = []
+    if similar:
+        tracks = load_tracks(conn, sorted(similar))
+        for other_id, other in tracks.items():
+            if len(other) < 2:
+                continue
+            cmp = compare_tracks(track.lats, track.lons, other.lats, other.lons)
+            kind = classify(cmp["frechet_m"], cmp["hausdorff_m"])
+            if kind is None:
+                continue
+            matches.append({
+                "route_id": other_id,
+                "kind": kind,
+                "similarity": round(similar[other_id], 3),
+                "frechet_m": round(cmp["frechet_m"], 1),
+                "hausdorff_m": round(cmp["hausdorff_m"], 1),
+                "reversed": bool(cmp["reversed"]),
+            })
+    matches.sort(key=lambda m: (m["frechet_m"], m["route_id"]))
+
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM route_duplicates WHERE route_id = %s OR duplicate_of = %s",
+            (route_id, route_id),
+        )
+        if matches:
+            # La ruta més nova és la duplicada de la més antiga
+            execute_values(
+                cur,
+                """
+                INSERT INTO route_duplicates (route_id, duplicate_of, kind, similarity, frechet_m, hausdorff_m, reversed)
+                VALUES %s
+                ON CONFLICT (route_id, duplicate_of) DO UPDATE SET
+                    kind = EXCLUDED.kind,
+                    similarity = EXCLUDED.similarity,
+                    frechet_m = EXCLUDED.frechet_m,
+                    hausdorff_m = EXCLUDED.hausdorff_m,
+                    reversed = EXCLUDED.reversed,
+                    detected_at = NOW()
+                """,
+                [
+                    (max(route_id, m["route_id"]), min(route_id, m["route_id"]), m["kind"],
+                     m["similarity"], m["frechet_m"], m["hausdorff_m"], m["reversed"])
+                    for m in matches
+                ],
+            )
+            cur.execute(
+                "SELECT route_id, name FROM routes WHERE route_id = ANY(%s)",
+                ([m["route_id"] for m in matches],),
+            )
+            names = {int(r[0]): r[1] for r in cur.fetchall()}
+            for m in matches:
+                m["name"] = names.get(m["route_id"])
+    return matches
+
+
+def fingerprint_route(conn, route_id: int, track):
+    """
+    Fingerprint the route's track and detect its duplicates (on upload).
+    Only the route's first file counts, as in load_track: a later file
+    leaves the stored fingerprint as it is and returns None.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT file_id, version FROM route_fingerprints WHERE route_id = %s", (route_id,))
+        row = cur.fetchone()
+    if row and int(row[0]) < int(track.file_id) and int(row[1]) == FINGERPRINT_VERSION:
+        return None
+
+    fp = fingerprint_track(track.lats, track.lons, track.length_m)
+    save_fingerprint(conn, route_id, track.file_id, fp)
+    return detect_duplicates(conn, route_id, track, fp)
+
+
+def duplicate_report(conn, kind: str = None, route_id: int = None, limit: int = 100) -> dict:
+    """Confirmed pairs, newest first, with totals per kind and the fingerprint coverage."""
+    where = []
+    params = []
+    if kind:
+        where.append("d.kind = %s")
+        params.append(kind)
+    if route_id is not None:
+        where.append("(d.route_id = %s OR d.duplicate_of = %s)")
+        params.extend([route_id, route_id])
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT d.route_id, r.name, r.creator_id, d.duplicate_of, o.name, o.creator_id,
+                   d.kind, d.similarity, d.frechet_m, d.hausdorff_m, d.reversed, d.detected_at
+            FROM route_duplicates d
+            JOIN routes r ON r.route_id = d.route_id
+            JOIN routes o ON o.route_id = d.duplicate_of
+            {where_sql}
+            ORDER BY d.detected_at DESC, d.route_id DESC, d.duplicate_of
+            LIMIT %s
+            """,
+            params + [int(limit)],
+        )
+        rows = cur.fetchall()
+        cur.execute("SELECT kind, COUNT(*), COUNT(DISTINCT route_id) FROM route_duplicates GROUP BY kind")
+        totals = {r[0]: {"pairs": int(r[1]), "routes": int(r[2])} for r in cur.fetchall()}
+        cur.execute(
+            """
+            SELECT
+                (SELECT COUNT(DISTINCT route_id) FROM route_tracks),
+                (SELECT COUNT(*) FROM route_fingerprints WHERE version = %s)
+            """,
+            (FINGERPRINT_VERSION,),
+        )
+        with_track, fingerprinted = cur.fetchone()
+
+    return {
+        "totals": totals,
+        "routes_with_track": int(with_track),
+        "routes_fingerprinted": int(fingerprinted),
+        "pairs": [
+            {
+                "route_id": int(r[0]),
+                "name": r[1],
+                "creator_id": r[2],
+                "duplicate_of": int(r[3]),
+                "duplicate_of_name": r[4],
+                "duplicate_of_creator_id": r[5],
+                "kind": r[6],
+                "similarity": float(r[7]),
+                "frechet_m": float(r[8]),
+                "hausdorff_m": float(r[9]),
+                "reversed": bool(r[10]),
+                "detected_at": r[11].isoformat() if r[11] else None,
+            }
+            for r in rows
+        ],
+    }
+
+
+def routes_missing_fingerprint(conn):
+    """route_ids with a stored track but no current fingerprint of its first file."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT t.route_id
+            FROM (
+                SELECT DISTINCT ON (route_id) route_id, file_id
+                FROM route_tracks
+                ORDER BY route_id, file_id
+            ) t
+            LEFT JOIN route_fingerprints f ON f.route_id = t.route_id
+            WHERE f.route_id IS NULL OR f.version <> %s OR f.file_id <> t.file_id
+            ORDER BY t.route_id
+            """,
+            (FINGERPRINT_VERSION,),
+        )
+        return [int(r[0]) for r in cur.fetchall()]
+
+
+def fingerprint_routes(conn, route_ids, detect_route_ids=None, batch_size: int = 100, progress=None) -> dict:
+    """
+    Backfill: fingerprint route_ids, then detect duplicates for
+    detect_route_ids (default: the same routes). Every route is
+    fingerprinted before any detection, so pairs inside the backfill are
+    found too. Commits after each batch; progress(phase, done, total).
+    """
+    route_ids = [int(r) for r in route_ids]
+    detect_route_ids = route_ids if detect_route_ids is None else [int(r) for r in detect_route_ids]
+    totals = {"fingerprinted": 0, "checked": 0, "pairs": 0}
+
+    for start in range(0, len(route_ids), batch_size):
+        tracks = load_tracks(conn, route_ids[start:start + batch_size])
+        for route_id, track in tracks.items():
+            if len(track) >= 2:
+                save_fingerprint(conn, route_id, track.file_id, fingerprint_track(track.lats, track.lons, track.length_m))
+                totals["fingerprinted"] += 1
+        conn.commit()
+        if progress is not None:
+            progress("fingerprint", min(start + batch_size, len(route_ids)), len(route_ids))
+
+    for start in range(0, len(detect_route_ids), batch_size):
+        tracks = load_tracks(conn, detect_route_ids[start:start + batch_size])
+        for route_id, track in tracks.items():
+            if len(track) >= 2:
+                totals["pairs"] += len(detect_duplicates(conn, route_id, track))
+                totals["checked"] += 1
+        conn.commit()
+        if progress is not None:
+            progress("detect", min(start + batch_size, len(detect_route_ids)), len(detect_route_ids))
+    return totals
@@ -0,0 +1,159 @@
+"""
+Compact persisted GPS tracks.
+
+A GPX file is parsed once (on upload, or lazily the first time it is
+needed) and stored in route_tracks as fixed-point arrays:
+latitude/longitude as int32 degrees * 1e7 (~1 cm resolution) and
+elevation as float32, plus the bounding box and the length. Geometric
+computations read these arrays instead of downloading and parsing XML.
+"""
+
+import numpy as np
+
+from services.geometry import polyline_length_m
+
+COORD_SCALE = 10_000_000
+
+_INT32 = np.dtype("<i4")
+_FLOAT32 = np.dtype("<f4")
+
+
+class TrackUnavailable(Exception):
+    """The route has no usable track (reason: no_gpx, download, points)."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Track:
+    """Decoded track: float64 lat/lon arrays and optional float32 elevations."""
+
+    __slots__ = ("file_id", "route_id", "lats", "lons", "eles", "bbox", "length_m")
+
+    def __init__(self, lats, lons, eles=None, file_id=None, route_id=None, bbox=None, length_m=None):
+        self.file_id = file_id
+        self.route_id = route_id
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.eles = None if eles is None else np.asarray(eles, dtype=np.float32)
+        if bbox is None and len(self.lats):
+            bbox = (float(self.lats.min()), float(self.lats.max()), float(self.lons.min()), float(self.lons.max()))
+        self.bbox = bbox
+        self.length_m = polyline_length_m(self.lats, self.lons) if length_m is None else float(length_m)
+
+    def __len__(self):
+        return len(self.lats)
+
+    @property
+    def has_elevation(self) -> bool:
+        return self.eles is not None and bool(np.isfinite(self.eles).any())
+
+
+def encode_track(lats, lons, eles=None) -> dict:
+    """Fixed-point binary columns for route_tracks."""
+    lat_e7 = np.round(np.asarray(lats, dtype=np.float64) * COORD_SCALE).astype(_INT32)
+    lon_e7 = np.round(np.asarray(lons, dtype=np.float64) * COORD_SCALE).astype(_INT32)
+
+    ele_bytes = None
+    if eles is not None:
+        if isinstance(eles, np.ndarray):
+            ele_arr = eles.astype(_FLOAT32)
+        else:
+            ele_arr = np.array([np.nan if e is None else e for e in eles], dtype=_FLOAT32)
+        if np.isfinite(ele_arr).any():
+            ele_bytes = ele_arr.tobytes()
+
+    return {
+        "lat_e7": lat_e7.tobytes(),
+        "lon_e7": lon_e7.tobytes(),
+        "ele": ele_bytes,
+    }
+
+
+def decode_track(lat_e7: bytes, lon_e7: bytes, ele: bytes = None, **kwargs) -> Track:
+    lats = np.frombuffer(bytes(lat_e7), dtype=_INT32).astype(np.float64) / COORD_SCALE
+    lons = np.frombuffer(bytes(lon_e7), dtype=_INT32).astype(np.float64) / COORD_SCALE
+    eles = np.frombuffer(bytes(ele), dtype=_FLOAT32) if ele is not None else None
+    return Track(lats, lons, eles, **kwargs)
+
+
+def save_track(conn, file_id: int, route_id: int, lats, lons, eles=None) -> Track:
+    """
+    Persist the track of a route file (the caller commits).
+    Returns the Track as it will be read back (fixed-point rounded).
+    """
+    encoded = encode_track(lats, lons, eles)
+    track = decode_track(encoded["lat_e7"], encoded["lon_e7"], encoded["ele"], file_id=file_id, route_id=route_id)
+    min_lat, max_lat, min_lon, max_lon = track.bbox
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO route_tracks (
+                file_id, route_id, point_count, lat_e7, lon_e7, ele,
+                min_lat, max_lat, min_lon, max_lon, length_m
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (file_id) DO UPDATE SET
+                point_count = EXCLUDED.point_count,
+                lat_e7 = EXCLUDED.lat_e7,
+                lon_e7 = EXCLUDED.lon_e7,
+                ele = EXCLUDED.ele,
+                min_lat = EXCLUDED.min_lat,
+                max_lat = EXCLUDED.max_lat,
+                min_lon = EXCLUDED.min_lon,
+                max_lon = EXCLUDED.max_lon,
+                length_m = EXCLUDED.length_m
+            """,
+            (
+                file_id, route_id, len(track),
+                encoded["lat_e7"], encoded["lon_e7"], encoded["ele"],
+                min_lat, max_lat, min_lon, max_lon, track.length_m,
+            ),
+        )
+    return track
+
+
+_SELECT_TRACK = """
+    SELECT DISTINCT ON (route_id)
+        file_id, route_id, lat_e7, lon_e7, ele,
+        min_lat, max_lat, min_lon, max_lon, length_m
+    FROM route_tracks
+"""
+
+
+def _row_to_track(row) -> Track:
+    file_id, route_id, lat_e7, lon_e7, ele, min_lat, max_lat, min_lon, max_lon, length_m = row
+    return decode_track(
+        lat_e7, lon_e7, ele,
+        file_id=int(file_id),
+        route_id=int(route_id),
+        bbox=(float(min_lat), float(max_lat), float(min_lon), float(max_lon)),
+        length_m=float(length_m),
+    )
+
+
+def load_track(conn, route_id: int):
+    """Stored track of the route (its first GPX file), or None."""
+    with conn.cursor() as cur:
+        cur.execute(
+            _SELECT_TRACK + " WHERE route_id = %s ORDER BY route_id, file_id ASC",
+            (route_id,),
+        )
+        row = cur.fetchone()
+    return _row_to_track(row) if row else None
+
+
+def load_tracks(conn, route_ids) -> dict:
+    """route_id -> Track for every route in route_ids that has a stored track."""
+    route_ids = [int(r) for r in route_ids]
+    if not route_ids:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(
+            _SELECT_TRACK + " WHERE route_id = ANY(%s) ORDER BY route_id, file_id ASC",
+            (route_ids,),
+        )
+        rows = cur.fetchall()
+    return {int(r[1]): _row_to_track(r) for r in rows}
@@ -0,0 +1,364 @@
+"""
+Local pedestrian routing graph.
+
+An OSM extract (XML, or PBF when pyosmium is installed) is imported once
+into a compact CSR adjacency graph stored as plain .npy files:
+
+    lat.npy, lon.npy        float64 per node
+    indptr.npy              int64, edges of node v are indptr[v]:indptr[v + 1]
+    indices.npy             int32 target node of each edge
+    weight.npy              float32 length in metres
+    edge_way.npy            int32 index into ways.json (name, highway)
+    cell_keys.npy,          snapping grid: sorted cell keys of the nodes
+    cell_order.npy          and the node of each key
+    meta.json
+
+Every array is opened with mmap_mode="r", so several workers share the
+same pages and start instantly. The graph is undirected (walking ignores
+oneway). Routes are answered with bidirectional A* using the great-circle
+distance as heuristic, with average potentials so both searches work on
+the same reduced costs and can stop as soon as topf + topr >= best.
+"""
+
+import heapq
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+GRAPH_FORMAT_VERSION = 1
+EARTH_RADIUS_M = 6371000.0
+SNAP_CELL_DEG = 0.005
+
+# highway=* que es poden caminar (motorway/trunk queden fora si no porten foot=yes)
+WALKABLE_HIGHWAYS = {
+    "footway", "path", "pedestrian", "steps", "track", "bridleway", "cycleway",
+    "living_street", "residential", "service", "unclassified", "road",
+    "tertiary", "tertiary_link", "secondary", "secondary_link",
+    "primary", "primary_link", "corridor",
+}
+_FOOT_ALLOWED = {"yes", "designated", "permissive", "official"}
+_ACCESS_DENIED = {"no", "private"}
+
+_ARRAYS = ("lat", "lon", "indptr", "indices", "weight", "edge_way", "cell_keys", "cell_order")
+
+
+class GraphUnavailable(Exception):
+    """No graph has been built or the files are missing."""
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _cell_key(cy, cx):
+    return (np.asarray(cy, dtype=np.int64) + (1 << 20)) * (1 << 21) + (np.asarray(cx, dtype=np.int64) + (1 << 20))
+
+
+def is_walkable(tags: dict) -> bool:
+    highway = tags.get("highway")
+    if not highway:
+        return False
+    foot = tags.get("foot")
+    if foot in _FOOT_ALLOWED:
+        return True
+    if foot == "no" or tags.get("access") in _ACCESS_DENIED:
+        return False
+    return highway in WALKABLE_HIGHWAYS
+
+
+# --- Importació OSM ---------------------------------------------------------
+
+def _read_osm_xml(path):
+    """(coords {node_id: (lat, lon)}, ways [(refs, name, highway)]) d'un .osm."""
+    coords = {}
+    ways = []
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end":
+            continue
+        if elem.tag == "node":
+            coords[int(elem.attrib["id"])] = (float(elem.attrib["lat"]), float(elem.attrib["lon"]))
+            root.clear()
+        elif elem.tag == "way":
+            tags = {t.attrib["k"]: t.attrib["v"] for t in elem.iter("tag")}
+            if is_walkable(tags):
+                refs = [int(nd.attrib["ref"]) for nd in elem.iter("nd")]
+                ways.append((refs, tags.get("name") or "", tags["highway"]))
+            root.clear()
+        elif elem.tag == "relation":
+            root.clear()
+    return coords, ways
+
+
+def _read_osm_pbf(path):
+    try:
+        import osmium
+    except ImportError as e:  # pyosmium és opcional: sense ell només s'accepta XML
+        raise RuntimeError("Per importar fitxers .pbf cal instal·lar pyosmium (pip install osmium)") from e
+
+    coords = {}
+    ways = []
+
+    class _Handler(osmium.SimpleHandler):
+        def node(self, n):
+            if n.location.valid():
+                coords[n.id] = (n.location.lat, n.location.lon)
+
+        def way(self, w):
+            tags = {t.k: t.v for t in w.tags}
+            if is_walkable(tags):
+                ways.append(([nd.ref for nd in w.nodes], tags.get("name") or "", tags["highway"]))
+
+    _Handler().apply_file(path)
+    return coords, ways
+
+
+def build_graph_arrays(coords: dict, ways: list) -> dict:
+    """CSR arrays (and the ways table) from parsed OSM nodes and ways."""
+    used = {}
+    src, dst, way_idx = [], [], []
+    for w, (refs, _, _) in enumerate(ways):
+        refs = [r for r in refs if r in coords]
+        for a, b in zip(refs, refs[1:]):
+            if a == b:
+                continue
+            ia = used.setdefault(a, len(used))
+            ib = used.setdefault(b, len(used))
+            src.append(ia)
+            dst.append(ib)
+            way_idx.append(w)
+
+    n = len(used)
+    lat = np.empty(n, dtype=np.float64)
+    lon = np.empty(n, dtype=np.float64)
+    for node_id, i in used.items():
+        lat[i], lon[i] = coords[node_id]
+
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    way_idx = np.asarray(way_idx, dtype=np.int32)
+
+    # Graf no dirigit: cada tram en tots dos sentits
+    s = np.concatenate([src, dst])
+    d = np.concatenate([dst, src])
+    wy = np.concatenate([way_idx, way_idx])
+
+    phi1 = np.radians(lat[s])
+    phi2 = np.radians(lat[d])
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon[d] - lon[s]) / 2) ** 2)
+    weight = (2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).astype(np.float32)
+
+    order = np.lexsort((d, s))
+    s, d, wy, weight = s[order], d[order], wy[order], weight[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(s, minlength=n), out=indptr[1:])
+
+    keys = _cell_key(np.floor(lat / SNAP_CELL_DEG), np.floor(lon / SNAP_CELL_DEG))
+    cell_order = np.argsort(keys, kind="stable").astype(np.int32)
+
+    return {
+        "lat": lat,
+        "lon": lon,
+        "indptr": indptr,
+        "indices": d.astype(np.int32),
+        "weight": weight,
+        "edge_way": wy,
+        "cell_keys": keys[cell_order],
+        "cell_order": cell_order,
+        "ways": [[name, highway] for _, name, highway in ways],
+    }
+
+
+def import_osm(path: str) -> dict:
+    """Graph arrays from an .osm / .osm.pbf extract."""
+    if path.endswith(".pbf"):
+        coords, ways = _read_osm_pbf(path)
+    else:
+        coords, ways = _read_osm_xml(path)
+    return build_graph_arrays(coords, ways)
+
+
+def save_graph(arrays: dict, graph_dir: str, source: str = None):
+    os.makedirs(graph_dir, exist_ok=True)
+    for name in _ARRAYS:
+        np.save(os.path.join(graph_dir, f"{name}.npy"), arrays[name])
+    with open(os.path.join(graph_dir, "ways.json"), "w", encoding="utf-8") as f:
+        json.dump(arrays["ways"], f, ensure_ascii=False)
+
+    lat, lon = arrays["lat"], arrays["lon"]
+    meta = {
+        "version": GRAPH_FORMAT_VERSION,
+        "source": source,
+        "nodes": int(len(lat)),
+        "edges": int(len(arrays["indices"])),
+        "bbox": [float(lat.min()), float(lat.max()), float(lon.min()), float(lon.max())] if len(lat) else None,
+        "snap_cell_deg": SNAP_CELL_DEG,
+    }
+    with open(os.path.join(graph_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- Consultes --------------------------------------------------------------
+
+class WalkGraph:
+    """Memory-mapped CSR walking graph."""
+
+    def __init__(self, arrays: dict, ways, meta: dict = None):
+        self.lat = arrays["lat"]
+        self.lon = arrays["lon"]
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.weight = arrays["weight"]
+        self.edge_way = arrays["edge_way"]
+        self.cell_keys = arrays["cell_keys"]
+        self.cell_order = arrays["cell_order"]
+        self.ways = ways
+        self.meta = meta or {}
+        self.cell_deg = float(self.meta.get("snap_cell_deg", SNAP_CELL_DEG))
+
+    @classmethod
+    def load(cls, graph_dir: str):
+        meta_path = os.path.join(graph_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            raise GraphUnavailable(f"No hi ha cap graf a {graph_dir}")
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != GRAPH_FORMAT_VERSION:
+            raise GraphUnavailable("Format de graf antic: cal tornar-lo a generar")
+        arrays = {name: np.load(os.path.join(graph_dir, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        with open(os.path.join(graph_dir, "ways.json"), encoding="utf-8") as f:
+            ways = json.load(f)
+        return cls(arrays, ways, meta)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        return cls(arrays, arrays["ways"], {"snap_cell_deg": SNAP_CELL_DEG})
+
+    def __len__(self):
+        return len(self.lat)
+
+    def nearest_node(self, lat: float, lon: float, max_distance_m: float):
+        """(node, distance_m) of the closest node within max_distance_m, or None."""
+        if not len(self.lat):
+            return None
+        dlat = max_distance_m / 111320.0
+        dlon = max_distance_m / (111320.0 * max(math.cos(math.radians(min(abs(lat), 89.9))), 1e-6))
+        cy0 = int(math.floor((lat - dlat) / self.cell_deg))
+        cy1 = int(math.floor((lat + dlat) / self.cell_deg))
+        cx0 = int(math.floor((lon - dlon) / self.cell_deg))
+        cx1 = int(math.floor((lon + dlon) / self.cell_deg))
+
+        parts = []
+        for cy in range(cy0, cy1 + 1):
+            lo = np.searchsorted(self.cell_keys, _cell_key(cy, cx0), side="left")
+            hi = np.searchsorted(self.cell_keys, _cell_key(cy, cx1), side="right")
+            if hi > lo:
+                parts.append(np.asarray(self.cell_order[lo:hi]))
+        if not parts:
+            return None
+
+        cand = np.concatenate(parts)
+        phi1 = math.radians(lat)
+        phi2 = np.radians(self.lat[cand])
+        a = (np.sin((phi2 - phi1) / 2) ** 2
+             + math.cos(phi1) * np.cos(phi2) * np.sin(np.radians(self.lon[cand] - lon) / 2) ** 2)
+        d = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        best = int(np.argmin(d))
+        if d[best] > max_distance_m:
+            return None
+        return int(cand[best]), float(d[best])
+
+    def shortest_path(self, source: int, target: int, max_settled: int = 2_000_000):
+        """
+        Bidirectional A*. Returns (distance_m, [node, ...]) or None when the
+        nodes are not connected (or the search exceeds max_settled nodes).
+        """
+        if source == target:
+            return 0.0, [source]
+
+        lat, lon = self.lat, self.lon
+        s_lat, s_lon = float(lat[source]), float(lon[source])
+        t_lat, t_lon = float(lat[target]), float(lon[target])
+        indptr, indices, weight = self.indptr, self.indices, self.weight
+
+        potential = {}
+
+        def pf(v):
+            p = potential.get(v)
+            if p is None:
+                vl, vo = float(lat[v]), float(lon[v])
+                p = (_haversine(vl, vo, t_lat, t_lon) - _haversine(vl, vo, s_lat, s_lon)) / 2.0
+                potential[v] = p
+            return p
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        settled = (set(), set())
+        heaps = ([(pf(source), source)], [(-pf(target), target)])
+        sign = (1.0, -1.0)  # potencial invers: pr(v) = -pf(v)
+
+        best = math.inf
+        meet = -1
+        n_settled = 0
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            key, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+            n_settled += 1
+            if n_settled > max_settled:
+                return None
+
+            d_here, d_other = dist[side], dist[1 - side]
+            du = d_here[u]
+            lo, hi = int(indptr[u]), int(indptr[u + 1])
+            for v, w in zip(indices[lo:hi].tolist(), weight[lo:hi].tolist()):
+                nd = du + w
+                if nd < d_here.get(v, math.inf):
+                    d_here[v] = nd
+                    parent[side][v] = u
+                    heapq.heappush(heaps[side], (nd + sign[side] * pf(v), v))
+                other = d_other.get(v)
+                if other is not None and d_here[v] + other < best:
+                    best = d_here[v] + other
+                    meet = v
+
+        if meet < 0:
+            return None
+
+        path = []
+        v = meet
+        while v != -1:
+            path.append(v)
+            v = parent[0][v]
+        path.reverse()
+        v = parent[1][meet]
+        while v != -1:
+            path.append(v)
+            v = parent[1][v]
+        return best, path
+
+    def path_ways(self, path):
+        """(name, highway) of the way used by each consecutive pair in path."""
+        out = []
+        for u, v in zip(path, path[1:]):
+            lo, hi = int(self.indptr[u]), int(self.indptr[u + 1])
+            targets = np.asarray(self.indices[lo:hi])
+            pos = np.nonzero(targets == v)[0]
+            if len(pos):
+                out.append(tuple(self.ways[int(self.edge_way[lo + int(pos[0])])]))
+        return out
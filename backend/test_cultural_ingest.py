@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test script for the cultural_items bulk loader (services/cultural_ingest.py)
+Uses a fake connection that records the COPY data, so no database is needed.
+"""
+
+import io
+
+from fake_db import FakeConnection
+from services.cultural_ingest import (
+    _find_duplicates,
+    _match_existing,
+    iter_csv,
+    iter_geojson,
+    normalize_item_type,
+    normalize_record,
+    stage_records,
+    title_key,
+    titles_similar,
+)
+
+
+def test_item_type_normalization():
+    assert normalize_item_type("  Edifici ") == ("edifici", True)
+    assert normalize_item_type("JACIMENT ARQUEOLOGIC") == ("jaciment arqueològic", True)
+    assert normalize_item_type("Zona d’interès") == ("zona d'interès", True)
+    assert normalize_item_type("col.lecció") == ("col·lecció", True)
+    assert normalize_item_type("Molí  fariner") == ("molí fariner", False)
+    assert normalize_item_type("") == (None, True)
+
+
+def test_record_validation():
+    row = normalize_record({"Nom": "Castell de Burriac", "Latitud": "41,5411", "Longitud": "2,3964", "Tipus": "Edifici"})
+    assert row["title"] == "Castell de Burriac" and row["latitude"] == 41.5411 and row["item_type"] == "edifici"
+    for record, reason in [
+        ({"lat": 41, "lon": 2}, "title"),
+        ({"title": "X", "lat": "abc", "lon": 2}, "coordinates"),
+        ({"title": "X", "lat": 95, "lon": 2}, "coordinates"),
+        ({"title": "X", "lat": 0, "lon": 0}, "coordinates"),
+    ]:
+        try:
+            normalize_record(record)
+            raise AssertionError("hauria de fallar")
+        except ValueError as e:
+            assert str(e) == reason
+    try:
+        normalize_record({"title": "X", "lat": 41, "lon": 2, "type": "ovni"}, strict_types=True)
+        raise AssertionError("hauria de fallar")
+    except ValueError as e:
+        assert str(e) == "item_type"
+
+
+def test_title_similarity():
+    assert title_key("Església de Sant Martí (Romànic)") == "esglesia de sant marti romanic"
+    assert titles_similar(title_key("Església de Sant Martí"), title_key("Esglesia de Sant Marti"), 0.85) == 1.0
+    assert titles_similar(title_key("Església de Sant Martí"), title_key("Església Sant Martí"), 0.85) > 0
+    assert titles_similar(title_key("Església de Sant Martí"), title_key("Pont romà"), 0.85) == 0.0
+
+
+def test_readers():
+    rows = list(iter_csv(io.StringIO("nom;lat;lon\nPont;41.1;2.2\nMolí;41.2;2.3\n")))
+    assert [r["nom"] for r in rows] == ["Pont", "Molí"]
+    lines = io.StringIO(
+        '{"type":"Feature","geometry":{"type":"Point","coordinates":[2.2,41.1]},"properties":{"name":"Pont"}}\n\n'
+        '{"type":"Feature","geometry":null,"properties":{"name":"Sense punt"}}\n'
+    )
+    features = [normalize_record_or_none(r) for r in iter_geojson(lines, lines=True)]
+    assert features[0]["latitude"] == 41.1 and features[0]["longitude"] == 2.2
+    assert features[1] is None
+    fc = io.StringIO('{"type":"FeatureCollection","features":[{"type":"Feature","geometry":{"type":"Point","coordinates":[2.2,41.1]},"properties":{"name":"Pont"}}]}')
+    assert [r["name"] for r in iter_geojson(fc)] == ["Pont"]
+
+
+def normalize_record_or_none(record):
+    try:
+        return normalize_record(record)
+    except ValueError:
+        return None
+
+
+def test_stage_records_copies_in_batches():
+    conn = FakeConnection()
+    records = [{"title": f"Ítem {i}", "lat": 41.0 + i * 0.001, "lon": 2.0, "tipus": "edifici" if i % 2 else "ovni"} for i in range(7)]
+    records.append({"title": "", "lat": 41, "lon": 2})
+    batches = []
+    stats = stage_records(conn, records, batch_size=3, progress=lambda phase, n: batches.append(n))
+    assert stats["read"] == 8 and stats["staged"] == 7
+    assert stats["invalid"] == {"title": 1}
+    assert stats["unknown_types"] == {"ovni": 4}
+    assert batches == [3, 6, 7]
+    assert len(conn.copied["ingest_staging"]) == 7
+
+
+def test_duplicates_in_input_keep_first_row():
+    conn = FakeConnection([
+        # (b.row_id, b.key, b.lat, b.lon, a.key, a.lat, a.lon)
+        (2, "pont roma", 41.0, 2.0, "pont roma", 41.0001, 2.0),        # duplicat de 1
+        (2, "pont roma", 41.0, 2.0, "pont roma", 41.0002, 2.0),        # ja marcat
+        (3, "moli fariner", 41.0, 2.0, "pont roma", 41.0, 2.0),        # títol diferent
+        (4, "pont roma", 41.0, 2.0, "pont roma", 41.01, 2.0),          # massa lluny
+    ])
+    assert _find_duplicates(conn, 50, 0.85, 100) == 1
+    assert conn.copied["ingest_dupes"] == ["2"]
+
+
+def test_match_existing_prefers_most_similar_then_nearest():
+    conn = FakeConnection([
+        # (s.row_id, s.key, s.lat, s.lon, ci.item_id, ci.title, ci.lat, ci.lon)
+        (1, "esglesia de sant marti", 41.0, 2.0, 10, "Església Sant Martí", 41.0, 2.0),
+        (1, "esglesia de sant marti", 41.0, 2.0, 11, "Església de Sant Martí", 41.0003, 2.0),
+        (2, "pont roma", 41.0, 2.0, 12, "Pont romà", 41.0002, 2.0),
+        (2, "pont roma", 41.0, 2.0, 13, "Pont romà", 41.0001, 2.0),
+        (3, "creu de terme", 41.0, 2.0, 14, "Creu de terme", 41.01, 2.0),
+    ])
+    assert _match_existing(conn, 50, 0.85, 100) == 2
+    assert conn.copied["ingest_matches"] == ["1,11", "2,13"]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
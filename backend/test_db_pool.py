@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script for the pooled connection layer (db.ConnectionPool)
+Uses fake connections, so no database is needed.
+"""
+
+import threading
+
+from db import ConnectionPool, PoolTimeout
+from fake_db import FakeConnection
+
+
+def test_connections_are_reused():
+    created = []
+
+    def connect():
+        created.append(FakeConnection())
+        return created[-1]
+
+    pool = ConnectionPool(connect=connect, minconn=1, maxconn=2)
+    for _ in range(5):
+        conn = pool.getconn()
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        conn.close()
+
+    assert len(created) == 1
+    # La transacció oberta es desfà en retornar la connexió
+    assert created[0].rollbacks == 5
+    stats = pool.stats()
+    assert stats["checkouts"] == 5
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+
+
+def test_closed_proxy_cannot_be_used():
+    pool = ConnectionPool(connect=FakeConnection, minconn=0, maxconn=1)
+    conn = pool.getconn()
+    conn.close()
+    conn.close()  # idempotent
+    assert conn.closed
+    try:
+        conn.cursor()
+    except Exception:
+        pass
+    else:
+        raise AssertionError("cursor() hauria de fallar després de close()")
+
+
+def test_timeout_when_exhausted():
+    pool = ConnectionPool(connect=FakeConnection, minconn=0, maxconn=1, timeout=0.05)
+    held = pool.getconn()
+    try:
+        pool.getconn()
+    except PoolTimeout:
+        pass
+    else:
+        raise AssertionError("S'esperava PoolTimeout")
+    held.close()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool = ConnectionPool(connect=FakeConnection, minconn=0, maxconn=1, timeout=2)
+    held = pool.getconn()
+    got = []
+
+    def worker():
+        c = pool.getconn()
+        got.append(c)
+        c.close()
+
+    t = threading.Thread(target=worker)
+    t.start()
+    held.close()
+    t.join(timeout=3)
+    assert len(got) == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_broken_connection_is_replaced_on_checkout():
+    created = []
+
+    def connect():
+        created.append(FakeConnection())
+        return created[-1]
+
+    pool = ConnectionPool(connect=connect, minconn=1, maxconn=2, health_check_interval=0)
+    created[0].broken = True
+    conn = pool.getconn()
+    conn.close()
+
+    assert len(created) == 2
+    assert created[0].closed
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_unclosed_connections_are_reclaimed():
+    pool = ConnectionPool(connect=FakeConnection, minconn=0, maxconn=2)
+    conn = pool.getconn()  # noqa: F841 (handler que oblida close())
+    assert pool.release_thread_connections() == 1
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["leaks_detected"] == 1
+    # Un close() tardà no ha de tornar a alliberar la connexió
+    other = pool.getconn()
+    conn.close()
+    assert pool.stats()["in_use"] == 1
+    other.close()
+
+
+def test_pool_stats_are_for_operators_only():
+    import os
+
+    from flask_jwt_extended import create_access_token
+
+    from app import app
+
+    orig_admins = os.environ.get("ADMIN_USER_IDS")
+    os.environ["ADMIN_USER_IDS"] = "4"
+    try:
+        client = app.test_client()
+        with app.app_context():
+            admin = create_access_token(identity="4")
+            user = create_access_token(identity="2")
+        anonymous = client.get("/health/db").status_code
+        as_user = client.get("/health/db", headers={"Authorization": f"Bearer {user}"}).status_code
+        cache = client.get("/health/http-cache", headers={"Authorization": f"Bearer {admin}"})
+    finally:
+        if orig_admins is None:
+            os.environ.pop("ADMIN_USER_IDS", None)
+        else:
+            os.environ["ADMIN_USER_IDS"] = orig_admins
+
+    assert (anonymous, as_user) == (401, 403)
+    assert cache.status_code == 200 and "hits" in cache.get_json()
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
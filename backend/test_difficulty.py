@@ -4,7 +4,9 @@ Test script for difficulty calculator
 Tests the hiking difficulty formula with various route scenarios
 """
 
-from services.difficulty_calculator import calculate_difficulty, get_difficulty_score
+import random
+
+from services.difficulty_calculator import calculate_difficulty, calculate_difficulty_batch, get_difficulty_score
 
 def test_difficulty_calculator():
     """Run tests for difficulty calculator"""
@@ -74,5 +76,66 @@ def test_difficulty_calculator():
     print()
 
 
+def test_batch_matches_scalar():
+    """calculate_difficulty_batch must classify exactly like calculate_difficulty"""
+    rng = random.Random(7)
+    times = [None, "", "1:00", "2:30", "5h", "3h30m", "45m", "10:15", "abc"]
+    distances = [rng.uniform(0, 40) for _ in range(2000)] + [0, None, -3, 5.8333]
+    elevations = [rng.randint(0, 2500) for _ in range(2000)] + [None, 0, -10, 0]
+    est = [rng.choice(times) for _ in range(len(distances))]
+
+    for lang in ('es', 'ca'):
+        batch = calculate_difficulty_batch(distances, elevations, est, lang=lang)
+        scalar = [calculate_difficulty(d, e, t, lang=lang) for d, e, t in zip(distances, elevations, est)]
+        mismatches = [i for i, (a, b) in enumerate(zip(batch, scalar)) if a != b]
+        assert not mismatches, f"{lang}: {len(mismatches)} diferències, primera a {mismatches[0]}"
+
+    print("✓ calculate_difficulty_batch coincideix amb calculate_difficulty")
+
+
+def test_thresholds_are_lower_bounds():
+    """A score exactly on a threshold already belongs to the next level"""
+    from services.difficulty_calculator import _LABELS, _SCORE_THRESHOLDS
+
+    for lang in ('es', 'ca'):
+        for level, threshold in enumerate(_SCORE_THRESHOLDS, start=1):
+            # Només desnivell: score = elevation / 80
+            below, at = (threshold - 0.5) * 80, threshold * 80
+            assert calculate_difficulty(0, below, lang=lang) == _LABELS[lang][level - 1]
+            assert calculate_difficulty(0, at, lang=lang) == _LABELS[lang][level]
+            assert calculate_difficulty_batch([0, 0], [below, at], lang=lang) == list(_LABELS[lang][level - 1:level + 1])
+
+    print("✓ els llindars de dificultat són inclusius per sota")
+
+
+def test_list_filter_matches_both_label_sets():
+    """?difficulty= accepts Catalan, Spanish and English names and matches every stored label"""
+    from routes.routes_routes import _route_list_filters
+
+    for raw in ("moderada", "Mitjana", " MEDIA "):
+        clauses, params = _route_list_filters({"difficulty": raw})
+        assert clauses == ["r.difficulty = ANY(%s)"]
+        assert params == [["Mitjana", "Moderada"]], params
+
+    _, params = _route_list_filters({"difficulty": "fàcil,muy dificil"})
+    assert params == [["Fàcil", "Fácil", "Molt Difícil", "Muy Difícil"]]
+
+    # Cada etiqueta que escriu calculate_difficulty torna a trobar el seu nivell
+    for label in ("Fácil", "Moderada", "Difícil", "Muy Difícil", "Fàcil", "Mitjana", "Molt Difícil"):
+        assert label in _route_list_filters({"difficulty": label})[1][0]
+
+    try:
+        _route_list_filters({"difficulty": "extrema"})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("una dificultat desconeguda hauria de donar error")
+
+    print("✓ el filtre de dificultat accepta totes les etiquetes")
+
+
 if __name__ == "__main__":
     test_difficulty_calculator()
+    test_batch_matches_scalar()
+    test_thresholds_are_lower_bounds()
+    test_list_filter_matches_both_label_sets()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test script for the polyline geometry and the cultural items spatial index
+Compares the vectorized point-to-segment distance with a dense brute force.
+"""
+
+import numpy as np
+
+from services.geo_utils import haversine_m
+from services.geometry import (
+    points_to_polyline_m,
+    point_to_polyline_m,
+    polyline_length_m,
+    simplify_douglas_peucker,
+    simplify_visvalingam,
+)
+from fake_db import FakeConnection
+from services.spatial_index import CulturalIndexCache, CulturalItemIndex
+
+
+def _densify(lats, lons, per_segment=400):
+    out_lat, out_lon = [], []
+    for i in range(len(lats) - 1):
+        t = np.linspace(0.0, 1.0, per_segment)
+        out_lat.extend(lats[i] + (lats[i + 1] - lats[i]) * t)
+        out_lon.extend(lons[i] + (lons[i + 1] - lons[i]) * t)
+    return out_lat, out_lon
+
+
+def test_point_near_long_segment():
+    # Segment recte d'uns 8 km: el punt és a ~100 m del centre, lluny dels vèrtexs
+    line_lat = [41.40, 41.40]
+    line_lon = [2.00, 2.10]
+    d = point_to_polyline_m(41.4009, 2.05, line_lat, line_lon)
+    assert 95 < d < 105, d
+    vertex_only = min(haversine_m(41.4009, 2.05, la, lo) for la, lo in zip(line_lat, line_lon))
+    assert vertex_only > 4000
+
+
+def test_matches_dense_brute_force():
+    rng = np.random.default_rng(3)
+    line_lat = 41.3 + np.cumsum(rng.normal(0, 0.002, 60))
+    line_lon = 1.9 + np.cumsum(rng.normal(0, 0.002, 60))
+    pts_lat = rng.uniform(line_lat.min() - 0.01, line_lat.max() + 0.01, 300)
+    pts_lon = rng.uniform(line_lon.min() - 0.01, line_lon.max() + 0.01, 300)
+
+    exact = points_to_polyline_m(pts_lat, pts_lon, line_lat, line_lon)
+    dense_lat, dense_lon = _densify(line_lat, line_lon)
+    for la, lo, d in zip(pts_lat, pts_lon, exact):
+        brute = min(haversine_m(la, lo, a, b) for a, b in zip(dense_lat[::7], dense_lon[::7]))
+        # El mostreig dens sempre sobreestima una mica
+        assert d <= brute + 0.5, (d, brute)
+        assert brute - d < 15, (d, brute)
+
+
+def test_max_distance_pruning():
+    line_lat = [41.0, 41.0, 41.1]
+    line_lon = [2.0, 2.1, 2.1]
+    d = points_to_polyline_m([41.001, 42.0], [2.05, 2.05], line_lat, line_lon, max_distance_m=500)
+    assert d[0] < 500
+    assert np.isinf(d[1])
+
+
+def test_polyline_length():
+    length = polyline_length_m([41.0, 41.0, 41.1], [2.0, 2.1, 2.1])
+    expected = haversine_m(41.0, 2.0, 41.0, 2.1) + haversine_m(41.0, 2.1, 41.1, 2.1)
+    assert abs(length - expected) < 1e-6
+
+
+def test_index_polyline_query_is_exact():
+    rng = np.random.default_rng(5)
+    n = 5000
+    lat = rng.uniform(41.0, 41.5, n)
+    lon = rng.uniform(1.8, 2.4, n)
+    index = CulturalItemIndex(np.arange(1, n + 1), lat, lon, ["edifici"] * n)
+
+    line_lat = np.array([41.05, 41.2, 41.25, 41.45])
+    line_lon = np.array([1.85, 2.0, 2.3, 2.35])
+    found = index.query_polyline(line_lat, line_lon, 300)
+
+    expected = points_to_polyline_m(lat, lon, line_lat, line_lon)
+    expected_ids = {i + 1 for i in np.nonzero(expected <= 300)[0].tolist()}
+    assert set(found) == expected_ids
+    for item_id, dist in found.items():
+        assert abs(dist - expected[item_id - 1]) < 1e-6
+
+
+class CulturalItemsTable:
+    """cultural_items with change_txid and its tombstones, as migration 0017 leaves them."""
+
+    def __init__(self):
+        self.rows = {}         # item_id -> (lat, lon, item_type, change_txid)
+        self.tombstones = {}   # item_id -> change_txid
+        self.txid = 100
+
+    def write(self, item_id, lat, lon, item_type="edifici"):
+        self.txid += 1
+        self.rows[item_id] = (lat, lon, item_type, self.txid)
+        self.tombstones.pop(item_id, None)
+
+    def delete(self, item_id):
+        self.txid += 1
+        del self.rows[item_id]
+        self.tombstones[item_id] = self.txid
+
+    def handle(self, sql, params):
+        if sql.startswith("SELECT txid_snapshot_xmin"):
+            return [(self.txid + 1,)]
+        if sql.startswith("SELECT item_id FROM cultural_item_tombstones"):
+            lo, hi = params
+            return [(i,) for i, t in self.tombstones.items() if lo <= t < hi]
+        if "WHERE change_txid >= %s" in sql:
+            lo, hi = params
+            return [(i, *r[:3]) for i, r in sorted(self.rows.items()) if lo <= r[3] < hi]
+        if sql.startswith("SELECT item_id, latitude, longitude, item_type FROM cultural_items"):
+            return [(i, *r[:3]) for i, r in sorted(self.rows.items()) if r[0] is not None]
+        raise AssertionError(f"SQL inesperat: {sql}")
+
+
+def test_index_refresh_picks_up_moved_and_deleted_items():
+    table = CulturalItemsTable()
+    table.write(1, 41.0, 2.0)
+    table.write(2, 41.0, 2.1)
+    table.write(3, 41.0, 2.2)
+    cache = CulturalIndexCache(refresh_s=0, full_reload_s=1e9)
+    conn = FakeConnection(handler=table.handle)
+
+    def near(index, lat, lon):
+        return index.query_radius(lat, lon, 100)[0].tolist()
+
+    assert near(cache.get(conn), 41.0, 2.0) == [1]
+
+    table.write(1, 41.5, 2.5)        # mogut
+    table.delete(2)
+    table.write(3, None, None)       # sense coordenades
+    table.write(4, 41.0, 2.0)        # nou
+    index = cache.get(conn)
+
+    assert len(index) == 2
+    assert near(index, 41.0, 2.0) == [4]
+    assert near(index, 41.5, 2.5) == [1]
+    assert near(index, 41.0, 2.1) == [] and near(index, 41.0, 2.2) == []
+
+
+def test_douglas_peucker_respects_tolerance():
+    rng = np.random.default_rng(11)
+    lat = 41.4 + np.cumsum(rng.normal(0, 0.00003, 2000))
+    lon = 2.1 + np.cumsum(rng.normal(0, 0.00003, 2000))
+
+    keep = simplify_douglas_peucker(lat, lon, 5.0)
+    assert keep[0] == 0 and keep[-1] == len(lat) - 1
+    assert len(keep) < len(lat) / 2
+    d = points_to_polyline_m(lat, lon, lat[keep], lon[keep])
+    assert d.max() <= 5.0 + 1e-6, d.max()
+
+
+def test_visvalingam_drops_collinear_points():
+    lat = np.linspace(41.0, 41.01, 50)
+    lon = np.full(50, 2.0)
+    lon[25] += 0.001  # un sol desviament de ~80 m
+    keep = simplify_visvalingam(lat, lon, 5.0)
+    # Es conserven els extrems i el pic (amb els seus veïns, que formen triangles grans)
+    assert keep[0] == 0 and keep[-1] == 49 and 25 in keep
+    assert len(keep) <= 5
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
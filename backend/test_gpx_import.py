@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test script for the bulk GPX import (services/gpx_import.py)
+Parses in-process and uses a fake connection and upload, so no database
+or storage is needed.
+"""
+
+import io
+import zipfile
+
+import services.gpx_import as import_module
+from fake_db import FakeConnection
+from services.gpx_import import import_gpx_files, iter_zip, parse_gpx_file, route_name_from_filename
+
+
+def _gpx(n=30, minutes=90):
+    pts = "\n".join(
+        f'<trkpt lat="{41.0 + i * 0.001:.4f}" lon="2.0"><ele>{100 + i * 10}</ele>'
+        f'<time>2024-05-01T{10 + (i * minutes // (n - 1)) // 60:02d}:{(i * minutes // (n - 1)) % 60:02d}:00Z</time></trkpt>'
+        for i in range(n)
+    )
+    return f'<?xml version="1.0"?><gpx version="1.1"><trk><trkseg>{pts}</trkseg></trk></gpx>'.encode()
+
+
+class InlinePool:
+    """Mateixa interfície que GpxParsePool, sense processos."""
+
+    def parse(self, named_files):
+        for filename, data in named_files:
+            yield data, parse_gpx_file(filename, data)
+
+
+def _route_id_sequence(start=100):
+    """Connexió falsa on nextval() de routes.route_id comença a start."""
+    next_id = [start]
+
+    def handle(sql, params):
+        assert sql.startswith("SELECT nextval(pg_get_serial_sequence('routes', 'route_id'))"), sql
+        ids = list(range(next_id[0], next_id[0] + params[0]))
+        next_id[0] += params[0]
+        return [(i,) for i in ids]
+
+    return FakeConnection(handler=handle)
+
+
+def test_parse_gpx_file():
+    res = parse_gpx_file("Volta_al-Montseny.gpx", _gpx())
+    assert res["ok"] and res["name"] == "Volta al Montseny"
+    assert 3.0 < res["distance_km"] < 3.5
+    assert res["elevation_gain"] == 290
+    assert res["estimated_time"] == "1:30"
+    assert len(res["lats"]) == 30
+
+    assert parse_gpx_file("notes.txt", b"hola")["error"] == "no és un fitxer .gpx"
+    assert parse_gpx_file("x.gpx", b"<html></html>")["error"] == "no sembla un GPX vàlid"
+    assert parse_gpx_file("x.gpx", b'<gpx version="1.1"></gpx>')["error"] == "el GPX no té cap track"
+    assert parse_gpx_file("x.gpx", None)["error"] == "fitxer massa gran"
+    assert route_name_from_filename("dir/ruta.GPX") == "Ruta"
+
+
+def test_iter_zip_skips_noise_and_oversized():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("tracks/a.gpx", _gpx())
+        zf.writestr("tracks/b.gpx", b"x" * 2000)
+        zf.writestr("__MACOSX/tracks/._a.gpx", b"")
+        zf.writestr("README.txt", b"hola")
+    buf.seek(0)
+    entries = list(iter_zip(buf, max_file_bytes=1500))
+    assert [name for name, _ in entries] == ["a.gpx", "b.gpx"]
+    assert entries[1][1] is None
+
+
+def test_import_creates_routes_and_reports_each_file():
+    stored, enqueued, uploads, route_rows = [], [], [], []
+
+    def fake_execute_values(cur, sql, rows, fetch=False):
+        if "INSERT INTO routes" in sql:
+            route_rows.extend(rows)
+            return None
+        return [(r[0], 1000 + r[0]) for r in rows]
+
+    def fake_upload(data, path, ctype):
+        uploads.append(path)
+        if path.startswith("101/"):
+            raise RuntimeError("503")
+        return f"https://storage/{path}"
+
+    originals = (import_module.execute_values, import_module.save_track, import_module.jobs.enqueue, import_module.fingerprint_route)
+    import_module.execute_values = fake_execute_values
+    import_module.save_track = lambda conn, file_id, route_id, *a: stored.append((file_id, route_id)) or route_id
+    import_module.fingerprint_route = lambda conn, route_id, track: [{"route_id": 5, "kind": "duplicate"}] if track == 102 else None
+    import_module.jobs.enqueue = lambda conn, kind, payload, **kw: enqueued.append(payload["route_id"])
+    try:
+        conn = _route_id_sequence()
+        statuses = import_gpx_files(
+            conn, 7,
+            [("a.gpx", _gpx()), ("b.txt", b"no"), ("c.gpx", _gpx(20, 40)), ("d.gpx", _gpx())],
+            upload=fake_upload, batch_size=2, parse_pool=InlinePool(),
+        )
+    finally:
+        (import_module.execute_values, import_module.save_track,
+         import_module.jobs.enqueue, import_module.fingerprint_route) = originals
+
+    assert [s["status"] for s in statuses] == ["created", "error", "error", "created"]
+    assert statuses[0]["route_id"] == 100 and statuses[3]["route_id"] == 102
+    assert statuses[2]["error"] == "pujada: 503"
+    assert statuses[0]["difficulty"] and statuses[0]["file_url"].startswith("https://storage/100/")
+    # Només les rutes pujades s'insereixen, amb el creador i la versió de la fórmula
+    assert [r[0] for r in route_rows] == [100, 102]
+    assert all(r[8] == 7 for r in route_rows)
+    assert stored == [(1100, 100), (1102, 102)] and enqueued == [100, 102]
+    assert len(uploads) == 3
+    assert statuses[0]["duplicates"] == [] and statuses[3]["duplicates"][0]["route_id"] == 5
+
+
+def test_failed_store_deletes_uploaded_files():
+    uploaded, deleted = [], []
+
+    def failing_execute_values(cur, sql, rows, fetch=False):
+        raise RuntimeError("deadlock")
+
+    def fake_upload(data, path, ctype):
+        uploaded.append(path)
+        return f"https://storage/{path}"
+
+    def run(delete):
+        orig = import_module.execute_values
+        import_module.execute_values = failing_execute_values
+        try:
+            conn = _route_id_sequence()
+            statuses = import_gpx_files(
+                conn, 7, [("a.gpx", _gpx()), ("b.gpx", _gpx())],
+                upload=fake_upload, delete=delete, parse_pool=InlinePool(),
+            )
+        finally:
+            import_module.execute_values = orig
+        return conn, statuses
+
+    conn, statuses = run(lambda paths: deleted.extend(paths))
+    assert conn.rollbacks == 1
+    assert sorted(deleted) == sorted(uploaded) and len(uploaded) == 2
+    assert all(s["status"] == "error" and s["error"] == "desant: deadlock" for s in statuses)
+    assert not any("orphaned_path" in s for s in statuses)
+
+    def broken_delete(paths):
+        raise RuntimeError("503")
+
+    uploaded.clear()
+    _, statuses = run(broken_delete)
+    # Si no es poden esborrar, l'estat diu quin objecte ha quedat penjat
+    assert sorted(s["orphaned_path"] for s in statuses) == sorted(uploaded)
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming GPX parser
+Checks columns, segments, waypoints and the single-pass totals.
+"""
+
+import math
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from services.gpx_parser import parse_gpx, parse_gpx_points, parse_gpx_track
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <wpt lat="41.5" lon="2.5"><name>Font</name></wpt>
+  <trk>
+    <trkseg>
+      <trkpt lat="41.000" lon="2.000"><ele>100</ele><time>2024-05-01T10:00:00Z</time></trkpt>
+      <trkpt lat="41.001" lon="2.000"><ele>110</ele><time>2024-05-01T10:01:00Z</time></trkpt>
+      <trkpt lat="41.002" lon="2.000"><ele>105</ele></trkpt>
+    </trkseg>
+    <trkseg>
+      <trkpt lat="41.010" lon="2.000"/>
+      <trkpt lat="41.011" lon="2.000"><ele>50</ele></trkpt>
+    </trkseg>
+  </trk>
+  <rte>
+    <rtept lat="42.0" lon="3.0"/>
+    <rtept lat="42.1" lon="3.0"/>
+  </rte>
+</gpx>
+"""
+
+
+def test_columns_and_segments():
+    parsed = parse_gpx(GPX)
+    assert len(parsed) == 7
+    assert parsed.segment_ranges("trkseg") == [(0, 3), (3, 5)]
+    assert parsed.segment_ranges("rte") == [(5, 7)]
+    assert list(parsed.wpt_name) == ["Font"]
+    assert math.isnan(parsed.ele[3])
+    assert parsed.time[1] - parsed.time[0] == 60
+
+
+def test_totals_only_count_track():
+    parsed = parse_gpx(GPX)
+    # 0.002 graus de latitud dins el primer segment + 0.001 al segon; el salt
+    # entre segments i la ruta planificada no compten
+    assert abs(parsed.distance_m - 0.003 * 111195) < 1.0, parsed.distance_m
+    assert parsed.elevation_gain_m == 10
+    assert parsed.elevation_loss_m == 5
+    assert parsed.bounds == (41.0, 42.1, 2.0, 3.0)
+    assert (parsed.min_ele, parsed.max_ele) == (50, 110)
+
+
+def test_compat_helpers():
+    points = parse_gpx_points(GPX)
+    assert len(points) == 5 and points[0] == (41.0, 2.0)
+    lats, lons, eles = parse_gpx_track(GPX.encode("utf-8"))
+    assert isinstance(lats, np.ndarray) and len(lats) == 5
+    assert eles[1] == 110
+
+
+def test_bom_text_and_bytes():
+    # Fitxers desats amb BOM: tant el text descodificat com els bytes
+    lats, _, _ = parse_gpx_track("\ufeff" + GPX)
+    assert len(lats) == 5
+    lats, _, _ = parse_gpx_track(b"\xef\xbb\xbf" + GPX.encode("utf-8"))
+    assert len(lats) == 5
+
+
+def test_text_is_never_a_path():
+    try:
+        parse_gpx("   ")
+    except FileNotFoundError:
+        raise AssertionError("el text s'ha obert com a ruta")
+    except ET.ParseError:
+        pass
+    else:
+        raise AssertionError("el text buit no és un GPX")
+
+
+def test_route_only_fallback():
+    gpx = '<gpx><rte><rtept lat="1" lon="1"/><rtept lat="1.001" lon="1"/></rte></gpx>'
+    assert parse_gpx_points(gpx) == [(1.0, 1.0), (1.001, 1.0)]
+    assert parse_gpx(gpx).distance_m > 100
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
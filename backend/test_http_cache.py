@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script for the conditional GET / response cache (services.http_cache)
+Uses a small Flask app and an in-memory version table (no database needed).
+"""
+
+from datetime import datetime, timezone
+
+from flask import Flask, jsonify
+
+from services.http_cache import HttpCache, conditional_get
+
+
+class MemoryCache(HttpCache):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.table = {}
+
+    def _fetch_versions(self, resources, conn=None):
+        return {r: self.table[r] for r in resources if r in self.table}
+
+    def bump(self, resource, when):
+        version = self.table.get(resource, (0, None))[0] + 1
+        self.table[resource] = (version, when)
+
+
+def _app(cache):
+    app = Flask(__name__)
+    calls = []
+
+    @app.get("/routes/<int:route_id>/ratings")
+    @conditional_get(lambda route_id: [f"ratings:{route_id}"], cache=cache)
+    def ratings(route_id):
+        calls.append(route_id)
+        return jsonify([{"route_id": route_id, "n": len(calls)}]), 200
+
+    return app, calls
+
+
+_T1 = datetime(2024, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+_T2 = datetime(2024, 3, 2, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def test_etag_and_304_without_running_the_view():
+    cache = MemoryCache(version_ttl_s=0, response_ttl_s=60)
+    cache.bump("ratings:1", _T1)
+    app, calls = _app(cache)
+    client = app.test_client()
+
+    first = client.get("/routes/1/ratings")
+    assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+    etag = first.headers["ETag"]
+    assert etag.startswith('"') and first.headers["Last-Modified"].endswith("GMT")
+
+    second = client.get("/routes/1/ratings", headers={"If-None-Match": etag})
+    assert second.status_code == 304 and second.data == b""
+    assert calls == [1]
+
+    third = client.get("/routes/1/ratings")
+    assert third.headers["X-Cache"] == "HIT" and third.data == first.data
+    assert calls == [1]
+
+
+def test_write_changes_etag():
+    cache = MemoryCache(version_ttl_s=0, response_ttl_s=60)
+    cache.bump("ratings:1", _T1)
+    app, calls = _app(cache)
+    client = app.test_client()
+
+    etag = client.get("/routes/1/ratings").headers["ETag"]
+    cache.bump("ratings:1", _T2)
+    resp = client.get("/routes/1/ratings", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.headers["ETag"] != etag
+    assert calls == [1, 1]
+
+
+def test_version_ttl_and_invalidate():
+    cache = MemoryCache(version_ttl_s=60, response_ttl_s=60)
+    cache.bump("ratings:1", _T1)
+    app, calls = _app(cache)
+    client = app.test_client()
+
+    etag = client.get("/routes/1/ratings").headers["ETag"]
+    cache.bump("ratings:1", _T2)
+    # Versió en cache (escriptura d'un altre procés): encara es considera vigent
+    assert client.get("/routes/1/ratings", headers={"If-None-Match": etag}).status_code == 304
+    # Escriptura d'aquest procés: invalidate la fa visible de seguida
+    cache.invalidate(["ratings:1"])
+    assert client.get("/routes/1/ratings", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_if_modified_since():
+    cache = MemoryCache(version_ttl_s=0)
+    cache.bump("ratings:2", _T1)
+    app, calls = _app(cache)
+    client = app.test_client()
+
+    assert client.get("/routes/2/ratings", headers={"If-Modified-Since": "Sat, 02 Mar 2024 00:00:00 GMT"}).status_code == 304
+    assert client.get("/routes/2/ratings", headers={"If-Modified-Since": "Thu, 29 Feb 2024 00:00:00 GMT"}).status_code == 200
+
+
+def test_resources_are_keyed_separately():
+    cache = MemoryCache(version_ttl_s=0)
+    cache.bump("ratings:1", _T1)
+    cache.bump("ratings:2", _T1)
+    app, _ = _app(cache)
+    client = app.test_client()
+    assert client.get("/routes/1/ratings").headers["ETag"] != client.get("/routes/2/ratings").headers["ETag"]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for the incremental item -> route association (services/item_association.py)
+Uses in-memory tables and tracks, so no database is needed.
+"""
+
+import numpy as np
+
+import services.item_association as assoc_module
+from fake_db import FakeConnection
+from services.item_association import RouteBBoxIndex, associate_items, drain_queue
+from services.track_store import Track
+
+
+class AssocTables:
+    """cultural_items, route_cultural_items, the item cache and the queue in memory."""
+
+    def __init__(self, items, links=(), cached=(), queued=()):
+        self.items = dict(items)          # item_id -> (lat, lon)
+        self.links = dict(links)          # (route_id, item_id) -> distance_m
+        self.cached = set(cached)         # item_ids a cultural_item_routes_cache
+        self.queued = list(queued)
+
+    def write_links(self, cur, sql, rows):
+        for route_id, item_id, distance_m in rows:
+            self.links[(route_id, item_id)] = distance_m
+
+    def handle(self, sql, params):
+        if sql.startswith("SELECT item_id, latitude, longitude FROM cultural_items"):
+            return [(i, *self.items[i]) for i in params[0] if i in self.items]
+        if sql.startswith("DELETE FROM route_cultural_items"):
+            gone = [key for key in self.links if key[1] in params[0]]
+            for key in gone:
+                del self.links[key]
+            return [(route_id,) for route_id, _ in gone]
+        if sql.startswith("DELETE FROM cultural_item_routes_cache"):
+            self.cached -= set(params[0])
+            return []
+        if sql.startswith("DELETE FROM cultural_item_assoc_queue"):
+            taken, self.queued = self.queued[:params[0]], self.queued[params[0]:]
+            return [(i,) for i in taken]
+        raise AssertionError(f"SQL inesperat: {sql}")
+
+    def connection(self):
+        return FakeConnection(handler=self.handle)
+
+
+def _line_track(route_id, lat0, lon0, lat1, lon1):
+    return Track(np.linspace(lat0, lat1, 50), np.linspace(lon0, lon1, 50), route_id=route_id)
+
+
+_TRACKS = {
+    1: _line_track(1, 41.00, 2.00, 41.00, 2.10),   # horitzontal a lat 41.00
+    2: _line_track(2, 41.50, 2.50, 41.60, 2.50),   # lluny
+    3: _line_track(3, 40.90, 2.05, 41.10, 2.05),   # creua la ruta 1
+}
+
+
+def _index():
+    ids = sorted(_TRACKS)
+    boxes = [_TRACKS[i].bbox for i in ids]
+    return RouteBBoxIndex(ids, *zip(*boxes), max_file_id=10)
+
+
+def _patched(tables, fn):
+    orig_load, orig_values = assoc_module.load_tracks, assoc_module.execute_values
+    assoc_module.load_tracks = lambda conn, ids: {i: _TRACKS[i] for i in ids if i in _TRACKS}
+    assoc_module.execute_values = tables.write_links
+    try:
+        return fn()
+    finally:
+        assoc_module.load_tracks, assoc_module.execute_values = orig_load, orig_values
+
+
+def test_candidates_match_brute_force():
+    rng = np.random.default_rng(1)
+    n = 300
+    lat0 = rng.uniform(41.0, 42.0, n)
+    lon0 = rng.uniform(1.0, 3.0, n)
+    h = rng.uniform(0.0, 0.2, n)
+    w = rng.uniform(0.0, 0.2, n)
+    index = RouteBBoxIndex(np.arange(n), lat0, lat0 + h, lon0, lon0 + w)
+    for lat, lon in zip(rng.uniform(41.0, 42.0, 50), rng.uniform(1.0, 3.0, 50)):
+        dlat, dlon = assoc_module._deg_margins(abs(lat), 500)
+        expected = np.flatnonzero(
+            (lat0 <= lat + dlat) & (lat0 + h >= lat - dlat) & (lon0 <= lon + dlon) & (lon0 + w >= lon - dlon)
+        )
+        assert sorted(index.candidates(lat, lon, 500).tolist()) == expected.tolist()
+
+
+def test_merged_keeps_first_track_of_route():
+    index = _index().merged([1, 4], [0.0, 42.0], [0.0, 42.1], [0.0, 3.0], [0.0, 3.1], max_file_id=12)
+    assert len(index) == 4 and index.max_file_id == 12
+    assert index.candidates(41.0, 2.05, 100).tolist().count(1) == 1
+    assert index.candidates(42.05, 3.05, 100).tolist() == [4]
+
+
+def test_associate_items_measures_only_candidate_routes():
+    # 10 a prop de les rutes 1 i 3 (abans enllaçat a la 7), 11 enlloc
+    tables = AssocTables(
+        {10: (41.0005, 2.05), 11: (45.0, 5.0)},
+        links={(7, 10): 90, (2, 12): 40},
+        cached={10, 12},
+    )
+    n, affected = _patched(tables, lambda: associate_items(tables.connection(), [10, 11], radius_m=150, index=_index()))
+
+    assert n == 2
+    assert sorted(tables.links) == [(1, 10), (2, 12), (3, 10)]
+    assert all(d <= 150 for d in tables.links.values())
+    # La ruta 7 perd l'enllaç: també se'n resincronitzen els booleans
+    assert affected == {1, 3, 7}
+    assert tables.cached == {12}
+
+
+def test_drain_queue_commits_per_batch():
+    tables = AssocTables({10: (41.0005, 2.05)}, queued=[10])
+    conn = tables.connection()
+    synced = []
+    orig_get = assoc_module.route_bboxes.get
+    assoc_module.route_bboxes.get = lambda conn: _index()
+    try:
+        totals = _patched(tables, lambda: drain_queue(conn, lambda c, rid: synced.append(rid), radius_m=150))
+    finally:
+        assoc_module.route_bboxes.get = orig_get
+    assert totals == {"items": 1, "links": 2, "routes": 2, "batches": 1}
+    assert synced == [1, 3] and conn.commits == 1
+    assert tables.queued == [] and sorted(tables.links) == [(1, 10), (3, 10)]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test script for the background job queue (services.jobs)
+Runs jobs against an in-memory model of the jobs table, so no database is needed.
+"""
+
+import re
+
+from fake_db import FakeConnection, Result
+from services import jobs
+
+
+class JobTable:
+    """The jobs rows the worker updates, shared by all the fake connections."""
+
+    def __init__(self):
+        self.rows = {}
+        self.beats = []  # (connection, job_id) de cada batec acceptat
+
+    def add(self, job: jobs.Job, worker_id="host:1"):
+        self.rows[job.job_id] = {"status": "running", "locked_by": worker_id, "last_error": None}
+
+    def status(self, job_id):
+        return self.rows[job_id]["status"]
+
+    def connection(self):
+        conn = FakeConnection()
+        conn.handler = lambda sql, params: self.handle(conn, sql, params)
+        return conn
+
+    def handle(self, conn, sql, params):
+        if sql.startswith("UPDATE jobs SET heartbeat_at = NOW()"):
+            job_id, worker_id = params
+            row = self.rows[job_id]
+            alive = row["status"] == "running" and row["locked_by"] == worker_id
+            if alive:
+                self.beats.append((conn, job_id))
+            return Result(rowcount=int(alive))
+        match = re.match(r"UPDATE jobs SET status = '(\w+)'", sql)
+        if match:
+            row = self.rows[params[-1]]
+            row["status"], row["locked_by"] = match.group(1), None
+            if row["status"] in ("queued", "failed"):
+                row["last_error"] = params[0]
+            return Result(rowcount=1)
+        raise AssertionError(f"SQL inesperat: {sql}")
+
+
+def test_backoff_grows_and_is_capped():
+    delays = [jobs.backoff_s(n, base_s=5, cap_s=120) for n in range(1, 10)]
+    assert 4 <= delays[0] <= 6
+    assert 8 <= delays[1] <= 12
+    assert max(delays) <= 120 * 1.2
+
+
+def test_success_marks_done():
+    calls = []
+    jobs.register("test_ok")(lambda conn, payload: calls.append(payload) or {"n": 1})
+    table = JobTable()
+    job = jobs.Job(1, "test_ok", {"x": 1}, 1, 3)
+    table.add(job)
+
+    assert jobs.run_job(table.connection(), job)
+    assert calls == [{"x": 1}]
+    assert table.status(1) == "done"
+
+
+def test_failure_is_retried_then_failed():
+    def boom(conn, payload):
+        raise RuntimeError("boom")
+
+    jobs.register("test_boom")(boom)
+
+    table = JobTable()
+    first = jobs.Job(2, "test_boom", {}, 1, 3)
+    table.add(first)
+    conn = table.connection()
+    assert not jobs.run_job(conn, first)
+    assert conn.rollbacks == 1
+    assert table.status(2) == "queued"
+    assert "RuntimeError: boom" in table.rows[2]["last_error"]
+
+    last = jobs.Job(2, "test_boom", {}, 3, 3)
+    table.add(last)
+    assert not jobs.run_job(table.connection(), last)
+    assert table.status(2) == "failed"
+
+
+def test_unknown_kind_fails_without_retry():
+    table = JobTable()
+    job = jobs.Job(3, "does_not_exist", {}, 1, 5)
+    table.add(job)
+    assert not jobs.run_job(table.connection(), job)
+    assert table.status(3) == "failed"
+
+
+def test_long_job_sends_heartbeats_on_its_own_connection():
+    import time
+
+    jobs.register("test_slow")(lambda conn, payload: time.sleep(0.15) or {"ok": True})
+    table = JobTable()
+    job = jobs.Job(5, "test_slow", {}, 1, 3)
+    table.add(job, worker_id="host:1")
+    job_conn = table.connection()
+
+    orig = jobs.HEARTBEAT_INTERVAL_S
+    jobs.HEARTBEAT_INTERVAL_S = 0.02
+    try:
+        assert jobs.run_job(job_conn, job, table.connection, "host:1")
+    finally:
+        jobs.HEARTBEAT_INTERVAL_S = orig
+
+    # El batec va per una connexió pròpia: la del treball no fa commit fins al final
+    assert table.beats
+    assert all(conn is not job_conn for conn, _ in table.beats)
+    assert table.status(5) == "done"
+
+    # Un altre worker no pot mantenir viu un treball que no té
+    assert not jobs.heartbeat(table.connection(), 5, "host:2")
+
+
+def test_job_endpoints_require_jwt_and_hide_private_fields():
+    from flask_jwt_extended import create_access_token
+
+    import app as app_module
+    import routes.jobs_routes as jobs_routes
+
+    job = {"job_id": 3, "kind": jobs.DIFFICULTY_BACKFILL, "status": "failed",
+           "payload": {"force": True}, "last_error": "Traceback ...", "locked_by": "host:1"}
+    orig_conn, orig_get = jobs_routes.get_connection, jobs.get_job
+    jobs_routes.get_connection = FakeConnection
+    jobs.get_job = lambda conn, job_id: dict(job)
+    try:
+        client = app_module.app.test_client()
+        assert client.get("/jobs/3").status_code == 401
+        with app_module.app.app_context():
+            token = create_access_token(identity="1")
+        res = client.get("/jobs/3", headers={"Authorization": f"Bearer {token}"})
+    finally:
+        jobs_routes.get_connection, jobs.get_job = orig_conn, orig_get
+
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["status"] == "failed"
+    assert "payload" not in body and "last_error" not in body and "locked_by" not in body
+
+
+def test_job_list_and_stats_are_for_operators_only():
+    import os
+
+    from flask_jwt_extended import create_access_token
+
+    import app as app_module
+    import routes.jobs_routes as jobs_routes
+
+    originals = (jobs_routes.get_connection, jobs.list_jobs, jobs.queue_stats, os.environ.get("ADMIN_USER_IDS"))
+    jobs_routes.get_connection = FakeConnection
+    jobs.list_jobs = lambda conn, **kw: [{"job_id": 3, "status": "failed", "last_error": "Traceback ..."}]
+    jobs.queue_stats = lambda conn: {"counts": {}, "oldest_ready_s": 0.0}
+    os.environ["ADMIN_USER_IDS"] = "4"
+    try:
+        client = app_module.app.test_client()
+        with app_module.app.app_context():
+            admin = {"Authorization": f"Bearer {create_access_token(identity='4')}"}
+            user = {"Authorization": f"Bearer {create_access_token(identity='2')}"}
+        codes = {
+            path: (client.get(path).status_code, client.get(path, headers=user).status_code)
+            for path in ("/jobs", "/jobs/stats")
+        }
+        listed = client.get("/jobs", headers=admin)
+        stats = client.get("/jobs/stats", headers=admin)
+    finally:
+        jobs_routes.get_connection, jobs.list_jobs, jobs.queue_stats, orig_admins = originals
+        if orig_admins is None:
+            os.environ.pop("ADMIN_USER_IDS", None)
+        else:
+            os.environ["ADMIN_USER_IDS"] = orig_admins
+
+    assert codes == {"/jobs": (401, 403), "/jobs/stats": (401, 403)}
+    assert listed.status_code == 200 and listed.get_json() == [{"job_id": 3, "status": "failed"}]
+    assert stats.status_code == 200
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for the incremental per-user learning aggregates
+Checks that the running sums give the same averages as aggregating the
+whole completion history (no database needed).
+"""
+
+from routes.social_routes import _compute_adaptive_signals
+from datetime import datetime
+
+from fake_db import FakeConnection
+
+from services.learning_stats import (
+    STAT_COLUMNS,
+    _as_learning,
+    check_learning_stats,
+    difficulty_buckets,
+    learning_difficulty_rank,
+)
+
+
+def _full_history(completions):
+    # Com l'antiga consulta: mitjanes ponderades per completion_count
+    total = sum(c for _, _, _, c in completions)
+    return {
+        "total_completions": total,
+        "avg_distance_km": sum(d * c for d, _, _, c in completions) / total,
+        "avg_elevation_gain": sum(e * c for _, e, _, c in completions) / total,
+        "avg_difficulty_rank": sum(learning_difficulty_rank(x) * c for _, _, x, c in completions) / total,
+    }
+
+
+def test_difficulty_rank_matches_sql_like_rules():
+    assert learning_difficulty_rank("Fàcil") == 0
+    assert learning_difficulty_rank("Mitjana") == 1
+    assert learning_difficulty_rank("Moderada") == 1
+    assert learning_difficulty_rank("Difícil") == 2
+    assert learning_difficulty_rank("Molt Difícil") == 3
+    assert learning_difficulty_rank("Muy difícil") == 3
+    assert learning_difficulty_rank(None) == 0
+
+
+def test_running_sums_match_full_history():
+    completions = [
+        (8.0, 300, "Fàcil", 3),
+        (14.5, 900, "Difícil", 1),
+        (11.0, 650, "Mitjana", 2),
+    ]
+    sums = [0, 0.0, 0.0, 0.0]
+    for distance, elevation, difficulty, count in completions:
+        for _ in range(count):
+            sums[0] += 1
+            sums[1] += distance
+            sums[2] += elevation
+            sums[3] += learning_difficulty_rank(difficulty)
+
+    incremental = _as_learning(tuple(sums))
+    expected = _full_history(completions)
+    for key, value in expected.items():
+        assert abs(incremental[key] - value) < 1e-9, key
+
+    assert _compute_adaptive_signals("mitjana", 10.0, incremental) == _compute_adaptive_signals("mitjana", 10.0, expected)
+
+
+def test_no_row_means_no_completions():
+    learning = _as_learning(None)
+    assert learning["total_completions"] == 0
+    assert _compute_adaptive_signals("alta", 12.0, learning)["effective_max_difficulty"] == "Difícil"
+
+
+def test_difficulty_buckets_match_stats_rules():
+    assert difficulty_buckets("Fàcil") == {"easy_count": 1, "medium_count": 0, "hard_count": 0, "very_hard_count": 0}
+    assert difficulty_buckets("Mitjana")["medium_count"] == 1
+    assert difficulty_buckets("Difícil") == {"easy_count": 0, "medium_count": 0, "hard_count": 1, "very_hard_count": 0}
+    assert difficulty_buckets("Molt Difícil") == {"easy_count": 0, "medium_count": 0, "hard_count": 0, "very_hard_count": 1}
+    assert sum(difficulty_buckets("").values()) == 0
+
+
+def test_checker_reports_drift_and_orphans():
+    when = datetime(2024, 5, 1, 10, 0)
+    good = (3, 2, 20.0, 900.0, 3.0, 1, 1, 1, 0, when, when)
+    assert len(good) == len(STAT_COLUMNS)
+    drifted = (4,) + good[1:]
+
+    conn = FakeConnection(
+        [(1, *good), (2, *good)],                   # recàlcul complet
+        [(1, *good), (2, *drifted), (3, *good)],    # resum guardat
+    )
+    result = check_learning_stats(conn)
+    assert result["checked"] == 3
+    found = {(m["user_id"], m["column"]) for m in result["mismatches"]}
+    assert (2, "total_completions") in found
+    assert (3, "total_completions") in found
+    assert not any(uid == 1 for uid, _ in found)
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for the compact polyline encodings
+Round trips and the Google reference example.
+"""
+
+import base64
+
+import numpy as np
+
+from services.polyline_codec import (
+    decode_polyline,
+    decode_varint,
+    encode_polyline,
+    encode_varint,
+    polyline_fields,
+)
+
+
+def test_google_reference_example():
+    encoded = encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453])
+    assert encoded == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    lats, lons = decode_polyline(encoded)
+    assert lats == [38.5, 40.7, 43.252] and lons == [-120.2, -120.95, -126.453]
+
+
+def test_varint_round_trip():
+    rng = np.random.default_rng(2)
+    lat = 41.4 + np.cumsum(rng.normal(0, 0.0005, 500))
+    lon = -2.1 + np.cumsum(rng.normal(0, 0.0005, 500))
+    lats, lons = decode_varint(encode_varint(lat, lon, 6), 6)
+    assert np.abs(np.asarray(lats) - lat).max() <= 5e-7
+    assert np.abs(np.asarray(lons) - lon).max() <= 5e-7
+
+
+def test_polyline_fields_formats():
+    points = [[41.0, 2.0], [41.0005, 2.0005], [41.001, 2.001]]
+    assert polyline_fields(points) == {"polyline": points}
+
+    fields = polyline_fields(points, "polyline")
+    lats, _ = decode_polyline(fields["polyline_encoded"])
+    assert lats == [41.0, 41.0005, 41.001]
+
+    fields = polyline_fields(points, "varint")
+    lats, _ = decode_varint(base64.b64decode(fields["polyline_encoded"]), fields["polyline_precision"])
+    assert len(lats) == 3
+
+    # Punts alineats: la simplificació deixa només els extrems
+    assert polyline_fields(points, "json", "dp", 1.0) == {"polyline": [points[0], points[-1]]}
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Test script for the server-side recommendation scoring
+Feature matrix, vectorized scores and top-k selection (no database needed).
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from fake_db import FakeConnection
+from services.recommendation import RouteFeatureCache, RouteFeatureMatrix, difficulty_rank
+
+_T0 = datetime(2024, 1, 1)
+
+
+def _row(route_id, distance_km, difficulty="Fàcil", flags=(False, False, False, False), days=0):
+    return (route_id, distance_km, 100, difficulty, *flags, _T0 + timedelta(days=days))
+
+
+def _reference_score(distance, pd, diff_rank, max_rank, n_flags, multiplier=1.0, boost=1.0):
+    # Puntuació ruta a ruta, com RecommendationService a l'app
+    sigma = min(max(pd * 0.2, 2.0), 10.0)
+    rel = abs(distance - pd) / sigma
+    gaussian = 60.0 * np.exp(-0.5 * rel * rel)
+    ratio = distance / pd
+    if ratio < 0.5:
+        penalty = 0.1
+    elif ratio < 0.7:
+        penalty = 0.5
+    elif ratio > 2.0:
+        penalty = 0.2
+    elif ratio > 1.5:
+        penalty = 0.7
+    else:
+        penalty = 1.0
+    score = min(max(gaussian * penalty, 0.0), 60.0)
+    score += 30.0 if diff_rank <= max_rank else -40.0
+    score += min(max(n_flags / 4.0 * 20.0 * multiplier, 0.0), 20.0) * boost
+    return score
+
+
+def test_difficulty_rank():
+    assert difficulty_rank("Fàcil") == 0
+    assert difficulty_rank("Mitjana") == 1
+    assert difficulty_rank("Moderada") == 1
+    assert difficulty_rank("Difícil") == 2
+    assert difficulty_rank("Molt Difícil") == 3
+    assert difficulty_rank(None) == 0
+
+
+def test_vectorized_score_matches_reference():
+    rng = np.random.default_rng(3)
+    names = ["Fàcil", "Mitjana", "Difícil", "Molt Difícil"]
+    rows = []
+    for i in range(500):
+        flags = tuple(bool(v) for v in rng.integers(0, 2, 4))
+        rows.append(_row(i + 1, float(rng.uniform(0.5, 40)), names[i % 4], flags, days=i))
+    matrix = RouteFeatureMatrix.from_rows(rows)
+
+    scores = matrix.score(12.0, max_difficulty_rank=1, cultural_interest="alta", cultural_boost=1.8)
+    expected = [
+        _reference_score(r[1], 12.0, difficulty_rank(r[3]), 1, sum(r[4:8]), 1.4, 1.8)
+        for r in rows
+    ]
+    assert np.allclose(scores, expected)
+
+
+def test_top_k_matches_full_sort():
+    rng = np.random.default_rng(5)
+    rows = [_row(i + 1, float(rng.choice([5.0, 10.0, 20.0])), days=int(rng.integers(0, 30))) for i in range(1000)]
+    matrix = RouteFeatureMatrix.from_rows(rows)
+    scores = matrix.score(10.0, max_difficulty_rank=2)
+
+    full = sorted(range(len(rows)), key=lambda p: (-scores[p], -matrix.created_at[p], -matrix.route_ids[p]))
+    for k in (1, 7, 50, 1000, 2000):
+        assert matrix.top_k(scores, k).tolist() == full[:k]
+
+
+def test_top_k_mask():
+    matrix = RouteFeatureMatrix.from_rows([
+        _row(1, 10.0, "Difícil"),
+        _row(2, 10.0, "Fàcil", days=1),
+        _row(3, 3.0, "Fàcil"),
+    ])
+    scores = matrix.score(10.0, max_difficulty_rank=0)
+    top = matrix.top_k(scores, 2, mask=matrix.difficulty_rank <= 0)
+    assert matrix.route_ids[top].tolist() == [2, 3]
+
+
+def test_merged_upserts_and_removes():
+    matrix = RouteFeatureMatrix.from_rows([_row(1, 5.0), _row(2, 8.0), _row(3, 12.0)])
+    updated = matrix.merged([_row(2, 9.5, "Difícil"), _row(4, 15.0)], removed_ids=[3])
+    by_id = dict(zip(updated.route_ids.tolist(), updated.distance_km.tolist()))
+    assert by_id == {1: 5.0, 2: 9.5, 4: 15.0}
+    assert updated.max_route_id == 4
+    assert updated.difficulty_rank[updated.route_ids.tolist().index(2)] == 2
+
+
+def test_cache_adds_a_new_dirty_route_once():
+    routes = {1: _row(1, 5.0), 2: _row(2, 8.0, days=1)}
+
+    def handle(sql, params):
+        if "route_id = ANY(%s)" in sql:
+            return [routes[i] for i in params[0] if i in routes]
+        return [routes[i] for i in sorted(routes) if i > params[0]]
+
+    conn = FakeConnection(handler=handle)
+    cache = RouteFeatureCache(refresh_s=1e9, full_reload_s=1e9)
+    assert cache.get(conn).route_ids.tolist() == [1, 2]
+
+    # create_route marca la ruta nova: surt a les files noves i també com a marcada
+    routes[3] = _row(3, 8.0, days=2)
+    cache.mark_dirty([3])
+    matrix = cache.get(conn)
+    assert sorted(matrix.route_ids.tolist()) == [1, 2, 3]
+    top = matrix.route_ids[matrix.top_k(matrix.score(8.0), 3)].tolist()
+    assert top == [3, 2, 1]
+
+    # Una ruta editada i una d'esborrada també es reflecteixen una sola vegada
+    routes[1] = _row(1, 7.5)
+    del routes[2]
+    cache.mark_dirty([1, 2])
+    matrix = cache.get(conn)
+    assert dict(zip(matrix.route_ids.tolist(), matrix.distance_km.tolist())) == {1: 7.5, 3: 8.0}
+
+
+def test_merged_keeps_one_row_per_route():
+    matrix = RouteFeatureMatrix.from_rows([_row(1, 5.0)])
+    updated = matrix.merged([_row(2, 8.0), _row(2, 9.0)])
+    assert sorted(updated.route_ids.tolist()) == [1, 2]
+    assert updated.distance_km[updated.route_ids.tolist().index(2)] == 9.0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
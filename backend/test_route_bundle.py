@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test script for offline route bundles (services/route_bundle.py)
+Uses a fake connection and a temporary cache directory, so no database is needed.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+import services.route_bundle as bundle_module
+from fake_db import FakeConnection
+from services.route_bundle import BundleStore, elevation_profile
+from services.polyline_codec import decode_polyline
+from services.track_store import Track
+
+_T = datetime(2024, 6, 1, 9, 30)
+
+
+_ROUTE = (3, "Ruta 3", "", 8.5, "Mitjana", 420, "Montseny", "3h", 1,
+          "", True, False, False, True, _T, "Anna")
+_ITEM = (11, "Castell", "Ruïnes", 41.78, 2.39, "Medieval", "castell", None, 35.0)
+
+
+def _track():
+    lats = np.linspace(41.70, 41.80, 400)
+    lons = np.linspace(2.30, 2.40, 400)
+    eles = np.linspace(300.0, 900.0, 400).astype(np.float32)
+    return Track(lats, lons, eles, file_id=7, route_id=3)
+
+
+def _inputs(items=(_ITEM,), md5="abc"):
+    return ([_ROUTE], list(items), [(md5,)] if md5 else [])
+
+
+def _with_track(fn):
+    original = bundle_module.load_track
+    calls = []
+
+    def fake_load(conn, route_id):
+        calls.append(route_id)
+        return _track()
+
+    bundle_module.load_track = fake_load
+    try:
+        return fn(calls)
+    finally:
+        bundle_module.load_track = original
+
+
+def test_build_then_hit_from_disk():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BundleStore(tmp)
+
+        def run(calls):
+            data, key, source = store.get_or_build(FakeConnection(*_inputs()), 3)
+            assert source == "built"
+            bundle = json.loads(gzip.decompress(data))
+            assert bundle["route"]["name"] == "Ruta 3"
+            assert bundle["cultural_items"][0]["item_id"] == 11
+            # Un track recte es queda amb els dos extrems
+            assert bundle["track"]["simplified_point_count"] == 2
+            assert len(decode_polyline(bundle["track"]["polyline_encoded"])) == 2
+            assert bundle["elevation_profile"]["max_m"] == 900.0
+
+            data2, key2, source2 = store.get_or_build(FakeConnection(*_inputs()), 3)
+            assert (data2, key2, source2) == (data, key, "hit")
+            assert calls == [3]
+
+        _with_track(run)
+
+
+def test_changed_input_rebuilds_and_drops_old_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BundleStore(tmp)
+
+        def run(calls):
+            _, key1, _ = store.get_or_build(FakeConnection(*_inputs()), 3)
+            moved = _ITEM[:3] + (41.79,) + _ITEM[4:]
+            _, key2, source = store.get_or_build(FakeConnection(*_inputs(items=(moved,))), 3)
+            assert key1 != key2 and source == "built"
+            assert [f for f in os.listdir(tmp) if not f.startswith(".")] == [f"route_3_{key2}.json.gzip"]
+
+        _with_track(run)
+
+
+def test_route_without_track():
+    with tempfile.TemporaryDirectory() as tmp:
+        data, _, _ = BundleStore(tmp).get_or_build(FakeConnection(*_inputs(md5=None)), 3)
+        bundle = json.loads(gzip.decompress(data))
+        assert bundle["track"] is None and bundle["elevation_profile"] is None
+
+
+def test_missing_route():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert BundleStore(tmp).get_or_build(FakeConnection([]), 99) is None
+
+
+def test_elevation_profile_resampled():
+    t = _track()
+    profile = elevation_profile(t.lats, t.lons, t.eles, points=50)
+    assert len(profile["distance_km"]) == len(profile["elevation_m"]) == 50
+    assert profile["distance_km"][0] == 0.0
+    assert profile["elevation_m"][0] == 300.0 and profile["elevation_m"][-1] == 900.0
+    assert elevation_profile(t.lats, t.lons, None) is None
+
+
+def test_endpoint_etag_and_bad_format():
+    import routes.route_files_routes as files_module
+    from app import app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        original_conn, original_store = files_module.get_connection, files_module.bundle_store
+        files_module.bundle_store = BundleStore(tmp)
+        files_module.get_connection = lambda: FakeConnection(*_inputs(md5=None))
+        try:
+            client = app.test_client()
+            assert client.get("/routes/3/bundle?format=xml").status_code == 400
+
+            resp = client.get("/routes/3/bundle", headers={"Origin": "http://localhost:5173"})
+            assert resp.status_code == 200
+            # L'app web llegeix el format per CORS
+            assert "X-Bundle-Format" in resp.headers["Access-Control-Expose-Headers"]
+            # Fitxer .gz tal qual: sense Content-Encoding el client no el descomprimeix
+            assert "Content-Encoding" not in resp.headers
+            assert resp.mimetype == "application/gzip"
+            assert resp.headers["X-Bundle-Format"] == "application/json"
+            assert json.loads(gzip.decompress(resp.data))["route"]["name"] == "Ruta 3"
+            assert resp.headers["X-Cache"] == "MISS"
+
+            again = client.get("/routes/3/bundle", headers={"If-None-Match": resp.headers["ETag"]})
+            assert again.status_code == 304
+        finally:
+            files_module.get_connection, files_module.bundle_store = original_conn, original_store
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
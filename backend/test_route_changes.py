@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for the route change feed (GET /routes/changes)
+Serves the feed from an in-memory change log, so no database is needed.
+"""
+
+from datetime import datetime
+
+import routes.routes_routes as routes_module
+from fake_db import FakeConnection
+from routes.routes_routes import _decode_change_token, _encode_change_token, _CHANGES_ALL_ROUTES
+
+_T = datetime(2024, 6, 1, 9, 30)
+
+
+class ChangeLog:
+    """routes and route_tombstones by change_txid, plus the snapshot xmin."""
+
+    def __init__(self, xmin, upserted=(), deleted=()):
+        self.xmin = xmin
+        self.changes = [(txid, rid, False) for txid, rid in upserted] + [(txid, rid, True) for txid, rid in deleted]
+
+    def handle(self, sql, params):
+        if sql.startswith("SELECT txid_snapshot_xmin"):
+            return [(self.xmin,)]
+        if sql.startswith("SELECT change_txid, route_id, deleted"):
+            since_txid, since_route_id, xmin = params[:3]
+            rows = sorted(
+                c for c in self.changes
+                if (c[0], c[1]) > (since_txid, since_route_id) and c[0] < xmin
+            )
+            return rows[:params[-1]]
+        if "WHERE r.route_id = ANY(%s)" in sql:
+            return [_route_row(rid) for txid, rid, deleted in sorted(self.changes)
+                    if not deleted and rid in params[1]]
+        raise AssertionError(f"SQL inesperat: {sql}")
+
+    def connection(self):
+        return FakeConnection(handler=self.handle)
+
+
+def _route_row(route_id):
+    return (route_id, f"Ruta {route_id}", "", 10.0, "Mitjana", 500, "Montseny", "3h", 1,
+            "", False, False, False, True, _T, "Anna", False, _T)
+
+
+def _get(conn, query=""):
+    from app import app
+    original = routes_module.get_connection
+    routes_module.get_connection = lambda: conn
+    try:
+        return app.test_client().get("/routes/changes" + query)
+    finally:
+        routes_module.get_connection = original
+
+
+def test_token_round_trip():
+    assert _decode_change_token(_encode_change_token(123456789, 42)) == (123456789, 42)
+
+
+def test_caught_up_cursor_moves_to_snapshot_xmin():
+    log = ChangeLog(1000, upserted=[(900, 5), (1000, 8)], deleted=[(950, 7)])
+    resp = _get(log.connection())
+    body = resp.get_json()
+    assert resp.status_code == 200
+    # El canvi de la transacció 1000 pot no ser visible encara: no surt fins que el xmin el passi
+    assert [r["route_id"] for r in body["upserted"]] == [5]
+    assert body["deleted"] == [7]
+    assert body["has_more"] is False
+    assert _decode_change_token(body["next_since"]) == (999, _CHANGES_ALL_ROUTES)
+
+    log.xmin = 1200
+    body = _get(log.connection(), f"?since={body['next_since']}").get_json()
+    assert [r["route_id"] for r in body["upserted"]] == [8]
+    assert body["deleted"] == []
+
+
+def test_page_cursor_is_last_change():
+    log = ChangeLog(1000, upserted=[(50, 9), (200, 1), (200, 2), (300, 3)])
+    since = _encode_change_token(100, 0)
+    body = _get(log.connection(), f"?since={since}&limit=2").get_json()
+    assert [r["route_id"] for r in body["upserted"]] == [1, 2]
+    assert body["has_more"] is True
+    assert _decode_change_token(body["next_since"]) == (200, 2)
+
+    body = _get(log.connection(), f"?since={body['next_since']}&limit=2").get_json()
+    assert [r["route_id"] for r in body["upserted"]] == [3]
+    assert body["has_more"] is False
+
+
+def test_cursor_never_goes_back():
+    since = _encode_change_token(5000, 3)
+    body = _get(ChangeLog(4000).connection(), f"?since={since}").get_json()
+    assert _decode_change_token(body["next_since"]) == (5000, 3)
+
+
+def test_invalid_token():
+    assert _get(FakeConnection(), "?since=nope").status_code == 400
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test script for the /routing/walking result cache
+The shared tier runs against fake_db, so no database is needed.
+"""
+
+import os
+import threading
+import time
+
+from fake_db import FakeConnection
+from services.routing_cache import RouteCache
+
+
+def _cache(**kwargs):
+    kwargs.setdefault("grid_deg", 0.0005)
+    kwargs.setdefault("ttl_s", 60)
+    kwargs.setdefault("max_entries", 100)
+    return RouteCache(shared=False, **kwargs)
+
+
+def test_nearby_points_share_key():
+    cache = _cache()
+    a = cache.make_key("osrm", 41.40001, 2.10001, 41.5, 2.2)
+    b = cache.make_key("osrm", 41.40012, 2.09992, 41.50004, 2.2)
+    c = cache.make_key("osrm", 41.401, 2.10001, 41.5, 2.2)
+    assert a == b
+    assert a != c
+    assert a != cache.make_key("local", 41.40001, 2.10001, 41.5, 2.2)
+
+
+def test_hit_miss_and_lru_eviction():
+    cache = _cache(max_entries=2)
+    calls = []
+    compute = lambda k: (lambda: calls.append(k) or {"k": k})  # noqa: E731
+
+    assert cache.get_or_compute("a", compute("a")) == ({"k": "a"}, "miss")
+    assert cache.get_or_compute("a", compute("a")) == ({"k": "a"}, "hit")
+    cache.get_or_compute("b", compute("b"))
+    cache.get_or_compute("a", compute("a"))  # "a" passa a ser el més recent
+    cache.get_or_compute("c", compute("c"))  # expulsa "b"
+    assert cache.get_or_compute("b", compute("b"))[1] == "miss"
+    assert calls == ["a", "b", "c", "b"]
+    stats = cache.stats()
+    assert stats["evictions"] == 2 and stats["entries"] == 2
+
+
+def test_ttl_expiry():
+    cache = _cache(ttl_s=0.05)
+    cache.get_or_compute("k", lambda: 1)
+    time.sleep(0.08)
+    assert cache.get_or_compute("k", lambda: 2) == (2, "miss")
+    assert cache.stats()["expired"] == 1
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = _cache()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return {"ok": True}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", slow))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    sources = sorted(s for _, s in results)
+    assert sources.count("miss") == 1 and sources.count("coalesced") == 7
+
+
+def test_errors_are_shared_but_not_cached():
+    cache = _cache()
+
+    def boom():
+        raise RuntimeError("upstream down")
+
+    try:
+        cache.get_or_compute("k", boom)
+        assert False, "should raise"
+    except RuntimeError:
+        pass
+    assert cache.get_or_compute("k", lambda: 5) == (5, "miss")
+    assert cache.stats()["errors"] == 1
+
+
+def test_shared_tier_counts_from_many_threads():
+    deletes = []
+
+    def handler(sql, params):
+        if sql.startswith("SELECT value"):
+            return []
+        if sql.startswith("DELETE FROM routing_cache"):
+            deletes.append(sql)
+        return []
+
+    cache = RouteCache(grid_deg=0.0005, ttl_s=60, max_entries=1000, shared=True,
+                       connect=lambda: FakeConnection(handler=handler))
+
+    def put_many(offset):
+        for i in range(50):
+            cache.get_or_compute(f"k{offset + i}", lambda: 1)
+
+    threads = [threading.Thread(target=put_many, args=(t * 50,)) for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 400 escriptures: una neteja de caducats cada 200
+    assert cache._stores == 400
+    assert len(deletes) == 2
+
+    def down():
+        raise RuntimeError("connection refused")
+
+    broken = RouteCache(grid_deg=0.0005, ttl_s=60, max_entries=1000, shared=True, connect=down)
+    threads = [threading.Thread(target=lambda o=t: [broken.get_or_compute(f"k{o}-{i}", lambda: 1) for i in range(50)])
+               for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Lectura i escriptura fallen per a cada clau, però la ruta es calcula igualment
+    stats = broken.stats()
+    assert stats["shared_errors"] == 800
+    assert stats["misses"] == 400
+
+
+def test_stats_endpoint_is_for_operators_only():
+    from flask_jwt_extended import create_access_token
+
+    from app import app
+
+    original = os.environ.get("ADMIN_USER_IDS")
+    os.environ["ADMIN_USER_IDS"] = "4"
+    try:
+        client = app.test_client()
+        with app.app_context():
+            admin, user = (create_access_token(identity=uid) for uid in ("4", "2"))
+        anonymous = client.get("/routing/cache/stats")
+        forbidden = client.get("/routing/cache/stats", headers={"Authorization": f"Bearer {user}"})
+        allowed = client.get("/routing/cache/stats", headers={"Authorization": f"Bearer {admin}"})
+    finally:
+        if original is None:
+            os.environ.pop("ADMIN_USER_IDS", None)
+        else:
+            os.environ["ADMIN_USER_IDS"] = original
+
+    assert anonymous.status_code == 401
+    assert forbidden.status_code == 403
+    assert allowed.status_code == 200 and "hit_ratio" in allowed.get_json()
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test script for the denormalized like/rating counters (services.social_stats)
+Drives the like/rating endpoints against an in-memory model of the likes,
+ratings and route_social_stats tables, so no database is needed.
+"""
+
+from flask_jwt_extended import create_access_token
+
+import routes.social_routes as social_routes
+from fake_db import FakeConnection, Result
+from services.social_stats import load_social_stats, rating_average
+
+
+class SocialTables:
+    """likes, ratings and route_social_stats as the endpoints see them."""
+
+    def __init__(self):
+        self.likes = {}      # (user_id, route_id) -> like_id
+        self.ratings = {}    # (user_id, route_id) -> [rating_id, score]
+        self.stats = {}      # route_id -> [like_count, rating_count, rating_sum]
+        self._next_id = 1
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _stats(self, route_id):
+        return self.stats.setdefault(route_id, [0, 0, 0])
+
+    def handle(self, sql, params):
+        if sql.startswith("SELECT like_id FROM likes"):
+            return [(self.likes[params],)] if params in self.likes else []
+        if sql.startswith("INSERT INTO likes"):
+            self.likes[params] = self._new_id()
+            return [(self.likes[params],)]
+        if sql.startswith("DELETE FROM likes"):
+            return Result(rowcount=1 if self.likes.pop(params, None) else 0)
+        if sql.startswith("INSERT INTO route_social_stats (route_id, like_count"):
+            route_id, delta, _ = params
+            row = self._stats(route_id)
+            row[0] = max(row[0] + delta, 0)
+            return []
+        if sql.startswith("INSERT INTO route_social_stats (route_id, rating_count"):
+            route_id, count_delta, sum_delta = params
+            row = self._stats(route_id)
+            row[1] += count_delta
+            row[2] += sum_delta
+            return []
+        if sql.startswith("SELECT like_count FROM route_social_stats"):
+            row = self.stats.get(params[0])
+            return [(row[0],)] if row else []
+        if sql.startswith("SELECT rating_id, score FROM ratings"):
+            row = self.ratings.get(params)
+            return [tuple(row)] if row else []
+        if sql.startswith("UPDATE ratings"):
+            score, _, rating_id = params
+            for row in self.ratings.values():
+                if row[0] == rating_id:
+                    row[1] = score
+            return [(rating_id,)]
+        if sql.startswith("INSERT INTO ratings"):
+            user_id, route_id, score, _ = params
+            self.ratings[(user_id, route_id)] = [self._new_id(), score]
+            return [(self.ratings[(user_id, route_id)][0],)]
+        raise AssertionError(f"SQL inesperat: {sql}")
+
+
+def _with_tables(fn):
+    from app import app
+
+    tables = SocialTables()
+    original = social_routes.get_connection
+    social_routes.get_connection = lambda: FakeConnection(handler=tables.handle)
+    try:
+        client = app.test_client()
+        with app.app_context():
+            tokens = {uid: create_access_token(identity=str(uid)) for uid in (1, 2)}
+
+        def call(method, path, user=None, **kwargs):
+            headers = {"Authorization": f"Bearer {tokens[user]}"} if user else {}
+            return getattr(client, method)(path, headers=headers, **kwargs)
+
+        return fn(tables, call)
+    finally:
+        social_routes.get_connection = original
+
+
+def test_rating_average():
+    assert rating_average(0, 0) is None
+    assert rating_average(3, 13) == 4.33
+    assert rating_average(None, None) is None
+
+
+def test_like_twice_and_unlike_keep_the_count():
+    def run(tables, call):
+        assert call("post", "/routes/7/like", user=1).status_code == 201
+        assert call("post", "/routes/7/like", user=1).status_code == 200
+        assert call("post", "/routes/7/like", user=2).status_code == 201
+        assert call("get", "/routes/7/likes/count").get_json()["likes"] == 2
+
+        call("delete", "/routes/7/like", user=1)
+        assert call("get", "/routes/7/likes/count").get_json()["likes"] == 1
+
+    _with_tables(run)
+
+
+def test_unlike_without_a_like_does_not_touch_counters():
+    def run(tables, call):
+        assert call("delete", "/routes/7/like", user=1).status_code == 200
+        assert call("get", "/routes/7/likes/count").get_json()["likes"] == 0
+        assert 7 not in tables.stats
+
+        call("post", "/routes/7/like", user=2)
+        call("delete", "/routes/7/like", user=1)
+        assert tables.stats[7][0] == 1
+
+    _with_tables(run)
+
+
+def test_changed_rating_adds_only_the_difference():
+    def run(tables, call):
+        assert call("post", "/routes/3/rating", user=1, json={"score": 2}).status_code == 201
+        assert call("post", "/routes/3/rating", user=2, json={"score": 4}).status_code == 201
+        assert call("post", "/routes/3/rating", user=1, json={"score": 5}).status_code == 200
+
+        _, rating_count, rating_sum = tables.stats[3]
+        assert (rating_count, rating_sum) == (2, 9)
+        assert rating_average(rating_count, rating_sum) == 4.5
+
+    _with_tables(run)
+
+
+def test_batch_lookup_is_one_query():
+    conn = FakeConnection([(1, 4, 2, 9, True), (2, 0, 0, 0, False)])
+    stats = load_social_stats(conn, [1, 2, 99], user_id=5)
+    assert len(conn.executed) == 1
+    assert stats == {
+        1: {"likes": 4, "liked": True, "rating_count": 2, "rating_avg": 4.5},
+        2: {"likes": 0, "liked": False, "rating_count": 0, "rating_avg": None},
+    }
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
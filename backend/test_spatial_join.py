@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test script for the catalog-wide spatial join (services/spatial_join.py)
+Uses synthetic tracks and in-memory tables, so no database is needed.
+"""
+
+import numpy as np
+
+import services.spatial_join as join_module
+from fake_db import FakeConnection
+from services.geometry import points_to_polyline_m
+from services.spatial_join import join_tracks, run_catalog_join
+from services.track_store import decode_track, encode_track
+
+
+def _catalog(seed=3):
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for route_id in range(1, 13):
+        lat0, lon0 = rng.uniform(41.0, 41.2), rng.uniform(2.0, 2.2)
+        lat = lat0 + np.cumsum(rng.normal(0, 0.0002, 300))
+        lon = lon0 + np.cumsum(rng.normal(0, 0.0002, 300))
+        enc = encode_track(lat, lon)
+        tracks.append((route_id, enc["lat_e7"], enc["lon_e7"]))
+    items = (np.arange(1, 3001), rng.uniform(41.0, 41.2, 3000), rng.uniform(2.0, 2.2, 3000))
+    return tracks, items
+
+
+def _brute_force(tracks, items, radius_m):
+    ids, lats, lons = items
+    out = set()
+    for route_id, lat_e7, lon_e7 in tracks:
+        t = decode_track(lat_e7, lon_e7)
+        d = points_to_polyline_m(lats, lons, t.lats, t.lons)
+        out.update((route_id, int(i), int(round(x))) for i, x in zip(ids, d) if x <= radius_m)
+    return out
+
+
+def _join(tracks, items, processes):
+    chunks = [tracks[i:i + 5] for i in range(0, len(tracks), 5)]
+    out = []
+    for chunk, rows in join_tracks(items, iter(chunks), 150, processes):
+        out.append((chunk, rows))
+    return out
+
+
+def test_join_matches_brute_force():
+    tracks, items = _catalog()
+    result = _join(tracks, items, processes=1)
+    assert [c for c, _ in result] == [tracks[i:i + 5] for i in range(0, len(tracks), 5)]
+    rows = {r for _, chunk_rows in result for r in chunk_rows}
+    assert rows and rows == _brute_force(tracks, items, 150)
+
+
+def test_process_pool_gives_same_rows_in_order():
+    tracks, items = _catalog()
+    serial = _join(tracks, items, processes=1)
+    pooled = _join(tracks, items, processes=2)
+    assert [c for c, _ in pooled] == [c for c, _ in serial]
+    assert [sorted(r) for _, r in pooled] == [sorted(r) for _, r in serial]
+
+
+class JoinTables:
+    """route_tracks, route_cultural_items and the item cache as run_catalog_join sees them."""
+
+    def __init__(self, tracks, links, cached=True):
+        self.tracks = tracks
+        self.links = dict(links)   # (route_id, item_id) -> distance_m
+        self.cached = cached
+        self.conn = FakeConnection(handler=self.handle)
+
+    def _staged(self, table):
+        return [tuple(int(v) for v in line.split("\t")) for line in self.conn.copied.get(table, [])]
+
+    def handle(self, sql, params):
+        if sql.startswith("SELECT DISTINCT ON (route_id)"):
+            return list(self.tracks)
+        if sql.startswith("SELECT COUNT"):
+            return [(len(self.tracks),)]
+        if sql.startswith(("CREATE", "ANALYZE")):
+            return []
+        staging = {(r, i): d for r, i, d in self._staged("rci_staging")}
+        if sql.startswith("DELETE FROM route_cultural_items"):
+            scope = {r for (r,) in self._staged("rci_scope")}
+            gone = [k for k in self.links if k[0] in scope and k not in staging]
+            for k in gone:
+                del self.links[k]
+            return [(r,) for r, _ in gone]
+        if sql.startswith("UPDATE route_cultural_items"):
+            moved = [k for k, d in staging.items() if k in self.links and self.links[k] != d]
+            for k in moved:
+                self.links[k] = staging[k]
+            return [(r,) for r, _ in moved]
+        if sql.startswith("INSERT INTO route_cultural_items"):
+            new = [k for k in staging if k not in self.links]
+            for k in new:
+                self.links[k] = staging[k]
+            return [(r,) for r, _ in new]
+        if sql == "DELETE FROM cultural_item_routes_cache":
+            self.cached = False
+            return []
+        raise AssertionError(f"SQL inesperat: {sql}")
+
+
+def test_run_catalog_join_stages_and_merges():
+    tracks, items = _catalog()
+    expected = {(r, i): d for r, i, d in _brute_force(tracks, items, 150)}
+
+    # Estat previ: la ruta 3 té una distància antiga, la 5 un ítem que ja no hi és,
+    # la 8 li falta un enllaç i la 99 (sense track) no s'ha de tocar
+    links = dict(expected)
+    stale = next(k for k in links if k[0] == 3)
+    links[stale] += 40
+    links[(5, 999999)] = 20
+    del links[next(k for k in links if k[0] == 8)]
+    links[(99, 1)] = 10
+    tables = JoinTables(tracks, links)
+
+    original = join_module._fetch_items
+    join_module._fetch_items = lambda conn: (items[0], items[1], items[2], [""] * len(items[0]))
+    progress = []
+    try:
+        result = run_catalog_join(tables.conn, radius_m=150, chunk_size=5, progress=lambda *a: progress.append(a))
+    finally:
+        join_module._fetch_items = original
+
+    assert result["routes"] == 12 and result["items"] == 3000
+    assert result["links"] == len(expected)
+    assert [p[0] for p in progress] == [5, 10, 12]
+    assert result["changed_route_ids"] == [3, 5, 8]
+    assert tables.links == {**expected, (99, 1): 10}
+    assert not tables.cached
+    # Qui crida decideix si fa commit (o rollback en una prova en sec)
+    assert tables.conn.commits == 0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
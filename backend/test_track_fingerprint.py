@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test script for track fingerprints and duplicate detection (services/track_fingerprint.py)
+Uses synthetic tracks and in-memory tables, so no database is needed.
+"""
+
+import numpy as np
+
+import services.track_fingerprint as fp_module
+from fake_db import FakeConnection
+from services.track_fingerprint import (
+    classify,
+    compare_tracks,
+    detect_duplicates,
+    discrete_frechet,
+    fingerprint_track,
+    geohash_cells,
+    minhash,
+)
+from services.track_store import Track
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _trail(n=800, lat0=41.60, lon0=2.00, seed=None, noise_deg=0.0):
+    t = np.linspace(0.0, 1.0, n)
+    lats = lat0 + 0.05 * t + 0.01 * np.sin(6 * t)
+    lons = lon0 + 0.04 * np.sin(3 * t)
+    if seed is not None:
+        rng = np.random.default_rng(seed)
+        lats = lats + rng.normal(0.0, noise_deg, n)
+        lons = lons + rng.normal(0.0, noise_deg, n)
+    return lats, lons
+
+
+def _frechet_reference(d):
+    n, m = d.shape
+    c = np.zeros((n, m))
+    for i in range(n):
+        for j in range(m):
+            if i == 0 and j == 0:
+                prev = 0.0
+            elif i == 0:
+                prev = c[0, j - 1]
+            elif j == 0:
+                prev = c[i - 1, 0]
+            else:
+                prev = min(c[i - 1, j], c[i - 1, j - 1], c[i, j - 1])
+            c[i, j] = max(d[i, j], prev)
+    return c[n - 1, m - 1]
+
+
+def test_geohash_matches_reference():
+    expected = 0
+    for ch in "u4pruyd":
+        expected = (expected << 5) | _BASE32.index(ch)
+    assert int(geohash_cells([57.64911], [10.40744])[0]) == expected
+
+
+def test_minhash_estimates_jaccard():
+    a = np.arange(0, 1000)
+    b = np.arange(400, 1400)  # Jaccard 600 / 1400
+    sim = float(np.mean(minhash(a) == minhash(b)))
+    assert abs(sim - 600 / 1400) < 0.15
+    assert np.array_equal(minhash(a), minhash(a[::-1]))
+
+
+def test_discrete_frechet_matches_reference():
+    rng = np.random.default_rng(3)
+    for n, m in ((1, 1), (1, 5), (7, 3), (12, 12)):
+        d = rng.uniform(0, 100, (n, m))
+        assert abs(discrete_frechet(d) - _frechet_reference(d)) < 1e-9
+
+
+def test_rerecorded_trail_is_duplicate_in_either_direction():
+    lats, lons = _trail()
+    again_lats, again_lons = _trail(n=650, seed=1, noise_deg=8e-5)
+    a = fingerprint_track(lats, lons)
+    b = fingerprint_track(again_lats[::-1], again_lons[::-1])
+    assert a.similarity(b.signature) > 0.7
+    assert np.any(a.buckets == b.buckets)
+
+    cmp = compare_tracks(lats, lons, again_lats[::-1], again_lons[::-1])
+    assert cmp["reversed"] and cmp["frechet_m"] < 60
+    assert classify(cmp["frechet_m"], cmp["hausdorff_m"]) == "duplicate"
+
+
+def test_other_trail_and_subsection_are_not_duplicates():
+    lats, lons = _trail()
+    a = fingerprint_track(lats, lons)
+    far = fingerprint_track(*_trail(lat0=41.70))
+    assert a.similarity(far.signature) < 0.2
+    assert not np.any(a.buckets == far.buckets)
+
+    cmp = compare_tracks(lats[:400], lons[:400], lats, lons)
+    assert classify(cmp["frechet_m"], cmp["hausdorff_m"]) is None
+
+
+class DuplicateTables:
+    """LSH candidates, route names and route_duplicates in memory."""
+
+    def __init__(self, candidates, names, pairs=()):
+        self.candidates = candidates
+        self.names = names
+        self.pairs = {p[:2]: p[2] for p in pairs}   # (route_id, duplicate_of) -> kind
+
+    def write_pairs(self, cur, sql, rows):
+        for route_id, duplicate_of, kind, *_ in rows:
+            self.pairs[(route_id, duplicate_of)] = kind
+
+    def handle(self, sql, params):
+        if sql.startswith("SELECT f.route_id, f.signature"):
+            return [c for c in self.candidates if c[0] != params[2]]
+        if sql.startswith("DELETE FROM route_duplicates"):
+            for key in [k for k in self.pairs if k[0] == params[0] or k[1] == params[1]]:
+                del self.pairs[key]
+            return []
+        if sql.startswith("SELECT route_id, name FROM routes"):
+            return [(rid, self.names[rid]) for rid in params[0] if rid in self.names]
+        raise AssertionError(f"SQL inesperat: {sql}")
+
+
+def test_detect_duplicates_confirms_candidates_and_orients_pairs():
+    lats, lons = _trail()
+    track = Track(lats, lons, route_id=20, file_id=200)
+    tracks = {
+        7: Track(*_trail(n=650, seed=2, noise_deg=8e-5), route_id=7),  # mateix recorregut
+        9: Track(lats[:400], lons[:400], route_id=9),                 # només una part
+    }
+    sigs = {rid: fingerprint_track(t.lats, t.lons).signature.astype("<u4").tobytes() for rid, t in tracks.items()}
+    unrelated = fingerprint_track(*_trail(lat0=41.70)).signature.astype("<u4").tobytes()
+
+    # Parelles d'abans del canvi de track (20 i 33) i una d'altres rutes que no es toca
+    tables = DuplicateTables(
+        [(7, sigs[7]), (9, sigs[9]), (11, unrelated)],
+        {7: "Camí de ronda", 9: "Tram", 11: "Altra"},
+        pairs=[(20, 9, "near_duplicate"), (33, 20, "duplicate"), (40, 41, "duplicate")],
+    )
+    loaded = []
+    orig_load, orig_values = fp_module.load_tracks, fp_module.execute_values
+    fp_module.load_tracks = lambda conn, ids: loaded.extend(ids) or {i: tracks[i] for i in ids if i in tracks}
+    fp_module.execute_values = tables.write_pairs
+    try:
+        matches = detect_duplicates(FakeConnection(handler=tables.handle), 20, track)
+    finally:
+        fp_module.load_tracks, fp_module.execute_values = orig_load, orig_values
+
+    # La ruta sense cel·les en comú no arriba a carregar-se
+    assert 11 not in loaded
+    assert [m["route_id"] for m in matches] == [7]
+    assert matches[0]["kind"] == "duplicate" and matches[0]["name"] == "Camí de ronda"
+    # La ruta nova és route_id; les parelles antigues de la 20 desapareixen
+    assert tables.pairs == {(20, 7): "duplicate", (40, 41): "duplicate"}
+
+
+def test_duplicate_report_is_restricted_to_admins():
+    import os
+
+    from flask_jwt_extended import create_access_token
+
+    import app as app_module
+    import routes.route_files_routes as files_module
+
+    orig_conn, orig_report = files_module.get_connection, files_module.duplicate_report
+    orig_admins = os.environ.get("ADMIN_USER_IDS")
+    files_module.get_connection = FakeConnection
+    files_module.duplicate_report = lambda conn, **kw: {"pairs": [], "totals": {}}
+    os.environ["ADMIN_USER_IDS"] = "1, 4"
+    try:
+        client = app_module.app.test_client()
+        with app_module.app.app_context():
+            admin = create_access_token(identity="4")
+            user = create_access_token(identity="2")
+        anonymous = client.get("/routes/duplicates").status_code
+        as_user = client.get("/routes/duplicates", headers={"Authorization": f"Bearer {user}"}).status_code
+        as_admin = client.get("/routes/duplicates", headers={"Authorization": f"Bearer {admin}"})
+    finally:
+        files_module.get_connection, files_module.duplicate_report = orig_conn, orig_report
+        if orig_admins is None:
+            os.environ.pop("ADMIN_USER_IDS", None)
+        else:
+            os.environ["ADMIN_USER_IDS"] = orig_admins
+
+    assert (anonymous, as_user) == (401, 403)
+    assert as_admin.status_code == 200 and as_admin.get_json()["pairs"] == []
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for the local walking graph and routing backend
+Builds a small synthetic OSM extract and checks bidirectional A*
+against a plain Dijkstra.
+"""
+
+import heapq
+import os
+import random
+import tempfile
+
+from services.routing_backends import LocalBackend
+from services.walk_graph import WalkGraph, import_osm, save_graph
+
+
+def _grid_osm(n=15, seed=5):
+    """Graella n x n amb alguns trams eliminats i una autopista no transitable."""
+    rng = random.Random(seed)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    node_id = lambda i, j: 1 + i * n + j  # noqa: E731
+    for i in range(n):
+        for j in range(n):
+            lat = 41.0 + i * 0.001 + rng.uniform(-0.0002, 0.0002)
+            lon = 2.0 + j * 0.001 + rng.uniform(-0.0002, 0.0002)
+            lines.append(f'<node id="{node_id(i, j)}" lat="{lat:.7f}" lon="{lon:.7f}"/>')
+
+    way_id = 1
+    for i in range(n):
+        for j in range(n):
+            for di, dj in ((0, 1), (1, 0)):
+                if i + di >= n or j + dj >= n or rng.random() < 0.15:
+                    continue
+                highway, name = ("path", "") if (i + j) % 2 else ("residential", "Carrer Major")
+                lines.append(f'<way id="{way_id}">')
+                lines.append(f'<nd ref="{node_id(i, j)}"/><nd ref="{node_id(i + di, j + dj)}"/>')
+                lines.append(f'<tag k="highway" v="{highway}"/>')
+                if name:
+                    lines.append(f'<tag k="name" v="{name}"/>')
+                lines.append("</way>")
+                way_id += 1
+
+    # Drecera per autopista: no s'ha de fer servir
+    lines.append(f'<way id="{way_id}"><nd ref="{node_id(0, 0)}"/><nd ref="{node_id(n - 1, n - 1)}"/>'
+                 '<tag k="highway" v="motorway"/></way>')
+    lines.append("</osm>")
+    return "\n".join(lines)
+
+
+def _build(tmp):
+    path = os.path.join(tmp, "grid.osm")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_grid_osm())
+    save_graph(import_osm(path), os.path.join(tmp, "graph"))
+    return WalkGraph.load(os.path.join(tmp, "graph"))
+
+
+def _dijkstra(graph, source):
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(int(graph.indptr[u]), int(graph.indptr[u + 1])):
+            v = int(graph.indices[k])
+            nd = d + float(graph.weight[k])
+            if nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def test_bidirectional_astar_matches_dijkstra():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _build(tmp)
+        rng = random.Random(1)
+        for _ in range(15):
+            s = rng.randrange(len(graph))
+            expected = _dijkstra(graph, s)
+            for t in rng.sample(range(len(graph)), 10):
+                found = graph.shortest_path(s, t)
+                if t not in expected:
+                    assert found is None
+                    continue
+                dist, path = found
+                assert abs(dist - expected[t]) < 1e-3, (s, t, dist, expected[t])
+                assert path[0] == s and path[-1] == t
+
+
+def test_motorway_is_not_walkable():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _build(tmp)
+        highways = {hw for _, hw in graph.ways}
+        assert "motorway" not in highways
+
+
+def test_local_backend_payload():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _build(tmp)
+        backend = LocalBackend(graph=graph)
+        payload = backend.route(41.0001, 2.0001, 41.0135, 2.0135)
+        assert set(payload) == {"distance_km", "duration_min", "polyline", "steps"}
+        assert payload["distance_km"] > 2.0
+        assert payload["duration_min"] > 0
+        assert payload["polyline"][0] == [41.0001, 2.0001]
+        assert set(payload["steps"]) <= {"Camí", "Carrer"}
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -1,96 +1,84 @@
 #!/usr/bin/env python3
 """
-Migration script to update existing routes with calculated difficulty.
-This script validates and recalculates difficulty for routes as needed.
+Recalcula la dificultat guardada de les rutes.
+
+Només es recalculen les rutes amb una versió de fórmula antiga
+(routes.difficulty_version < DIFFICULTY_FORMULA_VERSION), en lots i amb
+UPDATE ... FROM (VALUES ...). Cal executar-lo després de canviar la
+fórmula de services/difficulty_calculator.py.
+
+Ús:
+    python update_difficulties.py              # només rutes desfasades
+    python update_difficulties.py --force      # totes les rutes
+    python update_difficulties.py --dry-run    # calcula sense escriure
 """
 
+import argparse
 import sys
+
 from db import get_connection
-from services.difficulty_calculator import calculate_difficulty
+from services.difficulty_calculator import DIFFICULTY_FORMULA_VERSION
+from services.difficulty_recompute import count_stale_routes, recompute_difficulties
+from services.learning_stats import rebuild_learning_stats
+
+
+def update_route_difficulties(force: bool = False, dry_run: bool = False, batch_size: int = 2000):
+    """Recalcula la dificultat de les rutes desfasades (o de totes amb force)"""
 
-def update_route_difficulties():
-    """Update difficulty for all routes with empty or invalid difficulty values"""
-    
     conn = get_connection()
-    cur = conn.cursor()
-    
-    print("=" * 70)
-    print("ACTUALIZACIÓN DE DIFICULTAD DE RUTAS")
-    print("=" * 70)
-    print()
-    
-    # Fetch ALL routes
-    cur.execute("""
-        SELECT route_id, name, distance_km, elevation_gain, estimated_time, difficulty
-        FROM routes
-        ORDER BY route_id ASC
-    """)
-    
-    routes = cur.fetchall()
-    
-    if not routes:
-        print("✓ No hay rutas para procesar.")
-        cur.close()
+    try:
+        print("=" * 70)
+        print("ACTUALIZACIÓN DE DIFICULTAD DE RUTAS")
+        print("=" * 70)
+        print()
+        print(f"Versió de la fórmula: {DIFFICULTY_FORMULA_VERSION}")
+
+        if not force:
+            stale = count_stale_routes(conn)
+            if stale == 0:
+                print("✓ No hay rutas para procesar.")
+                return
+            print(f"Se encontraron {stale} ruta(s) desfasada(s).")
+        print()
+
+        def _progress(processed, changed):
+            print(f"  {processed} processada(es), {changed} amb canvi de dificultat")
+
+        result = recompute_difficulties(
+            conn,
+            batch_size=batch_size,
+            force=force,
+            dry_run=dry_run,
+            progress=_progress,
+        )
+
+        if result["changed"] and not dry_run:
+            # Els agregats d'aprenentatge guarden el rang de dificultat de cada completion
+            users = rebuild_learning_stats(conn)
+            conn.commit()
+            print(f"  Agregats d'aprenentatge recalculats per a {users} usuari(s)")
+    finally:
         conn.close()
-        return
-    
-    print(f"Se encontraron {len(routes)} ruta(s) para procesar.")
+
     print()
-    
-    valid_difficulties = {'Fàcil', 'Mitjana', 'Difícil', 'Molt Difícil', 
-                         'Fácil', 'Moderada', 'Muy Difícil'}
-    
-    updated_count = 0
-    for route_id, name, distance_km, elevation_gain, estimated_time, current_difficulty in routes:
-        # Check if current difficulty is valid
-        current_is_valid = current_difficulty in valid_difficulties if current_difficulty else False
-        
-        if current_is_valid:
-            print(f"[{route_id}] {name}")
-            print(f"  ✓ Dificultad existente válida: {current_difficulty}")
-            print()
-            continue
-        
-        # Calculate difficulty in Catalan to match existing data
-        difficulty = calculate_difficulty(
-            float(distance_km or 0),
-            int(elevation_gain or 0),
-            estimated_time,
-            lang='ca'  # Use Catalan to match existing data
-        )
-        
-        print(f"[{route_id}] {name}")
-        print(f"  Distancia: {distance_km} km, Elevación: {elevation_gain} m")
-        print(f"  Dificultad calculada: {difficulty}")
-        
-        # Update the route
-        try:
-            cur.execute("""
-                UPDATE routes
-                SET difficulty = %s
-                WHERE route_id = %s
-            """, (difficulty, route_id))
-            
-            updated_count += 1
-            print(f"  ✓ Actualizado")
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
-        
-        print()
-    
-    # Commit changes
-    conn.commit()
-    cur.close()
-    conn.close()
-    
     print("=" * 70)
-    print(f"✓ {updated_count} ruta(s) actualizada(s) correctamente")
+    if dry_run:
+        print(f"✓ Dry run: {result['changed']} de {result['processed']} ruta(s) canviarien")
+    else:
+        print(f"✓ {result['processed']} ruta(s) actualizada(s) correctamente ({result['changed']} amb canvi)")
     print("=" * 70)
     print()
 
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula la dificultat de les rutes")
+    parser.add_argument("--force", action="store_true", help="recalcula totes les rutes")
+    parser.add_argument("--dry-run", action="store_true", help="no escriu cap canvi")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
     try:
-        update_route_difficulties()
+        update_route_difficulties(force=args.force, dry_run=args.dry_run, batch_size=args.batch_size)
     except Exception as e:
         print(f"✗ Error durante la actualización: {e}")
         sys.exit(1)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Worker de la cua de treballs (taula jobs, migració 0007).
+
+Executa fora de les peticions HTTP els recàlculs pesats que l'API encua:
+associació ruta <-> ítems culturals, associació ítem -> rutes (amb
+descàrrega de GPX), associació incremental dels ítems inserits o moguts,
+sincronització dels booleans culturals i recàlcul de dificultats.
+
+Ús:
+    python worker.py                       # 1 procés, fins a SIGTERM/Ctrl+C
+    python worker.py --processes 4         # 4 processos en paral·lel
+    python worker.py --once                # buida la cua i surt
+    python worker.py --kinds difficulty_backfill
+    python worker.py --enqueue difficulty_backfill --payload '{"force": true}'
+    python worker.py --enqueue sync_cultural_booleans
+    python worker.py --enqueue cultural_items_associate --payload '{"radius_m": 150}'
+    python worker.py --enqueue cultural_join_all --payload '{"processes": 4}'
+    python worker.py --purge-days 7        # esborra treballs acabats antics
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+
+from db import get_connection
+from routes.route_cultural_routes import (
+    TrackUnavailable,
+    _recompute_route_cultural_items,
+    _sync_route_cultural_booleans,
+)
+from routes.routes_routes import _associate_item_routes, _mark_item_routes_cached
+from services import jobs
+from services.difficulty_recompute import recompute_difficulties
+from services.item_association import drain_queue
+from services.learning_stats import rebuild_learning_stats
+from services.spatial_join import run_catalog_join
+
+
+@jobs.register(jobs.ROUTE_CULTURAL_RECOMPUTE)
+def route_cultural_recompute(conn, payload):
+    route_id = int(payload["route_id"])
+    radius_m = int(payload.get("radius_m", 150))
+    try:
+        items_found = _recompute_route_cultural_items(conn, route_id, radius_m)
+    except TrackUnavailable as e:
+        if e.reason == "download":
+            raise  # error de xarxa: es reintenta amb backoff
+        conn.rollback()
+        return {"route_id": route_id, "radius_m": radius_m, "error": e.reason}
+    return {"route_id": route_id, "radius_m": radius_m, "items_found": items_found}
+
+
+@jobs.register(jobs.CULTURAL_ITEM_ROUTES)
+def cultural_item_routes(conn, payload):
+    item_id = int(payload["item_id"])
+    radius_m = int(payload.get("radius_m", 1000))
+    max_routes = int(payload.get("max_routes", 60))
+    max_cache_rows = int(payload.get("max_cache_rows", 2000))
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT latitude, longitude FROM cultural_items WHERE item_id = %s", (item_id,))
+        row = cur.fetchone()
+        if not row:
+            return {"item_id": item_id, "error": "not_found"}
+
+        # Un altre treball (o una petició) ja ho ha calculat
+        cur.execute(
+            """
+            SELECT 1
+            FROM cultural_item_routes_cache
+            WHERE item_id = %s AND radius_m = %s
+              AND updated_at > NOW() - INTERVAL '6 hours'
+            """,
+            (item_id, radius_m),
+        )
+        if cur.fetchone():
+            return {"item_id": item_id, "radius_m": radius_m, "skipped": "fresh"}
+
+    _associate_item_routes(conn, item_id, float(row[0]), float(row[1]), radius_m, max_routes, fetch_missing=True)
+    _mark_item_routes_cached(conn, item_id, radius_m, max_cache_rows)
+    return {"item_id": item_id, "radius_m": radius_m}
+
+
+@jobs.register(jobs.SYNC_CULTURAL_BOOLEANS)
+def sync_cultural_booleans(conn, payload):
+    if payload.get("route_id") is not None:
+        route_ids = [int(payload["route_id"])]
+    else:
+        with conn.cursor() as cur:
+            cur.execute("SELECT route_id FROM routes ORDER BY route_id")
+            route_ids = [int(r[0]) for r in cur.fetchall()]
+
+    for i, route_id in enumerate(route_ids, start=1):
+        _sync_route_cultural_booleans(conn, route_id)
+        if i % 500 == 0:
+            conn.commit()
+    return {"routes": len(route_ids)}
+
+
+@jobs.register(jobs.CULTURAL_ITEMS_ASSOCIATE)
+def cultural_items_associate(conn, payload):
+    radius_m = payload.get("radius_m")
+    return drain_queue(
+        conn,
+        _sync_route_cultural_booleans,
+        radius_m=float(radius_m) if radius_m is not None else None,
+        batch_size=int(payload.get("batch_size", 500)),
+    )
+
+
+@jobs.register(jobs.CULTURAL_JOIN_ALL)
+def cultural_join_all(conn, payload):
+    result = run_catalog_join(
+        conn,
+        radius_m=float(payload.get("radius_m", 150)),
+        processes=max(1, int(payload.get("processes", 1))),
+        chunk_size=max(1, int(payload.get("chunk_size", 50))),
+    )
+    changed = result.pop("changed_route_ids")
+    for route_id in changed:
+        _sync_route_cultural_booleans(conn, route_id)
+    return dict(result, changed_routes=len(changed))
+
+
+@jobs.register(jobs.DIFFICULTY_BACKFILL)
+def difficulty_backfill(conn, payload):
+    result = recompute_difficulties(
+        conn,
+        batch_size=int(payload.get("batch_size", 2000)),
+        force=bool(payload.get("force", False)),
+    )
+    if result["changed"]:
+        # Els agregats d'aprenentatge guarden el rang de dificultat de cada completion
+        result["learning_stats_users"] = rebuild_learning_stats(conn)
+    return result
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _work(kinds, once: bool, poll_interval_s: float, stale_after_s: float):
+    stop = {"flag": False}
+
+    def _stop(_signum, _frame):
+        stop["flag"] = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    processed = jobs.run_worker(
+        get_connection,
+        kinds=kinds,
+        poll_interval_s=poll_interval_s,
+        stale_after_s=stale_after_s,
+        once=once,
+        should_stop=lambda: stop["flag"],
+    )
+    print(f"Worker {jobs.default_worker_id()} aturat ({processed} treball(s) processat(s))")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cua de treballs")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--once", action="store_true", help="surt quan no queda res per fer")
+    parser.add_argument("--kinds", nargs="+", choices=jobs.registered_kinds(), help="només aquests tipus")
+    parser.add_argument("--poll-interval", type=float, default=_env_float("JOBS_POLL_INTERVAL_S", 1.0))
+    parser.add_argument("--stale-after", type=float, default=_env_float("JOBS_STALE_AFTER_S", 900.0))
+    parser.add_argument("--enqueue", metavar="KIND", choices=jobs.registered_kinds(), help="encua un treball i surt")
+    parser.add_argument("--payload", default="{}", help="payload JSON del treball encuat")
+    parser.add_argument("--priority", type=int, default=jobs.PRIORITY_NORMAL)
+    parser.add_argument("--dedupe-key")
+    parser.add_argument("--purge-days", type=int, help="esborra treballs acabats fa més de N dies i surt")
+    args = parser.parse_args()
+
+    if args.enqueue or args.purge_days is not None:
+        conn = get_connection()
+        try:
+            if args.enqueue:
+                job_id = jobs.enqueue(
+                    conn,
+                    args.enqueue,
+                    json.loads(args.payload),
+                    priority=args.priority,
+                    dedupe_key=args.dedupe_key,
+                )
+                conn.commit()
+                print(f"✓ Treball {job_id} ({args.enqueue}) encuat")
+            else:
+                n = jobs.purge_finished(conn, args.purge_days)
+                print(f"✓ {n} treball(s) esborrat(s)")
+        finally:
+            conn.close()
+        return
+
+    work_args = (args.kinds, args.once, args.poll_interval, args.stale_after)
+    if args.processes <= 1:
+        _work(*work_args)
+        return
+
+    procs = [multiprocessing.Process(target=_work, args=work_args) for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"✗ Error al worker: {e}")
+        sys.exit(1)